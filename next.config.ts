@@ -41,6 +41,17 @@ const nextConfig: NextConfig = {
           { key: 'Cross-Origin-Embedder-Policy', value: 'require-corp' },
         ],
       },
+      {
+        // Content-hashed reference databases and ANN indices never change under a URL
+        source: '/ml/:file(embeddings-.+\\.[0-9a-f]{16}\\..+)',
+        headers: [
+          { key: 'Cache-Control', value: 'public, max-age=31536000, immutable' },
+        ],
+      },
+      {
+        source: '/ml/manifest.json',
+        headers: [{ key: 'Cache-Control', value: 'no-cache' }],
+      },
     ];
   },
 };
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+
+Times each stage of the embedding pipeline and the exported ONNX models on a
+fixed local image corpus, and compares two benchmark runs.
+
+Usage:
+    .venv/bin/python scripts/benchmark.py run                               # Stages + every exported model
+    .venv/bin/python scripts/benchmark.py run --cards 64 --output base.json
+    .venv/bin/python scripts/benchmark.py run --skip-stages --batch-sizes 1 --threads 1 2 4
+    .venv/bin/python scripts/benchmark.py compare base.json new.json        # Exit 1 on regressions
+
+The corpus is the first --cards images of .cache/card-images (or --corpus) in
+name order, so runs on one machine time the same bytes; the corpus digest is
+stored in the result and compare warns when it differs.
+
+Stages (ms per card unless noted): decode, crop_artwork, letterbox, histogram,
+spatial, crop_store (reading a cached letterboxed crop, see ml/crops.py),
+augment_pil, augment_tensor, images_to_tensor (one card's augmentations),
+inference (torch, per batch size) and json_serialize (one database of the
+corpus cards). ONNX models are timed with onnxruntime on the
+CPU execution provider for each batch size and intra-op thread count.
+
+Output:
+    .cache/benchmarks/<timestamp>.json (or --output; format in ml/bench.py)
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from ml.bench import (DEFAULT_MIN_DELTA_MS, DEFAULT_REGRESSION_THRESHOLD, compare_results, environment, new_result,
+                      time_calls)
+
+# torch, onnxruntime and generate_embeddings are imported by the benchmarks that need them, so compare
+# (and run --skip-stages without torch) works without the whole ML stack
+
+RESULTS_DIR = Path(".cache/benchmarks")
+CACHE_DIR = Path(".cache/card-images")  # generate_embeddings.CACHE_DIR
+MODEL_DIR = Path("public/ml")
+
+# Exported models timed by default, when present (see export_onnx.py)
+MODEL_NAMES = (
+    "mobilenet_v3_large.onnx",
+    "mobilenet_v3_large.int8.onnx",
+    "mobilenet_v3_large.ort",
+    "mobilenet_v3_large.int8.ort",
+    "mobilenet_v3_large.rgba.onnx",
+    "mobilenet_v3_large.multi.onnx",
+)
+
+DEFAULT_CARDS = 32
+DEFAULT_BATCH_SIZES = (1, 8, 32)
+DEFAULT_THREADS = (1, 2, 4)
+DEFAULT_MODEL_RUNS = 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding pipeline and exported ONNX models")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Time every stage and model, write a JSON result")
+    run.add_argument("--corpus", type=Path, default=CACHE_DIR,
+                     help=f"Directory of card images (default: {CACHE_DIR})")
+    run.add_argument("--cards", type=int, default=DEFAULT_CARDS,
+                     help=f"Images used from the corpus, in name order (default: {DEFAULT_CARDS})")
+    run.add_argument("--output", type=Path, default=None,
+                     help=f"Result path (default: {RESULTS_DIR}/<timestamp>.json)")
+    run.add_argument("--batch-sizes", type=int, nargs="+", default=list(DEFAULT_BATCH_SIZES),
+                     help="Batch sizes for torch and ONNX inference "
+                          f"(default: {' '.join(map(str, DEFAULT_BATCH_SIZES))})")
+    run.add_argument("--threads", type=int, nargs="+", default=list(DEFAULT_THREADS),
+                     help=f"onnxruntime intra-op thread counts (default: {' '.join(map(str, DEFAULT_THREADS))})")
+    run.add_argument("--runs", type=int, default=DEFAULT_MODEL_RUNS,
+                     help=f"Timed calls per inference configuration (default: {DEFAULT_MODEL_RUNS})")
+    run.add_argument("--models", type=Path, nargs="+", default=None,
+                     help=f"ONNX/ORT models to time (default: every exported model in {MODEL_DIR})")
+    run.add_argument("--skip-stages", action="store_true",
+                     help="Only time the ONNX models")
+    run.add_argument("--skip-models", action="store_true",
+                     help="Only time the pipeline stages")
+
+    compare = commands.add_parser("compare", help="Compare two results; exit 1 if any timing regressed")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("current", type=Path)
+    compare.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                         help="Relative median slowdown counted as a regression "
+                              f"(default: {DEFAULT_REGRESSION_THRESHOLD})")
+    compare.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                         help=f"Ignore changes smaller than this (default: {DEFAULT_MIN_DELTA_MS} ms)")
+    return parser.parse_args()
+
+
+# ─── Corpus ─────────────────────────────────────────────────────────────────
+
+def load_corpus(directory: Path, count: int) -> tuple[list, dict]:
+    """The first `count` images of directory in name order as raw bytes, plus a description."""
+    paths = sorted(p for p in directory.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"))
+    paths = paths[:count]
+    blobs = [p.read_bytes() for p in paths]
+    digest = hashlib.sha256()
+    for path, blob in zip(paths, blobs):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(blob)
+    corpus = {
+        "directory": str(directory),
+        "images": len(paths),
+        "bytes": sum(len(b) for b in blobs),
+        "digest": digest.hexdigest()[:16],
+        "first": paths[0].name if paths else None,
+        "last": paths[-1].name if paths else None,
+    }
+    return blobs, corpus
+
+
+# ─── Pipeline Stages ────────────────────────────────────────────────────────
+
+def _batches(inputs: np.ndarray, batch_size: int, runs: int) -> list:
+    """`runs` batches cycling through inputs (repeating rows when the corpus is smaller)."""
+    n = len(inputs)
+    return [(inputs[np.arange(i * batch_size, (i + 1) * batch_size) % n],) for i in range(runs)]
+
+
+def bench_stages(blobs: list, batch_sizes: list, runs: int, timings: dict) -> int:
+    """
+    Time generate_embeddings.py's per-card stages, torch inference and JSON serialization.
+    Returns torch's intra-op thread count.
+    """
+    import torch
+
+    from generate_embeddings import (AUGMENT_COUNT, AUGMENT_SEED, AUGMENTATIONS, EMBEDDING_DIM, IMAGENET_MEAN,
+                                     IMAGENET_STD, INPUT_SIZE, MODEL_ID, compute_hsv_histogram, compute_spatial_color,
+                                     crop_artwork, crop_store_config, decode_image, generate_augmented_inputs,
+                                     images_to_tensor, images_to_uint8, letterbox, letterbox_geometry, load_model,
+                                     uint8_to_input)
+    from ml.augment import augment_batch
+    from ml.cache import hash_bytes
+    from ml.crops import CropStore
+
+    images = [decode_image(b) for b in blobs]
+    arts = [crop_artwork(img) for img in images]
+    boxed = [letterbox(art) for art in arts]
+
+    stages = [
+        ("decode", decode_image, [(b,) for b in blobs]),
+        ("crop_artwork", crop_artwork, [(img,) for img in images]),
+        ("letterbox", letterbox, [(art,) for art in arts]),
+        ("histogram", lambda img: compute_hsv_histogram(img, letterboxed=True), [(img,) for img in boxed]),
+        ("spatial", compute_spatial_color, [(art,) for art in arts]),
+        ("augment_pil", generate_augmented_inputs, [(art,) for art in arts]),
+    ]
+    for name, fn, args_list in stages:
+        timings[f"stage/{name}"] = time_calls(fn, args_list)
+        print(f"  {name:<18} {timings[f'stage/{name}']['medianMs']:>9.3f} ms")
+
+    # What the tensor engine does instead of decode + crop_artwork + letterbox when the crop is cached
+    with tempfile.TemporaryDirectory() as root:
+        store = CropStore(crop_store_config(), INPUT_SIZE, Path(root), writable=True)
+        with store.writing():
+            for i, (blob, art, img) in enumerate(zip(blobs, arts, boxed)):
+                scale, box = letterbox_geometry(*art.size)
+                store.add(f"BENCH-{i:03d}", hash_bytes(blob), np.asarray(img), box, scale,
+                          np.asarray(compute_spatial_color(art), dtype=np.float32))
+        reader = CropStore(crop_store_config(), INPUT_SIZE, Path(root))
+        timings["stage/crop_store"] = time_calls(lambda row: np.array(reader.crop(row)),
+                                                 [(i,) for i in range(len(blobs))])
+        print(f"  {'crop_store':<18} {timings['stage/crop_store']['medianMs']:>9.3f} ms")
+
+    def augment_tensor(base, art):
+        scale, box = letterbox_geometry(*art.size)
+        return augment_batch(base, box, scale, IMAGENET_MEAN, IMAGENET_STD, AUGMENT_SEED,
+                             AUGMENTATIONS[:AUGMENT_COUNT])
+
+    bases = [images_to_uint8([img])[0] for img in boxed]
+    timings["stage/augment_tensor"] = time_calls(augment_tensor, list(zip(bases, arts)))
+    print(f"  {'augment_tensor':<18} {timings['stage/augment_tensor']['medianMs']:>9.3f} ms")
+
+    # Only the first cards' augmentations are kept in memory for the tensor and inference stages
+    augmented = [generate_augmented_inputs(art) for art in arts[:4]]
+    cpu = torch.device("cpu")
+    timings["stage/images_to_tensor"] = time_calls(lambda imgs: images_to_tensor(imgs, cpu),
+                                                   [(imgs,) for imgs in augmented], items_per_call=AUGMENT_COUNT)
+    print(f"  {'images_to_tensor':<18} {timings['stage/images_to_tensor']['medianMs']:>9.3f} ms")
+
+    model = load_model(cpu)
+    inputs = uint8_to_input(images_to_uint8([img for imgs in augmented for img in imgs]))
+
+    def infer(batch):
+        with torch.no_grad():
+            return model(torch.from_numpy(batch))
+
+    for batch_size in batch_sizes:
+        name = f"stage/inference/b{batch_size}"
+        timings[name] = time_calls(infer, _batches(inputs, batch_size, runs), items_per_call=batch_size)
+        print(f"  {f'inference b{batch_size}':<18} {timings[name]['medianMs']:>9.3f} ms "
+              f"({timings[name]['perItemMs']:.3f} ms/img, {torch.get_num_threads()} threads)")
+
+    # A database of the corpus cards as generate_embeddings.py writes it (centroids are random here)
+    rng = np.random.default_rng(0)
+    db = {
+        "version": "1.0.0",
+        "model": MODEL_ID,
+        "embeddingDim": EMBEDDING_DIM,
+        "cardCount": len(arts),
+        "entries": [{"cardCode": f"BENCH-{i:03d}",
+                     "embedding": rng.standard_normal(EMBEDDING_DIM).tolist(),
+                     "histogram": compute_hsv_histogram(img, letterboxed=True),
+                     "dhash": compute_spatial_color(art)}
+                    for i, (art, img) in enumerate(zip(arts, boxed))],
+    }
+    timings["stage/json_serialize"] = time_calls(json.dumps, [(db,)] * runs, items_per_call=len(arts))
+    print(f"  {'json_serialize':<18} {timings['stage/json_serialize']['medianMs']:>9.3f} ms "
+          f"({len(arts)} cards)")
+    return torch.get_num_threads()
+
+
+# ─── ONNX Models ────────────────────────────────────────────────────────────
+
+def model_feeds(session, crops: np.ndarray, boxes: np.ndarray) -> dict:
+    """Per-input arrays for every row of the corpus, by the model's input names (see export_onnx.py)."""
+    from generate_embeddings import uint8_to_input
+
+    feeds = {}
+    for model_input in session.get_inputs():
+        if model_input.name == "input":
+            feeds["input"] = uint8_to_input(crops)
+        elif model_input.name == "pixels":
+            alpha = np.full(crops.shape[:3] + (1,), 255, dtype=np.uint8)
+            feeds["pixels"] = np.concatenate([crops, alpha], axis=3)
+        elif model_input.name == "box":
+            feeds["box"] = boxes
+        else:
+            raise ValueError(f"Unknown model input {model_input.name!r}")
+    return feeds
+
+
+def bench_models(models: list, blobs: list, batch_sizes: list, threads: list, runs: int, timings: dict):
+    """Time each model on batches of corpus crops for every batch size x intra-op thread count."""
+    import onnxruntime as ort
+
+    from generate_embeddings import crop_artwork, decode_image, images_to_uint8, letterbox, letterbox_geometry
+
+    arts = [crop_artwork(decode_image(b)) for b in blobs]
+    crops = images_to_uint8([letterbox(art) for art in arts])
+    boxes = np.asarray([letterbox_geometry(*art.size)[1] for art in arts], dtype=np.int32)
+
+    for path in models:
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"\n  {path.name} ({size_mb:.1f} MB)")
+        for thread_count in threads:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = thread_count
+            options.inter_op_num_threads = 1
+            session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+            feeds = model_feeds(session, crops, boxes)
+            names = list(feeds)
+            columns = [feeds[name] for name in names]
+            for batch_size in batch_sizes:
+                batches = [tuple(col[idx] for col in columns)
+                           for (idx,) in _batches(np.arange(len(crops)), batch_size, runs)]
+                stats = time_calls(lambda *arrays: session.run(None, dict(zip(names, arrays))), batches,
+                                   items_per_call=batch_size)
+                key = f"onnx/{path.name}/b{batch_size}/t{thread_count}"
+                timings[key] = {**stats, "sizeMB": size_mb}
+                print(f"    batch {batch_size:>3}, {thread_count} threads: {stats['medianMs']:>9.3f} ms "
+                      f"({stats['perItemMs']:.3f} ms/img)")
+
+
+# ─── Commands ───────────────────────────────────────────────────────────────
+
+def run(args):
+    if not args.corpus.is_dir():
+        print(f"ERROR: corpus directory {args.corpus} not found; run generate_embeddings.py to cache images")
+        sys.exit(1)
+    blobs, corpus = load_corpus(args.corpus, args.cards)
+    if not blobs:
+        print(f"ERROR: no images in {args.corpus}")
+        sys.exit(1)
+    print(f"Corpus: {corpus['images']} images from {corpus['directory']} (digest {corpus['digest']})")
+
+    result = new_result(corpus)
+    result["settings"] = {"batchSizes": args.batch_sizes, "threads": args.threads, "runs": args.runs}
+
+    if not args.skip_stages:
+        print("\nPipeline stages (median per call):")
+        result["settings"]["torchThreads"] = bench_stages(blobs, args.batch_sizes, args.runs, result["timings"])
+
+    if not args.skip_models:
+        models = args.models or [MODEL_DIR / name for name in MODEL_NAMES if (MODEL_DIR / name).exists()]
+        if not models:
+            print(f"\nNo exported models in {MODEL_DIR}; run export_onnx.py first")
+        else:
+            print("\nONNX Runtime (CPU execution provider, median per call):")
+            bench_models(models, blobs, args.batch_sizes, args.threads, args.runs, result["timings"])
+
+    # Again, now that the benchmarks have imported the libraries they time (torch, onnxruntime, PIL)
+    result["environment"] = environment()
+    output = args.output or RESULTS_DIR / f"{result['createdAt'].replace(':', '-')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWritten: {output} ({len(result['timings'])} timings)")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline["corpus"]["digest"] != current["corpus"]["digest"]:
+        print("WARNING: the runs used different corpora; timings are not directly comparable")
+    for key in ("platform", "cpuCount", "torch", "onnxruntime"):
+        before = baseline["environment"].get(key)
+        after = current["environment"].get(key)
+        if before != after:
+            print(f"NOTE: {key} differs ({before} -> {after})")
+
+    rows = compare_results(baseline, current, args.threshold, args.min_delta_ms)
+    print(f"\n  {'timing':<52} {'base ms':>9} {'new ms':>9} {'change':>8}")
+    for name, before, after, change, status in rows:
+        flag = {"regression": "  SLOWER", "improvement": "  faster"}.get(status, "")
+        print(f"  {name:<52} {before:>9.3f} {after:>9.3f} {change:>+8.1%}{flag}")
+
+    only_base = sorted(set(baseline["timings"]) - set(current["timings"]))
+    only_new = sorted(set(current["timings"]) - set(baseline["timings"]))
+    if only_base:
+        print(f"\n  Missing from {args.current}: {', '.join(only_base)}")
+    if only_new:
+        print(f"\n  New in {args.current}: {', '.join(only_new)}")
+
+    regressions = [row for row in rows if row[4] == "regression"]
+    if regressions:
+        print(f"\n  WARNING: {len(regressions)} timing(s) slower than the {args.threshold:.0%} threshold")
+        sys.exit(1)
+    print(f"\n  PASS: no timing regressed by more than {args.threshold:.0%}")
+
+
+def main():
+    args = parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+distill_student.py
+
+Trains a small student embedder to reproduce the reference model's embeddings,
+for cheaper per-frame inference in the browser (see ml/distill.py).
+
+Usage:
+    .venv/bin/python scripts/distill_student.py                         # MobileNetV3 Small at 160px
+    .venv/bin/python scripts/distill_student.py --input-size 128 --epochs 20
+    .venv/bin/python scripts/distill_student.py --cards 48 --train-seeds 1   # Quick CPU run
+
+Training data is the generator's own augmentation pipeline (generate_augmented_inputs)
+applied to the cached card art (.cache/card-images) with --train-seeds noise seeds;
+targets are the teacher's embeddings of the same views, PCA-projected when the
+reference databases are (generate_embeddings.py --reduce-dim). Every HOLDOUT_EVERY-th
+augmentation is left out of training (the split of ml.pca.heldout_sweep), so the
+student never sees those transforms. It is then evaluated twice, next to the teacher
+on the same views: on the held-out augmentations (another noise seed) and on the
+synthetic scanner captures of ml/evaluate.py, scoring each view's top-1 card by
+embedding similarity against the generated references. It passes when it loses at
+most --top1-tolerance of the teacher's top-1 on both and needs at least MIN_MAC_RATIO
+times fewer multiply-accumulates per frame.
+
+The student is exported through export_onnx.py's float "input" interface at its
+own input size. Only a passing student is named in public/ml/manifest.json as
+"embedder" ({name, url, inputSize, teacher, ...}); useCardRecognition then runs it
+instead of the default model. generate_embeddings.py keeps the entry while the
+references come from the same teacher model. The manifest's signature pre-filter
+cutoff (ml/signature.py) is recalibrated on captures embedded by both the teacher and
+the student, since the scanner's queries now come from the student.
+
+Output:
+    public/ml/<arch>_<size>.student.onnx   - Student model, "input" (N, 3, S, S) -> "embedding"
+    .cache/distill/<arch>_<size>.pt        - Student weights
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from export_onnx import export_model, load_references, verify_export
+from generate_embeddings import (AUGMENT_COUNT, AUGMENT_SEED, AUGMENTATIONS, DEFAULT_SIGNATURE_CALIBRATION, INPUT_SIZE,
+                                 OUTPUT_DIR, calibrate_signature, crop_artwork, decode_image, generate_augmented_inputs,
+                                 get_cache_path, images_to_uint8, letterbox, load_cards, load_model, read_databases,
+                                 read_manifest, uint8_to_input)
+from ml.cache import atomic_write_bytes
+from ml.distill import (DEFAULT_BATCH_SIZE, DEFAULT_EPOCHS, DEFAULT_LR, DEFAULT_STUDENT_ARCH, DEFAULT_STUDENT_SIZE,
+                        STUDENT_ARCHS, build_student, count_macs, embed, train_student)
+from ml.evaluate import capture_views, evaluate
+from ml.pca import HOLDOUT_EVERY, PCA, PCA_PATH, with_projection
+from ml.scoring import ReferenceSet, manifest_emb_ramp
+from ml.signature import SimHash
+
+WEIGHTS_DIR = Path(".cache/distill")
+
+DEFAULT_TRAIN_SEEDS = 2
+# Augmentation noise seed of the held-out views, disjoint from the training seeds
+HOLDOUT_SEED = AUGMENT_SEED + 10_000
+# Every HOLDOUT_EVERY-th augmentation is only used for evaluation
+TRAIN_AUGMENTATIONS = [a for i, a in enumerate(AUGMENTATIONS[:AUGMENT_COUNT]) if i % HOLDOUT_EVERY]
+HOLDOUT_AUGMENTATIONS = [a for i, a in enumerate(AUGMENTATIONS[:AUGMENT_COUNT]) if not i % HOLDOUT_EVERY]
+
+# Held-out top-1 the student may lose against the teacher
+DEFAULT_TOP1_TOLERANCE = 0.01
+# Teacher MACs per frame over student MACs per frame
+MIN_MAC_RATIO = 3.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill the reference embedder into a smaller student model")
+    parser.add_argument("--arch", choices=STUDENT_ARCHS, default=DEFAULT_STUDENT_ARCH,
+                        help=f"Student architecture (default: {DEFAULT_STUDENT_ARCH})")
+    parser.add_argument("--input-size", type=int, default=DEFAULT_STUDENT_SIZE,
+                        help=f"Student input resolution (default: {DEFAULT_STUDENT_SIZE})")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS,
+                        help=f"Training epochs (default: {DEFAULT_EPOCHS})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Training batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--lr", type=float, default=DEFAULT_LR,
+                        help=f"Peak AdamW learning rate (default: {DEFAULT_LR})")
+    parser.add_argument("--train-seeds", type=int, default=DEFAULT_TRAIN_SEEDS,
+                        help="Augmentation noise seeds per card for training; each adds one view per "
+                             f"augmentation (default: {DEFAULT_TRAIN_SEEDS})")
+    parser.add_argument("--cards", type=int, default=0,
+                        help="Train and evaluate on the first N cached reference cards (default: all)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Torch intra-op threads (default: library choice)")
+    parser.add_argument("--top1-tolerance", type=float, default=DEFAULT_TOP1_TOLERANCE,
+                        help=f"Held-out top-1 the student may lose vs the teacher (default: {DEFAULT_TOP1_TOLERANCE})")
+    parser.add_argument("--pca", type=Path, default=PCA_PATH,
+                        help=f"Projection for --reduce-dim databases (default: {PCA_PATH})")
+    parser.add_argument("--signature-calibration", type=int, metavar="N", default=DEFAULT_SIGNATURE_CALIBRATION,
+                        help="Recalibrate the manifest's signature cutoff on captures of N cached cards per model "
+                             f"(0: drop the cutoff; default: {DEFAULT_SIGNATURE_CALIBRATION})")
+    return parser.parse_args()
+
+
+def build_views(codes: list, seeds: list, augmentations: list, input_size: int, teacher,
+                device: torch.device) -> tuple:
+    """
+    `augmentations` of each card's art for every seed: (codes per view, student uint8 crops
+    at input_size, teacher embeddings of the same views at INPUT_SIZE).
+    """
+    view_codes = []
+    crops = []
+    targets = []
+    for i, code in enumerate(codes):
+        art = crop_artwork(decode_image(get_cache_path(code).read_bytes()))
+        for seed in seeds:
+            crops.append(images_to_uint8(generate_augmented_inputs(art, seed, augmentations, size=input_size)))
+            teacher_views = images_to_uint8(generate_augmented_inputs(art, seed, augmentations))
+            targets.append(embed(teacher, teacher_views, uint8_to_input, device=device))
+            view_codes.extend([code] * len(teacher_views))
+        if (i + 1) % 25 == 0 or i + 1 == len(codes):
+            print(f"  {i + 1}/{len(codes)} cards")
+    return view_codes, np.concatenate(crops), np.concatenate(targets)
+
+
+def build_captures(codes: list, input_size: int, teacher, device: torch.device) -> tuple:
+    """
+    Synthetic scanner captures of each card (ml/evaluate.py), cropped and letterboxed as the
+    scanner does: (codes per view, student uint8 crops at input_size, teacher embeddings).
+    """
+    view_codes = []
+    crops = []
+    teacher_crops = []
+    for code in codes:
+        for _, img in capture_views(decode_image(get_cache_path(code).read_bytes())):
+            art = crop_artwork(img)
+            crops.append(letterbox(art, input_size))
+            teacher_crops.append(letterbox(art))
+            view_codes.append(code)
+    targets = embed(teacher, images_to_uint8(teacher_crops), uint8_to_input, device=device)
+    return view_codes, images_to_uint8(crops), targets
+
+
+def heldout_top1(view_codes: list, embeddings: np.ndarray, refs: ReferenceSet) -> float:
+    queries = [{"cardCode": code, "embedding": e} for code, e in zip(view_codes, embeddings)]
+    return evaluate(queries, refs, use_descriptors=False)["top1"]
+
+
+def main():
+    args = parse_args()
+
+    manifest = read_manifest()
+    ref_codes, ref_embeddings = load_references()
+    if manifest is None or ref_embeddings is None:
+        print(f"ERROR: no reference databases in {OUTPUT_DIR}; run generate_embeddings.py first")
+        sys.exit(1)
+    refs = ReferenceSet(ref_codes, ref_embeddings, emb_ramp=manifest_emb_ramp(manifest))
+    embedding_dim = ref_embeddings.shape[1]
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    teacher = load_model(device)
+    teacher_macs = count_macs(teacher, INPUT_SIZE)
+    if manifest.get("projection"):
+        if not args.pca.exists():
+            print(f"ERROR: the databases are PCA-reduced ({manifest['model']}) but {args.pca} is missing")
+            sys.exit(1)
+        pca = PCA.load(args.pca)
+        if pca.dim != embedding_dim:
+            print(f"ERROR: {args.pca} projects to {pca.dim} dims, the databases have {embedding_dim}")
+            sys.exit(1)
+        teacher = with_projection(teacher, pca)
+
+    codes = [code for code in ref_codes if get_cache_path(code).exists()]
+    if args.cards:
+        codes = codes[:args.cards]
+    if not codes:
+        print("ERROR: no cached card images for the reference cards; run generate_embeddings.py first")
+        sys.exit(1)
+
+    student = build_student(embedding_dim, args.arch)
+    student_macs = count_macs(student, args.input_size)
+    name = f"{args.arch}_{args.input_size}"
+    print(f"Teacher: {manifest['model']} at {INPUT_SIZE}px, {teacher_macs / 1e6:.0f}M MACs")
+    print(f"Student: {args.arch} at {args.input_size}px, {student_macs / 1e6:.0f}M MACs "
+          f"({teacher_macs / student_macs:.1f}x fewer), {embedding_dim}-dim output")
+
+    seeds = [AUGMENT_SEED + s for s in range(args.train_seeds)]
+    print(f"\nBuilding training views ({len(codes)} cards x {len(seeds)} seed(s) x "
+          f"{len(TRAIN_AUGMENTATIONS)} augmentations)...")
+    t0 = time.time()
+    train_codes, train_crops, train_targets = build_views(codes, seeds, TRAIN_AUGMENTATIONS, args.input_size,
+                                                          teacher, device)
+    print(f"  {len(train_codes)} views in {time.time() - t0:.1f}s")
+
+    print(f"\nTraining {name} ({args.epochs} epochs, batch size {args.batch_size})...")
+    train_student(student, train_crops, train_targets, uint8_to_input, args.epochs, args.batch_size, args.lr,
+                  device=device)
+    WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
+    torch.save(student.state_dict(), WEIGHTS_DIR / f"{name}.pt")
+
+    print(f"\nHeld-out evaluation ({len(refs)} references):")
+
+    def compare_top1(label: str, view_codes: list, crops: np.ndarray, teacher_embeddings: np.ndarray) -> tuple:
+        teacher_top1 = heldout_top1(view_codes, teacher_embeddings, refs)
+        student_top1 = heldout_top1(view_codes, embed(student, crops, uint8_to_input, device=device), refs)
+        print(f"  {label} ({len(view_codes)} views): teacher top-1 {teacher_top1:.2%}, "
+              f"student {student_top1:.2%} ({student_top1 - teacher_top1:+.2%})")
+        return teacher_top1, student_top1
+
+    teacher_top1, student_top1 = compare_top1(
+        f"Held-out augmentations ({len(HOLDOUT_AUGMENTATIONS)}), seed {HOLDOUT_SEED}",
+        *build_views(codes, [HOLDOUT_SEED], HOLDOUT_AUGMENTATIONS, args.input_size, teacher, device))
+    teacher_capture_top1, student_capture_top1 = compare_top1(
+        "Scanner captures", *build_captures(codes, args.input_size, teacher, device))
+    mac_ratio = teacher_macs / student_macs
+
+    student = student.cpu().eval()
+    path = OUTPUT_DIR / f"{name}.student.onnx"
+    print()
+    export_model(student, path, args.input_size)
+    if verify_export(student, path, args.input_size, relative=True) is False:
+        sys.exit(1)
+
+    lost = max(teacher_top1 - student_top1, teacher_capture_top1 - student_capture_top1)
+    if lost > args.top1_tolerance or mac_ratio < MIN_MAC_RATIO:
+        print(f"  WARNING: student loses up to {lost:.2%} top-1 vs the teacher "
+              f"(tolerance {args.top1_tolerance:.0%}) at {mac_ratio:.1f}x fewer MACs (threshold {MIN_MAC_RATIO}x); "
+              "manifest not updated")
+        sys.exit(1)
+
+    embedder_name = f"{name}_student"
+    if manifest.get("signature"):
+        # The cutoff was calibrated on the teacher's queries; the scanner now embeds with the student
+        simhash = SimHash.from_json(manifest["signature"])
+        simhash.cutoff = None
+        simhash.calibrated_with = None
+        report = None
+        if args.signature_calibration:
+            infer = lambda model: lambda batch: embed(model, batch, np.asarray, device=next(model.parameters()).device)
+            embedders = [(manifest["model"], infer(teacher), INPUT_SIZE),
+                         (embedder_name, infer(student), args.input_size)]
+            report = calibrate_signature(load_cards(), embedders, args.signature_calibration,
+                                         read_databases(manifest["sets"]), simhash, refs.emb_ramp)
+        else:
+            print("\nSignature cutoff dropped (--signature-calibration 0), the scanner scores every reference")
+        manifest["signature"] = simhash.to_json()
+        if simhash.cutoff is not None:
+            manifest["signature"]["prunedFraction"] = round(report["prunedFraction"], 4)
+
+    manifest["embedder"] = {
+        "name": embedder_name,
+        "url": f"/ml/{path.name}",
+        "inputSize": args.input_size,
+        "embeddingDim": embedding_dim,
+        "teacher": manifest["model"],
+        "macs": student_macs,
+        "teacherMacs": teacher_macs,
+        "heldoutTop1": round(student_top1, 4),
+        "teacherHeldoutTop1": round(teacher_top1, 4),
+        "captureTop1": round(student_capture_top1, 4),
+        "teacherCaptureTop1": round(teacher_capture_top1, 4),
+    }
+    atomic_write_bytes(OUTPUT_DIR / "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+    print(f"  PASS: student matches teacher top-1 within {args.top1_tolerance:.0%} at {mac_ratio:.1f}x fewer MACs; "
+          f"named as the embedder in {OUTPUT_DIR / 'manifest.json'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,27 @@ via ONNX Runtime Web.
 
 Usage:
     .venv/bin/python scripts/export_onnx.py
+    .venv/bin/python scripts/export_onnx.py --pca .cache/pca.npz   # Append generate_embeddings.py --reduce-dim's PCA
+    .venv/bin/python scripts/export_onnx.py --int8 --ort           # Also int8 and ORT-format variants
+    .venv/bin/python scripts/export_onnx.py --rgba-input           # Also a model taking raw RGBA bytes
+    .venv/bin/python scripts/export_onnx.py --descriptor-outputs   # Also embedding + histogram + dhash in one run
 
 Output:
-    public/ml/mobilenet_v3_large.onnx (~22MB)
+    public/ml/mobilenet_v3_large.onnx       (~22MB)
+    public/ml/mobilenet_v3_large.int8.onnx  (--int8, static quantization, see ml/onnx_variants.py)
+    public/ml/mobilenet_v3_large.ort        (--ort, pre-optimized graph; .int8.ort too with --int8)
+    public/ml/mobilenet_v3_large.rgba.onnx  (--rgba-input, uint8 NHWC RGBA "pixels" input)
+    public/ml/mobilenet_v3_large.multi.onnx (--descriptor-outputs, see ml/graph_descriptors.py)
+
+Variants are verified on every cached card image (.cache/card-images) by top-1
+agreement with the fp32 model against the generated reference databases. The
+RGBA model folds the uint8 cast, alpha drop, NHWC->NCHW transpose and ImageNet
+normalization into the graph (the browser detects it by its "pixels" input, see
+onnx-model.ts) and is checked for parity with the float model on card crops.
 """
 
+import argparse
+import json
 import sys
 from pathlib import Path
 
@@ -19,25 +35,93 @@ import numpy as np
 import torch
 import torchvision.models as models
 
+from generate_embeddings import CACHE_DIR, IMAGENET_MEAN, IMAGENET_STD, load_crops, uint8_to_input
+from ml.graph_descriptors import DescriptorHead, parity_cases, verify_descriptor_parity
+from ml.pca import PCA, projection_head
+
 OUTPUT_PATH = Path("public/ml/mobilenet_v3_large.onnx")
+INT8_PATH = OUTPUT_PATH.with_name("mobilenet_v3_large.int8.onnx")
+RGBA_PATH = OUTPUT_PATH.with_name("mobilenet_v3_large.rgba.onnx")
+MULTI_PATH = OUTPUT_PATH.with_name("mobilenet_v3_large.multi.onnx")
+PUBLIC_DIR = OUTPUT_PATH.parent.parent
 
+DEFAULT_CALIBRATION_CARDS = 64
+DEFAULT_PARITY_CARDS = 32
 
-def main():
-    # Load MobileNetV3 Large with ImageNet V2 weights
-    model = models.mobilenet_v3_large(weights=models.MobileNet_V3_Large_Weights.IMAGENET1K_V2)
-    # Keep only the first linear layer of the classifier (960→1280 feature vector)
-    model.classifier = model.classifier[:1]
-    model.eval()
+# Fused RGBA model vs float model, relative to the output magnitude
+RGBA_PARITY_TOLERANCE = 1e-4
+
+# In-graph descriptors vs ml/descriptors.py (same arithmetic, so only float32 storage rounding)
+DESCRIPTOR_PARITY_TOLERANCE = 1e-6
+
+# Variants must pick the same top-1 card as the fp32 model on at least this share of cards
+MIN_TOP1_AGREEMENT = 0.98
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the card embedding model to ONNX")
+    parser.add_argument("--pca", type=Path, default=None,
+                        help="PCA projection saved by generate_embeddings.py --reduce-dim; appended as a "
+                             "final MatMul + Add so the model outputs the reduced embedding")
+    parser.add_argument("--int8", action="store_true",
+                        help=f"Also write {INT8_PATH.name}, static-quantized with calibration on cached card crops")
+    parser.add_argument("--ort", action="store_true",
+                        help="Also write pre-optimized ORT-format (.ort) copies of every exported model")
+    parser.add_argument("--calibration-cards", type=int, default=DEFAULT_CALIBRATION_CARDS,
+                        help=f"Card crops used to calibrate --int8 (default: {DEFAULT_CALIBRATION_CARDS})")
+    parser.add_argument("--calibration-method", choices=["minmax", "entropy", "percentile"], default="minmax",
+                        help="Activation range calibration for --int8 (default: minmax)")
+    parser.add_argument("--rgba-input", action="store_true",
+                        help=f"Also write {RGBA_PATH.name}, taking uint8 RGBA NHWC bytes (ImageData) with "
+                             "preprocessing fused into the graph")
+    parser.add_argument("--parity-cards", type=int, default=DEFAULT_PARITY_CARDS,
+                        help="Cached card crops for the --rgba-input/--descriptor-outputs parity checks "
+                             f"(default: {DEFAULT_PARITY_CARDS})")
+    parser.add_argument("--descriptor-outputs", action="store_true",
+                        help=f"Also write {MULTI_PATH.name}: RGBA \"pixels\" plus content \"box\" inputs, "
+                             "embedding, histogram and dhash outputs from one run")
+    return parser.parse_args()
+
+
+class RgbaInput(torch.nn.Module):
+    """
+    uint8 (N, H, W, 4) RGBA -> float32 (N, 3, H, W) ImageNet-normalized input,
+    i.e. rgbaToNormalizedRgb in preprocess.ts folded into the graph.
+    """
+
+    def __init__(self):
+        super().__init__()
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        self.register_buffer("scale", 1 / (255 * std))
+        self.register_buffer("shift", mean / std)
+
+    def forward(self, pixels: torch.Tensor) -> torch.Tensor:
+        rgb = pixels[..., :3].permute(0, 3, 1, 2).float()
+        return rgb * self.scale - self.shift
+
+
+class MultiOutput(torch.nn.Module):
+    """RGBA frame + content box -> (embedding, histogram, dhash); see ml/graph_descriptors.py."""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.rgba = RgbaInput()
+        self.model = model
+        self.descriptors = DescriptorHead()
+
+    def forward(self, pixels: torch.Tensor, box: torch.Tensor) -> tuple:
+        histogram, dhash = self.descriptors(pixels, box)
+        return self.model(self.rgba(pixels)), histogram, dhash
 
-    # Dummy input: batch of 1, 3 channels, 224x224 (ImageNet-normalized)
-    dummy_input = torch.randn(1, 3, 224, 224)
 
-    # Export to ONNX
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+def export_model(model: torch.nn.Module, path: Path, input_size: int = 224):
+    """Export with the browser's float interface: "input" (N, 3, S, S) ImageNet-normalized -> "embedding"."""
+    path.parent.mkdir(parents=True, exist_ok=True)
     torch.onnx.export(
         model,
-        dummy_input,
-        str(OUTPUT_PATH),
+        torch.randn(1, 3, input_size, input_size),
+        str(path),
         input_names=["input"],
         output_names=["embedding"],
         dynamic_axes={
@@ -46,20 +130,23 @@ def main():
         },
         opset_version=17,
     )
+    print(f"Exported: {path} ({path.stat().st_size / 1024 / 1024:.1f} MB)")
 
-    size_mb = OUTPUT_PATH.stat().st_size / 1024 / 1024
-    print(f"Exported: {OUTPUT_PATH} ({size_mb:.1f} MB)")
 
-    # Verify: compare PyTorch output vs ONNX Runtime output
+def verify_export(model: torch.nn.Module, path: Path, input_size: int = 224, relative: bool = False) -> bool | None:
+    """
+    Compare onnxruntime with PyTorch on a random input; with `relative` the tolerance scales
+    with the output magnitude. Returns None when onnxruntime isn't installed.
+    """
     print("Verifying ONNX vs PyTorch output...")
     try:
         import onnxruntime as ort
     except ImportError:
         print("  onnxruntime not installed, skipping verification")
-        return
+        return None
 
-    session = ort.InferenceSession(str(OUTPUT_PATH))
-    test_input = torch.randn(1, 3, 224, 224)
+    session = ort.InferenceSession(str(path))
+    test_input = torch.randn(1, 3, input_size, input_size)
 
     # PyTorch inference
     with torch.no_grad():
@@ -70,13 +157,222 @@ def main():
 
     max_diff = np.abs(pytorch_out - onnx_out).max()
     mean_diff = np.abs(pytorch_out - onnx_out).mean()
+    print(f"  Output dim: {onnx_out.shape[1]}")
     print(f"  Max diff: {max_diff:.2e}")
     print(f"  Mean diff: {mean_diff:.2e}")
 
-    if max_diff < 1e-5:
+    tolerance = 1e-5 if not relative else 1e-5 * max(1.0, float(np.abs(pytorch_out).max()))
+    if max_diff < tolerance:
         print("  PASS: ONNX output matches PyTorch within tolerance")
-    else:
-        print(f"  WARNING: Max diff {max_diff:.2e} exceeds 1e-5 threshold")
+        return True
+    print(f"  WARNING: Max diff {max_diff:.2e} exceeds {tolerance:.0e} threshold")
+    return False
+
+
+def load_references() -> tuple[list, np.ndarray | None]:
+    """Card codes and centroids of the generated reference databases (public/ml/manifest.json)."""
+    manifest_path = OUTPUT_PATH.parent / "manifest.json"
+    if not manifest_path.exists():
+        return [], None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    codes = []
+    embeddings = []
+    for entry in manifest["sets"]:
+        with open(PUBLIC_DIR / entry["embeddingsUrl"].lstrip("/")) as f:
+            db = json.load(f)
+        for e in db["entries"]:
+            codes.append(e["cardCode"])
+            embeddings.append(e["embedding"])
+    return codes, np.asarray(embeddings, dtype=np.float32) if embeddings else None
+
+
+def load_card_crops(codes: list) -> tuple[list, np.ndarray, np.ndarray]:
+    """
+    (N, H, W, 3) uint8 letterboxed art crops, as in generation, for every card of codes
+    with a cached image, plus each crop's (x, y, w, h) content box inside the letterbox.
+    Read from the crop cache (see ml/crops.py) so re-exports don't decode every image again.
+    """
+    return load_crops(codes)
+
+
+def cached_card_codes() -> list:
+    return sorted(p.stem for p in CACHE_DIR.glob("*.jpg"))
+
+
+def export_variants(args) -> bool:
+    """Write the requested int8/ORT variants and verify them. Returns False if verification fails."""
+    from ml.onnx_variants import quantize_int8, save_ort_format, verify_variants
+
+    ref_codes, ref_embeddings = load_references()
+    codes, crops, _ = load_card_crops(ref_codes or cached_card_codes())
+    if not codes:
+        print(f"  No cached card images in {CACHE_DIR}; run generate_embeddings.py first")
+        return False
+    inputs = uint8_to_input(crops)
+
+    variants = {"fp32": OUTPUT_PATH}
+    if args.int8:
+        step = max(1, len(inputs) // max(1, args.calibration_cards))
+        calibration = inputs[::step][:args.calibration_cards]
+        print(f"\nQuantizing to int8 ({len(calibration)} calibration crops, {args.calibration_method})...")
+        quantize_int8(OUTPUT_PATH, INT8_PATH, calibration, args.calibration_method)
+        print(f"  Written: {INT8_PATH} ({INT8_PATH.stat().st_size / 1024 / 1024:.1f} MB)")
+        variants["int8"] = INT8_PATH
+    if args.ort:
+        for name, path in list(variants.items()):
+            ort_path = path.with_suffix(".ort")
+            save_ort_format(path, ort_path)
+            print(f"  Written: {ort_path} ({ort_path.stat().st_size / 1024 / 1024:.1f} MB, optimized graph)")
+            variants[f"{name}.ort"] = ort_path
+
+    if ref_embeddings is None:
+        print("  No reference databases in public/ml; comparing embeddings only")
+    worst = verify_variants(variants, inputs, codes, ref_codes, ref_embeddings)
+    if worst >= MIN_TOP1_AGREEMENT:
+        print(f"  PASS: every variant agrees with fp32 top-1 on at least {MIN_TOP1_AGREEMENT:.0%} of cards")
+        return True
+    print(f"  WARNING: top-1 agreement {worst:.1%} below {MIN_TOP1_AGREEMENT:.0%} threshold")
+    return False
+
+
+def _parity_crops(parity_cards: int) -> tuple[np.ndarray, np.ndarray, str]:
+    """Letterboxed crops and content boxes for parity checks (random frames without cached images)."""
+    codes, crops, boxes = load_card_crops(cached_card_codes()[:parity_cards])
+    if codes:
+        return crops, boxes, f"{len(codes)} card crops"
+    crops = np.random.default_rng(0).integers(0, 256, (4, 224, 224, 3), dtype=np.uint8)
+    boxes = np.tile(np.array([[0, 0, 224, 224]], dtype=np.int32), (len(crops), 1))
+    return crops, boxes, f"{len(crops)} random frames (no cached card images in {CACHE_DIR})"
+
+
+def _rgba(crops: np.ndarray) -> np.ndarray:
+    return np.concatenate([crops, np.full(crops.shape[:3] + (1,), 255, dtype=np.uint8)], axis=3)
+
+
+def check_embedding_parity(fused_out: np.ndarray, crops: np.ndarray) -> bool:
+    """Compare embeddings of a fused-input model with the float model on the same crops."""
+    import onnxruntime as ort
+
+    float_session = ort.InferenceSession(str(OUTPUT_PATH), providers=["CPUExecutionProvider"])
+    float_out = np.concatenate([float_session.run(None, {"input": uint8_to_input(c[None])})[0] for c in crops])
+
+    max_diff = np.abs(float_out - fused_out).max()
+    cos = (float_out * fused_out).sum(axis=1) / (
+        np.linalg.norm(float_out, axis=1) * np.linalg.norm(fused_out, axis=1))
+    print(f"  Embedding max diff: {max_diff:.2e}")
+    print(f"  Embedding min cosine: {cos.min():.7f}")
+
+    tolerance = RGBA_PARITY_TOLERANCE * max(1.0, float(np.abs(float_out).max()))
+    if max_diff < tolerance:
+        print("  PASS: embeddings match the float path within tolerance")
+        return True
+    print(f"  WARNING: Max diff {max_diff:.2e} exceeds {tolerance:.0e} threshold")
+    return False
+
+
+def export_rgba(model: torch.nn.Module, parity_cards: int) -> bool:
+    """Export model behind RgbaInput and check it against the float model. Returns False on mismatch."""
+    import onnxruntime as ort
+
+    fused = torch.nn.Sequential(RgbaInput(), model).eval()
+    torch.onnx.export(
+        fused,
+        torch.randint(0, 256, (1, 224, 224, 4), dtype=torch.uint8),
+        str(RGBA_PATH),
+        input_names=["pixels"],
+        output_names=["embedding"],
+        dynamic_axes={
+            "pixels": {0: "batch"},
+            "embedding": {0: "batch"},
+        },
+        opset_version=17,
+    )
+    print(f"\nExported: {RGBA_PATH} ({RGBA_PATH.stat().st_size / 1024 / 1024:.1f} MB, uint8 RGBA input)")
+
+    crops, _, source = _parity_crops(parity_cards)
+    session = ort.InferenceSession(str(RGBA_PATH), providers=["CPUExecutionProvider"])
+    rgba_out = np.concatenate([session.run(None, {"pixels": p[None]})[0] for p in _rgba(crops)])
+    print(f"Verifying RGBA model vs float path on {source}...")
+    return check_embedding_parity(rgba_out, crops)
+
+
+def export_multi_output(model: torch.nn.Module, parity_cards: int) -> bool:
+    """
+    Export MultiOutput and check its embedding against the float model and its descriptors
+    against ml/descriptors.py. Returns False on mismatch.
+    """
+    import onnxruntime as ort
+
+    torch.onnx.export(
+        MultiOutput(model).eval(),
+        (torch.randint(0, 256, (1, 224, 224, 4), dtype=torch.uint8),
+         torch.tensor([[0, 30, 224, 164]], dtype=torch.int32)),
+        str(MULTI_PATH),
+        input_names=["pixels", "box"],
+        output_names=["embedding", "histogram", "dhash"],
+        dynamic_axes={name: {0: "batch"} for name in ("pixels", "box", "embedding", "histogram", "dhash")},
+        opset_version=17,
+    )
+    print(f"\nExported: {MULTI_PATH} ({MULTI_PATH.stat().st_size / 1024 / 1024:.1f} MB, "
+          "embedding + histogram + dhash outputs)")
+
+    crops, boxes, source = _parity_crops(parity_cards)
+    session = ort.InferenceSession(str(MULTI_PATH), providers=["CPUExecutionProvider"])
+    frames = _rgba(crops)
+    embeddings = np.concatenate([session.run(["embedding"], {"pixels": f[None], "box": b[None]})[0]
+                                 for f, b in zip(frames, boxes)])
+    print(f"Verifying multi-output model on {source}...")
+    ok = check_embedding_parity(embeddings, crops)
+
+    cases = parity_cases(224, list(zip(crops, boxes)))
+    hist_err, dhash_err = verify_descriptor_parity(
+        lambda f, b: session.run(["histogram", "dhash"], {"pixels": f, "box": b}), cases)
+    print(f"  Descriptor parity ({len(cases)} cases incl. descriptor fixture edge cases):")
+    print(f"    Histogram max diff: {hist_err:.2e}")
+    print(f"    Spatial descriptor max diff: {dhash_err:.2e}")
+    if max(hist_err, dhash_err) < DESCRIPTOR_PARITY_TOLERANCE:
+        print("  PASS: in-graph descriptors match ml/descriptors.py")
+        return ok
+    print(f"  WARNING: descriptor diff exceeds {DESCRIPTOR_PARITY_TOLERANCE:.0e} threshold")
+    return False
+
+
+def main():
+    args = parse_args()
+
+    # Load MobileNetV3 Large with ImageNet V2 weights
+    model = models.mobilenet_v3_large(weights=models.MobileNet_V3_Large_Weights.IMAGENET1K_V2)
+    # Keep only the first linear layer of the classifier (960→1280 feature vector)
+    model.classifier = model.classifier[:1]
+    if args.pca is not None:
+        pca = PCA.load(args.pca)
+        model = torch.nn.Sequential(model, projection_head(pca))
+        print(f"Appending PCA projection from {args.pca} "
+              f"(1280 -> {pca.dim}{', whitened' if pca.whiten else ''})")
+    model.eval()
+
+    export_model(model, OUTPUT_PATH)
+
+    # A projection (whitening especially) rescales outputs; compare relative to their magnitude
+    ok = verify_export(model, OUTPUT_PATH, relative=args.pca is not None)
+    if ok is None:
+        if args.int8 or args.ort or args.rgba_input or args.descriptor_outputs:
+            print("ERROR: --int8/--ort/--rgba-input/--descriptor-outputs need onnxruntime (and onnx): "
+                  ".venv/bin/pip install onnx onnxruntime")
+            sys.exit(1)
+        return
+    if not ok:
+        sys.exit(1)
+
+    if (args.int8 or args.ort) and not export_variants(args):
+        sys.exit(1)
+
+    if args.rgba_input and not export_rgba(model, args.parity_cards):
+        sys.exit(1)
+
+    if args.descriptor_outputs and not export_multi_output(model, args.parity_cards):
         sys.exit(1)
 
 
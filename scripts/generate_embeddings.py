@@ -8,13 +8,50 @@ Usage:
     .venv/bin/python scripts/generate_embeddings.py                    # All cards
     .venv/bin/python scripts/generate_embeddings.py --mock             # Mock embeddings
     .venv/bin/python scripts/generate_embeddings.py --gpu              # Force GPU
+    .venv/bin/python scripts/generate_embeddings.py --backend onnxruntime   # Run the browser's ONNX model
+    .venv/bin/python scripts/generate_embeddings.py --check-backends 8      # CI: every backend agrees with torch
+    .venv/bin/python scripts/generate_embeddings.py --no-cache         # Ignore per-card result cache
+    .venv/bin/python scripts/generate_embeddings.py --revalidate       # Re-check cached images (ETag)
+    .venv/bin/python scripts/generate_embeddings.py --resume           # Continue an interrupted run
+    .venv/bin/python scripts/generate_embeddings.py --shard 0/4 --shards-per-host 2   # One of 4 shards, 2 per host
+    .venv/bin/python scripts/generate_embeddings.py merge              # Combine .cache/shards/* into public/ml
+    .venv/bin/python scripts/generate_embeddings.py --batch-size 128   # Larger cross-card batches
+    .venv/bin/python scripts/generate_embeddings.py --binary float16   # Also write compact .bin databases
+    .venv/bin/python scripts/generate_embeddings.py --binary int8 --accuracy-report 40
+    .venv/bin/python scripts/generate_embeddings.py --reduce-dim 128  # PCA to 128 dims (then export_onnx.py --pca)
+    .venv/bin/python scripts/generate_embeddings.py --signature-calibration 300  # Signature cutoff from 300 cards
+    .venv/bin/python scripts/generate_embeddings.py --optimize-augmentations 200   # Search a smaller augmentation set
+    .venv/bin/python scripts/generate_embeddings.py --augment-preset optimized      # ...and generate with it
+    .venv/bin/python scripts/generate_embeddings.py --metrics metrics.json   # Stage timings, RSS, failures
+    .venv/bin/python scripts/generate_embeddings.py --profile          # cProfile + torch profiler traces
+    .venv/bin/python scripts/generate_embeddings.py --watch            # Daemon: refresh public/ml on card edits
 
 Outputs:
-    public/ml/embeddings-KS.json   - Embedding database for Konoha Shidō set
-    public/ml/manifest.json        - Index of all available embeddings
+    public/ml/embeddings-KS.<hash>.json        - Embedding database for Konoha Shidō set
+    public/ml/embeddings-KS.<hash>.float16.bin - Same database in the binary format (--binary, see ml/dbformat.py)
+    public/ml/embeddings-KS.<hash>.ivf.json    - ANN index over the set's embeddings (see ml/ann.py)
+    public/ml/embeddings-all.<hash>.json       - Every set in one database (--bundle)
+    public/ml/manifest.json        - Index of all available embeddings (hashes, sizes, formats, signature
+                                     pre-filter, see ml/signature.py)
+    .cache/pca.npz                 - PCA projection for export_onnx.py --pca (--reduce-dim, see ml/pca.py)
+    .cache/runs/embeddings-KS.jsonl - Checkpoint journal while a set is generated (see ml/journal.py)
+    .cache/crops/                   - Memory-mapped letterboxed art crops (tensor engine, see ml/crops.py)
+    .cache/profile/                 - cProfile stats and torch trace (--profile, see ml/metrics.py)
+    .cache/shards/shard-0-of-4/     - Partial results of --shard 0/4 (journals + shard.json), input to merge
+    scripts/ml/augment_presets.json - Named augmentation subsets (--optimize-augmentations, see ml/augment_search.py)
+
+Database files are named by a hash of their content and never change once written:
+unchanged sets are not rewritten, and files referenced by neither the new nor the
+previous manifest are removed.
+
+torch, torchvision and PIL are imported by the functions that use them: --mock runs
+never import them and start instantly.
 """
 
+from __future__ import annotations
+
 import argparse
+import hashlib
 import json
 import math
 import os
@@ -22,37 +59,75 @@ import random
 import sys
 import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import numpy as np
-import requests
-import torch
-import torchvision.models as models
-import torchvision.transforms.functional as TF
-from PIL import Image, ImageFilter
 from io import BytesIO
 
+from ml.ann import IVFIndex
+from ml.augmentations import (AUGMENTATION_NAMES, AUGMENTATIONS, FULL_PRESET, PRESETS_PATH, load_preset, noise_rng,
+                              save_preset)
+from ml.augment_search import DEFAULT_TOLERANCE as DEFAULT_AUGMENT_TOLERANCE, SEARCH_TOP_K, SubsetScorer, greedy_prune
+from ml.backends import BACKENDS, DEFAULT_ONNX_PATH, InferenceBackend, compare_backends, load_backend
+from ml.cache import EmbeddingCache, atomic_write_bytes, config_digest, hash_bytes
+from ml.crops import CropStore
+from ml.dbformat import (DTYPES as BINARY_DTYPES, SPARSE_HISTOGRAM_DTYPES, decode_database, dense_histogram,
+                         dequantize, encode_database, read_header, signature_words, sparse_histogram)
+from ml.descriptors import (GRID_H, GRID_W, HIST_H_BINS, HIST_S_BINS, HIST_V_BINS, compute_descriptors,
+                            hsv_histograms, spatial_colors)
+from ml.download import DEFAULT_WORKERS as DEFAULT_DOWNLOAD_WORKERS, ImageDownloader, image_cache_path
+from ml.pca import DEFAULT_SWEEP_DIMS, PCA, PCA_PATH, fit_pca, heldout_sweep
+from ml.journal import DEFAULT_JOURNAL_DIR, SetJournal, write_database_json
+from ml.metrics import DEFAULT_PROFILE_DIR, RunMetrics, profile_run
+from ml.pipeline import Prepared, run_batched
+from ml.procpool import SharedMemoryPool
+from ml.scoring import EMB_RAMP, ReferenceSet
+from ml.signature import DEFAULT_MARGIN as DEFAULT_SIGNATURE_MARGIN, SimHash, calibrate_cutoff, cascade_report
+from ml.watch import DEFAULT_WATCH_INTERVAL, InputWatcher, set_fingerprints
+
+if TYPE_CHECKING:  # imported where used, so --mock runs without them
+    import torch
+    from PIL import Image
+
 # ─── Constants ───────────────────────────────────────────────────────────────
 
 EMBEDDING_DIM = 1280
 INPUT_SIZE = 224
 AUGMENT_COUNT = 30
+AUGMENT_SEED = 1337
+MODEL_ID = "mobilenet_v3_large_100_224"
 DATA_PATH = Path("prisma/data/cards.json")
+SHARD_DIR = Path(".cache/shards")
+SHARD_MANIFEST = "shard.json"
 OUTPUT_DIR = Path("public/ml")
+PUBLIC_DIR = OUTPUT_DIR.parent
+# Hex digits of the content hash in database file names (embeddings-KS.<hash>.json)
+CONTENT_HASH_LENGTH = 16
 CACHE_DIR = Path(".cache/card-images")
 
+# Artwork region as (left, top, right, bottom) fractions of the card
+ART_CROP_BOX = (0.08, 0.18, 0.92, 0.62)
+
 # ImageNet normalization
 IMAGENET_MEAN = [0.485, 0.456, 0.406]
 IMAGENET_STD = [0.229, 0.224, 0.225]
 
-# HSV histogram bins
-HIST_H_BINS = 16
-HIST_S_BINS = 8
-HIST_V_BINS = 8
+# Bump when augmentation or descriptor code changes in a way the config below can't see
+PIPELINE_VERSION = 2
+
+# Minimum centroid cosine similarity between the tensor and PIL augmentation engines
+AUGMENT_DRIFT_TOLERANCE = 0.995
+
+# Inference pipeline: rows per forward pass (packed across cards) and preprocessing
+# worker processes (0 = preprocess in-process on a background thread)
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
 
-# Spatial color descriptor grid
-GRID_W = 12
-GRID_H = 12
-DHASH_DIM = GRID_W * GRID_H * 3  # 432
+# Card images read and decoded at a time while filling the crop store
+CROP_CHUNK = 64
+
+# Cached cards whose synthetic captures calibrate the signature pre-filter's cutoff
+DEFAULT_SIGNATURE_CALIBRATION = 100
 
 
 # ─── Argument Parsing ────────────────────────────────────────────────────────
@@ -63,13 +138,119 @@ def parse_args():
                         help="Generate random mock embeddings")
     parser.add_argument("--gpu", action="store_true",
                         help="Force GPU usage (default: auto-detect)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="torch: eager float32; torch-opt: inference mode, channels_last, torch.compile; "
+                             f"onnxruntime: {DEFAULT_ONNX_PATH} on the CPU, as in the browser (default: torch)")
+    parser.add_argument("--bf16", action="store_true",
+                        help="bfloat16 autocast for --backend torch-opt (faster on CPUs with bf16 support)")
+    parser.add_argument("--onnx-model", type=Path, default=DEFAULT_ONNX_PATH,
+                        help=f"Model run by --backend onnxruntime (default: {DEFAULT_ONNX_PATH})")
+    parser.add_argument("--check-backends", type=int, metavar="N", default=0,
+                        help="Embed N cached cards with every backend, check they agree with torch and exit")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Recompute every card instead of reusing cached per-card results")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continue an interrupted run from its checkpoint journals ({DEFAULT_JOURNAL_DIR})")
+    parser.add_argument("--shard", metavar="I/N", default=None,
+                        help="Generate only shard I (0-based) of N contiguous (set, id) ranges into "
+                             f"{SHARD_DIR}/shard-I-of-N; combine shards with the merge subcommand")
+    parser.add_argument("--shard-dir", type=Path, default=SHARD_DIR,
+                        help=f"Where --shard writes its partial results (default: {SHARD_DIR})")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Torch/onnxruntime intra-op threads (default: all cores; under --shard, "
+                             "cores / --shards-per-host)")
+    parser.add_argument("--shards-per-host", type=int, default=1, metavar="K",
+                        help="--shard runs sharing this host; each defaults to cores / K threads so they "
+                             "don't oversubscribe it (default: 1)")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Revalidate cached images with conditional GETs (ETag/Last-Modified)")
+    parser.add_argument("--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help=f"Concurrent image downloads (default: {DEFAULT_DOWNLOAD_WORKERS})")
+    parser.add_argument("--image-base-url", default=None,
+                        help="Base URL for relative imageUrl paths (default: $NEXT_PUBLIC_STORAGE_URL)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Model batch size, packed across cards (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--augment-engine", choices=["pil", "tensor"], default="pil",
+                        help="pil: per-image PIL augmentations; tensor: letterbox once, batched tensor ops")
+    parser.add_argument("--check-augment-drift", type=int, metavar="N", default=0,
+                        help="Compare tensor vs PIL augmentation engines on N cached cards and exit")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Preprocessing worker processes; 0 preprocesses in-process "
+                             f"(default: {DEFAULT_WORKERS}, output is identical either way)")
+    parser.add_argument("--binary", choices=BINARY_DTYPES, default=None,
+                        help="Also write embeddings-<SET>.<hash>.<dtype>.bin with float32/float16/int8 arrays "
+                             "(advertised in manifest.json, preferred by the browser loader)")
+    parser.add_argument("--histogram-dtype", choices=SPARSE_HISTOGRAM_DTYPES, default="float32",
+                        help="Values of the sparse histograms in JSON databases: float32 (exact) or uint16 "
+                             "codes (smaller, see ml/dbformat.py)")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Also write every set as one embeddings-all.<hash> database, loaded in one request")
+    parser.add_argument("--no-ann", action="store_true",
+                        help="Skip the per-set IVF index (see ml/ann.py)")
+    parser.add_argument("--accuracy-report", type=int, metavar="N", default=0,
+                        help="After generation, compare binary formats against the JSON database "
+                             "on synthetic scanner captures of N cached cards")
+    parser.add_argument("--signature-calibration", type=int, metavar="N", default=DEFAULT_SIGNATURE_CALIBRATION,
+                        help="Calibrate the signature pre-filter's Hamming cutoff on synthetic captures of N "
+                             "cached cards and check it on held-out ones; 0 writes signatures without a cutoff "
+                             f"(see ml/signature.py, default: {DEFAULT_SIGNATURE_CALIBRATION})")
+    parser.add_argument("--reduce-dim", type=int, metavar="K", default=0,
+                        help="Project embeddings to K dims with PCA fitted on every card's augmented "
+                             f"embeddings; saves {PCA_PATH} for export_onnx.py --pca and reports "
+                             "held-out accuracy for several K")
+    parser.add_argument("--whiten", action="store_true",
+                        help="Whiten the --reduce-dim projection (unit variance per component)")
+    parser.add_argument("--augment-preset", default=FULL_PRESET,
+                        help=f"Named augmentation subset from {PRESETS_PATH.name} (default: {FULL_PRESET}, "
+                             f"all {AUGMENT_COUNT})")
+    parser.add_argument("--optimize-augmentations", type=int, metavar="N", default=0,
+                        help="Search the smallest augmentation subset keeping top-1/top-5 accuracy on "
+                             "synthetic captures of N cached cards, save it as --preset-name and exit")
+    parser.add_argument("--preset-name", default="optimized",
+                        help="Preset written by --optimize-augmentations (default: optimized)")
+    parser.add_argument("--augment-tolerance", type=float, default=DEFAULT_AUGMENT_TOLERANCE,
+                        help="Top-1/top-5 accuracy the --optimize-augmentations subset may lose "
+                             f"(default: {DEFAULT_AUGMENT_TOLERANCE})")
+    parser.add_argument("--metrics", type=Path, metavar="PATH", default=None,
+                        help="Write per-stage and per-card timings, throughput, peak RSS and failed cards "
+                             "as JSON (see ml/metrics.py)")
+    parser.add_argument("--profile", type=Path, metavar="DIR", nargs="?", const=DEFAULT_PROFILE_DIR, default=None,
+                        help=f"Run under cProfile and the torch profiler, writing traces to DIR "
+                             f"(default {DEFAULT_PROFILE_DIR})")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"Keep running with the model loaded; when {DATA_PATH} or {CACHE_DIR} change, "
+                             "regenerate the affected sets and refresh public/ml (see ml/watch.py)")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help=f"Seconds between --watch polls (default: {DEFAULT_WATCH_INTERVAL})")
     return parser.parse_args()
 
 
+def parse_merge_args(argv: list):
+    parser = argparse.ArgumentParser(prog="generate_embeddings.py merge",
+                                     description="Combine --shard outputs into public/ml databases and manifest")
+    parser.add_argument("shards", type=Path, nargs="*",
+                        help=f"Shard directories (default: every {SHARD_DIR}/shard-*)")
+    parser.add_argument("--binary", choices=BINARY_DTYPES, default=None,
+                        help="Also write embeddings-<SET>.<hash>.<dtype>.bin with float32/float16/int8 arrays")
+    parser.add_argument("--histogram-dtype", choices=SPARSE_HISTOGRAM_DTYPES, default="float32",
+                        help="Values of the sparse histograms in JSON databases: float32 (exact) or uint16 "
+                             "codes (smaller, see ml/dbformat.py)")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Also write every set as one embeddings-all.<hash> database")
+    parser.add_argument("--no-ann", action="store_true",
+                        help="Skip the per-set IVF index")
+    parser.add_argument("--allow-changed-cards", action="store_true",
+                        help=f"Merge even if {DATA_PATH} changed since the shards ran (cards no shard "
+                             "covered are left out of the databases)")
+    return parser.parse_args(argv)
+
+
 # ─── Model Loading ───────────────────────────────────────────────────────────
 
 def load_model(device: torch.device):
     """Load MobileNetV3 Large as a feature extractor (1280-dim output)."""
+    import torchvision.models as models
+
     model = models.mobilenet_v3_large(weights=models.MobileNet_V3_Large_Weights.IMAGENET1K_V2)
     # Remove the final classification head, keep only the first linear (960→1280)
     model.classifier = model.classifier[:1]
@@ -82,421 +263,1462 @@ def load_model(device: torch.device):
 
 def get_cache_path(card_id: str) -> Path:
     """Return the local cache path for a card image."""
-    return CACHE_DIR / f"{card_id}.jpg"
+    return image_cache_path(CACHE_DIR, card_id)
+
+
+_downloader: ImageDownloader | None = None
+
+
+def get_downloader(**kwargs) -> ImageDownloader:
+    """Shared downloader so every fetch reuses one connection pool. kwargs reconfigure it."""
+    global _downloader
+    if _downloader is None or kwargs:
+        _downloader = ImageDownloader(CACHE_DIR, **kwargs)
+    return _downloader
+
+
+def load_image_bytes(card_id: str, url: str) -> bytes:
+    """Load raw card image bytes from local cache, downloading if not cached."""
+    return get_downloader().fetch_bytes(card_id, url)
 
 
 def load_image(card_id: str, url: str) -> Image.Image:
     """Load a card image from local cache, downloading if not cached."""
-    cached = get_cache_path(card_id)
-    if cached.exists():
-        return Image.open(cached).convert("RGB")
+    return decode_image(load_image_bytes(card_id, url))
 
-    # Download and cache
-    response = requests.get(url, timeout=30)
-    response.raise_for_status()
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    cached.write_bytes(response.content)
-    return Image.open(BytesIO(response.content)).convert("RGB")
 
+def decode_image(data: bytes) -> Image.Image:
+    from PIL import Image
 
-def download_all_images(cards: list):
-    """Download all card images to local cache. Skip already cached."""
-    total = len(cards)
-    cached = 0
-    failed = 0
-    cards_to_download = []
+    return Image.open(BytesIO(data)).convert("RGB")
 
-    for card in cards:
-        url = card.get("imageUrl")
-        if not url:
-            continue
-        if get_cache_path(card["id"]).exists():
-            cached += 1
-        else:
-            cards_to_download.append(card)
 
-    if cards_to_download:
-        print(f"  Downloading {len(cards_to_download)} images...")
-        for card in cards_to_download:
-            try:
-                sys.stdout.write(f"    {card['id']}... ")
-                sys.stdout.flush()
-                response = requests.get(card["imageUrl"], timeout=30)
-                response.raise_for_status()
-                path = get_cache_path(card["id"])
-                CACHE_DIR.mkdir(parents=True, exist_ok=True)
-                path.write_bytes(response.content)
-                sys.stdout.write("OK\n")
-            except Exception as e:
-                failed += 1
-                sys.stdout.write(f"FAILED ({e})\n")
+def download_all_images(cards: list, downloader: ImageDownloader, revalidate: bool = False):
+    """Download all card images to local cache concurrently. Skip (or revalidate) already cached."""
+    total = len(cards)
+    print(f"  Fetching {total} images ({downloader.workers} workers"
+          f"{', revalidating cache' if revalidate else ''})...")
+    counts = downloader.download_all(cards, revalidate=revalidate)
 
-    downloaded = total - cached - failed
-    print(f"\nImages: {total} total, {cached} already cached, {downloaded} downloaded, {failed} failed")
+    print(f"\nImages: {total} total, {counts['cached']} already cached, "
+          f"{counts['not-modified']} not modified, {counts['downloaded']} downloaded, "
+          f"{counts['failed']} failed")
 
 
 def crop_artwork(img: Image.Image) -> Image.Image:
     """Crop to artwork region (18%-62% V, 8%-92% H) for Naruto Mythos cards."""
     w, h = img.size
-    left = round(w * 0.08)
-    right = round(w * 0.92)
-    top = round(h * 0.18)
-    bottom = round(h * 0.62)
+    box_left, box_top, box_right, box_bottom = ART_CROP_BOX
+    left = round(w * box_left)
+    right = round(w * box_right)
+    top = round(h * box_top)
+    bottom = round(h * box_bottom)
     return img.crop((left, top, right, bottom))
 
 
-def letterbox(img: Image.Image, size: int = INPUT_SIZE) -> Image.Image:
-    """Resize with letterboxing (gray padding) to target size."""
-    w, h = img.size
+def letterbox_geometry(w: int, h: int, size: int = INPUT_SIZE) -> tuple:
+    """Return (scale, (paste_x, paste_y, new_w, new_h)) for letterboxing a w x h image."""
     scale = min(size / w, size / h)
     new_w = round(w * scale)
     new_h = round(h * scale)
+    paste_x = (size - new_w) // 2
+    paste_y = (size - new_h) // 2
+    return scale, (paste_x, paste_y, new_w, new_h)
+
+
+def letterbox(img: Image.Image, size: int = INPUT_SIZE) -> Image.Image:
+    """Resize with letterboxing (gray padding) to target size."""
+    from PIL import Image
+
+    _, (paste_x, paste_y, new_w, new_h) = letterbox_geometry(*img.size, size)
     resized = img.resize((new_w, new_h), Image.LANCZOS)
 
     result = Image.new("RGB", (size, size), (128, 128, 128))
-    paste_x = (size - new_w) // 2
-    paste_y = (size - new_h) // 2
     result.paste(resized, (paste_x, paste_y))
     return result
 
 
-# ─── HSV Histogram ───────────────────────────────────────────────────────────
+# ─── Color Descriptors ───────────────────────────────────────────────────────
 
-def compute_hsv_histogram(img: Image.Image) -> list:
+def compute_hsv_histogram(img: Image.Image, letterboxed: bool = False) -> list:
     """
-    Compute normalized HSV histogram from image.
+    Compute normalized HSV histogram from the letterboxed image (see ml/descriptors.py).
     16x8x8 = 1024 bins. Skip dark pixels (V<0.1) and desaturated bright pixels (S<0.1 & V>0.6).
+    Pass letterboxed=True when img already is the letterboxed crop to skip the resize.
     """
-    resized = letterbox(img, INPUT_SIZE)
-    pixels = np.array(resized, dtype=np.float32) / 255.0  # (224, 224, 3)
-    r, g, b = pixels[:, :, 0], pixels[:, :, 1], pixels[:, :, 2]
+    resized = img if letterboxed else letterbox(img, INPUT_SIZE)
+    return hsv_histograms(np.asarray(resized.convert("RGB")))[0].tolist()
 
-    cmax = np.maximum(np.maximum(r, g), b)
-    cmin = np.minimum(np.minimum(r, g), b)
-    delta = cmax - cmin
 
-    # Saturation
-    with np.errstate(invalid='ignore'):
-        s = np.where(cmax == 0, 0, delta / cmax)
-    v = cmax
+def compute_spatial_color(img: Image.Image) -> list:
+    """
+    Compute spatial color descriptor (12x12x3 = 432 dims).
+    Mean-center + L2-normalize. Matches dhash.ts computeDHashFromRgb.
+    """
+    return spatial_colors(np.asarray(img.convert("RGB")))[0].tolist()
 
-    # Hue
-    h = np.zeros_like(cmax)
-    mask_r = (cmax == r) & (delta > 0)
-    mask_g = (cmax == g) & (delta > 0)
-    mask_b = (cmax == b) & (delta > 0)
-    h[mask_r] = 60 * (((g[mask_r] - b[mask_r]) / delta[mask_r]) % 6)
-    h[mask_g] = 60 * ((b[mask_g] - r[mask_g]) / delta[mask_g] + 2)
-    h[mask_b] = 60 * ((r[mask_b] - g[mask_b]) / delta[mask_b] + 4)
-    h[h < 0] += 360
 
-    # Skip mask
-    valid = ~((v < 0.1) | ((s < 0.1) & (v > 0.6)))
+# ─── Augmentations ───────────────────────────────────────────────────────────
 
-    total_bins = HIST_H_BINS * HIST_S_BINS * HIST_V_BINS
-    histogram = np.zeros(total_bins, dtype=np.float32)
+def generate_augmented_inputs(art_img: Image.Image, seed: int = AUGMENT_SEED,
+                              augmentations: list | None = None, size: int = INPUT_SIZE) -> list:
+    """
+    Generate augmented versions of the artwork image (see ml/augment.py), by default
+    the first AUGMENT_COUNT. Returns list of PIL Images (letterboxed to `size`).
+    Noise is drawn from a generator seeded by (seed, augmentation index in AUGMENTATIONS),
+    so output is deterministic and the same for an augmentation in any preset.
+    """
+    from ml.augment import apply_pil
 
-    h_valid = h[valid]
-    s_valid = s[valid]
-    v_valid = v[valid]
+    augmentations = AUGMENTATIONS[:AUGMENT_COUNT] if augmentations is None else augmentations
+    boxed = lambda img: letterbox(img, size)
+    return [
+        apply_pil(art_img, augmentation, boxed, noise_rng(seed, AUGMENTATION_NAMES.index(augmentation[0])))
+        for augmentation in augmentations
+    ]
 
-    h_bins = np.clip((h_valid / 360 * HIST_H_BINS).astype(int), 0, HIST_H_BINS - 1)
-    s_bins = np.clip((s_valid * HIST_S_BINS).astype(int), 0, HIST_S_BINS - 1)
-    v_bins = np.clip((v_valid * HIST_V_BINS).astype(int), 0, HIST_V_BINS - 1)
 
-    indices = h_bins * HIST_S_BINS * HIST_V_BINS + s_bins * HIST_V_BINS + v_bins
-    np.add.at(histogram, indices, 1)
+def images_to_tensor(images: list, device: torch.device) -> torch.Tensor:
+    """Convert list of PIL Images to a batched tensor with ImageNet normalization."""
+    import torch
+    import torchvision.transforms.functional as TF
 
-    counted = valid.sum()
-    if counted > 0:
-        histogram /= counted
+    tensors = []
+    for img in images:
+        t = TF.to_tensor(img)  # (3, H, W), [0, 1]
+        t = TF.normalize(t, IMAGENET_MEAN, IMAGENET_STD)
+        tensors.append(t)
+    return torch.stack(tensors).to(device)
 
-    return histogram.tolist()
 
+def images_to_uint8(images: list) -> np.ndarray:
+    """Stack PIL Images into a (N, H, W, 3) uint8 array."""
+    return np.stack([np.asarray(img, dtype=np.uint8) for img in images])
 
-# ─── Spatial Color Descriptor ────────────────────────────────────────────────
 
-def compute_spatial_color(img: Image.Image) -> list:
-    """
-    Compute spatial color descriptor (12x12x3 = 432 dims).
-    Mean-center + L2-normalize. Matches dhash.ts computeDHashFromRgb.
-    """
-    pixels = np.array(img, dtype=np.float32)  # (H, W, 3)
-    h, w = pixels.shape[:2]
-    descriptor = np.zeros(DHASH_DIM, dtype=np.float32)
+# ─── Crop Cache ──────────────────────────────────────────────────────────────
 
-    cell_w = w / GRID_W
-    cell_h = h / GRID_H
+def crop_store_config() -> dict:
+    """Settings that change a stored crop or its spatial descriptor."""
+    return {"artCropBox": list(ART_CROP_BOX), "inputSize": INPUT_SIZE, "resample": "lanczos",
+            "grid": [GRID_W, GRID_H]}
 
-    for gy in range(GRID_H):
-        for gx in range(GRID_W):
-            start_x = int(gx * cell_w)
-            end_x = min(int((gx + 1) * cell_w), w)
-            start_y = int(gy * cell_h)
-            end_y = min(int((gy + 1) * cell_h), h)
 
-            cell = pixels[start_y:end_y, start_x:end_x]
-            count = cell.shape[0] * cell.shape[1]
-            if count > 0:
-                offset = (gy * GRID_W + gx) * 3
-                descriptor[offset] = cell[:, :, 0].mean() / 255
-                descriptor[offset + 1] = cell[:, :, 1].mean() / 255
-                descriptor[offset + 2] = cell[:, :, 2].mean() / 255
+_crop_store: CropStore | None = None
 
-    # Mean-center
-    mean = descriptor.mean()
-    descriptor -= mean
 
-    # L2-normalize
-    norm = np.linalg.norm(descriptor)
-    if norm > 0:
-        descriptor /= norm
+def get_crop_store() -> CropStore:
+    """This process's read-only view of the crop store (reopened by each worker process)."""
+    global _crop_store
+    if _crop_store is None:
+        _crop_store = CropStore(crop_store_config(), INPUT_SIZE)
+    return _crop_store
 
-    return descriptor.tolist()
 
+def _letterboxed_crop(image_bytes: bytes) -> tuple:
+    """(letterboxed uint8 crop, box, scale, spatial descriptor) of one card image."""
+    art_img = crop_artwork(decode_image(image_bytes))
+    scale, box = letterbox_geometry(*art_img.size)
+    return np.asarray(letterbox(art_img)), box, scale, spatial_colors(np.asarray(art_img))[0]
 
-# ─── Augmentations ───────────────────────────────────────────────────────────
 
-def add_gaussian_noise(img: Image.Image, sigma: float) -> Image.Image:
-    """Add Gaussian noise to simulate webcam sensor noise."""
-    arr = np.array(img, dtype=np.float32)
-    noise = np.random.normal(0, sigma, arr.shape)
-    arr = np.clip(arr + noise, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
+def update_crop_store(cards: list, workers: int = DEFAULT_WORKERS) -> CropStore:
+    """
+    Add the crops of cached card images that are missing or whose image changed, holding
+    the store's write lock (see ml/crops.py). Cards are read, hashed and decoded
+    CROP_CHUNK at a time, so filling the store never holds the whole image cache in RAM.
+    Decoding runs on a thread pool (PIL releases the GIL while decoding and resizing).
+    """
+    global _crop_store
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = CropStore(crop_store_config(), INPUT_SIZE, writable=True)
+    paths = [(card["id"], get_cache_path(card["id"])) for card in cards]
+    paths = [(card_id, path) for card_id, path in paths if path.exists()]
+    added = 0
+    t0 = time.time()
+    with store.writing(), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for start in range(0, len(paths), CROP_CHUNK):
+            todo = []
+            for card_id, path in paths[start:start + CROP_CHUNK]:
+                data = path.read_bytes()
+                image_hash = hash_bytes(data)
+                if store.lookup(card_id, image_hash) is None:
+                    todo.append((card_id, image_hash, data))
+            for (card_id, image_hash, _), (crop, box, scale, spatial) in zip(
+                    todo, executor.map(lambda item: _letterboxed_crop(item[2]), todo)):
+                store.add(card_id, image_hash, crop, box, scale, spatial)
+            if todo:
+                store.flush()
+                added += len(todo)
+
+    if added:
+        _crop_store = None  # this process's reader view predates the new rows
+        print(f"  Crop cache: {added} crops added in {time.time() - t0:.1f}s "
+              f"({len(store)} cached in {store.dir})")
+    return store
+
+
+def load_crops(codes: list, workers: int = DEFAULT_WORKERS) -> tuple[list, np.ndarray, np.ndarray]:
+    """
+    (N, H, W, 3) uint8 letterboxed art crops, as in generation, for every card of codes
+    with a cached image, plus each crop's (x, y, w, h) content box inside the letterbox.
+    Served from the crop store, which is filled first for new or changed images.
+    """
+    store = update_crop_store([{"id": code} for code in codes], workers)
+    found = [code for code in codes if store.row(code) is not None and get_cache_path(code).exists()]
+    crops = store.crops([store.row(code) for code in found])
+    boxes = np.asarray([store.geometry(code)[1] for code in found], dtype=np.int32).reshape(-1, 4)
+    return found, crops, boxes
 
 
-def adjust_contrast(img: Image.Image, factor: float) -> Image.Image:
-    """Adjust contrast around midpoint 128."""
-    arr = np.array(img, dtype=np.float32)
-    arr = (arr - 128) * factor + 128
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
+def uint8_to_input(batch: np.ndarray) -> np.ndarray:
+    """
+    (N, H, W, 3) uint8 -> (N, 3, H, W) float32 with ImageNet normalization.
+    Same ops as TF.to_tensor + TF.normalize, so results are bit-identical to images_to_tensor.
+    """
+    import torch
+    import torchvision.transforms.functional as TF
 
+    t = torch.from_numpy(batch).permute(0, 3, 1, 2).contiguous().float().div(255)
+    return TF.normalize(t, IMAGENET_MEAN, IMAGENET_STD).numpy()
 
-def desaturate(img: Image.Image, amount: float) -> Image.Image:
-    """Blend toward grayscale by amount (0=no change, 1=full grayscale)."""
-    arr = np.array(img, dtype=np.float32)
-    gray = 0.299 * arr[:, :, 0] + 0.587 * arr[:, :, 1] + 0.114 * arr[:, :, 2]
-    for c in range(3):
-        arr[:, :, c] = arr[:, :, c] * (1 - amount) + gray * amount
-    arr = np.clip(arr, 0, 255).astype(np.uint8)
-    return Image.fromarray(arr)
 
+# ─── Embedding Generation ───────────────────────────────────────────────────
 
-def generate_augmented_inputs(art_img: Image.Image) -> list:
-    """
-    Generate AUGMENT_COUNT augmented versions of the artwork image.
-    Returns list of PIL Images (letterboxed to INPUT_SIZE).
-    """
-    results = []
+def generate_mock_embedding() -> list:
+    return [random.random() * 2 - 1 for _ in range(EMBEDDING_DIM)]
 
-    def aug_identity(img):
-        return img
 
-    def aug_rotate_cw10(img):
-        return TF.rotate(img, -10, fill=(128, 128, 128))
+def generate_mock_database(set_code: str, cards: list) -> dict:
+    print(f"  [mock] Generating {len(cards)} random {EMBEDDING_DIM}D embeddings for {set_code}...")
+    entries = [{"cardCode": c["id"], "embedding": generate_mock_embedding()} for c in cards]
+    return {
+        "version": "1.0.0",
+        "model": f"{MODEL_ID}_mock",
+        "embeddingDim": EMBEDDING_DIM,
+        "cardCount": len(entries),
+        "generatedAt": _now_iso(),
+        "entries": entries,
+    }
 
-    def aug_rotate_ccw10(img):
-        return TF.rotate(img, 10, fill=(128, 128, 128))
 
-    def aug_bright(img):
-        return TF.adjust_brightness(img, 1.3)
+def pipeline_config(engine: str = "pil", augmentations: list | None = None, backend: str = "torch") -> dict:
+    """
+    Every setting that affects a card's generated result; part of the cache key.
+    The default torch backend adds no key, so existing caches stay valid.
+    """
+    augmentations = AUGMENTATIONS[:AUGMENT_COUNT] if augmentations is None else augmentations
+    config = {
+        "pipelineVersion": PIPELINE_VERSION,
+        "augmentEngine": engine,
+        "augmentations": augmentations,
+        "model": MODEL_ID,
+        "embeddingDim": EMBEDDING_DIM,
+        "inputSize": INPUT_SIZE,
+        "artCropBox": list(ART_CROP_BOX),
+        "augmentCount": len(augmentations),
+        "augmentSeed": AUGMENT_SEED,
+        "imagenetMean": IMAGENET_MEAN,
+        "imagenetStd": IMAGENET_STD,
+        "histBins": [HIST_H_BINS, HIST_S_BINS, HIST_V_BINS],
+        "grid": [GRID_W, GRID_H],
+    }
+    if backend != "torch":
+        config["backend"] = backend
+    return config
 
-    def aug_dark_blur(img):
-        return TF.adjust_brightness(img, 0.7).filter(ImageFilter.GaussianBlur(1.5))
 
-    def aug_hflip(img):
-        return TF.hflip(img)
+def preprocess_card(card: dict, cache: EmbeddingCache | None = None, engine: str = "pil",
+                    keep_augmented: bool = False, augmentations: list | None = None) -> Prepared:
+    """
+    CPU-side work for one card: load, crop, descriptors and augmented images as uint8.
+    With the tensor engine only the letterboxed crop is returned; to_model_input augments it.
+    Returns the cached result directly when the image and pipeline config are unchanged
+    (with keep_augmented, only if the cache also holds the card's augmented embeddings).
+    Runs either in-process or in a --workers process (see ml/procpool.py).
+    """
+    image_bytes = load_image_bytes(card["id"], card["imageUrl"])
+
+    key = None
+    if cache is not None:
+        key = cache.key(image_bytes)
+        cached = cache.get(key)
+        if cached is not None and not keep_augmented:
+            return Prepared(result=cached)
+        if cached is not None:
+            augmented = cache.get_array(key, "augmented")
+            if augmented is not None:
+                return Prepared(result={**cached, "augmented": augmented})
+
+    if engine == "tensor":
+        # Letterboxed crop straight from the memory-mapped crop store when it's current
+        store = get_crop_store()
+        row = store.lookup(card["id"], hash_bytes(image_bytes))
+        if row is not None:
+            boxed = np.array(store.crop(row))
+            scale, box = store.geometry(card["id"])
+            state = {"key": key, "histogram": hsv_histograms(boxed)[0].tolist(),
+                     "dhash": store.spatial(row).tolist(), "engine": engine, "keepAugmented": keep_augmented,
+                     "augmentations": augmentations, "scale": scale, "box": box}
+            return Prepared(inputs=boxed[None], state=state)
+
+    raw_img = decode_image(image_bytes)
+
+    # Crop to artwork region
+    art_img = crop_artwork(raw_img)
+
+    # Compute HSV histogram from letterboxed artwork (letterboxed once, reused by the tensor engine)
+    boxed = letterbox(art_img)
+    histogram = compute_hsv_histogram(boxed, letterboxed=True)
+
+    # Compute spatial color descriptor from art crop
+    dhash = compute_spatial_color(art_img)
+
+    state = {"key": key, "histogram": histogram, "dhash": dhash, "engine": engine,
+             "keepAugmented": keep_augmented, "augmentations": augmentations}
+    if engine == "tensor":
+        # Letterbox once; augmentations are applied as batched tensor ops in to_model_input
+        scale, box = letterbox_geometry(*art_img.size)
+        state.update(scale=scale, box=box)
+        return Prepared(inputs=images_to_uint8([boxed]), state=state)
+
+    # Generate augmented versions as (N, H, W, 3) uint8
+    augmented = images_to_uint8(generate_augmented_inputs(art_img, augmentations=augmentations))
+    return Prepared(inputs=augmented, state=state)
+
+
+def to_model_input(arr: np.ndarray, prepared: Prepared) -> np.ndarray:
+    """Turn preprocess_card's uint8 output into normalized (N, 3, H, W) float32 model input."""
+    if prepared.state["engine"] == "tensor":
+        from ml.augment import augment_batch
+
+        state = prepared.state
+        augmentations = state.get("augmentations") or AUGMENTATIONS[:AUGMENT_COUNT]
+        return augment_batch(arr[0], state["box"], state["scale"], IMAGENET_MEAN, IMAGENET_STD,
+                             AUGMENT_SEED, augmentations).numpy()
+    return uint8_to_input(arr)
+
+
+def prepare_card(card: dict, cache: EmbeddingCache | None = None, engine: str = "pil",
+                 keep_augmented: bool = False, augmentations: list | None = None) -> Prepared:
+    """In-process preparation: preprocess_card followed by conversion to normalized model input."""
+    prepared = preprocess_card(card, cache, engine, keep_augmented, augmentations)
+    if prepared.inputs is not None:
+        prepared.inputs = to_model_input(prepared.inputs, prepared)
+    return prepared
+
+
+def create_preprocess_pool(workers: int, augment_count: int = AUGMENT_COUNT) -> SharedMemoryPool:
+    """Worker processes running preprocess_card, sized to hand back one card's augmentations per slot."""
+    slot_bytes = augment_count * INPUT_SIZE * INPUT_SIZE * 3
+    return SharedMemoryPool(preprocess_card, to_model_input, workers, slot_bytes)
+
+
+def finalize_card(prepared: Prepared, embeddings: np.ndarray, cache: EmbeddingCache | None = None) -> dict:
+    """
+    Average a card's augmented embeddings into its centroid and store the result in the cache.
+    With keepAugmented the (N, D) embeddings are kept too (cache sidecar + result["augmented"]).
+    """
+    # Average into centroid (float64 for precision)
+    centroid = embeddings.astype(np.float64).mean(axis=0).tolist()
+    result = {"embedding": centroid, "histogram": prepared.state["histogram"], "dhash": prepared.state["dhash"]}
+    if cache is not None:
+        cache.put(prepared.state["key"], result)
+    if prepared.state.get("keepAugmented"):
+        augmented = embeddings.astype(np.float32)
+        if cache is not None:
+            cache.put_array(prepared.state["key"], "augmented", augmented)
+        result["augmented"] = augmented
+    return result
 
-    def aug_bright_desat(img):
-        return TF.adjust_saturation(TF.adjust_brightness(img, 1.15), 0.85)
 
-    def aug_very_bright(img):
-        return TF.adjust_brightness(img, 1.5)
+def generate_real_database(set_code: str, cards: list, infer: InferenceBackend, journal: SetJournal,
+                           cache: EmbeddingCache | None = None,
+                           batch_size: int = DEFAULT_BATCH_SIZE, pool: SharedMemoryPool | None = None,
+                           engine: str = "pil", augmented: dict | None = None,
+                           augmentations: list | None = None, metrics: RunMetrics | None = None) -> dict:
+    """
+    Build one set's database, streaming each finished card's entry into `journal`
+    (see ml/journal.py); cards already journaled by a resumed run are skipped.
+    Returns the database header; write_database_json adds the journaled entries.
+    When `augmented` is a dict, each card's (N, D) augmented embeddings are stored
+    in it by cardCode (for fitting --reduce-dim's PCA), so every card is processed.
+    With `metrics`, the prepare/forward/finalize steps and card latencies are recorded there.
+    """
+    augmentations = AUGMENTATIONS[:AUGMENT_COUNT] if augmentations is None else augmentations
+    mode = f"{pool.workers} worker processes" if pool is not None else "in-process"
+    print(f"  [real] Processing {set_code} ({len(cards)} cards, {len(augmentations)} augmentations each, "
+          f"batch size {batch_size}, {mode} preprocessing, {engine} augmentation engine)...")
 
-    def aug_very_dark(img):
-        return TF.adjust_brightness(img, 0.5)
+    cards_with_images = []
+    for card in cards:
+        if not card.get("imageUrl"):
+            print(f"  SKIP {card['id']}: no imageUrl")
+        elif card["id"] not in journal or augmented is not None:
+            cards_with_images.append(card)
+    if journal.resumed:
+        print(f"  Resuming {set_code}: {journal.resumed} cards already journaled"
+              f"{' (re-read for --reduce-dim)' if augmented is not None else ''}")
+
+    keep_augmented = augmented is not None
+    if pool is not None:
+        prepare = lambda card: pool(card, cache, engine, keep_augmented, augmentations)
+    else:
+        prepare = lambda card: prepare_card(card, cache, engine, keep_augmented, augmentations)
+    finalize = lambda prepared, embeddings: finalize_card(prepared, embeddings, cache)
+    if metrics is not None:
+        prepare = metrics.timed_prepare(prepare)
+        infer = metrics.timed_infer(infer)
+        finalize = metrics.timed("finalize", finalize)
+
+    outcomes = run_batched(
+        cards_with_images,
+        prepare=prepare,
+        infer=infer,
+        finalize=finalize,
+        batch_size=batch_size,
+        workers=pool.workers if pool is not None else 1,
+    )
+    _, reused = _collect_entries(outcomes, len(cards_with_images), augmented, journal, metrics)
+
+    if cache is not None:
+        print(f"  {set_code}: {reused} cards reused from cache, {len(cards_with_images) - reused} processed")
+    if journal.failed:
+        print(f"  WARNING: {len(journal.failed)} {set_code} card(s) failed and are missing from the database: "
+              f"{', '.join(sorted(journal.failed))} (retried by --resume)")
 
-    def aug_cool(img):
-        return TF.adjust_saturation(TF.adjust_brightness(img, 0.9), 0.8)
+    return {
+        "version": "1.0.0",
+        "model": MODEL_ID,
+        "embeddingDim": EMBEDDING_DIM,
+        "cardCount": 0,
+        "generatedAt": _now_iso(),
+    }
 
-    def aug_warm(img):
-        return TF.adjust_saturation(TF.adjust_brightness(img, 1.2), 1.1)
 
-    def aug_blur(img):
-        return img.filter(ImageFilter.GaussianBlur(2.0))
+def _collect_entries(outcomes, total: int, augmented: dict | None = None,
+                     journal: SetJournal | None = None, metrics: RunMetrics | None = None) -> tuple[list, int]:
+    """
+    Turn pipeline outcomes into database entries, logging progress. Returns (entries, reused);
+    with a journal, entries and failures are checkpointed there instead of returned.
+    """
+    entries = []
+    processed = 0
+    reused = 0
+
+    for outcome in outcomes:
+        card = outcome.item
+        processed += 1
+        sys.stdout.write(f"  Processing {card['id']} ({processed}/{total})... ")
+        if metrics is not None:
+            metrics.card_done(card["id"], outcome.error)
+
+        if outcome.error is not None:
+            sys.stdout.write(f"FAILED ({outcome.error})\n")
+            if journal is not None:
+                journal.add_failure(card["id"], outcome.error)
+            continue
 
-    def aug_rotate_cw20(img):
-        return TF.rotate(img, -20, fill=(128, 128, 128))
+        result = outcome.result
+        if outcome.cached:
+            reused += 1
+            sys.stdout.write("cached\n")
+        else:
+            sys.stdout.write("OK\n")
 
-    def aug_rotate_ccw20(img):
-        return TF.rotate(img, 20, fill=(128, 128, 128))
+        card_augmented = result.pop("augmented", None)
+        if augmented is not None and card_augmented is not None:
+            augmented[card["id"]] = card_augmented
+
+        entry = {
+            "cardCode": card["id"],
+            "embedding": result["embedding"],
+            "histogram": result["histogram"],
+            "color": card.get("group"),
+            "dhash": result["dhash"],
+        }
+        if journal is not None:
+            journal.add(entry)
+        else:
+            entries.append(entry)
 
-    def aug_flip_bright(img):
-        return TF.adjust_brightness(TF.hflip(img), 1.3)
+    return entries, reused
 
-    def aug_flip_dark(img):
-        return TF.adjust_brightness(TF.hflip(img), 0.7)
 
-    def aug_high_sat(img):
-        return TF.adjust_saturation(img, 1.4)
+def group_sets(cards: list) -> dict:
+    """Set code -> the set's cards, in file order."""
+    sets: dict[str, list] = {}
+    for card in cards:
+        sets.setdefault(card.get("set", "KS"), []).append(card)
+    return sets
 
-    def aug_low_sat(img):
-        return TF.adjust_saturation(img, 0.5)
 
-    def aug_bright_rot5(img):
-        return TF.adjust_brightness(TF.rotate(img, -5, fill=(128, 128, 128)), 1.2)
+def build_databases(sets: dict, args, infer: InferenceBackend | None, cache: EmbeddingCache | None,
+                    pool: SharedMemoryPool | None, augmentations: list, metrics: RunMetrics,
+                    augmented: dict | None = None, journal_dir: Path = DEFAULT_JOURNAL_DIR) -> tuple[list, list]:
+    """
+    Generate every set of `sets` (random embeddings with --mock). Returns the
+    (set_code, header, entries) databases for write_set and the journals holding
+    their entries. If a set fails, the journals are closed and the error propagates.
+    """
+    databases = []
+    journals = []
+    for set_code, cards in sorted(sets.items()):
+        print(f"\nProcessing {set_code} ({len(cards)} cards)...")
+        codes = [c["id"] for c in cards if c.get("imageUrl")]
 
-    def aug_dark_rot_neg5(img):
-        return TF.adjust_brightness(TF.rotate(img, 5, fill=(128, 128, 128)), 0.8)
+        if args.mock:
+            db = generate_mock_database(set_code, cards)
+            databases.append((set_code, {k: v for k, v in db.items() if k != "entries"}, db["entries"]))
+            continue
 
-    # Sharp-level augmentations (0-19)
-    sharp_augs = [
-        aug_identity, aug_rotate_cw10, aug_rotate_ccw10, aug_bright,
-        aug_dark_blur, aug_hflip, aug_bright_desat, aug_very_bright,
-        aug_very_dark, aug_cool, aug_warm, aug_blur,
-        aug_rotate_cw20, aug_rotate_ccw20, aug_flip_bright, aug_flip_dark,
-        aug_high_sat, aug_low_sat, aug_bright_rot5, aug_dark_rot_neg5,
-    ]
+        journal_config = {**pipeline_config(args.augment_engine, augmentations, infer.name), "set": set_code}
+        journal = SetJournal(journal_dir / f"embeddings-{set_code}.jsonl", journal_config, resume=args.resume)
+        journals.append(journal)
+        try:
+            with metrics.stage("generateSet"):
+                header = generate_real_database(set_code, cards, infer, journal, cache,
+                                                batch_size=args.batch_size, pool=pool,
+                                                engine=args.augment_engine, augmented=augmented,
+                                                augmentations=augmentations, metrics=metrics)
+        except BaseException:
+            for j in journals:
+                j.close()
+            raise
+        databases.append((set_code, header, lambda codes=codes, journal=journal: journal.entries(codes)))
+    return databases, journals
+
+
+# ─── Augmentation Engine Drift ──────────────────────────────────────────────
+
+def check_augment_drift(cards: list, infer, count: int) -> bool:
+    """
+    Compare the tensor augmentation engine against the PIL path on `count` cached cards.
+    Reports per-augmentation pixel and embedding drift; passes if every centroid stays
+    within AUGMENT_DRIFT_TOLERANCE cosine similarity of its PIL counterpart.
+    """
+    import torch
+
+    std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+    names = [name for name, _, _ in AUGMENTATIONS[:AUGMENT_COUNT]]
+    pixel_mae = {name: [] for name in names}
+    emb_cos = {name: [] for name in names}
+    centroid_cos = []
+
+    checked = [c for c in cards if c.get("imageUrl") and get_cache_path(c["id"]).exists()][:count]
+    if not checked:
+        print("No cached card images to compare")
+        return False
+
+    for card in checked:
+        art_img = crop_artwork(decode_image(get_cache_path(card["id"]).read_bytes()))
+        pil_batch = images_to_tensor(generate_augmented_inputs(art_img), torch.device("cpu"))
+        prepared = Prepared(state={"engine": "tensor"})
+        scale, box = letterbox_geometry(*art_img.size)
+        prepared.state.update(scale=scale, box=box)
+        tensor_batch = torch.from_numpy(to_model_input(images_to_uint8([letterbox(art_img)]), prepared))
+
+        # Pixel drift in 0-255 units
+        mae = ((pil_batch - tensor_batch).abs() * std * 255).mean(dim=(1, 2, 3))
+        pil_emb = torch.from_numpy(infer(pil_batch.numpy())).double()
+        tensor_emb = torch.from_numpy(infer(tensor_batch.numpy())).double()
+        cos = torch.nn.functional.cosine_similarity(pil_emb, tensor_emb, dim=1)
+        for i, name in enumerate(names):
+            pixel_mae[name].append(mae[i].item())
+            emb_cos[name].append(cos[i].item())
+        centroid_cos.append(torch.nn.functional.cosine_similarity(
+            pil_emb.mean(dim=0), tensor_emb.mean(dim=0), dim=0).item())
+
+    print(f"\nAugmentation engine drift over {len(checked)} cards (tensor vs PIL):")
+    print(f"  {'augmentation':<20} {'pixel MAE':>10} {'emb cos mean':>13} {'emb cos min':>12}")
+    for name in names:
+        print(f"  {name:<20} {np.mean(pixel_mae[name]):>10.2f} "
+              f"{np.mean(emb_cos[name]):>13.5f} {np.min(emb_cos[name]):>12.5f}")
+    worst = min(centroid_cos)
+    print(f"  Centroid cosine: mean {np.mean(centroid_cos):.5f}, min {worst:.5f}")
+
+    if worst >= AUGMENT_DRIFT_TOLERANCE:
+        print(f"  PASS: centroids within {AUGMENT_DRIFT_TOLERANCE} cosine of the PIL path")
+        return True
+    print(f"  WARNING: centroid cosine {worst:.5f} below {AUGMENT_DRIFT_TOLERANCE} threshold")
+    return False
+
+
+# ─── Inference Backends ─────────────────────────────────────────────────────
+
+def check_backends(cards: list, model, device: torch.device, count: int, onnx_path: Path = DEFAULT_ONNX_PATH,
+                   threads: int = 0) -> bool:
+    """
+    Embed every augmentation of `count` cached cards with each backend (see ml/backends.py)
+    and compare against torch eager, printing each backend's throughput on the same inputs.
+    Passes if every embedding stays within its backend's cosine tolerance. Backends that
+    can't run here (onnxruntime not installed, model not exported) are skipped.
+    """
+    checked = [c for c in cards if c.get("imageUrl") and get_cache_path(c["id"]).exists()][:count]
+    if not checked:
+        print("No cached card images to compare")
+        return False
+
+    batches = [prepare_card(card).inputs for card in checked]
+    reference = load_backend("torch", model, device, EMBEDDING_DIM)
+    reference.warmup(batches[0][:1])
+    expected = np.concatenate([reference(batch) for batch in batches])
+
+    print(f"\nInference backends over {len(checked)} cards ({len(expected)} images) vs torch eager:")
+    print(f"  {reference.summary()}")
+    ok = True
+    for name, bf16 in (("torch-opt", False), ("torch-opt", True), ("onnxruntime", False)):
+        try:
+            backend = load_backend(name, model, device, EMBEDDING_DIM, onnx_path, bf16, threads)
+            backend.warmup(batches[0][:1])
+        except (ImportError, FileNotFoundError, ValueError) as e:
+            print(f"  SKIP {name}{'/bf16' if bf16 else ''}: {e}")
+            continue
+        stats = compare_backends(expected, np.concatenate([backend(batch) for batch in batches]))
+        print(f"  {backend.summary()}: min cosine {stats['minCos']:.5f}, mean {stats['meanCos']:.5f}, "
+              f"max |diff| {stats['maxAbsDiff']:.2e}")
+        if stats["minCos"] < backend.tolerance:
+            print(f"  WARNING: {backend.name} min cosine {stats['minCos']:.5f} below {backend.tolerance} threshold")
+            ok = False
 
-    # Pixel-level augmentations (20-29)
-    pixel_augs = [
-        (aug_identity, lambda img: add_gaussian_noise(img, 15)),
-        (aug_identity, lambda img: adjust_contrast(img, 0.7)),
-        (aug_identity, lambda img: desaturate(img, 0.3)),
-        (aug_identity, lambda img: add_gaussian_noise(img, 25)),
-        (aug_identity, lambda img: adjust_contrast(img, 1.4)),
-        (aug_identity, lambda img: desaturate(img, 0.6)),
-        (lambda img: TF.adjust_brightness(img, 0.7), lambda img: add_gaussian_noise(img, 20)),
-        (lambda img: TF.adjust_brightness(img, 1.3), lambda img: add_gaussian_noise(img, 15)),
-        (aug_identity, lambda img: desaturate(adjust_contrast(img, 0.8), 0.2)),
-        (aug_hflip, lambda img: add_gaussian_noise(img, 15)),
-    ]
+    if ok:
+        print("  PASS: every backend agrees with torch eager")
+    return ok
 
-    # Apply sharp-only augmentations
-    for aug_fn in sharp_augs[:min(len(sharp_augs), AUGMENT_COUNT)]:
-        augmented = aug_fn(art_img)
-        results.append(letterbox(augmented))
 
-    # Apply pixel-level augmentations
-    remaining = AUGMENT_COUNT - len(results)
-    for sharp_fn, pixel_fn in pixel_augs[:remaining]:
-        augmented = sharp_fn(art_img)
-        letterboxed = letterbox(augmented)
-        results.append(pixel_fn(letterboxed))
+# ─── Accuracy Evaluation ────────────────────────────────────────────────────
 
-    return results
+def build_queries(cards: list, infer, count: int, seed: int | None = None, size: int = INPUT_SIZE) -> list:
+    """
+    Synthetic scanner queries for up to `count` cached cards (see ml/evaluate.py):
+    one query per capture view, built the way identifyCard in worker-bridge.ts does,
+    with the art crop letterboxed to `size` for `infer`.
+    Views are drawn with capture noise seed `seed` (default CAPTURE_SEED).
+    """
+    from ml.evaluate import CAPTURE_SEED, capture_views
+
+    seed = CAPTURE_SEED if seed is None else seed
+    queries = []
+    for card in [c for c in cards if c.get("imageUrl") and get_cache_path(c["id"]).exists()][:count]:
+        views = capture_views(decode_image(get_cache_path(card["id"]).read_bytes()), seed=seed)
+        inputs = []
+        for name, img in views:
+            art = crop_artwork(img)
+            art_hist, art_dhash = compute_descriptors(np.asarray(art))
+            full_hist = hsv_histograms(np.asarray(img))
+            queries.append({
+                "cardCode": card["id"],
+                "view": name,
+                "histogram": 0.6 * art_hist[0] + 0.4 * full_hist[0],
+                "dhash": art_dhash[0],
+            })
+            inputs.append(letterbox(art, size))
+        embeddings = infer(uint8_to_input(images_to_uint8(inputs)))
+        for query, embedding in zip(queries[-len(views):], embeddings):
+            query["embedding"] = embedding
+    return queries
 
 
-def images_to_tensor(images: list, device: torch.device) -> torch.Tensor:
-    """Convert list of PIL Images to a batched tensor with ImageNet normalization."""
-    tensors = []
-    for img in images:
-        t = TF.to_tensor(img)  # (3, H, W), [0, 1]
-        t = TF.normalize(t, IMAGENET_MEAN, IMAGENET_STD)
-        tensors.append(t)
-    return torch.stack(tensors).to(device)
+def report_binary_formats(databases: list, queries: list, emb_ramp: tuple = EMB_RAMP):
+    """
+    Transfer size, decode time and recognition accuracy of each binary dtype vs the JSON
+    databases, scored with the manifest's embedding ramp.
+    """
+    from ml.evaluate import evaluate
+
+    json_blobs = [json.dumps(db).encode("utf-8") for db in databases]
+    t0 = time.perf_counter()
+    for blob in json_blobs:
+        for entry in json.loads(blob)["entries"]:
+            np.asarray(entry["embedding"], dtype=np.float32)
+    json_ms = (time.perf_counter() - t0) * 1000
+    json_size = sum(len(b) for b in json_blobs)
+
+    baseline = evaluate(queries, ReferenceSet.from_entries([e for db in databases for e in db["entries"]], emb_ramp))
+    base_codes = [code for code, _ in baseline["predictions"]]
+    base_scores = np.array([score for _, score in baseline["predictions"]])
+
+    print(f"\nBinary database formats ({len(queries)} synthetic captures, "
+          f"{sum(db['cardCount'] for db in databases)} references):")
+    print(f"  {'format':<8} {'size':>10} {'ratio':>7} {'decode ms':>10} {'top-1':>7} {'delta':>7} "
+          f"{'agree':>7} {'max dscore':>11}")
+    print(f"  {'json':<8} {json_size / 1024:>8.0f}KB {1:>6.1f}x {json_ms:>10.1f} {baseline['top1']:>7.2%} "
+          f"{0:>+7.2%} {1:>7.1%} {0:>11.4f}")
+
+    for dtype in BINARY_DTYPES:
+        blobs = [encode_database(db, dtype) for db in databases]
+        t0 = time.perf_counter()
+        for blob in blobs:
+            header = read_header(blob)
+            for name in ("embedding", "histogram", "dhash"):
+                dequantize(blob, header, name)
+        decode_ms = (time.perf_counter() - t0) * 1000
+        size = sum(len(b) for b in blobs)
+
+        refs = ReferenceSet.from_entries([e for blob in blobs for e in decode_database(blob)["entries"]], emb_ramp)
+        result = evaluate(queries, refs)
+        codes = [code for code, _ in result["predictions"]]
+        scores = np.array([score for _, score in result["predictions"]])
+        agree = np.mean([a == b for a, b in zip(codes, base_codes)]) if codes else 1.0
+        max_delta = float(np.abs(scores - base_scores).max()) if len(scores) else 0.0
+        print(f"  {dtype:<8} {size / 1024:>8.0f}KB {json_size / max(1, size):>6.1f}x {decode_ms:>10.1f} "
+              f"{result['top1']:>7.2%} {result['top1'] - baseline['top1']:>+7.2%} {agree:>7.1%} {max_delta:>11.4f}")
+
+
+def report_sparse_histograms(databases: list, queries: list):
+    """JSON size and per-query intersection time of the databases' sparse histograms vs the dense form."""
+    sparse = [e["histogram"] for db in databases for e in db["entries"] if isinstance(e.get("histogram"), dict)]
+    query_hists = [np.asarray(q["histogram"], dtype=np.float32) for q in queries]
+    if not sparse or not query_hists:
+        return
+    dense = np.stack([dense_histogram(h) for h in sparse])
+    dense_bytes = sum(len(json.dumps(row.tolist())) for row in dense)
+    sparse_bytes = sum(len(json.dumps(h)) for h in sparse)
+
+    # CSR layout, as packReferences builds it in the browser
+    counts = [len(h["bins"]) for h in sparse]
+    rows = np.repeat(np.arange(len(sparse)), counts)
+    bins = np.concatenate([np.asarray(h["bins"], dtype=np.int64) for h in sparse])
+    values = dense[rows, bins]
+
+    t0 = time.perf_counter()
+    dense_scores = [np.minimum(dense, q[None, :]).sum(axis=1, dtype=np.float64) for q in query_hists]
+    dense_ms = (time.perf_counter() - t0) * 1000 / len(query_hists)
+    t0 = time.perf_counter()
+    sparse_scores = [np.bincount(rows, np.minimum(q[bins], values), minlength=len(sparse)) for q in query_hists]
+    sparse_ms = (time.perf_counter() - t0) * 1000 / len(query_hists)
+    max_diff = max(float(np.abs(a - b).max()) for a, b in zip(dense_scores, sparse_scores))
+
+    print(f"\nSparse histograms ({len(sparse)} references, {np.mean(counts):.0f} of {dense.shape[1]} bins "
+          f"nonzero on average):")
+    print(f"  JSON size:    {dense_bytes / 1024:.0f}KB dense -> {sparse_bytes / 1024:.0f}KB sparse "
+          f"({dense_bytes / max(1, sparse_bytes):.1f}x smaller)")
+    print(f"  Intersection: {dense_ms:.3f} ms dense -> {sparse_ms:.3f} ms sparse per query "
+          f"({dense_ms / max(sparse_ms, 1e-9):.1f}x faster, max score difference {max_diff:.2e})")
+
+
+# ─── Augmentation Budget ────────────────────────────────────────────────────
+
+def optimize_augmentations(cards: list, infer, count: int, name: str,
+                           tolerance: float, cache: EmbeddingCache | None = None, engine: str = "pil") -> bool:
+    """
+    Search the smallest augmentation subset that keeps top-1/top-5 accuracy on synthetic
+    captures of `count` cached cards (see ml/augment_search.py) and save it as preset `name`.
+    Drops are selected on one capture noise seed and accepted on a second (validation);
+    a third, which the search never sees, gives the held-out accuracy. All three are
+    stored with the preset. Returns False if no card could be evaluated.
+    """
+    from ml.evaluate import CAPTURE_SEED
+
+    checked = [c for c in cards if c.get("imageUrl") and get_cache_path(c["id"]).exists()][:count]
+    if not checked:
+        print("No cached card images to evaluate")
+        return False
+
+    print(f"\nEmbedding all {len(AUGMENTATIONS)} augmentations of {len(checked)} cards...")
+    t0 = time.time()
+    outcomes = run_batched(
+        checked,
+        prepare=lambda card: prepare_card(card, cache, engine, keep_augmented=True, augmentations=AUGMENTATIONS),
+        infer=infer,
+        finalize=lambda prepared, embeddings: finalize_card(prepared, embeddings, cache),
+        batch_size=DEFAULT_BATCH_SIZE,
+    )
+    augmented = {}
+    entries, _ = _collect_entries(outcomes, len(checked), augmented)
+    entries = [e for e in entries if e["cardCode"] in augmented]
+    codes = [e["cardCode"] for e in entries]
+    refs = ReferenceSet.from_entries(entries)
+    stacked = np.stack([augmented[code] for code in codes])
+    print(f"  Embedded in {time.time() - t0:.1f}s")
+
+    select, validate, held_out = (
+        [q for q in build_queries(checked, infer, count, seed=CAPTURE_SEED + i) if q["cardCode"] in augmented]
+        for i in range(3))
+
+    print(f"\nGreedy augmentation pruning ({len(select)} selection captures, seed {CAPTURE_SEED}; "
+          f"{len(validate)} validation captures, seed {CAPTURE_SEED + 1}; {len(refs)} references, "
+          f"tolerance {tolerance:.1%}):")
+    kept, steps = greedy_prune(SubsetScorer(stacked, refs, select), AUGMENTATION_NAMES, tolerance,
+                               validation=SubsetScorer(stacked, refs, validate))
+
+    held_scorer = SubsetScorer(stacked, refs, held_out)
+    full_top1, full_top5 = held_scorer.accuracy(list(range(len(AUGMENTATIONS))))
+    top1, top5 = held_scorer.accuracy([AUGMENTATION_NAMES.index(n) for n in kept])
+    print(f"\n  Held-out captures (seed {CAPTURE_SEED + 2}): all {len(AUGMENTATIONS)}: "
+          f"top-1 {full_top1:.2%}, top-{SEARCH_TOP_K} {full_top5:.2%}; "
+          f"{len(kept)}: top-1 {top1:.2%}, top-{SEARCH_TOP_K} {top5:.2%}")
+
+    save_preset(name, {
+        "augmentations": kept,
+        "cards": len(refs),
+        "tolerance": tolerance,
+        "selectionAccuracy": {"top1": steps[-1]["top1"], "top5": steps[-1]["topK"]},
+        "validationAccuracy": {"top1": steps[-1]["validationTop1"], "top5": steps[-1]["validationTopK"]},
+        "heldOutAccuracy": {"top1": top1, "top5": top5},
+        "fullHeldOutAccuracy": {"top1": full_top1, "top5": full_top5},
+        "generatedAt": _now_iso(),
+    })
+    print(f"  Saved preset {name!r} ({len(kept)}/{len(AUGMENTATIONS)} augmentations, "
+          f"~{len(kept) / AUGMENT_COUNT:.0%} of the forward passes) to {PRESETS_PATH}")
+    print(f"  Generate with it: .venv/bin/python scripts/generate_embeddings.py --augment-preset {name}")
+    if top1 < full_top1 - tolerance or top5 < full_top5 - tolerance:
+        print(f"  WARNING: held-out accuracy dropped more than {tolerance:.1%}; "
+              "evaluate more cards (--optimize-augmentations N) or lower --augment-tolerance")
+    return True
 
 
-# ─── Embedding Generation ───────────────────────────────────────────────────
+# ─── Dimensionality Reduction ──────────────────────────────────────────────
 
-def generate_mock_embedding() -> list:
-    return [random.random() * 2 - 1 for _ in range(EMBEDDING_DIM)]
+def fit_reduction(augmented: dict, k: int, whiten: bool = False) -> tuple[PCA, tuple]:
+    """
+    Fit a K-dim PCA on every card's augmented embeddings and report held-out accuracy
+    for several K. Centroids are projected as the databases are written. Returns the
+    PCA and the embedding ramp fitted for it (manifest projection.embRamp, see ml/pca.py).
+    """
+    dims = sorted({d for d in DEFAULT_SWEEP_DIMS if d < EMBEDDING_DIM} | {k})
+    t0 = time.time()
+    sweep = heldout_sweep(augmented, dims)
+    print(f"\nPCA held-out accuracy ({len(augmented)} cards, embedding-only top-1 by cosine and by the scanner's "
+          f"score with each projection's ramp, {time.time() - t0:.1f}s):")
+    print(f"  {'dims':>6} {'variance':>9} {'top-1':>7} {'fused':>7} {'whitened':>9} {'fused':>7}  ramp")
+    for row in sweep:
+        dim = row["k"] or EMBEDDING_DIM
+        marker = "  <- --reduce-dim" if row["k"] == k else ""
+        whitened = "" if row["top1Whitened"] is None else f"{row['top1Whitened']:.2%}"
+        fused_w = "" if row["top1FusedWhitened"] is None else f"{row['top1FusedWhitened']:.2%}"
+        start, width = row["embRampWhitened" if whiten and row["k"] else "embRamp"]
+        print(f"  {dim:>6} {row['varianceRetained']:>9.2%} {row['top1']:>7.2%} {row['top1Fused']:>7.2%} "
+              f"{whitened:>9} {fused_w:>7}  {start:.2f} + {width:.2f}{marker}")
+
+    chosen = next(row for row in sweep if row["k"] == min(k, EMBEDDING_DIM))
+    ramp = chosen["embRampWhitened" if whiten else "embRamp"]
+    return fit_pca(np.concatenate([augmented[code] for code in sorted(augmented)]), k, whiten), ramp
+
+
+# ─── Signature Pre-filter ───────────────────────────────────────────────────
+
+def fit_signature(databases: list, pca: PCA | None = None) -> SimHash | None:
+    """SimHash (see ml/signature.py) fitted on every entry's embedding, projected by `pca`; None without entries."""
+    embeddings = np.asarray([entry["embedding"] for _, _, entries in databases
+                             for entry in (entries() if callable(entries) else entries)], dtype=np.float32)
+    if not len(embeddings):
+        return None
+    return SimHash.fit(pca.project(embeddings) if pca is not None else embeddings)
+
+
+def calibrate_signature(cards: list, embedders: list, count: int, databases: list, simhash: SimHash,
+                        emb_ramp: tuple = EMB_RAMP) -> dict | None:
+    """
+    Set simhash.cutoff from synthetic captures of up to `count` cached cards (capture seed
+    CAPTURE_SEED) scored against the written `databases` (embedding ramp `emb_ramp`), then check it on held-out captures
+    (CAPTURE_SEED + 1): report the fraction of references pruned and whether every capture
+    keeps the full scorer's top-1. If one doesn't, no cutoff is set and the scanner keeps
+    scoring every reference. Returns the held-out report.
+
+    `embedders` lists every query model the scanner may use as (name, infer, input size);
+    each one embeds all the captures, and their names go in simhash.calibrated_with.
+    """
+    from ml.evaluate import CAPTURE_SEED
+
+    entries = [e for db in databases for e in db["entries"]]
+    refs = ReferenceSet.from_entries(entries, emb_ramp)
+    ref_signatures = np.stack([signature_words(e["signature"]) for e in entries])
+    tune = [q for _, infer, size in embedders for q in build_queries(cards, infer, count, size=size)]
+    if not tune:
+        print("\nSkipping signature calibration: no cached card images")
+        return None
+    heldout = [q for _, infer, size in embedders for q in build_queries(cards, infer, count, CAPTURE_SEED + 1, size)]
+    cutoff = calibrate_cutoff(simhash, refs, ref_signatures, tune)
+    report = cascade_report(simhash, refs, ref_signatures, heldout, cutoff)
+
+    n = len(refs)
+    survivors = (1 - report["prunedFraction"]) * n
+    names = [name for name, _, _ in embedders]
+    print(f"\nSignature pre-filter ({simhash.bits}-bit SimHash, {n} references, cutoff calibrated on "
+          f"{len(tune)} captures from {', '.join(names)}):")
+    print(f"  Cutoff:   {cutoff} bits (farthest top-1 / true card + {DEFAULT_SIGNATURE_MARGIN} bits)")
+    print(f"  Held-out: {report['queries']} captures (seed {CAPTURE_SEED + 1}), {report['prunedFraction']:.1%} of "
+          f"references pruned, true card kept {report['trueKept']}/{report['trueTotal']}")
+    print(f"  Embedding dot products per frame: {n} -> {survivors + simhash.bits:.0f} "
+          f"({survivors:.0f} survivors + {simhash.bits} for the query hash)")
+    dropped = report["queries"] - report["top1Kept"]
+    if dropped:
+        print(f"  WARNING: the cascade drops the full top-1 of {dropped} held-out capture(s) (threshold: 0); "
+              "no cutoff written, the scanner scores every reference")
+        simhash.cutoff = None
+        simhash.calibrated_with = None
+    else:
+        print("  PASS: the cascade keeps the full top-1 of every held-out capture")
+        simhash.cutoff = cutoff
+        simhash.calibrated_with = names
+    return report
 
 
-def generate_mock_database(set_code: str, cards: list) -> dict:
-    print(f"  [mock] Generating {len(cards)} random {EMBEDDING_DIM}D embeddings for {set_code}...")
-    entries = [{"cardCode": c["id"], "embedding": generate_mock_embedding()} for c in cards]
-    return {
-        "version": "1.0.0",
-        "model": "mobilenet_v3_large_100_224_mock",
-        "embeddingDim": EMBEDDING_DIM,
-        "cardCount": len(entries),
-        "generatedAt": _now_iso(),
-        "entries": entries,
-    }
+def signature_embedders(model_id: str, infer, embedder: dict | None) -> list | None:
+    """
+    calibrate_signature's query models: the reference model and the manifest's distilled
+    `embedder`, run with onnxruntime like the browser runs it. None if the embedder can't
+    be loaded (the cutoff would be unchecked for the scanner's default model).
+    """
+    embedders = [(model_id, infer, INPUT_SIZE)]
+    if embedder is not None:
+        path = PUBLIC_DIR / embedder["url"].lstrip("/")
+        try:
+            student = load_backend("onnxruntime", None, None, embedder["embeddingDim"], onnx_path=path)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"\nWARNING: can't load the manifest embedder {embedder['name']} ({e}); no signature cutoff "
+                  "written, the scanner scores every reference")
+            return None
+        embedders.append((embedder["name"], student, embedder["inputSize"]))
+    return embedders
 
 
-def generate_real_database(set_code: str, cards: list, model, device: torch.device) -> dict:
-    print(f"  [real] Processing {set_code} ({len(cards)} cards, {AUGMENT_COUNT} augmentations each)...")
+def signature_info(simhash: SimHash | None, cards: list, infer, count: int, model_id: str, set_entries: list,
+                   projection: dict | None = None, emb_ramp: tuple = EMB_RAMP) -> dict | None:
+    """
+    The manifest's "signature" for `simhash` over the written `set_entries`. Any previous
+    cutoff is dropped and calibrated again on these references (calibrate_signature); without
+    a model (mock mode) or with `count` 0 the signature ships without one.
+    """
+    if simhash is None:
+        return None
+    simhash.cutoff = None
+    simhash.calibrated_with = None
+    report = None
+    if infer is None:
+        print("\nSignature pre-filter not calibrated in mock mode (no cutoff written)")
+    elif not count:
+        print("\nSignature pre-filter not calibrated (--signature-calibration 0, no cutoff written)")
+    else:
+        # The distilled embedder write_manifest keeps is the scanner's default query model
+        embedders = signature_embedders(model_id, infer, kept_embedder(read_manifest(), model_id, projection))
+        if embedders is not None:
+            report = calibrate_signature(cards, embedders, count, read_databases(set_entries), simhash, emb_ramp)
+    signature = simhash.to_json()
+    if simhash.cutoff is not None:
+        signature["prunedFraction"] = round(report["prunedFraction"], 4)
+    return signature
 
-    entries = []
-    processed = 0
 
-    for card in cards:
-        image_url = card.get("imageUrl")
-        if not image_url:
-            print(f"  SKIP {card['id']}: no imageUrl")
-            continue
+# ─── Sharding ───────────────────────────────────────────────────────────────
 
-        try:
-            processed += 1
-            sys.stdout.write(f"  Processing {card['id']} ({processed}/{len(cards)})... ")
-            sys.stdout.flush()
+def parse_shard(spec: str) -> tuple[int, int]:
+    """"I/N" -> (I, N) with 0 <= I < N."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard expects I/N, got {spec!r}")
+    if not 0 <= index < count:
+        raise ValueError(f"--shard {spec}: I must be between 0 and N-1")
+    return index, count
 
-            # Load image (from cache or download)
-            raw_img = load_image(card["id"], image_url)
 
-            # Crop to artwork region
-            art_img = crop_artwork(raw_img)
+def shard_name(index: int, count: int) -> str:
+    return f"shard-{index}-of-{count}"
 
-            # Compute HSV histogram from letterboxed artwork
-            histogram = compute_hsv_histogram(art_img)
 
-            # Compute spatial color descriptor from art crop
-            dhash = compute_spatial_color(art_img)
+def shard_cards(cards: list, index: int, count: int) -> list:
+    """
+    Shard `index` of `count`: a contiguous range of the cards with images sorted by
+    (set, id). Depends only on cards.json, so every host computes the same split.
+    """
+    ordered = sorted((c for c in cards if c.get("imageUrl")), key=lambda c: (c.get("set", "KS"), c["id"]))
+    return ordered[index * len(ordered) // count:(index + 1) * len(ordered) // count]
+
+
+def _file_digest(path: Path) -> str:
+    return hash_bytes(path.read_bytes())[:16]
+
+
+def write_shard_manifest(shard_dir: Path, index: int, count: int, config: dict, journals: dict):
+    """Record a finished shard; merge only accepts shard directories with this file."""
+    shard = {
+        "shard": index,
+        "shards": count,
+        "model": MODEL_ID,
+        "config": config_digest(config),
+        "cardsDigest": _file_digest(DATA_PATH),
+        "sets": {
+            set_code: {"journal": journal.path.name, "cards": len(journal), "failed": sorted(journal.failed)}
+            for set_code, journal in journals.items()
+        },
+        "generatedAt": _now_iso(),
+    }
+    atomic_write_bytes(shard_dir / SHARD_MANIFEST, json.dumps(shard, indent=2).encode("utf-8"))
+
+
+def merge_shards(args):
+    """The merge subcommand: validate a complete set of shards and write public/ml from them."""
+    shard_dirs = args.shards or sorted(p for p in SHARD_DIR.glob("shard-*") if p.is_dir())
+    shards = []
+    for shard_dir in shard_dirs:
+        path = shard_dir / SHARD_MANIFEST
+        if not path.exists():
+            print(f"ERROR: {shard_dir} has no {SHARD_MANIFEST} (shard unfinished? rerun it with --resume)")
+            sys.exit(1)
+        with open(path) as f:
+            shards.append((shard_dir, json.load(f)))
+    if not shards:
+        print(f"ERROR: no shard directories in {SHARD_DIR}")
+        sys.exit(1)
 
-            # Generate augmented versions
-            augmented_images = generate_augmented_inputs(art_img)
+    first = shards[0][1]
+    for shard_dir, shard in shards:
+        for key in ("shards", "model", "config"):
+            if shard[key] != first[key]:
+                print(f"ERROR: {shard_dir} has {key}={shard[key]!r}, expected {first[key]!r} "
+                      "(shards must come from the same settings)")
+                sys.exit(1)
+    indices = sorted(shard["shard"] for _, shard in shards)
+    if indices != list(range(first["shards"])):
+        missing = sorted(set(range(first["shards"])) - set(indices))
+        print(f"ERROR: expected shards 0..{first['shards'] - 1} exactly once; "
+              f"missing {missing or 'none'}, got {indices}")
+        sys.exit(1)
+    stale = [str(shard_dir) for shard_dir, shard in shards if shard["cardsDigest"] != _file_digest(DATA_PATH)]
+    if stale and not args.allow_changed_cards:
+        print(f"ERROR: {DATA_PATH} changed since {', '.join(stale)} ran; rerun those shards, or pass "
+              "--allow-changed-cards to merge without the cards they didn't cover")
+        sys.exit(1)
+    if stale:
+        print(f"WARNING: {DATA_PATH} changed since {', '.join(stale)} ran; cards they didn't cover will be missing")
 
-            # Batch inference
-            batch = images_to_tensor(augmented_images, device)
-            with torch.no_grad():
-                embeddings = model(batch)  # (30, 1280)
+    with open(DATA_PATH) as f:
+        all_cards = json.load(f)
+    sets: dict[str, list] = {}
+    for card in all_cards:
+        if card.get("imageUrl"):
+            sets.setdefault(card.get("set", "KS"), []).append(card["id"])
 
-            # Average into centroid (float64 for precision)
-            centroid = embeddings.cpu().double().mean(dim=0).tolist()
+    journals: dict[str, list] = {}
+    failed = []
+    for shard_dir, shard in sorted(shards, key=lambda item: item[1]["shard"]):
+        for set_code, info in shard["sets"].items():
+            journals.setdefault(set_code, []).append(SetJournal.read(shard_dir / info["journal"]))
+            failed.extend(info["failed"])
+    print(f"Merging {len(shards)} shards ({len(journals)} set(s)) into {OUTPUT_DIR}")
 
-            entries.append({
-                "cardCode": card["id"],
-                "embedding": centroid,
-                "histogram": histogram,
-                "color": card.get("group"),
-                "dhash": dhash,
-            })
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    databases = []
+    for set_code in sorted(journals):
+        codes = sets.get(set_code, [])
+
+        def entries(codes=codes, parts=journals[set_code]):
+            # Every card is in exactly one shard; emit them in cards.json order
+            owner = {code: part for part in parts for code in codes if code in part}
+            for code in codes:
+                if code in owner:
+                    yield from owner[code].entries([code])
+
+        missing = [code for code in codes if not any(code in part for part in journals[set_code])]
+        if missing:
+            print(f"  WARNING: {len(missing)} {set_code} card(s) missing from every shard: {', '.join(missing)}")
+        header = {"version": "1.0.0", "model": first["model"], "embeddingDim": EMBEDDING_DIM,
+                  "cardCount": 0, "generatedAt": _now_iso()}
+        databases.append((set_code, header, entries))
+
+    # No model here to build captures with: the signatures ship without a calibrated cutoff
+    simhash = fit_signature(databases)
+    transform = lambda entry: output_entry(entry, args.histogram_dtype, simhash=simhash)
+    new_entries = [write_set(set_code, header, entries, args.binary, transform, ann=not args.no_ann)
+                   for set_code, header, entries in databases]
+    bundle = write_bundle(databases, new_entries, args.binary, transform) if args.bundle else None
+    manifest_path = write_manifest(new_entries, first["model"], bundle=bundle,
+                                   signature=simhash.to_json() if simhash is not None else None)
+    print(f"\nManifest written: {manifest_path}")
+    if failed:
+        print(f"WARNING: {len(failed)} card(s) failed in their shard: {', '.join(sorted(failed))}")
 
-            sys.stdout.write("OK\n")
 
-        except Exception as e:
-            sys.stdout.write(f"FAILED ({e})\n")
+# ─── Manifest & I/O ─────────────────────────────────────────────────────────
+
+def database_hash(header: dict, entries) -> str:
+    """
+    Content hash of a database: the header without its timestamp plus every entry, so
+    regenerating unchanged cards gives the same hash (and the same file names).
+    """
+    digest = hashlib.sha256(json.dumps({k: v for k, v in header.items() if k != "generatedAt"},
+                                       sort_keys=True).encode("utf-8"))
+    for entry in entries:
+        digest.update(json.dumps(entry).encode("utf-8"))
+    return digest.hexdigest()[:CONTENT_HASH_LENGTH]
 
-    return {
+
+def _write_artifact(path: Path, write) -> tuple[int, str]:
+    """
+    Call write(path) unless path exists (content-hashed names: same name, same bytes).
+    Returns the file size and "Written" or "Unchanged" for the log.
+    """
+    status = "Unchanged" if path.exists() else "Written"
+    if status == "Written":
+        write(path)
+    return path.stat().st_size, status
+
+
+def read_manifest() -> dict | None:
+    try:
+        with open(OUTPUT_DIR / "manifest.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_databases(set_entries: list) -> list:
+    """The JSON databases of manifest set entries, as written to public/ml."""
+    databases = []
+    for entry in set_entries:
+        with open(PUBLIC_DIR / entry["embeddingsUrl"].lstrip("/")) as f:
+            databases.append(json.load(f))
+    return databases
+
+
+def _manifest_files(manifest: dict | None) -> set:
+    """Names of the public/ml files a manifest points at."""
+    if not manifest:
+        return set()
+    urls = []
+    for entry in manifest.get("sets", []):
+        urls.append(entry.get("embeddingsUrl"))
+        urls.append(entry.get("binary", {}).get("url"))
+        urls.append(entry.get("ann", {}).get("url"))
+    urls.append((manifest.get("bundle") or {}).get("url"))
+    return {url.rsplit("/", 1)[-1] for url in urls if url}
+
+
+def kept_embedder(previous: dict | None, model_id: str, projection: dict | None) -> dict | None:
+    """The previous manifest's distilled embedder, if it was trained against `model_id` and `projection`."""
+    embedder = (previous or {}).get("embedder")
+    if embedder and embedder.get("teacher") == model_id and previous.get("projection") == projection:
+        return embedder
+    return None
+
+
+def write_manifest(set_entries: list, model_id: str, projection: dict | None = None,
+                   bundle: dict | None = None, signature: dict | None = None) -> Path:
+    """
+    Write manifest.json, then delete database artifacts referenced by neither this nor the
+    previous manifest (clients still holding the previous one can finish loading it).
+    A distilled "embedder" (distill_student.py) is kept while it was trained against the
+    same model and projection. `signature` is the databases' SimHash (SimHash.to_json).
+    """
+    manifest_path = OUTPUT_DIR / "manifest.json"
+    previous = read_manifest()
+    manifest = {
         "version": "1.0.0",
-        "model": "mobilenet_v3_large_100_224",
-        "embeddingDim": EMBEDDING_DIM,
-        "cardCount": len(entries),
+        "model": model_id,
+        "sets": sorted(set_entries, key=lambda e: e["setCode"]),
         "generatedAt": _now_iso(),
-        "entries": entries,
+    }
+    if projection is not None:
+        manifest["projection"] = projection
+    if bundle is not None:
+        manifest["bundle"] = bundle
+    if signature is not None:
+        manifest["signature"] = signature
+    embedder = kept_embedder(previous, model_id, projection)
+    if embedder is not None:
+        manifest["embedder"] = embedder
+    atomic_write_bytes(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+
+    keep = _manifest_files(manifest) | _manifest_files(previous)
+    stale = [p for p in OUTPUT_DIR.glob("embeddings-*") if p.name not in keep]
+    for path in stale:
+        path.unlink()
+    if stale:
+        print(f"  Removed {len(stale)} stale database file(s)")
+    return manifest_path
+
+
+def output_entry(entry: dict, histogram_dtype: str = "float32", pca: PCA | None = None,
+                 simhash: SimHash | None = None) -> dict:
+    """
+    A journaled entry as written to public/ml: sparse histogram, embedding projected by `pca`
+    and its `simhash` signature.
+    """
+    entry = dict(entry)
+    if pca is not None:
+        entry["embedding"] = pca.project(np.asarray(entry["embedding"])).tolist()
+    if simhash is not None:
+        entry["signature"] = simhash.signature(entry["embedding"])
+    if entry.get("histogram") is not None:
+        entry["histogram"] = sparse_histogram(dense_histogram(entry["histogram"]), histogram_dtype)
+    return entry
+
+
+def embedding_matrix(rows, count: int) -> tuple[np.ndarray, list]:
+    """(count, D) float32 embeddings and the card codes of `count` streamed rows, one row in memory at a time."""
+    embeddings = np.empty((count, 0), dtype=np.float32)
+    codes = []
+    for i, row in enumerate(rows):
+        if not i:
+            embeddings = np.empty((count, len(row["embedding"])), dtype=np.float32)
+        embeddings[i] = row["embedding"]
+        codes.append(row["cardCode"])
+    return embeddings, codes
+
+
+def write_ann_index(stem: str, embeddings: np.ndarray, codes: list, n_lists: int = 0) -> dict | None:
+    """Build, tune and write a set's IVF index (see ml/ann.py) over (N, D) embeddings. Returns its manifest entry."""
+    if len(codes) < 2:
+        return None
+    index = IVFIndex.build(embeddings, n_lists)
+    curve = index.tune(embeddings)
+    data = index.to_json(codes)
+    path = OUTPUT_DIR / f"{stem}.{hash_bytes(data)[:CONTENT_HASH_LENGTH]}.ivf.json"
+    size, status = _write_artifact(path, lambda p: atomic_write_bytes(p, data))
+    recall = ", ".join(f"{n}: {r:.3f}" for n, r in curve)
+    print(f"  {status}: {path} ({len(index.lists)} lists, nProbe {index.n_probe}; "
+          f"recall@{index.recall['k']} by nProbe: {recall})")
+    return {
+        "url": f"/ml/{path.name}",
+        "kind": "ivf",
+        "lists": len(index.lists),
+        "nProbe": index.n_probe,
+        "recall": index.recall,
+        "sizeBytes": size,
     }
 
 
-# ─── Manifest & I/O ─────────────────────────────────────────────────────────
+def write_set(set_code: str, header: dict, entries, binary: str | None = None, transform=None,
+              ann: bool = True) -> dict:
+    """
+    Write one set's artifacts under content-hashed names: embeddings-<SET>.<hash>.json,
+    .<dtype>.bin with `binary` and an .ivf.json ANN index with `ann`, streaming entries
+    from `entries()` through `transform`. Files whose name already exists hold the same
+    content and are left alone. Returns the set's manifest entry.
+    """
+    entries = entries if callable(entries) else (lambda rows=entries: iter(rows))
+    rows = lambda: (transform(e) if transform else e for e in entries())
+    header = {**header, "cardCount": sum(1 for _ in entries())}
+    content_hash = database_hash(header, rows())
+    stem = f"embeddings-{set_code}.{content_hash}"
+
+    output_path = OUTPUT_DIR / f"{stem}.json"
+    size, status = _write_artifact(output_path, lambda p: write_database_json(p, header, entries(), transform))
+    print(f"  {status}: {output_path} ({header['cardCount']} cards, {size / 1024 / 1024:.1f} MB)")
+
+    manifest_entry = {
+        "setCode": set_code,
+        "embeddingsUrl": f"/ml/{output_path.name}",
+        "cardCount": header["cardCount"],
+        "contentHash": content_hash,
+        "format": "json",
+        "sizeBytes": size,
+    }
+
+    if binary:
+        # The binary encoder needs the whole set at once (one set in memory, not every set)
+        binary_path = OUTPUT_DIR / f"{stem}.{binary}.bin"
+        binary_size, status = _write_artifact(binary_path, lambda p: atomic_write_bytes(
+            p, encode_database({**header, "entries": list(rows())}, binary)))
+        print(f"  {status}: {binary_path} ({binary}, {binary_size / 1024:.0f} KB, "
+              f"{size / binary_size:.1f}x smaller)")
+        manifest_entry["binary"] = {
+            "url": f"/ml/{binary_path.name}",
+            "dtype": binary,
+            "sizeBytes": binary_size,
+        }
+    if ann:
+        # Only the embeddings are kept, as one float32 array
+        embeddings, codes = embedding_matrix(rows(), header["cardCount"])
+        ann_entry = write_ann_index(f"embeddings-{set_code}", embeddings, codes)
+        if ann_entry is not None:
+            manifest_entry["ann"] = ann_entry
+    return manifest_entry
+
+
+def write_bundle(databases: list, set_entries: list, binary: str | None = None, transform=None) -> dict:
+    """
+    Write every set as one database (embeddings-all.<hash>.json, or .<dtype>.bin with
+    `binary`), so loadAllReferenceDatabases makes one request. Returns its manifest entry.
+    """
+    hashes = {e["setCode"]: e["contentHash"] for e in set_entries}
+    ordered = sorted(databases, key=lambda db: db[0])
+    content_hash = hashlib.sha256(json.dumps([[code, hashes[code]] for code, _, _ in ordered] + [binary])
+                                  .encode("utf-8")).hexdigest()[:CONTENT_HASH_LENGTH]
+    header = {**ordered[0][1], "cardCount": sum(e["cardCount"] for e in set_entries)}
+
+    def entries():
+        for _, _, set_rows in ordered:
+            for entry in (set_rows() if callable(set_rows) else set_rows):
+                yield transform(entry) if transform else entry
+
+    if binary:
+        path = OUTPUT_DIR / f"embeddings-all.{content_hash}.{binary}.bin"
+        size, status = _write_artifact(path, lambda p: atomic_write_bytes(
+            p, encode_database({**header, "entries": list(entries())}, binary)))
+    else:
+        path = OUTPUT_DIR / f"embeddings-all.{content_hash}.json"
+        size, status = _write_artifact(path, lambda p: write_database_json(p, header, entries()))
+    print(f"  {status}: {path} (bundle, {header['cardCount']} cards from {len(ordered)} set(s), {size / 1024:.0f} KB)")
+    bundle = {"url": f"/ml/{path.name}", "format": "binary" if binary else "json", "cardCount": header["cardCount"],
+              "contentHash": content_hash, "sizeBytes": size}
+    if binary:
+        bundle["dtype"] = binary
+    return bundle
+
 
 def _now_iso() -> str:
     from datetime import datetime, timezone
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+def load_cards() -> list:
+    with open(DATA_PATH) as f:
+        return json.load(f)
+
+
+# ─── Watch Mode ─────────────────────────────────────────────────────────────
+
+def watch(args, cards: list, infer: InferenceBackend | None, cache: EmbeddingCache | None,
+          pool: SharedMemoryPool | None, augmentations: list, metrics: RunMetrics):
+    """
+    --watch: generate every set once, then wait for DATA_PATH or CACHE_DIR to change and
+    regenerate only the sets whose cards or cached images changed (see ml/watch.py), reusing
+    the loaded model, preprocessing workers and caches. New cards' images are downloaded and
+    cards whose imageUrl changed are re-fetched. Each refresh writes the changed sets' files
+    and then swaps manifest.json atomically, so the scanner never sees a half-written state.
+    Runs until interrupted; a failed refresh is reported and the next change retried.
+    """
+    model_id = f"{MODEL_ID}_mock" if args.mock else MODEL_ID
+    # Unchanged sets keep their signatures, so the hash is fixed for the daemon's lifetime: the previous
+    # run's if it hashed the same embeddings, else fitted on the first refresh. Its cutoff is not: every
+    # refresh calibrates it again on the references it writes (signature_info)
+    previous = read_manifest() or {}
+    simhash = None
+    if (previous.get("model") == model_id and not previous.get("projection")
+            and (previous.get("signature") or {}).get("embeddingDim") == EMBEDDING_DIM):
+        simhash = SimHash.from_json(previous["signature"])
+    transform = lambda entry: output_entry(entry, args.histogram_dtype, simhash=simhash)
+    watcher = InputWatcher([DATA_PATH, CACHE_DIR], args.watch_interval)
+    image_urls: dict[str, str | None] = {}  # card id -> imageUrl at the last refresh
+    fingerprints: dict[str, str] = {}
+    set_entries: dict[str, dict] = {}
+
+    def refresh(cards: list):
+        nonlocal image_urls, fingerprints, simhash
+        if image_urls and not args.mock:
+            new = [c for c in cards if c.get("imageUrl") and c["id"] not in image_urls]
+            moved = [c for c in cards if c.get("imageUrl") and c["id"] in image_urls
+                     and image_urls[c["id"]] != c["imageUrl"]]
+            if new:
+                download_all_images(new, get_downloader(), revalidate=args.revalidate)
+            if moved:
+                download_all_images(moved, get_downloader(), revalidate=True)
+
+        sets = group_sets(cards)
+        current = set_fingerprints(sets, get_cache_path)
+        changed = sorted(code for code in sets if current[code] != fingerprints.get(code))
+        removed = sorted(set(set_entries) - set(sets))
+        if not changed and not removed:
+            print("  No set changed")
+        else:
+            if image_urls and not args.mock and args.augment_engine == "tensor":
+                update_crop_store([c for code in changed for c in sets[code] if c.get("imageUrl")],
+                                  max(1, args.workers))
+            databases, journals = build_databases({code: sets[code] for code in changed}, args, infer, cache,
+                                                  pool, augmentations, metrics)
+            if simhash is None:
+                simhash = fit_signature(databases)
+            with metrics.stage("write"):
+                for set_code, header, entries in databases:
+                    set_entries[set_code] = write_set(set_code, header, entries, args.binary, transform,
+                                                      ann=not args.no_ann)
+                for set_code in removed:
+                    del set_entries[set_code]
+            with metrics.stage("signatureCalibration"):
+                signature = signature_info(simhash, cards, infer, args.signature_calibration, model_id,
+                                           list(set_entries.values()))
+            with metrics.stage("write"):
+                write_manifest(list(set_entries.values()), model_id, signature=signature)
+            for journal in journals:
+                journal.discard()
+            print(f"\nRefreshed {OUTPUT_DIR / 'manifest.json'}: "
+                  + ", ".join([f"{code} regenerated" for code in changed] + [f"{code} removed" for code in removed]))
+        image_urls = {c["id"]: c.get("imageUrl") for c in cards}
+        fingerprints = current
+
+    try:
+        while True:
+            t0 = time.time()
+            try:
+                with metrics.stage("refresh"):
+                    refresh(cards)
+                print(f"Refresh took {time.time() - t0:.1f}s")
+            except Exception as e:
+                print(f"\n  ERROR: refresh failed ({e!r}); retrying on the next change")
+            print(f"\nWatching {DATA_PATH} and {CACHE_DIR} for changes (Ctrl-C to stop)...")
+
+            cards = None
+            while cards is None:
+                changed = watcher.wait()
+                print(f"\nChanged: {', '.join(str(p) for p in changed)}")
+                try:
+                    cards = load_cards()
+                except (OSError, ValueError) as e:
+                    print(f"  Can't read {DATA_PATH} ({e}); waiting for the next change")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+
+
 def main():
+    if sys.argv[1:2] == ["merge"]:
+        merge_shards(parse_merge_args(sys.argv[2:]))
+        return
     args = parse_args()
 
-    # Device selection
-    if args.gpu or torch.cuda.is_available():
-        device = torch.device("cuda")
-        print(f"[GPU] Using {torch.cuda.get_device_name(0)}")
-    else:
-        device = torch.device("cpu")
-        print("[CPU] CUDA not available, using CPU")
+    # Metrics are written however the run ends, so a failed nightly run still leaves them behind
+    metrics = RunMetrics()
+    try:
+        if args.profile:
+            profile_run(lambda: generate(args, metrics), args.profile)
+        else:
+            generate(args, metrics)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics)
+            print(f"Metrics written to {args.metrics}")
+
+
+def generate(args, metrics: RunMetrics):
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        if args.mock or args.reduce_dim or args.accuracy_report:
+            print("ERROR: --shard can't be combined with --mock, --reduce-dim or --accuracy-report "
+                  "(they need every card; run them on a single host)")
+            sys.exit(1)
+        if args.shards_per_host < 1:
+            print("ERROR: --shards-per-host must be at least 1")
+            sys.exit(1)
+        if not args.threads:
+            args.threads = max(1, (os.cpu_count() or 1) // args.shards_per_host)
+    if args.watch and (args.shard or args.resume or args.reduce_dim or args.bundle or args.accuracy_report
+                       or args.check_backends or args.check_augment_drift or args.optimize_augmentations):
+        print("ERROR: --watch can't be combined with --shard, --resume, --reduce-dim, --bundle, "
+              "--accuracy-report or the --check-*/--optimize-augmentations modes")
+        sys.exit(1)
+
+    # Device selection (mock runs never import torch)
+    device = None
+    if not args.mock:
+        import torch
+
+        if args.threads:
+            torch.set_num_threads(args.threads)
+            print(f"Torch intra-op threads: {args.threads}")
+        if args.gpu or torch.cuda.is_available():
+            device = torch.device("cuda")
+            print(f"[GPU] Using {torch.cuda.get_device_name(0)}")
+        else:
+            device = torch.device("cpu")
+            print("[CPU] CUDA not available, using CPU")
 
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -506,80 +1728,197 @@ def main():
         print(f"ERROR: Card data not found at {DATA_PATH}")
         sys.exit(1)
 
-    with open(DATA_PATH) as f:
-        all_cards = json.load(f)
+    all_cards = load_cards()
 
-    # Group cards by set
-    sets: dict[str, list] = {}
-    for card in all_cards:
-        set_code = card.get("set", "KS")
-        sets.setdefault(set_code, []).append(card)
+    shard_dir = None
+    if shard is not None:
+        total = len(all_cards)
+        all_cards = shard_cards(all_cards, *shard)
+        shard_dir = args.shard_dir / shard_name(*shard)
+        print(f"\nShard {shard[0]}/{shard[1]}: {len(all_cards)} of {total} cards"
+              + (f" ({all_cards[0]['id']} .. {all_cards[-1]['id']})" if all_cards else "")
+              + f" -> {shard_dir}")
+
+    sets = group_sets(all_cards)
 
     print(f"\nFound {len(all_cards)} cards across {len(sets)} set(s): {', '.join(sorted(sets.keys()))}")
     print(f"Mode: {'mock' if args.mock else 'real'}")
 
+    reduce_dim = 0
+    augmented = None
+    if args.reduce_dim:
+        if args.mock:
+            print("--reduce-dim ignored in mock mode")
+        elif not 0 < args.reduce_dim < EMBEDDING_DIM:
+            print(f"ERROR: --reduce-dim must be between 1 and {EMBEDDING_DIM - 1}")
+            sys.exit(1)
+        else:
+            reduce_dim = args.reduce_dim
+            augmented = {}
+
     # Phase 1: Download all images to local cache
     if not args.mock:
         print("\n── Phase 1: Download images ──")
         t_dl = time.time()
         cards_with_images = [c for c in all_cards if c.get("imageUrl")]
-        download_all_images(cards_with_images)
+        downloader = get_downloader(workers=args.download_workers, base_url=args.image_base_url)
+        download_all_images(cards_with_images, downloader, revalidate=args.revalidate)
+        metrics.record("download", time.time() - t_dl)
         print(f"Download phase: {time.time() - t_dl:.1f}s")
 
-    # Load model once (unless mock mode)
+    # Load model once (unless mock mode; the onnxruntime backend runs the exported model instead)
     model = None
-    if not args.mock:
+    if not args.mock and (args.backend != "onnxruntime" or args.check_backends):
         print("\nLoading MobileNetV3 Large model...")
         t0 = time.time()
         model = load_model(device)
+        metrics.record("modelLoad", time.time() - t0)
         print(f"Model loaded in {time.time() - t0:.1f}s")
 
+    if args.check_backends:
+        ok = check_backends(all_cards, model, device, args.check_backends, args.onnx_model, args.threads)
+        sys.exit(0 if ok else 1)
+
+    infer = None
+    if not args.mock:
+        if args.bf16 and args.backend != "torch-opt":
+            print("--bf16 ignored: only --backend torch-opt uses it")
+        if args.backend == "onnxruntime":
+            print(f"Inference backend: onnxruntime on {args.onnx_model} (CPU execution provider)")
+        try:
+            infer = load_backend(args.backend, model, device, EMBEDDING_DIM, args.onnx_model, args.bf16,
+                                 args.threads)
+        except (ImportError, FileNotFoundError, ValueError) as e:
+            print(f"ERROR: --backend {args.backend}: {e}")
+            sys.exit(1)
+
+    if args.check_augment_drift:
+        ok = check_augment_drift(all_cards, infer, args.check_augment_drift)
+        sys.exit(0 if ok else 1)
+
+    if args.optimize_augmentations:
+        cache = None if args.no_cache else EmbeddingCache(pipeline_config(args.augment_engine, AUGMENTATIONS,
+                                                                          infer.name))
+        ok = optimize_augmentations(all_cards, infer, args.optimize_augmentations, args.preset_name,
+                                    args.augment_tolerance, cache, args.augment_engine)
+        sys.exit(0 if ok else 1)
+
+    try:
+        augmentations = load_preset(args.augment_preset)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if args.augment_preset != FULL_PRESET:
+        print(f"Augmentation preset {args.augment_preset!r}: {len(augmentations)} of {len(AUGMENTATIONS)} "
+              f"({', '.join(name for name, _, _ in augmentations)})")
+
     # Phase 2: Generate embeddings
+    cache = None
+    pool = None
     if not args.mock:
         print("\n── Phase 2: Generate embeddings (local) ──")
+        if not args.no_cache:
+            cache = EmbeddingCache(pipeline_config(args.augment_engine, augmentations, infer.name))
+        if args.augment_engine == "tensor":
+            with metrics.stage("cropStore"):
+                update_crop_store([c for c in all_cards if c.get("imageUrl")], max(1, args.workers))
+        if args.workers > 0:
+            pool = create_preprocess_pool(args.workers, len(augmentations))
+
+    if args.watch:
+        try:
+            watch(args, all_cards, infer, cache, pool, augmentations, metrics)
+        finally:
+            if pool is not None:
+                pool.close()
+        return
+
     new_entries = []
     t_start = time.time()
+    journal_dir = shard_dir or DEFAULT_JOURNAL_DIR
+    try:
+        databases, journals = build_databases(sets, args, infer, cache, pool, augmentations, metrics, augmented,
+                                              journal_dir)
+    except BaseException as e:
+        print(f"\n  ERROR: {e!r}")
+        if pool is not None:
+            pool.close()
+        print(f"  Finished cards are checkpointed in {journal_dir}; public/ml was not modified. "
+              "Rerun with the same arguments plus --resume to continue.")
+        sys.exit(1)
 
-    for set_code, cards in sorted(sets.items()):
-        print(f"\nProcessing {set_code} ({len(cards)} cards)...")
-
-        if args.mock:
-            db = generate_mock_database(set_code, cards)
+    if pool is not None:
+        pool.close()
+    if infer is not None:
+        print(f"\nInference: {infer.summary()}")
+
+    if shard is not None:
+        for journal in journals:
+            journal.close()
+        write_shard_manifest(shard_dir, *shard, pipeline_config(args.augment_engine, augmentations, infer.name),
+                             {set_code: journal for (set_code, _, _), journal in zip(databases, journals)})
+        elapsed = time.time() - t_start
+        print(f"\nShard {shard[0]}/{shard[1]} written to {shard_dir} in {elapsed:.1f}s. Once every shard is done, "
+              f"copy the shard directories into {args.shard_dir} on one host and run: "
+              ".venv/bin/python scripts/generate_embeddings.py merge")
+        return
+
+    model_id = f"{MODEL_ID}_mock" if args.mock else MODEL_ID
+    projection = None
+    emb_ramp = EMB_RAMP
+    pca = None
+    query_infer = infer
+    if reduce_dim:
+        if not augmented:
+            print("ERROR: --reduce-dim needs at least one generated card")
+            sys.exit(1)
+        with metrics.stage("fitReduction"):
+            pca, emb_ramp = fit_reduction(augmented, reduce_dim, args.whiten)
+        augmented = None
+        pca.save(PCA_PATH)
+        print(f"  PCA projection ({EMBEDDING_DIM} -> {pca.dim}{', whitened' if args.whiten else ''}, "
+              f"{pca.variance_retained:.1%} variance) saved to {PCA_PATH}")
+        print(f"  Re-export the model to match: .venv/bin/python scripts/export_onnx.py --pca {PCA_PATH}")
+        query_infer = lambda batch: pca.project(infer(batch)).astype(np.float32)
+        model_id = f"{MODEL_ID}_pca{pca.dim}{'w' if args.whiten else ''}"
+        projection = {"dim": pca.dim, "whiten": args.whiten, "sourceDim": EMBEDDING_DIM, "embRamp": list(emb_ramp)}
+        for _, header, _ in databases:
+            header["embeddingDim"] = pca.dim
+            header["model"] = model_id
+
+    with metrics.stage("signature"):
+        simhash = fit_signature(databases, pca)
+    transform = lambda entry: output_entry(entry, args.histogram_dtype, pca, simhash)
+
+    with metrics.stage("write"):
+        for set_code, header, entries in databases:
+            new_entries.append(write_set(set_code, header, entries, args.binary, transform, ann=not args.no_ann))
+
+        bundle = write_bundle(databases, new_entries, args.binary, transform) if args.bundle else None
+
+    # The cutoff is calibrated against the databases as written, before the manifest points at them
+    with metrics.stage("signatureCalibration"):
+        signature = signature_info(simhash, all_cards, query_infer, args.signature_calibration, model_id,
+                                   new_entries, projection, emb_ramp)
+    manifest_path = write_manifest(new_entries, model_id, projection, bundle, signature)
+    failed = sum(len(j.failed) for j in journals)
+    for journal in journals:
+        journal.discard()
+
+    if args.accuracy_report:
+        if infer is None:
+            print("\nSkipping accuracy report in mock mode")
         else:
-            try:
-                db = generate_real_database(set_code, cards, model, device)
-            except Exception as e:
-                print(f"  ERROR: {e}")
-                print(f"  Falling back to mock embeddings for {set_code}")
-                db = generate_mock_database(set_code, cards)
-
-        output_path = OUTPUT_DIR / f"embeddings-{set_code}.json"
-        with open(output_path, "w") as f:
-            json.dump(db, f)
-        size_mb = output_path.stat().st_size / 1024 / 1024
-        print(f"  Written: {output_path} ({db['cardCount']} cards, {size_mb:.1f} MB)")
-
-        new_entries.append({
-            "setCode": set_code,
-            "embeddingsUrl": f"/ml/embeddings-{set_code}.json",
-            "cardCount": db["cardCount"],
-        })
-
-    # Write manifest
-    manifest_path = OUTPUT_DIR / "manifest.json"
-    manifest = {
-        "version": "1.0.0",
-        "model": "mobilenet_v3_large_100_224_mock" if args.mock else "mobilenet_v3_large_100_224",
-        "sets": sorted(new_entries, key=lambda e: e["setCode"]),
-        "generatedAt": _now_iso(),
-    }
-
-    with open(manifest_path, "w") as f:
-        json.dump(manifest, f, indent=2)
+            queries = build_queries(all_cards, query_infer, args.accuracy_report)
+            written = read_databases(new_entries)
+            report_binary_formats(written, queries, emb_ramp)
+            report_sparse_histograms(written, queries)
 
     elapsed = time.time() - t_start
     print(f"\nManifest written: {manifest_path}")
     print(f"\nDone! Generated {len(new_entries)} sets.")
+    if failed:
+        print(f"WARNING: {failed} card(s) failed (see above)")
     print(f"Total time: {elapsed:.1f}s ({elapsed / 60:.1f} min)")
 
 
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+identify_cards.py
+
+Identifies every card photo in a folder offline, for importing a collection
+without pointing the browser scanner at one card at a time.
+
+Usage:
+    .venv/bin/python scripts/identify_cards.py ~/photos/binder                 # One card per image
+    .venv/bin/python scripts/identify_cards.py scans/ --grid 3x3 --recursive   # 9-pocket binder page scans
+    .venv/bin/python scripts/identify_cards.py photos/ --output import.json --condition EXCELLENT
+    .venv/bin/python scripts/identify_cards.py photos/ --backend onnxruntime   # Same model as the browser
+
+Each image (or --grid cell) is expected to show one card, cropped roughly to
+its border like the scanner's detected card. It is queried the way identifyCard
+in worker-bridge.ts does: three art crop offsets plus the horizontally flipped
+art, each with an embedding, an art/full-card blended histogram and a spatial
+descriptor, keeping the view whose best candidate scores highest. Scoring is
+findTopCandidates (ml/scoring.py) against every reference database listed in
+public/ml/manifest.json, held as one matrix: images are decoded on a thread
+pool, embedded in packed batches with any generate_embeddings.py backend, and
+each block of queries is scored with a single matrix product per term.
+
+Output (JSON, --output):
+    collection - POST /api/collection bodies (cardId, status, condition, quantity,
+                 language) for the cards identified with at least --min-confidence
+    results    - every image/cell with its best match, confidence and top candidates
+    errors     - images that could not be read
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+from generate_embeddings import (DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, EMBEDDING_DIM, OUTPUT_DIR, PUBLIC_DIR,
+                                 images_to_uint8, letterbox, load_model, uint8_to_input)
+from ml.backends import BACKENDS, DEFAULT_ONNX_PATH, load_backend
+from ml.cache import atomic_write_bytes
+from ml.descriptors import compute_descriptors, hsv_histograms
+from ml.evaluate import THRESHOLD
+from ml.pca import PCA, PCA_PATH
+from ml.scoring import ReferenceSet, fused_scores_batch, manifest_emb_ramp, top_candidates
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+# Art crop geometry of identifyCard in worker-bridge.ts: (top, height) fractions of
+# the card, tried in order, then the first one mirrored
+ART_CROPS = ((0.18, 0.44), (0.15, 0.44), (0.21, 0.44))
+ART_LEFT_PCT = 0.08
+ART_WIDTH_PCT = 0.84
+
+# Histogram blend of the art crop with the full card (identifyCard)
+ART_HIST_WEIGHT = 0.6
+
+DEFAULT_TOP_K = 5
+DEFAULT_MIN_CONFIDENCE = 0.5
+# Cards (images or grid cells) decoded, embedded and scored together
+DEFAULT_BLOCK = 128
+
+# addToCollectionSchema in src/lib/validators/collection.ts
+STATUSES = ("OWNED", "WISHLIST", "TRADE")
+CONDITIONS = ("MINT", "NEAR_MINT", "EXCELLENT", "GOOD", "PLAYED", "POOR")
+LANGUAGES = ("en", "fr")
+MAX_QUANTITY = 99
+
+
+def parse_grid(value: str) -> tuple[int, int]:
+    try:
+        rows, cols = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected ROWSxCOLS, got {value!r}")
+    if rows < 1 or cols < 1:
+        raise argparse.ArgumentTypeError(f"grid must be at least 1x1, got {value!r}")
+    return rows, cols
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Identify a folder of card photos for collection import")
+    parser.add_argument("inputs", type=Path, nargs="+",
+                        help="Image files and/or directories of images")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Also scan subdirectories")
+    parser.add_argument("--output", type=Path, default=Path("identified.json"),
+                        help="Result JSON (default: identified.json)")
+    parser.add_argument("--grid", type=parse_grid, default=(1, 1), metavar="ROWSxCOLS",
+                        help="Split each image into a grid of cards, e.g. 3x3 for binder pages (default: 1x1)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Inference backend, as in generate_embeddings.py (default: torch)")
+    parser.add_argument("--bf16", action="store_true",
+                        help="bfloat16 autocast for --backend torch-opt")
+    parser.add_argument("--onnx-model", type=Path, default=DEFAULT_ONNX_PATH,
+                        help=f"Model run by --backend onnxruntime (default: {DEFAULT_ONNX_PATH})")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Torch/onnxruntime intra-op threads (default: library choice)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Model batch size (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Image decoding threads (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--pca", type=Path, default=PCA_PATH,
+                        help=f"Projection for --reduce-dim databases (default: {PCA_PATH})")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                        help=f"Candidates kept per card (default: {DEFAULT_TOP_K})")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help="Best-candidate score needed to add a card to the collection payload; "
+                             f"lower ones are left for review (default: {DEFAULT_MIN_CONFIDENCE})")
+    parser.add_argument("--status", choices=STATUSES, default="OWNED")
+    parser.add_argument("--condition", choices=CONDITIONS, default="NEAR_MINT")
+    parser.add_argument("--language", choices=LANGUAGES, default="en")
+    return parser.parse_args()
+
+
+# ─── References ─────────────────────────────────────────────────────────────
+
+def load_reference_set(manifest_path: Path = OUTPUT_DIR / "manifest.json") -> tuple[ReferenceSet, dict]:
+    """Every reference database of the manifest as one ReferenceSet, plus the manifest."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    entries = []
+    for entry in manifest["sets"]:
+        with open(PUBLIC_DIR / entry["embeddingsUrl"].lstrip("/")) as f:
+            entries.extend(json.load(f)["entries"])
+    return ReferenceSet.from_entries(entries, manifest_emb_ramp(manifest)), manifest
+
+
+# ─── Queries ────────────────────────────────────────────────────────────────
+
+def find_images(inputs: list, recursive: bool) -> list:
+    paths = []
+    for path in inputs:
+        if path.is_dir():
+            found = path.rglob("*") if recursive else path.iterdir()
+            paths.extend(p for p in found if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES)
+        elif path.is_file():
+            paths.append(path)
+        else:
+            raise FileNotFoundError(f"{path} not found")
+    return sorted(set(paths))
+
+
+def split_grid(img: Image.Image, rows: int, cols: int) -> list:
+    """((row, col), cell image) for an evenly divided rows x cols grid."""
+    w, h = img.size
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            box = (round(c * w / cols), round(r * h / rows), round((c + 1) * w / cols), round((r + 1) * h / rows))
+            cells.append(((r, c), img.crop(box)))
+    return cells
+
+
+def art_views(card: Image.Image) -> list:
+    """(view name, art crop) for each crop identifyCard tries."""
+    w, h = card.size
+    left = round(w * ART_LEFT_PCT)
+    width = round(w * ART_WIDTH_PCT)
+    views = []
+    for top_pct, height_pct in ART_CROPS:
+        top = round(h * top_pct)
+        views.append((f"art@{top_pct:.2f}", card.crop((left, top, left + width, top + round(h * height_pct)))))
+    views.append(("flipped", ImageOps.mirror(views[0][1])))
+    return views
+
+
+def card_queries(card: Image.Image) -> tuple[list, np.ndarray, np.ndarray, np.ndarray]:
+    """View names, letterboxed uint8 crops, blended histograms and spatial descriptors of one card."""
+    full_hist = hsv_histograms(np.asarray(card))[0]
+    names, crops, hists, dhashes = [], [], [], []
+    for name, art in art_views(card):
+        art_hist, art_dhash = compute_descriptors(np.asarray(art))
+        names.append(name)
+        crops.append(letterbox(art))
+        hists.append(ART_HIST_WEIGHT * art_hist[0] + (1 - ART_HIST_WEIGHT) * full_hist)
+        dhashes.append(art_dhash[0])
+    return names, images_to_uint8(crops), np.stack(hists), np.stack(dhashes)
+
+
+def load_cards(path: Path, grid: tuple[int, int]) -> list:
+    """One query bundle per card in the image: (cell or None, card_queries(...))."""
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    if grid == (1, 1):
+        return [(None, card_queries(img))]
+    return [(cell, card_queries(card)) for cell, card in split_grid(img, *grid)]
+
+
+# ─── Identification ─────────────────────────────────────────────────────────
+
+def embed(infer, crops: np.ndarray, batch_size: int, pca: PCA | None) -> np.ndarray:
+    embeddings = np.concatenate([infer(uint8_to_input(crops[i:i + batch_size]))
+                                 for i in range(0, len(crops), batch_size)])
+    return pca.project(embeddings) if pca is not None else embeddings
+
+
+def identify_block(cards: list, refs: ReferenceSet, infer, batch_size: int, pca: PCA | None,
+                   top_k: int) -> list:
+    """(best view name, candidates) per card; views are scored together, then picked per card."""
+    names = [queries[0] for queries in cards]
+    crops = np.concatenate([queries[1] for queries in cards])
+    hists = np.concatenate([queries[2] for queries in cards])
+    dhashes = np.concatenate([queries[3] for queries in cards])
+    scores = fused_scores_batch(refs, embed(infer, crops, batch_size, pca), hists, dhashes)
+
+    results = []
+    start = 0
+    for views in names:
+        rows = scores[start:start + len(views)]
+        start += len(views)
+        candidates = [top_candidates(row, refs, top_k, THRESHOLD) for row in rows]
+        # First view with the highest top score, like identifyCard's strict ">" comparison
+        best = int(np.argmax([c[0][1] if c else 0.0 for c in candidates]))
+        results.append((views[best], candidates[best]))
+    return results
+
+
+def collection_payload(results: list, args) -> list:
+    """addToCollection bodies for accepted results, one per card (split past MAX_QUANTITY)."""
+    counts: dict[str, int] = {}
+    for result in results:
+        if result["accepted"]:
+            counts[result["cardCode"]] = counts.get(result["cardCode"], 0) + 1
+    payload = []
+    for card_id in sorted(counts):
+        remaining = counts[card_id]
+        while remaining > 0:
+            quantity = min(remaining, MAX_QUANTITY)
+            payload.append({"cardId": card_id, "status": args.status, "condition": args.condition,
+                            "quantity": quantity, "language": args.language})
+            remaining -= quantity
+    return payload
+
+
+def main():
+    args = parse_args()
+
+    try:
+        paths = find_images(args.inputs, args.recursive)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if not paths:
+        print("ERROR: no images found")
+        sys.exit(1)
+
+    manifest_path = OUTPUT_DIR / "manifest.json"
+    if not manifest_path.exists():
+        print(f"ERROR: {manifest_path} not found; run generate_embeddings.py first")
+        sys.exit(1)
+    refs, manifest = load_reference_set(manifest_path)
+    pca = None
+    if manifest.get("projection"):
+        if not args.pca.exists():
+            print(f"ERROR: the databases are PCA-reduced ({manifest['model']}) but {args.pca} is missing")
+            sys.exit(1)
+        pca = PCA.load(args.pca)
+        if pca.dim != manifest["projection"]["dim"]:
+            print(f"ERROR: {args.pca} projects to {pca.dim} dims, the databases have {manifest['projection']['dim']}")
+            sys.exit(1)
+    print(f"References: {len(refs)} cards ({manifest['model']}); {len(paths)} images, "
+          f"{args.grid[0]}x{args.grid[1]} card(s) each")
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = load_model(device) if args.backend != "onnxruntime" else None
+    try:
+        infer = load_backend(args.backend, model, device, EMBEDDING_DIM, args.onnx_model, args.bf16, args.threads)
+    except (ImportError, FileNotFoundError, ValueError) as e:
+        print(f"ERROR: --backend {args.backend}: {e}")
+        sys.exit(1)
+
+    results = []
+    errors = []
+    t0 = time.time()
+    block_images = max(1, DEFAULT_BLOCK // (args.grid[0] * args.grid[1]))
+
+    def load(path: Path):
+        try:
+            return load_cards(path, args.grid), None
+        except Exception as e:  # unreadable or truncated image
+            return None, f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for start in range(0, len(paths), block_images):
+            block = paths[start:start + block_images]
+            cards = []
+            for path, (loaded, error) in zip(block, executor.map(load, block)):
+                if error is not None:
+                    errors.append({"file": str(path), "error": error})
+                    continue
+                cards.extend((path, cell, queries) for cell, queries in loaded)
+            if not cards:
+                continue
+
+            identified = identify_block([queries for _, _, queries in cards], refs, infer, args.batch_size, pca,
+                                        args.top_k)
+            for (path, cell, _), (view, candidates) in zip(cards, identified):
+                best_code, best_score = candidates[0] if candidates else (None, 0.0)
+                result = {"file": str(path)}
+                if cell is not None:
+                    result["cell"] = list(cell)
+                result.update({
+                    "cardCode": best_code,
+                    "confidence": best_score,
+                    "accepted": best_code is not None and best_score >= args.min_confidence,
+                    "view": view,
+                    "candidates": [{"cardCode": code, "confidence": score} for code, score in candidates],
+                })
+                results.append(result)
+
+            done = min(start + block_images, len(paths))
+            elapsed = time.time() - t0
+            print(f"  {done}/{len(paths)} images ({len(results)} cards, {done / elapsed:.1f} images/s)")
+
+    elapsed = time.time() - t0
+    accepted = sum(r["accepted"] for r in results)
+    output = {
+        "version": 1,
+        "createdAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "model": manifest["model"],
+        "backend": infer.name,
+        "settings": {"grid": list(args.grid), "topK": args.top_k, "minConfidence": args.min_confidence},
+        "summary": {"images": len(paths), "cards": len(results), "accepted": accepted,
+                    "review": len(results) - accepted, "errors": len(errors), "seconds": round(elapsed, 2)},
+        "collection": collection_payload(results, args),
+        "results": results,
+        "errors": errors,
+    }
+    atomic_write_bytes(args.output, json.dumps(output, indent=2).encode("utf-8"))
+
+    print(f"\nIdentified {accepted} of {len(results)} cards with confidence >= {args.min_confidence} "
+          f"in {elapsed:.1f}s ({infer.summary()})")
+    if len(results) > accepted:
+        print(f"  {len(results) - accepted} card(s) left for review (see \"results\" in {args.output})")
+    if errors:
+        print(f"  WARNING: {len(errors)} image(s) could not be read")
+    print(f"Written: {args.output} ({len(output['collection'])} collection entries)")
+
+
+if __name__ == "__main__":
+    main()
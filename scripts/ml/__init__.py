@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the card recognition ML scripts.
+
+Modules here are imported by scripts/generate_embeddings.py and
+scripts/export_onnx.py (run from the project root, so scripts/ is on sys.path).
+"""
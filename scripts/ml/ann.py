@@ -0,0 +1,129 @@
+"""
+Inverted-file (IVF) index over reference embeddings for sublinear candidate retrieval.
+
+findTopCandidates scores every reference on every frame. The IVF index clusters
+a set's L2-normalized embeddings with spherical k-means; the client scores the
+query against the list centroids, keeps the rows of the `nProbe` closest lists
+and runs the full fused rescoring on those rows only (see reference-db.ts).
+
+The index is written next to its set file as JSON:
+
+    {"version": 1, "kind": "ivf", "metric": "cosine", "embeddingDim": D,
+     "nProbe": P, "recall": {"k": K, "value": r},
+     "centroids": [[...D floats], ...], "lists": [["KS-001", ...], ...]}
+
+Lists hold card codes rather than row numbers, so they stay valid whatever
+order the client packs the references in (color groups, merged sets, bundle).
+
+nProbe is the smallest probe count whose recall@K against exact embedding
+search reaches the target. Recall is measured leave-one-out: each reference
+queries for its nearest other references, a proxy for a capture landing next
+to its card.
+"""
+
+import json
+
+import numpy as np
+
+from ml.scoring import normalize_rows
+
+INDEX_VERSION = 1
+
+# Probe the fewest lists that keep this recall@RECALL_K
+DEFAULT_RECALL_TARGET = 0.99
+RECALL_K = 10
+KMEANS_ITERATIONS = 25
+KMEANS_SEED = 0
+
+
+def default_list_count(n: int) -> int:
+    return max(1, round(np.sqrt(n)))
+
+
+def spherical_kmeans(x: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS,
+                     seed: int = KMEANS_SEED) -> tuple[np.ndarray, np.ndarray]:
+    """(k, D) unit centroids and (N,) assignments of unit rows x, by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    assign = np.full(len(x), -1)
+    for _ in range(iterations):
+        new_assign = np.argmax(x @ centroids.T, axis=1)
+        if np.array_equal(new_assign, assign):
+            break
+        assign = new_assign
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed an empty list with the row farthest from its centroid
+                far = int(np.argmin((x * centroids[assign]).sum(axis=1)))
+                centroids[c] = x[far]
+        centroids = normalize_rows(centroids)
+    return centroids, np.argmax(x @ centroids.T, axis=1)
+
+
+class IVFIndex:
+    """Spherical k-means lists over a set's embeddings (rows in entry order)."""
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, n_probe: int = 1):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments)
+        self.lists = [np.flatnonzero(self.assignments == c) for c in range(len(self.centroids))]
+        self.n_probe = n_probe
+        self.recall = None
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_lists: int = 0) -> "IVFIndex":
+        x = normalize_rows(np.asarray(embeddings, dtype=np.float64))
+        centroids, assignments = spherical_kmeans(x, n_lists or default_list_count(len(x)))
+        return cls(centroids, assignments)
+
+    def probe(self, queries: np.ndarray, n_probe: int) -> list:
+        """Candidate rows of each query: the members of its n_probe closest lists."""
+        sims = normalize_rows(np.asarray(queries, dtype=np.float64)) @ self.centroids.T.astype(np.float64)
+        nearest = np.argsort(-sims, axis=1, kind="stable")[:, :n_probe]
+        return [np.concatenate([self.lists[c] for c in row]) for row in nearest]
+
+    def recall_at_k(self, embeddings: np.ndarray, n_probe: int, k: int = RECALL_K) -> float:
+        """Leave-one-out recall@k of the probed rows against exact cosine search."""
+        x = normalize_rows(np.asarray(embeddings, dtype=np.float64))
+        n = len(x)
+        k = min(k, n - 1)
+        if k <= 0:
+            return 1.0
+        sims = x @ x.T
+        np.fill_diagonal(sims, -np.inf)
+        exact = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+        hits = 0
+        for i, rows in enumerate(self.probe(x, n_probe)):
+            rows = rows[rows != i]
+            found = rows[np.argsort(-sims[i, rows], kind="stable")[:k]]
+            hits += len(np.intersect1d(found, exact[i]))
+        return hits / (n * k)
+
+    def tune(self, embeddings: np.ndarray, target: float = DEFAULT_RECALL_TARGET, k: int = RECALL_K) -> list:
+        """Set n_probe to the fewest lists reaching `target` recall@k. Returns (n_probe, recall) per step."""
+        curve = []
+        for n_probe in range(1, len(self.lists) + 1):
+            recall = self.recall_at_k(embeddings, n_probe, k)
+            curve.append((n_probe, recall))
+            if recall >= target:
+                break
+        self.n_probe, recall = curve[-1]
+        self.recall = {"k": k, "value": round(recall, 4)}
+        return curve
+
+    def to_json(self, codes: list) -> bytes:
+        index = {
+            "version": INDEX_VERSION,
+            "kind": "ivf",
+            "metric": "cosine",
+            "embeddingDim": int(self.centroids.shape[1]),
+            "nProbe": self.n_probe,
+            "recall": self.recall,
+            "centroids": [[round(float(v), 6) for v in row] for row in self.centroids],
+            "lists": [[codes[i] for i in rows] for rows in self.lists],
+        }
+        return json.dumps(index).encode("utf-8")
@@ -0,0 +1,230 @@
+"""
+Augmentation engines for reference embedding generation.
+
+Two engines interpret the AUGMENTATIONS list of ml/augmentations.py:
+- apply_pil: the original per-image PIL path (one letterbox per augmentation)
+- augment_batch: letterboxes once, then applies every augmentation as batched
+  tensor ops (affine-grid rotation, conv Gaussian blur...) producing the whole
+  (N, 3, H, W) model input in one go. Output drifts slightly from the PIL path
+  (no intermediate uint8 rounding, resampling order); measure it with
+  `generate_embeddings.py --check-augment-drift` (npm run ml:check-augment-drift).
+
+The list, its presets and noise_rng are re-exported from ml/augmentations.py.
+"""
+
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchvision.transforms.functional as TF
+from PIL import Image, ImageFilter
+
+from ml.augmentations import AUGMENTATION_NAMES, AUGMENTATIONS, noise_rng
+from ml.augmentations import (FULL_PRESET, PRESETS_PATH, load_preset, load_presets,  # noqa: F401 (re-exported)
+                              save_preset, select_augmentations)  # noqa: F401
+
+GRAY = 128
+FILL = (GRAY, GRAY, GRAY)
+
+
+# ─── PIL engine ─────────────────────────────────────────────────────────────
+
+def add_gaussian_noise(img: Image.Image, sigma: float, rng: np.random.Generator) -> Image.Image:
+    """Add Gaussian noise to simulate webcam sensor noise (seeded via rng for reproducibility)."""
+    arr = np.array(img, dtype=np.float32)
+    noise = rng.normal(0, sigma, arr.shape)
+    arr = np.clip(arr + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def adjust_contrast(img: Image.Image, factor: float) -> Image.Image:
+    """Adjust contrast around midpoint 128."""
+    arr = np.array(img, dtype=np.float32)
+    arr = (arr - 128) * factor + 128
+    arr = np.clip(arr, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def desaturate(img: Image.Image, amount: float) -> Image.Image:
+    """Blend toward grayscale by amount (0=no change, 1=full grayscale)."""
+    arr = np.array(img, dtype=np.float32)
+    gray = 0.299 * arr[:, :, 0] + 0.587 * arr[:, :, 1] + 0.114 * arr[:, :, 2]
+    for c in range(3):
+        arr[:, :, c] = arr[:, :, c] * (1 - amount) + gray * amount
+    arr = np.clip(arr, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr)
+
+
+def _pil_op(img: Image.Image, op: str, param, rng: np.random.Generator) -> Image.Image:
+    if op == "rotate":
+        return TF.rotate(img, param, fill=FILL)
+    if op == "brightness":
+        return TF.adjust_brightness(img, param)
+    if op == "saturation":
+        return TF.adjust_saturation(img, param)
+    if op == "blur":
+        return img.filter(ImageFilter.GaussianBlur(param))
+    if op == "hflip":
+        return TF.hflip(img)
+    if op == "noise":
+        return add_gaussian_noise(img, param, rng)
+    if op == "contrast":
+        return adjust_contrast(img, param)
+    if op == "desaturate":
+        return desaturate(img, param)
+    raise ValueError(f"Unknown augmentation op: {op}")
+
+
+def apply_pil(art_img: Image.Image, augmentation: tuple, letterbox, rng: np.random.Generator) -> Image.Image:
+    """Apply one AUGMENTATIONS entry with PIL, letterboxing between pre and post ops."""
+    _, pre_ops, post_ops = augmentation
+    img = art_img
+    for op, param in pre_ops:
+        img = _pil_op(img, op, param, rng)
+    img = letterbox(img)
+    for op, param in post_ops:
+        img = _pil_op(img, op, param, rng)
+    return img
+
+
+# ─── Tensor engine ──────────────────────────────────────────────────────────
+
+def _luma(x: torch.Tensor) -> torch.Tensor:
+    return 0.299 * x[:, 0:1] + 0.587 * x[:, 1:2] + 0.114 * x[:, 2:3]
+
+
+def _per_row(params: list, x: torch.Tensor) -> torch.Tensor:
+    return torch.tensor(params, dtype=x.dtype, device=x.device).view(-1, 1, 1, 1)
+
+
+def _rotate(x: torch.Tensor, angles: list, center: tuple) -> torch.Tensor:
+    """Rotate each row counter-clockwise by its angle (degrees) about center (normalized coords)."""
+    n, _, h, w = x.shape
+    rad = torch.tensor(angles, dtype=x.dtype, device=x.device) * (math.pi / 180)
+    cos, sin = torch.cos(rad), torch.sin(rad)
+    cx, cy = center
+    # Output pixel p samples input at R(-angle) applied around center; image y axis points down
+    theta = torch.zeros(n, 2, 3, dtype=x.dtype, device=x.device)
+    theta[:, 0, 0] = cos
+    theta[:, 0, 1] = -sin * h / w
+    theta[:, 1, 0] = sin * w / h
+    theta[:, 1, 1] = cos
+    theta[:, 0, 2] = cx - cos * cx + sin * cy * h / w
+    theta[:, 1, 2] = cy - sin * cx * w / h - cos * cy
+    grid = F.affine_grid(theta, list(x.shape), align_corners=False)
+    fill = GRAY / 255
+    return F.grid_sample(x - fill, grid, mode="bilinear", padding_mode="zeros", align_corners=False) + fill
+
+
+def _gaussian_kernel(sigma: float, dtype, device) -> torch.Tensor:
+    radius = max(1, math.ceil(3 * sigma))
+    coords = torch.arange(-radius, radius + 1, dtype=dtype, device=device)
+    kernel = torch.exp(-(coords ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def _blur(x: torch.Tensor, sigma: float) -> torch.Tensor:
+    """Separable Gaussian blur as two depthwise convolutions (edges replicated)."""
+    kernel = _gaussian_kernel(sigma, x.dtype, x.device)
+    k = kernel.numel()
+    pad = k // 2
+    c = x.shape[1]
+    x = F.pad(x, (pad, pad, pad, pad), mode="replicate")
+    x = F.conv2d(x, kernel.view(1, 1, 1, k).expand(c, 1, 1, k), groups=c)
+    return F.conv2d(x, kernel.view(1, 1, k, 1).expand(c, 1, k, 1), groups=c)
+
+
+def _apply_op(x: torch.Tensor, op: str, params: list, ctx: dict) -> torch.Tensor:
+    if op == "brightness":
+        return (x * _per_row(params, x)).clamp(0, 1)
+    if op == "saturation":
+        gray = _luma(x)
+        return (gray + (x - gray) * _per_row(params, x)).clamp(0, 1)
+    if op == "contrast":
+        mid = GRAY / 255
+        return ((x - mid) * _per_row(params, x) + mid).clamp(0, 1)
+    if op == "desaturate":
+        amount = _per_row(params, x)
+        return (x * (1 - amount) + _luma(x) * amount).clamp(0, 1)
+    if op == "hflip":
+        # Flip within the letterboxed content box (the PIL path flips the crop itself)
+        return x[..., ctx["flip_cols"]]
+    if op == "rotate":
+        return _rotate(x, params, ctx["center"])
+    if op == "blur":
+        out = torch.empty_like(x)
+        weight = ctx["content"].to(x.dtype)
+        for sigma in sorted(set(params)):
+            rows = [i for i, p in enumerate(params) if p == sigma]
+            # PIL blurs the full-resolution crop; scale the radius to letterboxed pixels, and
+            # normalize by the blurred content mask so the gray padding doesn't bleed in
+            s = sigma * ctx["scale"]
+            out[rows] = _blur(x[rows] * weight, s) / _blur(weight, s).clamp_min(1e-6)
+        return out
+    if op == "noise":
+        noise = np.stack([
+            rng.normal(0, sigma, ctx["hw3"]) for rng, sigma in zip(ctx["rngs"], params)
+        ]).astype(np.float32)
+        noise = torch.from_numpy(noise).to(x.device).permute(0, 3, 1, 2) / 255
+        return (x + noise).clamp(0, 1)
+    raise ValueError(f"Unknown augmentation op: {op}")
+
+
+def augment_batch(base: np.ndarray, box: tuple, scale: float, mean: list, std: list,
+                  seed: int, augmentations: list | None = None, device: torch.device | None = None) -> torch.Tensor:
+    """
+    Apply augmentations to one letterboxed image as batched tensor ops.
+
+    base:  (H, W, 3) uint8 letterboxed art crop (gray padding outside box)
+    box:   (x, y, w, h) of the pasted crop inside base
+    scale: letterbox resize factor (crop pixels -> base pixels)
+    Returns (N, 3, H, W) float32, normalized with mean/std like images_to_tensor.
+    """
+    augmentations = AUGMENTATIONS if augmentations is None else augmentations
+    device = device or torch.device("cpu")
+    h, w = base.shape[:2]
+    bx, by, bw, bh = box
+    n = len(augmentations)
+
+    x = torch.tensor(base, dtype=torch.uint8, device=device).permute(2, 0, 1).float().div(255)
+    batch = x.unsqueeze(0).repeat(n, 1, 1, 1)
+
+    content = torch.zeros(1, 1, h, w, dtype=torch.bool, device=device)
+    content[..., by:by + bh, bx:bx + bw] = True
+    gray = torch.full_like(batch[:1], GRAY / 255)
+
+    flip_cols = torch.arange(w, device=device)
+    flip_cols[bx:bx + bw] = torch.arange(bx + bw - 1, bx - 1, -1, device=device)
+
+    ctx = {
+        "content": content,
+        "scale": scale,
+        "flip_cols": flip_cols,
+        "center": ((2 * (bx + bw / 2)) / w - 1, (2 * (by + bh / 2)) / h - 1),
+        "hw3": (h, w, 3),
+    }
+    indices = [AUGMENTATION_NAMES.index(name) if name in AUGMENTATION_NAMES else i
+               for i, (name, _, _) in enumerate(augmentations)]
+
+    for stage in (1, 2):
+        steps = max((len(aug[stage]) for aug in augmentations), default=0)
+        for k in range(steps):
+            groups: dict[str, list] = {}
+            for row, aug in enumerate(augmentations):
+                ops = aug[stage]
+                if k < len(ops):
+                    groups.setdefault(ops[k][0], []).append((row, ops[k][1]))
+            for op, items in groups.items():
+                rows = [row for row, _ in items]
+                params = [param for _, param in items]
+                if op == "noise":
+                    ctx["rngs"] = [noise_rng(seed, indices[row]) for row in rows]
+                batch[rows] = _apply_op(batch[rows], op, params, ctx)
+            if stage == 1:
+                # Pre-letterbox ops only ever touch the crop; keep the padding gray
+                batch = torch.where(content, batch, gray)
+
+    mean_t = torch.tensor(mean, dtype=batch.dtype, device=device).view(1, 3, 1, 1)
+    std_t = torch.tensor(std, dtype=batch.dtype, device=device).view(1, 3, 1, 1)
+    return (batch - mean_t) / std_t
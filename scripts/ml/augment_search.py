@@ -0,0 +1,127 @@
+"""
+Greedy search for the smallest augmentation subset that keeps recognition accuracy.
+
+Every reference centroid is the mean of a card's augmented embeddings, and a
+subset's embeddings are the matching rows of the full set (see ml/augment.py),
+so one pass of the model over every augmentation is enough: each candidate
+subset only re-averages rows. Queries are synthetic scanner captures (see
+ml/evaluate.py) scored like findTopCandidates (ml/scoring.py).
+
+The histogram and spatial terms of the fused score don't depend on the
+augmentations, so they are computed once per (query, reference); each subset
+then costs one matrix product for the embedding term.
+
+Backward elimination: starting from every augmentation, repeatedly drop the one
+whose removal hurts accuracy least on the selection captures, while top-1 and
+top-K stay within `tolerance` of the full set. With validation captures, a drop
+is only accepted if accuracy on those stays within `tolerance` too, so the kept
+subset isn't judged solely on the queries that picked it.
+"""
+
+import numpy as np
+
+from ml.scoring import (WEIGHTS_ALL, WEIGHTS_EMB_HIST, WEIGHTS_EMB_SPATIAL, ReferenceSet, fused_scores, norm_emb,
+                        normalize_rows)
+
+SEARCH_TOP_K = 5
+
+# Accuracy (absolute, both top-1 and top-K) a subset may lose against the full set
+DEFAULT_TOLERANCE = 0.005
+
+
+def embedding_weights(refs: ReferenceSet, use_hist: bool, use_dhash: bool) -> np.ndarray:
+    """Per-reference weight of the embedding term in fused_scores."""
+    weights = np.ones(len(refs))
+    use_hist = use_hist and refs.histograms is not None and refs.has_hist.any()
+    use_dhash = use_dhash and refs.dhashes is not None and refs.has_dhash.any()
+    if use_dhash:
+        weights[refs.has_dhash] = WEIGHTS_EMB_SPATIAL[0]
+    if use_hist:
+        weights[(refs.has_hist & ~refs.has_dhash) if use_dhash else refs.has_hist] = WEIGHTS_EMB_HIST[0]
+    if use_hist and use_dhash:
+        weights[refs.has_hist & refs.has_dhash] = WEIGHTS_ALL[0]
+    return weights
+
+
+class SubsetScorer:
+    """
+    Accuracy of queries against references whose centroids come from a subset of
+    augmentations. augmented is (C, A, D): card c's A augmented embeddings, with
+    reference c matching queries labelled c.
+    """
+
+    def __init__(self, augmented: np.ndarray, refs: ReferenceSet, queries: list, top_k: int = SEARCH_TOP_K):
+        self.augmented = np.asarray(augmented, dtype=np.float64)
+        self.top_k = top_k
+        index = {code: i for i, code in enumerate(refs.codes)}
+        self.labels = np.array([index[q["cardCode"]] for q in queries])
+        self.queries = normalize_rows(np.asarray([q["embedding"] for q in queries], dtype=np.float64))
+
+        # fused_scores with a zero embedding is the histogram + spatial part plus the ramp's score at 0
+        zero = np.zeros(self.augmented.shape[2])
+        self.weights = embedding_weights(refs, True, True)
+        self.ramp = refs.emb_ramp
+        self.fixed = (np.stack([fused_scores(refs, zero, q["histogram"], q["dhash"]) for q in queries])
+                      - self.weights[None, :] * norm_emb(np.zeros(1), self.ramp))
+
+    def scores(self, subset: list) -> np.ndarray:
+        """(Q, C) fused scores with centroids averaged over augmentation indices `subset`."""
+        centroids = normalize_rows(self.augmented[:, subset].mean(axis=1).astype(np.float32)).astype(np.float64)
+        return self.weights[None, :] * norm_emb(self.queries @ centroids.T, self.ramp) + self.fixed
+
+    def accuracy(self, subset: list) -> tuple[float, float]:
+        """(top-1, top-K) like find_top_candidates: ties go to the lower reference index."""
+        scores = self.scores(subset)
+        rows = np.arange(len(scores))
+        own = scores[rows, self.labels][:, None]
+        before = np.arange(scores.shape[1])[None, :] < self.labels[:, None]
+        rank = (scores > own).sum(axis=1) + ((scores == own) & before).sum(axis=1)
+        return float(np.mean(rank == 0)), float(np.mean(rank < self.top_k))
+
+
+def greedy_prune(scorer: SubsetScorer, names: list, tolerance: float = DEFAULT_TOLERANCE,
+                 min_count: int = 1, log=print, validation: SubsetScorer | None = None) -> tuple[list, list]:
+    """
+    Backward elimination over augmentation names (indices into scorer.augmented's
+    second axis). Drops are ranked on `scorer`'s queries and, with `validation`, the
+    best-ranked one that also keeps validation accuracy within `tolerance` is taken.
+    Returns (kept names, steps) where each step records the subset size, the dropped
+    augmentation and the resulting accuracy (plus validationTop1/validationTopK).
+    """
+    def within(accuracy: tuple, base: tuple) -> bool:
+        return accuracy[0] >= base[0] - tolerance and accuracy[1] >= base[1] - tolerance
+
+    def step(dropped, accuracy: tuple, checked: tuple | None) -> dict:
+        record = {"count": len(kept), "dropped": dropped, "top1": accuracy[0], "topK": accuracy[1]}
+        message = (f"  {len(kept):>3} augmentations: top-1 {accuracy[0]:.2%}, "
+                   f"top-{scorer.top_k} {accuracy[1]:.2%}")
+        if checked is not None:
+            record.update(validationTop1=checked[0], validationTopK=checked[1])
+            message += f" (validation {checked[0]:.2%}, {checked[1]:.2%})"
+        log(message + (f" (dropped {dropped})" if dropped else ""))
+        return record
+
+    kept = list(range(len(names)))
+    base = scorer.accuracy(kept)
+    validation_base = validation.accuracy(kept) if validation is not None else None
+    steps = [step(None, base, validation_base)]
+
+    while len(kept) > min_count:
+        trials = []
+        for i in kept:
+            accuracy = scorer.accuracy([j for j in kept if j != i])
+            if within(accuracy, base):
+                trials.append((accuracy, i))
+        best = None
+        for accuracy, i in sorted(trials, key=lambda t: t[0], reverse=True):
+            checked = validation.accuracy([j for j in kept if j != i]) if validation is not None else None
+            if checked is None or within(checked, validation_base):
+                best = (i, accuracy, checked)
+                break
+        if best is None:
+            break
+        dropped, accuracy, checked = best
+        kept.remove(dropped)
+        steps.append(step(names[dropped], accuracy, checked))
+
+    return [names[i] for i in kept], steps
@@ -0,0 +1,102 @@
+"""
+The augmentation list and its named presets, without the engines that apply them.
+
+AUGMENTATIONS declares every augmentation once as (name, pre_ops, post_ops):
+pre_ops run on the art crop before letterboxing, post_ops on the letterboxed
+image. Each op is (op_name, param). ml/augment.py interprets the list with PIL
+or batched tensor ops; this module needs neither, so the generator can parse
+its arguments and write mock databases without importing torch.
+
+Presets name subsets of AUGMENTATIONS (augment_presets.json next to this
+module). Every augmentation keeps its noise seed index when selected into a
+subset, so a subset's embeddings are exactly the matching rows of the full set.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+AUGMENTATIONS = [
+    # Sharp-level augmentations (0-19)
+    ("identity", [], []),
+    ("rotate_cw10", [("rotate", -10)], []),
+    ("rotate_ccw10", [("rotate", 10)], []),
+    ("bright", [("brightness", 1.3)], []),
+    ("dark_blur", [("brightness", 0.7), ("blur", 1.5)], []),
+    ("hflip", [("hflip", None)], []),
+    ("bright_desat", [("brightness", 1.15), ("saturation", 0.85)], []),
+    ("very_bright", [("brightness", 1.5)], []),
+    ("very_dark", [("brightness", 0.5)], []),
+    ("cool", [("brightness", 0.9), ("saturation", 0.8)], []),
+    ("warm", [("brightness", 1.2), ("saturation", 1.1)], []),
+    ("blur", [("blur", 2.0)], []),
+    ("rotate_cw20", [("rotate", -20)], []),
+    ("rotate_ccw20", [("rotate", 20)], []),
+    ("flip_bright", [("hflip", None), ("brightness", 1.3)], []),
+    ("flip_dark", [("hflip", None), ("brightness", 0.7)], []),
+    ("high_sat", [("saturation", 1.4)], []),
+    ("low_sat", [("saturation", 0.5)], []),
+    ("bright_rot5", [("rotate", -5), ("brightness", 1.2)], []),
+    ("dark_rot_neg5", [("rotate", 5), ("brightness", 0.8)], []),
+    # Pixel-level augmentations (20-29), applied after letterboxing
+    ("noise15", [], [("noise", 15)]),
+    ("low_contrast", [], [("contrast", 0.7)]),
+    ("desat30", [], [("desaturate", 0.3)]),
+    ("noise25", [], [("noise", 25)]),
+    ("high_contrast", [], [("contrast", 1.4)]),
+    ("desat60", [], [("desaturate", 0.6)]),
+    ("dark_noise20", [("brightness", 0.7)], [("noise", 20)]),
+    ("bright_noise15", [("brightness", 1.3)], [("noise", 15)]),
+    ("low_contrast_desat", [], [("contrast", 0.8), ("desaturate", 0.2)]),
+    ("flip_noise15", [("hflip", None)], [("noise", 15)]),
+]
+
+AUGMENTATION_NAMES = [name for name, _, _ in AUGMENTATIONS]
+
+# Named augmentation subsets (generate_embeddings.py --augment-preset), written by
+# --optimize-augmentations; "full" (every augmentation) is always available
+PRESETS_PATH = Path(__file__).with_name("augment_presets.json")
+FULL_PRESET = "full"
+
+
+def noise_rng(seed: int, index: int) -> np.random.Generator:
+    """Noise generator for the augmentation at `index` in AUGMENTATIONS."""
+    return np.random.default_rng([seed, index])
+
+
+def select_augmentations(names: list) -> list:
+    """AUGMENTATIONS entries for names, in AUGMENTATIONS order."""
+    unknown = set(names) - set(AUGMENTATION_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown augmentations: {', '.join(sorted(unknown))}")
+    return [aug for aug in AUGMENTATIONS if aug[0] in names]
+
+
+def load_presets(path: Path = PRESETS_PATH) -> dict:
+    """Preset name -> {"augmentations": [names], ...search metadata}."""
+    presets = {}
+    if path.exists():
+        with open(path) as f:
+            presets = json.load(f)
+    presets.setdefault(FULL_PRESET, {"augmentations": AUGMENTATION_NAMES})
+    return presets
+
+
+def load_preset(name: str, path: Path = PRESETS_PATH) -> list:
+    """AUGMENTATIONS entries of a named preset."""
+    presets = load_presets(path)
+    if name not in presets:
+        raise ValueError(f"Unknown augmentation preset {name!r} (available: {', '.join(sorted(presets))})")
+    return select_augmentations(presets[name]["augmentations"])
+
+
+def save_preset(name: str, preset: dict, path: Path = PRESETS_PATH):
+    if name == FULL_PRESET:
+        raise ValueError(f"Preset name {FULL_PRESET!r} is reserved")
+    presets = load_presets(path)
+    presets.pop(FULL_PRESET)
+    presets[name] = preset
+    with open(path, "w") as f:
+        json.dump(presets, f, indent=2)
+        f.write("\n")
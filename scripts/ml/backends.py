@@ -0,0 +1,157 @@
+"""
+Inference backends for generate_embeddings.py.
+
+Each backend turns a (N, 3, H, W) float32 ImageNet-normalized NumPy batch into
+(N, D) float32 embeddings:
+
+    torch        eager float32 NCHW PyTorch; the reference
+    torch-opt    inference mode, channels_last, torch.compile (falls back to
+                 eager when compilation fails) and optional bf16 autocast
+    onnxruntime  public/ml/mobilenet_v3_large.onnx on the CPU execution
+                 provider, the very graph the browser runs, so reference
+                 vectors match client-side inference
+
+A backend counts the images it embeds and the time it spends, so the generator
+can report throughput. compare_backends measures how far two backends' embeddings
+of the same inputs drift apart (generate_embeddings.py --check-backends).
+
+torch and onnxruntime are imported by the backends that run them, so importing
+this module (e.g. for BACKENDS in argument parsing) costs neither.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import copy
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import torch
+
+BACKENDS = ("torch", "torch-opt", "onnxruntime")
+
+DEFAULT_ONNX_PATH = Path("public/ml/mobilenet_v3_large.onnx")
+
+# Lowest cosine similarity any embedding may have to the torch eager one. bf16
+# keeps 8 mantissa bits, so it gets its own (looser) floor.
+BACKEND_TOLERANCE = 0.999
+BF16_BACKEND_TOLERANCE = 0.99
+
+
+class InferenceBackend:
+    """A NumPy batch -> NumPy embeddings function with throughput counters."""
+
+    def __init__(self, name: str, run, tolerance: float = BACKEND_TOLERANCE):
+        self.name = name
+        self.tolerance = tolerance
+        self._run = run
+        self.images = 0
+        self.seconds = 0.0
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        t0 = time.perf_counter()
+        embeddings = np.asarray(self._run(batch), dtype=np.float32)
+        self.seconds += time.perf_counter() - t0
+        self.images += len(batch)
+        return embeddings
+
+    def warmup(self, batch: np.ndarray):
+        """Run once without counting (compilation, session initialization)."""
+        self._run(batch)
+
+    def throughput(self) -> float:
+        """Images per second of model time so far."""
+        return self.images / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        return f"{self.name}: {self.images} images in {self.seconds:.1f}s ({self.throughput():.1f} img/s)"
+
+
+def _torch_eager(model, device: torch.device):
+    import torch
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return model(torch.from_numpy(batch).to(device)).cpu().numpy()
+    return run
+
+
+def _torch_optimized(model, device: torch.device, bf16: bool):
+    import torch
+
+    # A private copy: channels_last and compilation must not leak into the eager reference
+    model = copy.deepcopy(model).to(memory_format=torch.channels_last)
+    compiled = model
+    if hasattr(torch, "compile"):
+        compiled = torch.compile(model, dynamic=True)
+
+    def forward(x: torch.Tensor) -> torch.Tensor:
+        nonlocal compiled
+        autocast = torch.autocast(device.type, dtype=torch.bfloat16) if bf16 else contextlib.nullcontext()
+        with torch.inference_mode(), autocast:
+            try:
+                return compiled(x)
+            except Exception as e:  # no compiler toolchain, unsupported platform...
+                if compiled is model:
+                    raise
+                print(f"  torch.compile failed ({type(e).__name__}: {e}); torch-opt continues uncompiled")
+                compiled = model
+                return model(x)
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        x = torch.from_numpy(batch).to(device).contiguous(memory_format=torch.channels_last)
+        return forward(x).float().cpu().numpy()
+    return run
+
+
+def _onnxruntime(path: Path, threads: int, embedding_dim: int):
+    import onnxruntime as ort
+
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found; run export_onnx.py first")
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+    names = [i.name for i in session.get_inputs()]
+    if names != ["input"]:
+        raise ValueError(f"{path} takes {names}; the onnxruntime backend needs the float 'input' model")
+    dim = session.get_outputs()[0].shape[-1]
+    if dim != embedding_dim:
+        raise ValueError(f"{path} outputs {dim}-dim embeddings, expected {embedding_dim} "
+                         "(re-export it without --pca)")
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        return session.run(None, {"input": np.ascontiguousarray(batch, dtype=np.float32)})[0]
+    return run
+
+
+def load_backend(name: str, model, device: torch.device, embedding_dim: int, onnx_path: Path = DEFAULT_ONNX_PATH,
+                 bf16: bool = False, threads: int = 0) -> InferenceBackend:
+    """
+    Backend `name` (one of BACKENDS) over the loaded torch model. onnxruntime ignores
+    the model and device and runs onnx_path on the CPU with `threads` intra-op threads.
+    """
+    if name == "torch":
+        return InferenceBackend(name, _torch_eager(model, device))
+    if name == "torch-opt":
+        return InferenceBackend(name + ("/bf16" if bf16 else ""), _torch_optimized(model, device, bf16),
+                                BF16_BACKEND_TOLERANCE if bf16 else BACKEND_TOLERANCE)
+    if name == "onnxruntime":
+        return InferenceBackend(name, _onnxruntime(onnx_path, threads, embedding_dim))
+    raise ValueError(f"Unknown backend {name!r} (choose from {', '.join(BACKENDS)})")
+
+
+def compare_backends(reference: np.ndarray, other: np.ndarray) -> dict:
+    """Cosine similarity of matching (N, D) embedding rows: worst, mean, and max abs difference."""
+    reference = reference.astype(np.float64)
+    other = other.astype(np.float64)
+    dots = (reference * other).sum(axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(other, axis=1)
+    cos = np.divide(dots, norms, out=np.ones_like(dots), where=norms > 0)
+    return {"minCos": float(cos.min()), "meanCos": float(cos.mean()),
+            "maxAbsDiff": float(np.abs(reference - other).max())}
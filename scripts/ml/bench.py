@@ -0,0 +1,103 @@
+"""
+Timing and comparison helpers for scripts/benchmark.py.
+
+A benchmark result is a JSON document whose "timings" map a stable name
+("stage/decode", "onnx/int8/b8/t2", ...) to summary statistics in
+milliseconds per call. compare_results matches two documents by name and
+flags the entries whose median got slower by more than a relative threshold
+and an absolute noise floor (sub-0.1 ms stages jitter by more than 10%).
+"""
+
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+RESULT_VERSION = 1
+
+# A timing regresses when its median grows by more than this fraction...
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+# ...and by more than this many milliseconds
+DEFAULT_MIN_DELTA_MS = 0.05
+
+
+def summarize(samples_ms: list, items_per_call: int = 1) -> dict:
+    """Statistics of per-call durations; perItemMs divides the median by the batch size."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    median = float(np.median(samples))
+    return {
+        "calls": int(len(samples)),
+        "itemsPerCall": items_per_call,
+        "meanMs": float(samples.mean()),
+        "medianMs": median,
+        "p90Ms": float(np.percentile(samples, 90)),
+        "minMs": float(samples.min()),
+        "perItemMs": median / items_per_call,
+    }
+
+
+def time_calls(fn, args_list: list, warmup: int = 1, items_per_call: int = 1) -> dict:
+    """
+    Time fn(*args) once per entry of args_list after `warmup` untimed calls on the first
+    entry. Returns summarize() of the per-call durations.
+    """
+    for _ in range(warmup):
+        fn(*args_list[0])
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples, items_per_call)
+
+
+def environment() -> dict:
+    """Machine and library versions, so results from different hosts are recognizable."""
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpuCount": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    for module in ("torch", "onnxruntime", "PIL"):
+        if sys.modules.get(module) is not None:
+            env[module] = getattr(sys.modules[module], "__version__", None)
+    return env
+
+
+def new_result(corpus: dict) -> dict:
+    return {
+        "version": RESULT_VERSION,
+        "createdAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "environment": environment(),
+        "corpus": corpus,
+        "timings": {},
+    }
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+                    min_delta_ms: float = DEFAULT_MIN_DELTA_MS) -> list:
+    """
+    One row per timing present in both results: (name, baseline median, current median,
+    relative change, status) with status "regression", "improvement" or "ok".
+    """
+    rows = []
+    base_timings = baseline["timings"]
+    for name, stats in current["timings"].items():
+        if name not in base_timings:
+            continue
+        before = base_timings[name]["medianMs"]
+        after = stats["medianMs"]
+        change = (after - before) / before if before > 0 else 0.0
+        status = "ok"
+        if abs(after - before) > min_delta_ms:
+            if change > threshold:
+                status = "regression"
+            elif change < -threshold:
+                status = "improvement"
+        rows.append((name, before, after, change, status))
+    return rows
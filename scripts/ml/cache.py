@@ -0,0 +1,86 @@
+"""
+Content-addressed per-card result cache for embedding generation.
+
+Each card result (centroid, histogram, spatial descriptor) is stored under a key
+derived from the SHA-256 of the source image bytes and a digest of the pipeline
+config (crop box, augmentations, model id, normalization constants...).
+Changing either the image or any config value yields a new key, so stale results
+are never reused and nothing needs explicit invalidation.
+
+Layout:
+    .cache/embeddings/<key[:2]>/<key>.json
+    .cache/embeddings/<key[:2]>/<key>.<name>.npy   - optional array sidecars
+"""
+
+import hashlib
+import json
+import os
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path(".cache/embeddings")
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the hex SHA-256 digest of raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_digest(config: dict) -> str:
+    """Stable digest of a JSON-serializable pipeline config."""
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hash_bytes(canonical.encode("utf-8"))
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Write data to path via a temp file + rename so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class EmbeddingCache:
+    """Per-card result cache keyed by image content hash + pipeline config."""
+
+    def __init__(self, config: dict, root: Path = DEFAULT_CACHE_DIR):
+        self.root = root
+        self.config_digest = config_digest(config)
+
+    def key(self, image_bytes: bytes) -> str:
+        return hash_bytes(f"{self.config_digest}:{hash_bytes(image_bytes)}".encode("utf-8"))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached result for key, or None (corrupt files count as misses)."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key: str, result: dict):
+        atomic_write_bytes(self._path(key), json.dumps(result).encode("utf-8"))
+
+    def get_array(self, key: str, name: str) -> np.ndarray | None:
+        """Return the `name` array sidecar stored for key, or None."""
+        try:
+            return np.load(self.root / key[:2] / f"{key}.{name}.npy")
+        except (OSError, ValueError):
+            return None
+
+    def put_array(self, key: str, name: str, arr: np.ndarray):
+        buf = BytesIO()
+        np.save(buf, arr)
+        atomic_write_bytes(self.root / key[:2] / f"{key}.{name}.npy", buf.getvalue())
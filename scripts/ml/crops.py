@@ -0,0 +1,192 @@
+"""
+Memory-mapped cache of every card's letterboxed art crop.
+
+Decoding a full-resolution card image, cropping the art and LANCZOS-letterboxing
+it costs more than everything else the tensor augmentation engine does per card.
+The crop store keeps the result once per source image, in a directory named
+after the crop config's digest (crop box, input size...):
+
+    .cache/crops/<digest>/index.json   - card id -> row, source image hash, letterbox box/scale
+    .cache/crops/<digest>/crops.u8     - (capacity, size, size, 3) uint8 letterboxed crops
+    .cache/crops/<digest>/spatial.f32  - (capacity, 432) float32 spatial descriptor of the native crop
+
+Rows are read through np.memmap, so a reader touches only the pages of the
+crops it uses and never holds every image in RAM. A row is valid while its
+card's image hash matches; a changed image gets a new row (rows are only ever
+appended, and the index is rewritten atomically after the row data is flushed,
+so a crash can't leave the index pointing at a half-written row). Files only
+ever grow, so a reader's memory map never loses the pages under it (shrinking a
+mapped file would SIGBUS the reader). A different crop config starts a fresh
+store in its own directory instead of reusing the files another config's
+readers may have mapped; directories of configs no longer in use can be deleted
+by hand.
+
+Writers (generate_embeddings.py, possibly several --shard processes on one host,
+export_onnx.py...) go through CropStore.writing(), which holds an exclusive flock
+on .cache/crops/lock and reloads the index first: rows are appended after
+whatever another writer added, never over it. Any number of processes read
+without locking.
+"""
+
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from ml.cache import atomic_write_bytes, config_digest
+from ml.descriptors import DHASH_DIM
+
+DEFAULT_CROP_DIR = Path(".cache/crops")
+
+STORE_VERSION = 1
+
+# Rows allocated when the store is created; capacity doubles when full
+INITIAL_CAPACITY = 256
+
+
+class CropStore:
+    """Letterboxed art crops by card id, backed by memory-mapped files."""
+
+    def __init__(self, config: dict, size: int, root: Path = DEFAULT_CROP_DIR, writable: bool = False):
+        self.root = root
+        self.size = size
+        self.writable = writable
+        self.digest = config_digest({**config, "storeVersion": STORE_VERSION, "size": size})
+        self.dir = root / self.digest[:16]
+        self._crops = None
+        self._spatial = None
+        self._locked = False
+        self.index = self._read_index()
+
+    def _read_index(self) -> dict:
+        index = None
+        try:
+            with open(self.dir / "index.json") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if index is None or index.get("config") != self.digest:
+            index = {"config": self.digest, "capacity": 0, "used": 0, "rows": {}}
+        return index
+
+    @property
+    def _row_shape(self) -> tuple:
+        return (self.size, self.size, 3)
+
+    def _map(self):
+        if self._crops is not None or not self.index["capacity"]:
+            return
+        mode = "r+" if self.writable else "r"
+        capacity = self.index["capacity"]
+        self._crops = np.memmap(self.dir / "crops.u8", dtype=np.uint8, mode=mode,
+                                shape=(capacity,) + self._row_shape)
+        self._spatial = np.memmap(self.dir / "spatial.f32", dtype=np.float32, mode=mode,
+                                  shape=(capacity, DHASH_DIM))
+
+    def __len__(self) -> int:
+        return len(self.index["rows"])
+
+    def lookup(self, card_id: str, image_hash: str) -> int | None:
+        """Row of card_id's crop if it was made from the image with this hash."""
+        record = self.index["rows"].get(card_id)
+        if record is None or record["hash"] != image_hash:
+            return None
+        return record["row"]
+
+    def row(self, card_id: str) -> int | None:
+        """Row of card_id's crop, whatever image it came from."""
+        record = self.index["rows"].get(card_id)
+        return None if record is None else record["row"]
+
+    def crop(self, row: int) -> np.ndarray:
+        """(size, size, 3) uint8 view into the memory map (read-only unless writable)."""
+        self._map()
+        return self._crops[row]
+
+    def crops(self, rows: list) -> np.ndarray:
+        """(N, size, size, 3) uint8 copy of several rows."""
+        self._map()
+        if not rows:
+            return np.zeros((0,) + self._row_shape, dtype=np.uint8)
+        return np.asarray(self._crops[np.asarray(rows)])
+
+    def spatial(self, row: int) -> np.ndarray:
+        self._map()
+        return self._spatial[row]
+
+    def geometry(self, card_id: str) -> tuple:
+        """(scale, (x, y, w, h)) of the crop inside the letterbox, as letterbox_geometry."""
+        record = self.index["rows"][card_id]
+        return record["scale"], tuple(record["box"])
+
+    # ─── Writing ─────────────────────────────────────────────────────────────
+
+    @contextmanager
+    def writing(self):
+        """
+        Exclusive write access across processes: holds an flock on <root>/lock, reloads the
+        index (another writer may have appended rows since it was read) and flushes on exit.
+        """
+        if not self.writable:
+            raise ValueError("CropStore opened read-only")
+        import fcntl
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / "lock", "a+b") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._crops = self._spatial = None  # capacity may have changed
+                self.index = self._read_index()
+                self._locked = True
+                yield self
+                self.flush()
+            finally:
+                self._locked = False
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _check_locked(self):
+        if not self._locked:
+            raise RuntimeError("CropStore writes must happen inside `with store.writing():`")
+
+    def _grow(self, needed: int):
+        capacity = max(INITIAL_CAPACITY, self.index["capacity"])
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.index["capacity"]:
+            return
+        if self._crops is not None:
+            self._crops.flush()
+            self._spatial.flush()
+            self._crops = self._spatial = None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Only ever extend (readers may have the files mapped); a file left behind by an
+        # unreadable index may be larger already, its rows are overwritten as they are added
+        for name, nbytes in (("crops.u8", capacity * int(np.prod(self._row_shape))),
+                             ("spatial.f32", capacity * DHASH_DIM * 4)):
+            with open(self.dir / name, "a+b") as f:
+                if f.seek(0, 2) < nbytes:
+                    f.truncate(nbytes)
+        self.index["capacity"] = capacity
+
+    def add(self, card_id: str, image_hash: str, crop: np.ndarray, box: tuple, scale: float,
+            spatial: np.ndarray) -> int:
+        """Append a crop; flush() (or leaving writing()) makes it visible to readers."""
+        self._check_locked()
+        row = self.index["used"]
+        self._grow(row + 1)
+        self._map()
+        self._crops[row] = crop
+        self._spatial[row] = spatial
+        self.index["used"] = row + 1
+        self.index["rows"][card_id] = {"row": row, "hash": image_hash, "box": [int(v) for v in box],
+                                       "scale": float(scale)}
+        return row
+
+    def flush(self):
+        """Persist row data, then the index that points at it."""
+        self._check_locked()
+        if self._crops is not None:
+            self._crops.flush()
+            self._spatial.flush()
+        atomic_write_bytes(self.dir / "index.json", json.dumps(self.index).encode("utf-8"))
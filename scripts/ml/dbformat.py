@@ -0,0 +1,290 @@
+"""
+Binary reference database format (embeddings-<SET>.bin).
+
+Layout (little-endian):
+    0   4 bytes   magic "NMDB"
+    4   uint32    format version
+    8   uint32    header length L
+    12  L bytes   UTF-8 JSON header, space-padded so sections start aligned
+    ... sections  contiguous row-major arrays at header["sections"][name]["offset"]
+
+The header carries the database metadata (model, embeddingDim, cardCount...),
+per-entry cardCodes/colors, and one descriptor per section:
+    {"offset": int, "dtype": "float32"|"float16"|"int8"|"uint8", "shape": [N, D]}
+
+Rows are grouped by color so each color is one contiguous block, listed in
+header["colorGroups"] as {"color": str | None, "start": row, "count": rows}.
+The scanner scores a color filter's block first and only sweeps the remaining
+rows when it has no strong match (findTopCandidates in reference-db.ts).
+
+Embeddings and spatial descriptors are L2-normalized before storage. With
+dtype "int8" every matrix is quantized per row: `<name>` holds the codes and
+`<name>Scale` a float32 scale per row (value = code * scale). Histograms are
+non-negative and use uint8.
+
+JSON databases store each histogram sparse (sparse_histogram below); this format
+keeps them dense, and the browser re-sparsifies either layout when it packs
+references.
+
+Binary signatures (ml/signature.py) are hex strings in JSON databases and a
+uint32 "signature" section of shape [N, bits / 32] here, never quantized.
+The browser maps sections onto typed-array views (see reference-db.ts).
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"NMDB"
+FORMAT_VERSION = 1
+ALIGN = 16
+DTYPES = ("float32", "float16", "int8")
+
+# Matrices stored per entry, in section order
+MATRICES = ("embedding", "histogram", "dhash")
+
+# Value of one code in uint16 sparse histograms (histograms sum to 1)
+SPARSE_HISTOGRAM_SCALE = 1 / 65535
+SPARSE_HISTOGRAM_DTYPES = ("float32", "uint16")
+
+
+def sparse_histogram(histogram, dtype: str = "float32") -> dict:
+    """
+    JSON database form of a histogram: its nonzero bins in ascending order and their
+    values, {"size": 1024, "bins": [...], "values": [...]}. Card art fills a small
+    fraction of the bins, so this is several times smaller than the dense list. The
+    float32 form holds the exact dense values; with dtype "uint16" values are integer
+    codes, the dict carries their "scale" (value = code * scale) and bins that round
+    to zero are dropped.
+    """
+    hist = np.asarray(histogram, dtype=np.float32).reshape(-1)
+    bins = np.flatnonzero(hist)
+    if dtype == "float32":
+        return {"size": int(hist.size), "bins": bins.tolist(), "values": hist[bins].tolist()}
+    if dtype != "uint16":
+        raise ValueError(f"Unsupported sparse histogram dtype {dtype!r} (expected one of {SPARSE_HISTOGRAM_DTYPES})")
+    codes = np.rint(hist[bins].astype(np.float64) / SPARSE_HISTOGRAM_SCALE).astype(np.int64)
+    keep = codes > 0
+    return {"size": int(hist.size), "bins": bins[keep].tolist(), "values": codes[keep].tolist(),
+            "scale": SPARSE_HISTOGRAM_SCALE}
+
+
+def signature_words(signature: str) -> np.ndarray:
+    """uint32 words of a hex signature: 8 hex digits per word, word 0 first."""
+    return np.array([int(signature[i:i + 8], 16) for i in range(0, len(signature), 8)], dtype=np.uint32)
+
+
+def signature_hex(words) -> str:
+    """Inverse of signature_words."""
+    return "".join(f"{int(w):08x}" for w in words)
+
+
+def dense_histogram(histogram) -> np.ndarray:
+    """float32 histogram from a sparse_histogram dict; dense lists (older databases) pass through."""
+    if not isinstance(histogram, dict):
+        return np.asarray(histogram, dtype=np.float32)
+    dense = np.zeros(histogram["size"], dtype=np.float32)
+    values = np.asarray(histogram["values"], dtype=np.float64) * histogram.get("scale", 1.0)
+    dense[np.asarray(histogram["bins"], dtype=np.int64)] = values
+    return dense
+
+
+def _quantize(matrix: np.ndarray, dtype: str, unsigned: bool = False) -> dict:
+    """Return {section_suffix: array} for one matrix."""
+    if dtype == "float32":
+        return {"": matrix.astype(np.float32)}
+    if dtype == "float16":
+        return {"": matrix.astype(np.float16)}
+    if dtype != "int8":
+        raise ValueError(f"Unsupported dtype {dtype!r} (expected one of {DTYPES})")
+
+    levels = 255 if unsigned else 127
+    peak = np.abs(matrix).max(axis=1) if len(matrix) else np.zeros(0)
+    scale = (peak / levels).astype(np.float32)
+    safe = np.where(scale > 0, scale, 1).astype(np.float64)[:, None]
+    codes = np.rint(matrix / safe)
+    if unsigned:
+        codes = np.clip(codes, 0, 255).astype(np.uint8)
+    else:
+        codes = np.clip(codes, -127, 127).astype(np.int8)
+    return {"": codes, "Scale": scale}
+
+
+def _matrix(db: dict, name: str) -> np.ndarray | None:
+    """Stack an entry field into (N, D); None unless every entry has it."""
+    rows = [e.get(name) for e in db["entries"]]
+    if name == "histogram":
+        rows = [None if r is None else dense_histogram(r) for r in rows]
+    if not rows or any(r is None or isinstance(r, str) for r in rows):
+        return None
+    matrix = np.asarray(rows, dtype=np.float64)
+    if name in ("embedding", "dhash"):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    return matrix
+
+
+def group_by_color(entries: list) -> tuple[list, list]:
+    """Stable-sort entries into contiguous color blocks (uncolored last); returns (entries, groups)."""
+    colors = sorted({e.get("color") for e in entries}, key=lambda c: (c is None, c or ""))
+    grouped = sorted(entries, key=lambda e: colors.index(e.get("color")))
+
+    groups = []
+    start = 0
+    for color in colors:
+        count = sum(1 for e in entries if e.get("color") == color)
+        groups.append({"color": color, "start": start, "count": count})
+        start += count
+    return grouped, groups
+
+
+def encode_database(db: dict, dtype: str = "float16") -> bytes:
+    """Serialize a JSON-style database dict (see generate_embeddings.py) to the binary format."""
+    entries, groups = group_by_color(db["entries"])
+    db = {**db, "entries": entries}
+    arrays = {}
+    for name in MATRICES:
+        matrix = _matrix(db, name)
+        if matrix is None:
+            continue
+        for suffix, arr in _quantize(matrix, dtype, unsigned=name == "histogram").items():
+            arrays[name + suffix] = np.ascontiguousarray(arr)
+    signatures = [e.get("signature") for e in db["entries"]]
+    if signatures and all(isinstance(sig, str) for sig in signatures):
+        arrays["signature"] = np.stack([signature_words(sig) for sig in signatures])
+
+    header = {
+        "version": db["version"],
+        "model": db["model"],
+        "embeddingDim": db["embeddingDim"],
+        "cardCount": db["cardCount"],
+        "generatedAt": db["generatedAt"],
+        "dtype": dtype,
+        "normalized": True,
+        "cardCodes": [e["cardCode"] for e in db["entries"]],
+        "colors": [e.get("color") for e in db["entries"]],
+        "colorGroups": groups,
+        "sections": {},
+    }
+
+    # Offsets depend on the header length and vice versa: lay out with a placeholder, then fix up
+    def layout(header_len: int) -> tuple[int, dict]:
+        offset = _align(12 + header_len)
+        sections = {}
+        for name, arr in arrays.items():
+            sections[name] = {"offset": offset, "dtype": arr.dtype.name, "shape": list(arr.shape)}
+            offset = _align(offset + arr.nbytes)
+        return offset, sections
+
+    header_len = 0
+    while True:
+        _, header["sections"] = layout(header_len)
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        if len(encoded) <= header_len:
+            break
+        header_len = len(encoded)
+    encoded = encoded.ljust(header_len, b" ")
+
+    total, _ = layout(header_len)
+    out = bytearray(total)
+    out[0:12] = MAGIC + struct.pack("<II", FORMAT_VERSION, header_len)
+    out[12:12 + header_len] = encoded
+    for name, arr in arrays.items():
+        offset = header["sections"][name]["offset"]
+        out[offset:offset + arr.nbytes] = arr.astype(arr.dtype.newbyteorder("<"), copy=False).tobytes()
+    return bytes(out)
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def read_header(data: bytes) -> dict:
+    if data[:4] != MAGIC:
+        raise ValueError("Not a binary embedding database (bad magic)")
+    version, header_len = struct.unpack_from("<II", data, 4)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary database version {version}")
+    return json.loads(data[12:12 + header_len].decode("utf-8"))
+
+
+def section(data: bytes, header: dict, name: str) -> np.ndarray | None:
+    """Zero-copy view of a raw section, or None if absent."""
+    spec = header["sections"].get(name)
+    if spec is None:
+        return None
+    dtype = np.dtype(spec["dtype"]).newbyteorder("<")
+    count = int(np.prod(spec["shape"]))
+    return np.frombuffer(data, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+
+
+def dequantize(data: bytes, header: dict, name: str) -> np.ndarray | None:
+    """(N, D) float32 values of a matrix section, applying the per-row scale if quantized."""
+    values = section(data, header, name)
+    if values is None:
+        return None
+    scale = section(data, header, name + "Scale")
+    if scale is None:
+        return values.astype(np.float32)
+    return values.astype(np.float32) * scale[:, None]
+
+
+def decode_database(data: bytes) -> dict:
+    """Inverse of encode_database: a JSON-style database dict with float lists."""
+    header = read_header(data)
+    matrices = {name: dequantize(data, header, name) for name in MATRICES}
+    signatures = section(data, header, "signature")
+    entries = []
+    for i, (code, color) in enumerate(zip(header["cardCodes"], header["colors"])):
+        entry = {"cardCode": code}
+        for name in MATRICES:
+            if matrices[name] is not None:
+                entry[name] = matrices[name][i].tolist()
+        if signatures is not None:
+            entry["signature"] = signature_hex(signatures[i])
+        if color is not None:
+            entry["color"] = color
+        entries.append(entry)
+    keys = ("version", "model", "embeddingDim", "cardCount", "generatedAt")
+    return {**{k: header[k] for k in keys}, "entries": entries}
+
+
+# ─── Test fixture ───────────────────────────────────────────────────────────
+
+def write_fixtures(directory: str):
+    """Write a tiny database in every dtype for src/__tests__/scanner-binary-db.test.ts."""
+    from pathlib import Path
+
+    rng = np.random.default_rng(7)
+    entries = []
+    for i, color in enumerate(["Leaf Village", None, "Akatsuki"]):
+        hist = rng.random(8) * (rng.random(8) > 0.4)
+        dhash = rng.normal(0, 0.1, 6)
+        entries.append({
+            "cardCode": f"KS-{i + 1:03d}",
+            "embedding": rng.normal(0, 1, 16).tolist(),
+            "histogram": (hist / hist.sum()).tolist(),
+            "color": color,
+            "dhash": (dhash / np.linalg.norm(dhash)).tolist(),
+        })
+    entries[1].pop("color")
+    db = {"version": "1.0.0", "model": "fixture", "embeddingDim": 16, "cardCount": len(entries),
+          "generatedAt": "2026-01-01T00:00:00Z", "entries": entries}
+
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+    with open(out / "embeddings-tiny.json", "w") as f:
+        json.dump(db, f)
+        f.write("\n")
+    for dtype in DTYPES:
+        (out / f"embeddings-tiny.{dtype}.bin").write_bytes(encode_database(db, dtype))
+    print(f"Wrote tiny database fixtures ({', '.join(DTYPES)}) to {out}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Binary embedding database utilities")
+    parser.add_argument("--fixture", required=True, help="Write the TS test fixtures to this directory")
+    write_fixtures(parser.parse_args().fixture)
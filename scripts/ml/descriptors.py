@@ -0,0 +1,170 @@
+"""
+Color descriptors shared by the embedding generator and offline tools.
+
+Batch API over (N, H, W, 3) uint8 RGB arrays, loop-free:
+- hsv_histograms: 16x8x8 HSV histogram, same binning/skip rules as
+  src/lib/card-recognition/histogram.ts computeHistogram
+- spatial_colors: 12x12x3 mean-centered, L2-normalized cell means, same cell
+  boundaries as src/lib/card-recognition/dhash.ts computeDHashFromRgb
+
+Arithmetic follows the browser: float64 math, results stored as float32.
+Regenerate the cross-language parity fixture with:
+    python scripts/ml/descriptors.py --fixture src/__tests__/fixtures/descriptor-parity.json
+"""
+
+import numpy as np
+
+HIST_H_BINS = 16
+HIST_S_BINS = 8
+HIST_V_BINS = 8
+HISTOGRAM_SIZE = HIST_H_BINS * HIST_S_BINS * HIST_V_BINS  # 1024
+
+GRID_W = 12
+GRID_H = 12
+DHASH_DIM = GRID_W * GRID_H * 3  # 432
+
+
+def _as_batch(images: np.ndarray) -> np.ndarray:
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[None]
+    if images.ndim != 4 or images.shape[-1] != 3:
+        raise ValueError(f"Expected (N, H, W, 3) RGB array, got shape {images.shape}")
+    return images
+
+
+def rgb_to_hsv(images: np.ndarray) -> tuple:
+    """
+    Vectorized rgbToHsv from histogram.ts. Returns (h in [0, 360), s, v) as float64 arrays.
+    Hue branch precedence (r, then g, then b) and the sign of `%` follow JavaScript.
+    """
+    rgb = images.astype(np.float64) / 255
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    cmax = np.maximum(np.maximum(r, g), b)
+    cmin = np.minimum(np.minimum(r, g), b)
+    delta = cmax - cmin
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        s = np.where(cmax == 0, 0.0, delta / cmax)
+        safe = np.where(delta > 0, delta, 1.0)
+        is_r = (delta > 0) & (cmax == r)
+        is_g = (delta > 0) & ~is_r & (cmax == g)
+        is_b = (delta > 0) & ~is_r & ~is_g
+        h = np.zeros_like(cmax)
+        h = np.where(is_r, 60 * np.fmod((g - b) / safe, 6), h)
+        h = np.where(is_g, 60 * ((b - r) / safe + 2), h)
+        h = np.where(is_b, 60 * ((r - g) / safe + 4), h)
+    h = np.where(h < 0, h + 360, h)
+    return h, s, cmax
+
+
+def hsv_bins(h: np.ndarray, s: np.ndarray, v: np.ndarray) -> tuple:
+    """Return (bin index, valid mask). Skips dark pixels (V<0.1) and desaturated bright pixels (S<0.1 & V>0.6)."""
+    valid = ~((v < 0.1) | ((s < 0.1) & (v > 0.6)))
+    h_bins = np.minimum(np.floor(h / 360 * HIST_H_BINS), HIST_H_BINS - 1).astype(np.int64)
+    s_bins = np.minimum(np.floor(s * HIST_S_BINS), HIST_S_BINS - 1).astype(np.int64)
+    v_bins = np.minimum(np.floor(v * HIST_V_BINS), HIST_V_BINS - 1).astype(np.int64)
+    return h_bins * HIST_S_BINS * HIST_V_BINS + s_bins * HIST_V_BINS + v_bins, valid
+
+
+def _histograms_from_hsv(h, s, v) -> np.ndarray:
+    n = h.shape[0]
+    indices, valid = hsv_bins(h, s, v)
+    offsets = np.arange(n, dtype=np.int64).reshape(n, *([1] * (indices.ndim - 1))) * HISTOGRAM_SIZE
+    counts = np.bincount((indices + offsets)[valid], minlength=n * HISTOGRAM_SIZE)
+    counts = counts.reshape(n, HISTOGRAM_SIZE).astype(np.float64)
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0).astype(np.float32)
+
+
+def hsv_histograms(images: np.ndarray) -> np.ndarray:
+    """(N, H, W, 3) uint8 -> (N, 1024) float32 normalized HSV histograms."""
+    return _histograms_from_hsv(*rgb_to_hsv(_as_batch(images)))
+
+
+def _cell_starts(length: int, cells: int) -> np.ndarray:
+    # Math.floor(g * length / cells): the end of one cell is the start of the next
+    cell = length / cells
+    return np.array([int(g * cell) for g in range(cells)], dtype=np.int64)
+
+
+def spatial_colors(images: np.ndarray) -> np.ndarray:
+    """(N, H, W, 3) uint8 -> (N, 432) float32 mean-centered, L2-normalized grid descriptors."""
+    images = _as_batch(images)
+    n, height, width = images.shape[:3]
+    ys = _cell_starts(height, GRID_H)
+    xs = _cell_starts(width, GRID_W)
+
+    # Block sums via reduceat over rows then columns: (N, GRID_H, GRID_W, 3)
+    sums = np.add.reduceat(images, ys, axis=1, dtype=np.uint64)
+    sums = np.add.reduceat(sums, xs, axis=2, dtype=np.uint64).astype(np.float64)
+    rows = np.diff(np.append(ys, height))
+    cols = np.diff(np.append(xs, width))
+    counts = (rows[:, None] * cols[None, :]).astype(np.float64)[None, :, :, None]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts / 255, 0.0)
+    descriptor = means.reshape(n, DHASH_DIM).astype(np.float32)
+
+    # Mean-center, then L2-normalize (float64 math, float32 storage, like normalizeDescriptor)
+    mean = descriptor.astype(np.float64).sum(axis=1, keepdims=True) / DHASH_DIM
+    descriptor = (descriptor.astype(np.float64) - mean).astype(np.float32)
+    norm = np.sqrt((descriptor.astype(np.float64) ** 2).sum(axis=1, keepdims=True))
+    normalized = (descriptor.astype(np.float64) / np.where(norm > 0, norm, 1.0)).astype(np.float32)
+    return np.where(norm > 0, normalized, descriptor)
+
+
+def compute_descriptors(images: np.ndarray) -> tuple:
+    """Both descriptors of the same images in one pass: ((N, 1024), (N, 432)) float32."""
+    images = _as_batch(images)
+    return _histograms_from_hsv(*rgb_to_hsv(images)), spatial_colors(images)
+
+
+# ─── Parity fixture ─────────────────────────────────────────────────────────
+
+def _fixture_images() -> list:
+    """Small deterministic images covering uneven grid cells, hue ties and skip thresholds."""
+    rng = np.random.default_rng(42)
+    images = [
+        rng.integers(0, 256, (19, 26, 3), dtype=np.uint8),
+        rng.integers(0, 256, (12, 12, 3), dtype=np.uint8),
+    ]
+    edge = np.zeros((7, 30, 3), dtype=np.uint8)
+    values = [0, 25, 26, 128, 153, 154, 200, 255]
+    for x in range(30):
+        for y in range(7):
+            edge[y, x] = (values[x % 8], values[(x + y) % 8], values[(x * 3 + y) % 8])
+    edge[0, :5] = (255, 255, 0)   # r == g == max
+    edge[1, :5] = (128, 128, 128)  # letterbox gray
+    images.append(edge)
+    return images
+
+
+def write_parity_fixture(path: str):
+    """Write pixels + expected descriptors for src/__tests__/scanner-descriptors-parity.test.ts."""
+    import json
+
+    cases = []
+    for img in _fixture_images():
+        hist = hsv_histograms(img)[0]
+        nonzero = np.flatnonzero(hist)
+        cases.append({
+            "width": int(img.shape[1]),
+            "height": int(img.shape[0]),
+            "rgb": img.reshape(-1).tolist(),
+            "histogram": [[int(i), float(hist[i])] for i in nonzero],
+            "dhash": [float(x) for x in spatial_colors(img)[0]],
+        })
+    with open(path, "w") as f:
+        json.dump({"cases": cases}, f)
+        f.write("\n")
+    print(f"Wrote {len(cases)} parity cases to {path}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Descriptor utilities")
+    parser.add_argument("--fixture", required=True, help="Write the TS parity fixture to this path")
+    write_parity_fixture(parser.parse_args().fixture)
@@ -0,0 +1,135 @@
+"""
+Knowledge distillation of the reference embedder into a smaller student model.
+
+The browser embeds every scanned frame with the model the references were
+generated with (MobileNetV3 Large at 224px), which dominates per-frame cost on
+low-end phones. A student (MobileNetV3 Small at a lower input size by default)
+is trained to regress the teacher's embedding of the same augmented art crop,
+so it can embed queries against the unchanged reference databases.
+
+Training minimizes 1 - cosine(student, teacher): the scanner L2-normalizes
+embeddings before scoring, so only the direction matters. Targets are the
+teacher's outputs (PCA-projected when the references are), computed once up
+front; student inputs are kept as uint8 crops and normalized per batch.
+
+count_macs counts multiply-accumulates of the convolution and linear layers
+(everything else is negligible in these networks) for the FLOP comparison.
+"""
+
+import math
+import time
+from typing import Callable
+
+import numpy as np
+import torch
+import torchvision.models as models
+
+STUDENT_ARCHS = ("mobilenet_v3_small", "mobilenet_v3_large")
+
+DEFAULT_STUDENT_ARCH = "mobilenet_v3_small"
+DEFAULT_STUDENT_SIZE = 160
+DEFAULT_EPOCHS = 12
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_LR = 1e-3
+WEIGHT_DECAY = 1e-4
+
+
+def build_student(embedding_dim: int, arch: str = DEFAULT_STUDENT_ARCH) -> torch.nn.Module:
+    """
+    ImageNet-pretrained `arch` whose classifier ends in an embedding_dim linear head
+    (the classifier's dropout and 1000-way layer are dropped).
+    """
+    if arch == "mobilenet_v3_small":
+        model = models.mobilenet_v3_small(weights=models.MobileNet_V3_Small_Weights.IMAGENET1K_V1)
+    elif arch == "mobilenet_v3_large":
+        model = models.mobilenet_v3_large(weights=models.MobileNet_V3_Large_Weights.IMAGENET1K_V2)
+    else:
+        raise ValueError(f"Unknown student architecture {arch!r} (choose from {', '.join(STUDENT_ARCHS)})")
+    hidden = model.classifier[0].out_features
+    model.classifier = torch.nn.Sequential(model.classifier[0], model.classifier[1],
+                                           torch.nn.Linear(hidden, embedding_dim))
+    return model
+
+
+def count_macs(model: torch.nn.Module, input_size: int) -> int:
+    """Multiply-accumulates of one (1, 3, input_size, input_size) forward pass through Conv2d/Linear layers."""
+    total = 0
+
+    def conv_hook(module, _, output):
+        nonlocal total
+        kh, kw = module.kernel_size
+        total += output.numel() * (module.in_channels // module.groups) * kh * kw
+
+    def linear_hook(module, _, output):
+        nonlocal total
+        total += output.numel() * module.in_features
+
+    handles = []
+    for module in model.modules():
+        if isinstance(module, torch.nn.Conv2d):
+            handles.append(module.register_forward_hook(conv_hook))
+        elif isinstance(module, torch.nn.Linear):
+            handles.append(module.register_forward_hook(linear_hook))
+    was_training = model.training
+    device = next(model.parameters()).device
+    try:
+        model.eval()
+        with torch.no_grad():
+            model(torch.zeros(1, 3, input_size, input_size, device=device))
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.train(was_training)
+    return total
+
+
+def cosine_loss(student: torch.Tensor, teacher: torch.Tensor) -> torch.Tensor:
+    return (1 - torch.nn.functional.cosine_similarity(student, teacher, dim=1)).mean()
+
+
+def train_student(student: torch.nn.Module, inputs: np.ndarray, targets: np.ndarray,
+                  to_input: Callable[[np.ndarray], np.ndarray], epochs: int = DEFAULT_EPOCHS,
+                  batch_size: int = DEFAULT_BATCH_SIZE, lr: float = DEFAULT_LR, seed: int = 0,
+                  device: torch.device = torch.device("cpu")) -> list:
+    """
+    Fit student to targets ((N, D) teacher embeddings) on inputs ((N, H, W, 3) uint8 crops,
+    normalized per batch by to_input) with AdamW and a cosine learning-rate schedule.
+    Returns the mean training loss of each epoch.
+    """
+    student.to(device).train()
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=WEIGHT_DECAY)
+    steps = epochs * math.ceil(len(inputs) / batch_size)
+    schedule = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, max(1, steps))
+    rng = np.random.default_rng(seed)
+    target_tensor = torch.from_numpy(np.ascontiguousarray(targets, dtype=np.float32))
+
+    losses = []
+    for epoch in range(epochs):
+        t0 = time.time()
+        order = rng.permutation(len(inputs))
+        total = 0.0
+        for start in range(0, len(order), batch_size):
+            rows = np.sort(order[start:start + batch_size])
+            x = torch.from_numpy(to_input(inputs[rows])).to(device)
+            loss = cosine_loss(student(x), target_tensor[rows].to(device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            schedule.step()
+            total += loss.item() * len(rows)
+        losses.append(total / max(1, len(inputs)))
+        print(f"  Epoch {epoch + 1}/{epochs}: loss {losses[-1]:.5f} ({time.time() - t0:.1f}s)")
+    student.eval()
+    return losses
+
+
+def embed(model: torch.nn.Module, inputs: np.ndarray, to_input: Callable[[np.ndarray], np.ndarray],
+          batch_size: int = DEFAULT_BATCH_SIZE, device: torch.device = torch.device("cpu")) -> np.ndarray:
+    """(N, D) float32 embeddings of (N, H, W, 3) uint8 crops, in eval mode."""
+    model.eval()
+    out = []
+    with torch.no_grad():
+        for start in range(0, len(inputs), batch_size):
+            x = torch.from_numpy(to_input(inputs[start:start + batch_size])).to(device)
+            out.append(model(x).float().cpu().numpy())
+    return np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
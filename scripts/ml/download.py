@@ -0,0 +1,160 @@
+"""
+Concurrent card image downloader backed by .cache/card-images.
+
+- One pooled requests.Session shared by a bounded thread pool
+- Exponential-backoff retries on connection errors and 429/5xx responses
+- ETag / Last-Modified revalidation (conditional GET) of cached images
+- Atomic writes, so an interrupted run never leaves a truncated image behind
+
+Validators are kept in a sidecar next to each image: <card_id>.meta.json
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ml.cache import atomic_write_bytes
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 30
+
+# Same env var the app uses to serve card images (see .env.example)
+STORAGE_URL_ENV = "NEXT_PUBLIC_STORAGE_URL"
+
+STATUS_CACHED = "cached"
+STATUS_DOWNLOADED = "downloaded"
+STATUS_NOT_MODIFIED = "not-modified"
+STATUS_FAILED = "failed"
+
+
+def image_cache_path(cache_dir: Path, card_id: str) -> Path:
+    return cache_dir / f"{card_id}.jpg"
+
+
+def resolve_image_url(url: str, base_url: str | None = None) -> str:
+    """Resolve a storage-relative imageUrl (e.g. cards/KS-001.webp) against the storage base URL."""
+    if url.startswith("http://") or url.startswith("https://"):
+        return url
+    base = base_url or os.environ.get(STORAGE_URL_ENV)
+    if not base:
+        return url
+    return urljoin(base.rstrip("/") + "/", url.lstrip("/"))
+
+
+def create_session(pool_size: int = DEFAULT_WORKERS, retries: int = DEFAULT_RETRIES,
+                   backoff: float = DEFAULT_BACKOFF) -> requests.Session:
+    """Session with a connection pool sized for pool_size workers and a backoff retry policy."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ImageDownloader:
+    """Fetches card images into cache_dir with pooled connections and conditional GETs."""
+
+    def __init__(self, cache_dir: Path, workers: int = DEFAULT_WORKERS,
+                 session: requests.Session | None = None, base_url: str | None = None,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.session = session or create_session(pool_size=self.workers)
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def path(self, card_id: str) -> Path:
+        return image_cache_path(self.cache_dir, card_id)
+
+    def _meta_path(self, card_id: str) -> Path:
+        return self.cache_dir / f"{card_id}.meta.json"
+
+    def _read_meta(self, card_id: str) -> dict:
+        try:
+            with open(self._meta_path(card_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fetch(self, card_id: str, url: str, revalidate: bool = False) -> str:
+        """
+        Ensure the image for card_id is cached. Returns one of the STATUS_* values.
+        Raises on HTTP/network errors once retries are exhausted.
+        """
+        path = self.path(card_id)
+        cached = path.exists()
+        if cached and not revalidate:
+            return STATUS_CACHED
+
+        url = resolve_image_url(url, self.base_url)
+        headers = {}
+        meta = self._read_meta(card_id) if cached else {}
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = meta["lastModified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            return STATUS_NOT_MODIFIED
+        response.raise_for_status()
+
+        atomic_write_bytes(path, response.content)
+        new_meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "lastModified": response.headers.get("Last-Modified"),
+        }
+        atomic_write_bytes(self._meta_path(card_id), json.dumps(new_meta).encode("utf-8"))
+        return STATUS_DOWNLOADED
+
+    def fetch_bytes(self, card_id: str, url: str) -> bytes:
+        self.fetch(card_id, url)
+        return self.path(card_id).read_bytes()
+
+    def download_all(self, cards: list, revalidate: bool = False, log=print) -> dict:
+        """
+        Fetch every card's imageUrl concurrently. Returns counts per status plus
+        a list of (card_id, error) failures.
+        """
+        counts = {STATUS_CACHED: 0, STATUS_DOWNLOADED: 0, STATUS_NOT_MODIFIED: 0, STATUS_FAILED: 0}
+        failures = []
+        unique = {c["id"]: c["imageUrl"] for c in cards if c.get("imageUrl")}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self.fetch, card_id, url, revalidate): card_id
+                for card_id, url in unique.items()
+            }
+            for future in as_completed(futures):
+                card_id = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    status = STATUS_FAILED
+                    failures.append((card_id, str(e)))
+                    log(f"    {card_id}... FAILED ({e})")
+                else:
+                    if status != STATUS_CACHED:
+                        log(f"    {card_id}... {status}")
+                counts[status] += 1
+
+        counts["failures"] = failures
+        return counts
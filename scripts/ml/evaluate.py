@@ -0,0 +1,78 @@
+"""
+Offline recognition accuracy against synthetic scanner captures.
+
+Each card image is degraded like a webcam capture (downscale, lighting, blur,
+tilt, sensor noise, JPEG) and turned into the query the browser would build:
+an embedding of the letterboxed art crop, a histogram blending the art crop
+(0.6) with the full card (0.4), and the art crop's spatial descriptor (see
+identifyCard in worker-bridge.ts). Queries are scored with ml.scoring, so the
+numbers track what the scanner would return for a given reference database.
+"""
+
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from ml.augment import _pil_op, noise_rng
+from ml.scoring import ReferenceSet, find_top_candidates
+
+# (name, ops) applied to the full card image; ops as in ml.augment plus resize/jpeg
+CAPTURE_VIEWS = [
+    ("clean", [("resize", 360), ("jpeg", 85)]),
+    ("dim_noisy", [("resize", 320), ("brightness", 0.8), ("noise", 6), ("jpeg", 75)]),
+    ("bright_soft", [("resize", 300), ("brightness", 1.15), ("blur", 1.0), ("jpeg", 80)]),
+    ("tilted", [("resize", 340), ("rotate", 4), ("jpeg", 80)]),
+    ("small_desat", [("resize", 220), ("saturation", 0.85), ("jpeg", 70)]),
+]
+
+CAPTURE_SEED = 4242
+
+# Scanner defaults (DEFAULT_CONFIG in src/hooks/useCardRecognition.ts)
+TOP_K = 20
+THRESHOLD = 0.0
+
+
+def capture_view(card_img: Image.Image, ops: list, rng: np.random.Generator) -> Image.Image:
+    """Apply one CAPTURE_VIEWS op list to a full card image."""
+    img = card_img.convert("RGB")
+    for op, param in ops:
+        if op == "resize":
+            w, h = img.size
+            img = img.resize((param, max(1, round(h * param / w))), Image.BILINEAR)
+        elif op == "jpeg":
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=param)
+            img = Image.open(BytesIO(buf.getvalue())).convert("RGB")
+        else:
+            img = _pil_op(img, op, param, rng)
+    return img
+
+
+def capture_views(card_img: Image.Image, views: list | None = None, seed: int = CAPTURE_SEED) -> list:
+    """All capture views of one card as (view_name, image)."""
+    views = CAPTURE_VIEWS if views is None else views
+    return [(name, capture_view(card_img, ops, noise_rng(seed, i))) for i, (name, ops) in enumerate(views)]
+
+
+def evaluate(queries: list, refs: ReferenceSet, top_k: int = TOP_K, threshold: float = THRESHOLD,
+             use_descriptors: bool = True) -> dict:
+    """
+    Score queries ({"cardCode", "embedding", "histogram", "dhash"}) against refs.
+    Returns top-1/top-K accuracy plus each query's top-1 (code, score) for diffing.
+    """
+    top1 = 0
+    topk = 0
+    predictions = []
+    for q in queries:
+        candidates = find_top_candidates(
+            np.asarray(q["embedding"]), refs, top_k, threshold,
+            query_hist=np.asarray(q["histogram"]) if use_descriptors else None,
+            query_dhash=np.asarray(q["dhash"]) if use_descriptors else None,
+        )
+        codes = [code for code, _ in candidates]
+        top1 += bool(codes) and codes[0] == q["cardCode"]
+        topk += q["cardCode"] in codes
+        predictions.append(candidates[0] if candidates else (None, 0.0))
+    n = max(1, len(queries))
+    return {"queries": len(queries), "top1": top1 / n, "topK": topk / n, "predictions": predictions}
@@ -0,0 +1,151 @@
+"""
+The color descriptors of ml/descriptors.py as a torch module, so export_onnx.py
+can add them to the model graph (--descriptor-outputs) and one session.run in
+the browser returns the embedding, the HSV histogram and the spatial descriptor.
+
+Input is what the browser has at that point: the letterboxed uint8 RGBA frame
+(N, H, W, 4) plus the content box (N, 4) int32 as (x, y, w, h) in frame pixels
+(see letterboxContentBox in preprocess.ts). Both descriptors cover only the box,
+so they describe the art crop and not the gray letterbox padding.
+
+Arithmetic mirrors the reference implementation: HSV, bins and the descriptor
+normalization run in float64 like histogram.ts/dhash.ts; counts and cell sums are
+integer-valued and exact in float32. verify_descriptor_parity checks the graph
+against hsv_histograms/spatial_colors on the same pixels.
+"""
+
+import numpy as np
+import torch
+
+from ml.descriptors import (DHASH_DIM, GRID_H, GRID_W, HIST_H_BINS, HIST_S_BINS, HIST_V_BINS, _fixture_images,
+                            hsv_histograms, spatial_colors)
+
+SV_BINS = HIST_S_BINS * HIST_V_BINS
+
+
+class DescriptorHead(torch.nn.Module):
+    """(pixels uint8 (N, H, W, 4), box int32 (N, 4)) -> (histogram (N, 1024), dhash (N, 432)) float32."""
+
+    def forward(self, pixels: torch.Tensor, box: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        height, width = pixels.shape[1], pixels.shape[2]
+        x0, y0, box_w, box_h = box.to(torch.int64).unbind(-1)
+        rows = torch.arange(height)
+        cols = torch.arange(width)
+        in_rows = (rows[None] >= y0[:, None]) & (rows[None] < (y0 + box_h)[:, None])
+        in_cols = (cols[None] >= x0[:, None]) & (cols[None] < (x0 + box_w)[:, None])
+        inside = in_rows[:, :, None] & in_cols[:, None, :]
+        return self.histogram(pixels, inside), self.spatial(pixels, x0, y0, box_w, box_h)
+
+    @staticmethod
+    def histogram(pixels: torch.Tensor, inside: torch.Tensor) -> torch.Tensor:
+        rgb = pixels[..., :3].to(torch.float64) / 255
+        r, g, b = rgb.unbind(-1)
+        zero = torch.zeros_like(r)
+        one = torch.ones_like(r)
+
+        cmax = torch.maximum(torch.maximum(r, g), b)
+        cmin = torch.minimum(torch.minimum(r, g), b)
+        delta = cmax - cmin
+        s = torch.where(cmax == 0, zero, delta / torch.where(cmax == 0, one, cmax))
+        v = cmax
+
+        safe = torch.where(delta > 0, delta, one)
+        is_r = (delta > 0) & (cmax == r)
+        is_g = (delta > 0) & ~is_r & (cmax == g)
+        is_b = (delta > 0) & ~is_r & ~is_g
+        # histogram.ts takes `% 6` of (g - b) / d, a no-op here since |g - b| <= d
+        h = torch.where(is_r, 60 * ((g - b) / safe), zero)
+        h = torch.where(is_g, 60 * ((b - r) / safe + 2), h)
+        h = torch.where(is_b, 60 * ((r - g) / safe + 4), h)
+        h = torch.where(h < 0, h + 360, h)
+
+        valid = inside & ~((v < 0.1) | ((s < 0.1) & (v > 0.6)))
+        h_bin = torch.minimum(torch.floor(h / 360 * HIST_H_BINS), torch.tensor(HIST_H_BINS - 1.0, dtype=h.dtype))
+        s_bin = torch.minimum(torch.floor(s * HIST_S_BINS), torch.tensor(HIST_S_BINS - 1.0, dtype=s.dtype))
+        v_bin = torch.minimum(torch.floor(v * HIST_V_BINS), torch.tensor(HIST_V_BINS - 1.0, dtype=v.dtype))
+
+        # counts[h, s * V + v] = one_hot(h)^T @ one_hot(sv): a matmul instead of a scatter
+        h_index = h_bin.to(torch.int64).flatten(1).unsqueeze(-1)
+        sv_index = (s_bin * HIST_V_BINS + v_bin).to(torch.int64).flatten(1).unsqueeze(-1)
+        one_h = ((h_index == torch.arange(HIST_H_BINS)) & valid.flatten(1).unsqueeze(-1)).to(torch.float32)
+        one_sv = (sv_index == torch.arange(SV_BINS)).to(torch.float32)
+        counts = torch.matmul(one_h.transpose(1, 2), one_sv).flatten(1).to(torch.float64)
+
+        totals = counts.sum(dim=1, keepdim=True)
+        normalized = counts / torch.where(totals > 0, totals, torch.ones_like(totals))
+        return torch.where(totals > 0, normalized, torch.zeros_like(counts)).to(torch.float32)
+
+    @staticmethod
+    def spatial(pixels: torch.Tensor, x0: torch.Tensor, y0: torch.Tensor, box_w: torch.Tensor,
+                box_h: torch.Tensor) -> torch.Tensor:
+        height, width = pixels.shape[1], pixels.shape[2]
+        row_cells, row_counts = _cell_membership(torch.arange(height)[None] - y0[:, None], box_h, GRID_H)
+        col_cells, col_counts = _cell_membership(torch.arange(width)[None] - x0[:, None], box_w, GRID_W)
+
+        # Cell sums as two matmuls with 0/1 membership matrices: (N, GRID_H, GRID_W, 3)
+        rgb = pixels[..., :3].to(torch.float32)
+        by_rows = torch.matmul(row_cells, rgb.flatten(2)).unflatten(2, (width, 3))
+        sums = torch.matmul(by_rows.permute(0, 1, 3, 2), col_cells.transpose(1, 2)[:, None]).permute(0, 1, 3, 2)
+        counts = (row_counts[:, :, None] * col_counts[:, None, :])[..., None].to(torch.float64)
+
+        means = torch.where(counts > 0, sums.to(torch.float64) / torch.where(counts > 0, counts, 1.0) / 255,
+                            torch.zeros_like(counts))
+        descriptor = means.flatten(1).to(torch.float32)
+
+        # Mean-center, then L2-normalize (float64 math, float32 storage, like normalizeDescriptor)
+        mean = descriptor.to(torch.float64).sum(dim=1, keepdim=True) / DHASH_DIM
+        descriptor = (descriptor.to(torch.float64) - mean).to(torch.float32)
+        norm = torch.sqrt((descriptor.to(torch.float64) ** 2).sum(dim=1, keepdim=True))
+        normalized = (descriptor.to(torch.float64) / torch.where(norm > 0, norm, torch.ones_like(norm)))
+        return torch.where(norm > 0, normalized.to(torch.float32), descriptor)
+
+
+def _cell_membership(offsets: torch.Tensor, length: torch.Tensor, cells: int) -> tuple:
+    """
+    (N, cells, P) 0/1 matrix of which cell each pixel offset falls in, and (N, cells) pixel counts.
+    Cell starts are floor(g * (length / cells)) in float64, like dhash.ts; the last cell ends at length.
+    """
+    cell = length.to(torch.float64) / cells
+    starts = torch.floor(torch.arange(cells, dtype=torch.float64)[None] * cell[:, None]).to(torch.int64)
+    ends = torch.cat([starts[:, 1:], length[:, None]], dim=1)
+    member = (offsets[:, None, :] >= starts[:, :, None]) & (offsets[:, None, :] < ends[:, :, None])
+    return member.to(torch.float32), ends - starts
+
+
+# ─── Parity ─────────────────────────────────────────────────────────────────
+
+def place_in_frame(image: np.ndarray, size: int, x: int, y: int) -> tuple[np.ndarray, np.ndarray]:
+    """Paste an (h, w, 3) uint8 image onto a gray (size, size, 4) RGBA frame; returns (frame, box)."""
+    frame = np.full((size, size, 4), 128, dtype=np.uint8)
+    frame[..., 3] = 255
+    h, w = image.shape[:2]
+    frame[y:y + h, x:x + w, :3] = image
+    return frame, np.array([x, y, w, h], dtype=np.int32)
+
+
+def parity_cases(size: int, crops: list | None = None) -> list:
+    """(frame, box, reference image) triples: descriptor fixture edge cases plus letterboxed crops."""
+    cases = []
+    for i, image in enumerate(_fixture_images()):
+        h, w = image.shape[:2]
+        x, y = (i * 37) % (size - w), (i * 53) % (size - h)
+        cases.append(place_in_frame(image, size, x, y) + (image,))
+    for crop, box in crops or []:
+        x, y, w, h = (int(v) for v in box)
+        frame = np.concatenate([crop, np.full(crop.shape[:2] + (1,), 255, dtype=np.uint8)], axis=2)
+        cases.append((frame, np.asarray(box, dtype=np.int32), crop[y:y + h, x:x + w]))
+    return cases
+
+
+def verify_descriptor_parity(run, cases: list) -> tuple[float, float]:
+    """
+    Max abs (histogram, dhash) error of run(frames, boxes) -> (histograms, dhashes)
+    against hsv_histograms/spatial_colors of each case's reference pixels.
+    """
+    hist_err = 0.0
+    dhash_err = 0.0
+    for frame, box, image in cases:
+        histogram, dhash = run(frame[None], box[None])
+        hist_err = max(hist_err, float(np.abs(histogram[0] - hsv_histograms(image)[0]).max()))
+        dhash_err = max(dhash_err, float(np.abs(dhash[0] - spatial_colors(image)[0]).max()))
+    return hist_err, dhash_err
@@ -0,0 +1,175 @@
+"""
+Crash-safe streaming output for embedding databases.
+
+Each set's finished cards are appended to a JSONL journal as they complete
+(.cache/runs/embeddings-<SET>.jsonl), so a crash loses at most the cards in
+flight and the parent process never holds a whole set of entries. The first
+line records the run config; `generate_embeddings.py --resume` reopens a
+journal with a matching config and skips the cards it already holds. A torn
+last line (the process died mid-write) is ignored.
+
+write_database_json then streams the entries from the journal, in card order,
+into a temp file next to the target and renames it into place, so the live
+public/ml files are always either the previous or the new complete version.
+
+Failed cards are journaled too (without an entry) so the run can report them;
+they are retried on --resume. A --shard run keeps its journals as its partial
+output and `generate_embeddings.py merge` reads them back with SetJournal.read.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from ml.cache import config_digest
+
+DEFAULT_JOURNAL_DIR = Path(".cache/runs")
+
+JOURNAL_VERSION = 1
+
+
+class SetJournal:
+    """Append-only checkpoint of one set's finished cards."""
+
+    def __init__(self, path: Path, config: dict, resume: bool = False):
+        self.path = path
+        self.digest = config_digest(config)
+        self._offsets: dict[str, int] = {}
+        self.failed: dict[str, str] = {}
+        self.resumed = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self._load():
+            self.resumed = len(self._offsets)
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            self._write({"journal": JOURNAL_VERSION, "config": self.digest})
+
+    @classmethod
+    def read(cls, path: Path) -> "SetJournal":
+        """Open a finished journal (e.g. a --shard's output) read-only, whatever its config."""
+        journal = cls.__new__(cls)
+        journal.path = path
+        journal.digest = None
+        journal._offsets = {}
+        journal.failed = {}
+        journal._file = None
+        if not journal._load(truncate=False):
+            raise ValueError(f"{path} is not a readable journal")
+        journal.resumed = len(journal._offsets)
+        return journal
+
+    def _load(self, truncate: bool = True) -> bool:
+        """Index an existing journal with this config. Returns False when it can't be resumed."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return False
+            if self.digest is None:
+                self.digest = header.get("config")
+            if header.get("journal") != JOURNAL_VERSION or header.get("config") != self.digest:
+                return False
+
+            offset = f.tell()
+            end = offset
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn write at the end of a crashed run
+                if not line.endswith(b"\n"):
+                    break
+                code = record["cardCode"]
+                if "entry" in record:
+                    self._offsets[code] = offset
+                    self.failed.pop(code, None)
+                else:
+                    self.failed[code] = record.get("error", "")
+                offset += len(line)
+                end = offset
+
+        # Drop a torn tail so appends start on a line boundary
+        if truncate:
+            os.truncate(self.path, end)
+        return True
+
+    def _write(self, record: dict) -> int:
+        offset = self._file.tell()
+        self._file.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._file.flush()
+        return offset
+
+    def __contains__(self, card_code: str) -> bool:
+        return card_code in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def add(self, entry: dict):
+        """Checkpoint a finished card's database entry."""
+        self._offsets[entry["cardCode"]] = self._write({"cardCode": entry["cardCode"], "entry": entry})
+        self.failed.pop(entry["cardCode"], None)
+
+    def add_failure(self, card_code: str, error: str):
+        self._write({"cardCode": card_code, "error": error})
+        self.failed[card_code] = error
+
+    def entries(self, card_codes: Iterable[str]) -> Iterator[dict]:
+        """Journaled entries of card_codes, in that order, read one at a time."""
+        if self._file is not None:
+            self._file.flush()
+        with open(self.path, "rb") as f:
+            for code in card_codes:
+                offset = self._offsets.get(code)
+                if offset is None:
+                    continue
+                f.seek(offset)
+                yield json.loads(f.readline())["entry"]
+
+    def close(self):
+        if self._file is None or self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self):
+        """Close and delete the journal once its set has been written."""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        self.path.unlink(missing_ok=True)
+
+
+def write_database_json(path: Path, header: dict, entries: Iterable[dict],
+                        transform: Callable[[dict], dict] | None = None) -> int:
+    """
+    Write {**header, "entries": [...]} to path (same bytes as json.dump of the whole
+    dict) one entry at a time, via a temp file renamed into place. header must
+    already hold the final cardCount. Returns the number of entries written.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    count = 0
+    try:
+        with open(tmp, "w") as f:
+            f.write(json.dumps(header)[:-1] + (", " if header else "") + '"entries": [')
+            for entry in entries:
+                if count:
+                    f.write(", ")
+                f.write(json.dumps(transform(entry) if transform else entry))
+                count += 1
+            f.write("]}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return count
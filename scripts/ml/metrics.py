@@ -0,0 +1,201 @@
+"""
+Run telemetry for generate_embeddings.py --metrics and --profile.
+
+RunMetrics collects wall-clock durations per stage (download, model load,
+per-card prepare, forward pass, finalize, per-set write...), end-to-end card
+latency (from the start of a card's preparation to its finalized entry),
+image and forward-pass counts, peak RSS and the cards that failed, then writes
+them as one JSON document:
+
+    {"version": 1, "startedAt": ..., "durationS": ..., "argv": [...],
+     "stages": {"prepare": {"count", "totalS", "p50Ms", "p95Ms", "maxMs"}, ...},
+     "cards": {"count", "p50Ms", "p95Ms", "maxMs"},
+     "throughput": {"images", "forwardPasses", "imagesPerSec", "forwardPassesPerSec"},
+     "peakRssMb": {"main", "workers"}, "failed": [{"cardCode", "error"}, ...]}
+
+Throughput is over forward-pass time, like InferenceBackend.throughput. Stage
+callbacks may run on pipeline threads; list appends are atomic, so recording
+needs no lock. Work inside --workers processes is only seen from the parent
+(the "prepare" stage covers the round trip).
+
+profile_run wraps a whole run in cProfile and the torch profiler and writes
+generate.prof, generate-profile.txt (top functions by cumulative time) and
+torch-trace.json (chrome://tracing / Perfetto) into a directory.
+"""
+
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+METRICS_VERSION = 1
+
+DEFAULT_PROFILE_DIR = Path(".cache/profile")
+# Functions listed in generate-profile.txt
+PROFILE_TOP_N = 40
+
+
+def _stats_ms(seconds: list) -> dict:
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        "count": int(len(ms)),
+        "p50Ms": round(float(np.percentile(ms, 50)), 3),
+        "p95Ms": round(float(np.percentile(ms, 95)), 3),
+        "maxMs": round(float(ms.max()), 3),
+    }
+
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size of this process and of its largest reaped child, in MB (None if unknown)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {"main": None, "workers": None}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20, 1),
+    }
+
+
+class RunMetrics:
+    """Stage durations, card latencies and counters of one generator run."""
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        self._t0 = time.perf_counter()
+        self.stages: dict[str, list] = defaultdict(list)
+        self.card_seconds: list = []
+        self._card_started: dict[str, float] = {}
+        self.images = 0
+        self.forward_passes = 0
+        self.failed: dict[str, str] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as one call of stage `name`."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        """fn, with every call recorded under stage `name`."""
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - t0)
+        return wrapper
+
+    def timed_prepare(self, fn: Callable) -> Callable:
+        """A pipeline prepare step that also starts the card's latency clock."""
+        timed = self.timed("prepare", fn)
+
+        def wrapper(card, *args):
+            self._card_started.setdefault(card["id"], time.perf_counter())
+            return timed(card, *args)
+        return wrapper
+
+    def timed_infer(self, infer: Callable) -> Callable:
+        """A pipeline infer step, counted as forward passes over their images."""
+        timed = self.timed("forward", infer)
+
+        def wrapper(batch: np.ndarray) -> np.ndarray:
+            embeddings = timed(batch)
+            self.images += len(batch)
+            self.forward_passes += 1
+            return embeddings
+        return wrapper
+
+    def card_done(self, card_code: str, error: str | None = None):
+        """A card left the pipeline (finalized, or failed with `error`)."""
+        started = self._card_started.pop(card_code, None)
+        if started is not None:
+            self.card_seconds.append(time.perf_counter() - started)
+        if error is not None:
+            self.failed[card_code] = error
+        else:
+            self.failed.pop(card_code, None)
+
+    def to_json(self) -> dict:
+        forward_seconds = sum(self.stages.get("forward", []))
+        per_second = lambda n: round(n / forward_seconds, 2) if forward_seconds > 0 else 0.0
+        return {
+            "version": METRICS_VERSION,
+            "startedAt": self.started_at,
+            "durationS": round(time.perf_counter() - self._t0, 3),
+            "argv": sys.argv[1:],
+            "stages": {name: {**_stats_ms(seconds), "totalS": round(sum(seconds), 3)}
+                       for name, seconds in self.stages.items() if seconds},
+            "cards": _stats_ms(self.card_seconds) if self.card_seconds else {"count": 0},
+            "throughput": {
+                "images": self.images,
+                "forwardPasses": self.forward_passes,
+                "imagesPerSec": per_second(self.images),
+                "forwardPassesPerSec": per_second(self.forward_passes),
+            },
+            "peakRssMb": peak_rss_mb(),
+            "failed": [{"cardCode": code, "error": error} for code, error in sorted(self.failed.items())],
+        }
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+
+def _torch_profiler():
+    """A torch.profiler context over CPU (and CUDA when present), or None without torch."""
+    # Imported here: the generator only imports torch once the run is under way
+    try:
+        import torch
+        import torch.profiler
+    except ImportError:
+        return None
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    return torch.profiler.profile(activities=activities)
+
+
+def profile_run(fn: Callable, out_dir: Path = DEFAULT_PROFILE_DIR):
+    """
+    Run fn() under cProfile and the torch profiler. The trace files are written
+    even when fn exits early (sys.exit, Ctrl-C, an exception), which propagates.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    torch_profiler = _torch_profiler()
+    profiler = cProfile.Profile()
+    try:
+        with torch_profiler if torch_profiler is not None else contextlib.nullcontext():
+            profiler.enable()
+            try:
+                return fn()
+            finally:
+                profiler.disable()
+    finally:
+        profiler.dump_stats(out_dir / "generate.prof")
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+        (out_dir / "generate-profile.txt").write_text(text.getvalue())
+        written = ["generate.prof", "generate-profile.txt"]
+        if torch_profiler is not None:
+            torch_profiler.export_chrome_trace(str(out_dir / "torch-trace.json"))
+            written.append("torch-trace.json")
+        print(f"Profile written to {out_dir}: {', '.join(written)}")
@@ -0,0 +1,139 @@
+"""
+Smaller and pre-optimized variants of the exported ONNX model.
+
+- int8: static QDQ quantization (per-channel int8 weights, uint8 activations)
+  calibrated on letterboxed art crops of cached card images
+- ORT format: graph optimizations applied ahead of time and saved as .ort, so
+  the browser session loads an already-optimized graph (onnxruntime-web reads
+  .ort files directly)
+
+verify_variants checks each variant the way the scanner uses it: top-1 against
+the reference database over every cached card, and agreement with the fp32
+model's top-1, rather than a max-abs diff on random noise.
+
+Requires onnxruntime (and onnx for quantization).
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from ml.scoring import normalize_rows
+
+CALIBRATION_METHODS = {
+    "minmax": CalibrationMethod.MinMax,
+    "entropy": CalibrationMethod.Entropy,
+    "percentile": CalibrationMethod.Percentile,
+}
+
+# Wasm runs the CPU execution provider, so extended (fused CPU contrib op) optimizations
+# are safe; ORT_ENABLE_ALL adds layout transforms tied to the build machine's CPU
+ORT_OPTIMIZATION_LEVEL = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+
+
+class CropReader(CalibrationDataReader):
+    """Feeds (N, 3, H, W) float32 model inputs to the calibrator one image at a time."""
+
+    def __init__(self, inputs: np.ndarray, input_name: str = "input"):
+        self.inputs = inputs
+        self.input_name = input_name
+        self._index = 0
+
+    def get_next(self) -> dict | None:
+        if self._index >= len(self.inputs):
+            return None
+        batch = self.inputs[self._index:self._index + 1]
+        self._index += 1
+        return {self.input_name: batch}
+
+    def rewind(self):
+        self._index = 0
+
+
+def quantize_int8(model_path: Path, output_path: Path, calibration: np.ndarray, method: str = "minmax"):
+    """Static int8 QDQ quantization of model_path, calibrated on `calibration` model inputs."""
+    prepared = output_path.with_name(f".{output_path.stem}.prep.onnx")
+    quant_pre_process(str(model_path), str(prepared))
+    try:
+        quantize_static(
+            str(prepared),
+            str(output_path),
+            CropReader(calibration),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CALIBRATION_METHODS[method],
+        )
+    finally:
+        prepared.unlink(missing_ok=True)
+
+
+def save_ort_format(model_path: Path, output_path: Path):
+    """Optimize model_path's graph once and save it in ORT format."""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ORT_OPTIMIZATION_LEVEL
+    options.optimized_model_filepath = str(output_path)
+    options.add_session_config_entry("session.save_model_format", "ORT")
+    ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+
+def run_model(model_path: Path, inputs: np.ndarray, batch_size: int = 1) -> tuple[np.ndarray, float]:
+    """Embeddings of every input row plus mean milliseconds per batch (batch 1 = one scanner frame)."""
+    session = ort.InferenceSession(str(model_path), providers=["CPUExecutionProvider"])
+    name = session.get_inputs()[0].name
+    outputs = []
+    t0 = time.perf_counter()
+    for i in range(0, len(inputs), batch_size):
+        outputs.append(session.run(None, {name: inputs[i:i + batch_size]})[0])
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    return np.concatenate(outputs), elapsed_ms / max(1, -(-len(inputs) // batch_size))
+
+
+def verify_variants(variants: dict, inputs: np.ndarray, codes: list, ref_codes: list,
+                    ref_embeddings: np.ndarray | None) -> float:
+    """
+    Compare every variant in `variants` (name -> path, first entry is the fp32 reference)
+    on the model inputs of cards `codes`. With reference embeddings, reports top-1
+    accuracy (raw cosine against ref_codes) and top-1 agreement with the reference
+    variant. Returns the lowest agreement (1.0 without references).
+    """
+    refs = None if ref_embeddings is None else normalize_rows(np.asarray(ref_embeddings, dtype=np.float64))
+    truth = np.array(codes)
+    ref_codes = np.array(ref_codes)
+
+    print(f"\nVariant verification ({len(inputs)} cards, batch 1"
+          f"{'' if refs is not None else ', no reference database'}):")
+    print(f"  {'variant':<12} {'size':>8} {'ms/img':>7} {'cos min':>8} {'cos mean':>9} {'top-1':>7} {'agree':>7}")
+
+    baseline = None
+    base_top1 = None
+    worst = 1.0
+    for name, path in variants.items():
+        embeddings, ms = run_model(path, inputs)
+        embeddings = normalize_rows(embeddings.astype(np.float64))
+        if baseline is None:
+            baseline = embeddings
+        cos = (embeddings * baseline).sum(axis=1)
+
+        top1 = agree = ""
+        if refs is not None:
+            if embeddings.shape[1] != refs.shape[1]:
+                raise ValueError(f"{name} outputs {embeddings.shape[1]} dims but the reference database has "
+                                 f"{refs.shape[1]}; regenerate embeddings or export with the matching --pca")
+            predicted = ref_codes[(embeddings @ refs.T).argmax(axis=1)]
+            if base_top1 is None:
+                base_top1 = predicted
+            agreement = float(np.mean(predicted == base_top1))
+            worst = min(worst, agreement)
+            top1 = f"{np.mean(predicted == truth):.2%}"
+            agree = f"{agreement:.1%}"
+
+        size_mb = Path(path).stat().st_size / 1024 / 1024
+        print(f"  {name:<12} {size_mb:>6.1f}MB {ms:>7.2f} {cos.min():>8.4f} {cos.mean():>9.4f} {top1:>7} {agree:>7}")
+    return worst
@@ -0,0 +1,206 @@
+"""
+PCA projection of model embeddings to a lower dimension.
+
+generate_embeddings.py --reduce-dim K fits the projection on the augmented
+embeddings of every card, projects the reference centroids and saves it to
+PCA_PATH. export_onnx.py --pca appends it to the model as a final MatMul + Add,
+so the browser receives K-dim vectors and the reference database matches.
+
+The projection is affine (y = (x - mean) @ components.T, optionally divided by
+sqrt(explained variance) when whitened), so projecting a centroid equals the
+centroid of the projected augmentations.
+
+Centering changes the cosine distribution: unrelated cards score near 0 instead
+of well above it, so the scanner's embedding ramp (ml.scoring.EMB_RAMP, tuned on
+the model's own embeddings) would clip most of the range. fit_emb_ramp retunes it
+for a projection; the generator ships the result as manifest projection.embRamp,
+which reference-db.ts and ml.scoring use instead of the default.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from ml.scoring import EMB_RAMP, ReferenceSet, fused_scores_batch, normalize_rows
+
+if TYPE_CHECKING:
+    import torch
+
+PCA_PATH = Path(".cache/pca.npz")
+
+# Dimensions reported by the held-out accuracy sweep (the full dimension is always included)
+DEFAULT_SWEEP_DIMS = (32, 64, 128, 256, 512)
+
+# Every HOLDOUT_EVERY-th augmentation of a card is held out as a query
+HOLDOUT_EVERY = 5
+
+# Added to the variance before whitening so near-zero components don't blow up
+WHITEN_EPS = 1e-6
+
+
+@dataclass
+class PCA:
+    mean: np.ndarray                # (D,)
+    components: np.ndarray          # (K, D), rows sorted by decreasing variance
+    explained_variance: np.ndarray  # (K,)
+    total_variance: float
+    whiten: bool = False
+
+    @property
+    def dim(self) -> int:
+        return len(self.components)
+
+    @property
+    def variance_retained(self) -> float:
+        return float(self.explained_variance.sum() / self.total_variance) if self.total_variance > 0 else 1.0
+
+    def truncate(self, k: int, whiten: bool | None = None) -> "PCA":
+        """The first k components (a PCA fitted once at the largest K serves every smaller K)."""
+        return PCA(self.mean, self.components[:k], self.explained_variance[:k], self.total_variance,
+                   self.whiten if whiten is None else whiten)
+
+    def weights(self) -> tuple[np.ndarray, np.ndarray]:
+        """(W, b) with shapes (D, K) and (K,) such that project(x) == x @ W + b."""
+        w = self.components.T.astype(np.float64)
+        if self.whiten:
+            w = w / np.sqrt(self.explained_variance + WHITEN_EPS)
+        return w, -self.mean.astype(np.float64) @ w
+
+    def project(self, x: np.ndarray) -> np.ndarray:
+        w, b = self.weights()
+        return np.asarray(x, dtype=np.float64) @ w + b
+
+    def save(self, path: Path = PCA_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, mean=self.mean, components=self.components,
+                     explained_variance=self.explained_variance,
+                     total_variance=self.total_variance, whiten=self.whiten)
+
+    @classmethod
+    def load(cls, path: Path = PCA_PATH) -> "PCA":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], data["explained_variance"],
+                       float(data["total_variance"]), bool(data["whiten"]))
+
+
+def fit_pca(samples: np.ndarray, k: int, whiten: bool = False) -> PCA:
+    """Fit the top-k principal components of (N, D) samples."""
+    x = np.asarray(samples, dtype=np.float64)
+    k = min(k, x.shape[1])
+    mean = x.mean(axis=0)
+    centered = x - mean
+    cov = centered.T @ centered / max(1, len(x) - 1)
+    variances, vectors = np.linalg.eigh(cov)
+    order = np.argsort(variances)[::-1][:k]
+    components = vectors[:, order].T
+    # Deterministic signs: largest-magnitude coordinate of each component is positive
+    signs = np.sign(components[np.arange(k), np.abs(components).argmax(axis=1)])
+    components *= np.where(signs == 0, 1, signs)[:, None]
+    return PCA(mean, components, np.maximum(variances[order], 0), float(np.maximum(variances, 0).sum()), whiten)
+
+
+def projection_head(pca: PCA) -> torch.nn.Module:
+    """
+    PCA as a torch module: exports to a MatMul followed by an Add. torch is imported
+    here, so the NumPy side of this module loads without it.
+    """
+    import torch
+
+    class ProjectionHead(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            w, b = pca.weights()
+            self.register_buffer("weight", torch.from_numpy(w.astype(np.float32)))
+            self.register_buffer("bias", torch.from_numpy(b.astype(np.float32)))
+
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            return torch.matmul(x, self.weight) + self.bias
+
+    return ProjectionHead()
+
+
+def with_projection(model: torch.nn.Module, pca: PCA) -> torch.nn.Module:
+    """model followed by the PCA projection, on the model's device."""
+    import torch
+
+    device = next(model.parameters()).device
+    return torch.nn.Sequential(model, projection_head(pca).to(device)).eval()
+
+
+def fit_emb_ramp(raw_sims: np.ndarray, projected_sims: np.ndarray, ramp: tuple = EMB_RAMP) -> tuple:
+    """
+    Embedding ramp (start, width) for projected cosines: its ends sit at the quantiles
+    of projected_sims where `ramp`'s ends sit among raw_sims, the same query/reference
+    pairs before projection.
+    """
+    start, width = ramp
+    quantiles = [np.mean(raw_sims < start), np.mean(raw_sims < start + width)]
+    low, high = np.quantile(projected_sims, quantiles)
+    return round(float(low), 4), round(max(float(high - low), 1e-3), 4)
+
+
+def heldout_sweep(augmented: dict, dims: list, holdout_every: int = HOLDOUT_EVERY) -> list:
+    """
+    Top-1 accuracy on held-out augmentations for each K in dims, plain and whitened,
+    plus the unprojected baseline (k=None): by raw cosine ("top1") and by the scanner's
+    score (ml.scoring.fused_scores, embedding term only) with the ramp fitted for that
+    projection ("top1Fused", ramp in "embRamp"). Saturated scores tie and ties go to
+    the lower reference index, as in the scanner, so the fused top-1 can be lower.
+
+    augmented maps cardCode -> (N, D) augmented embeddings. Every holdout_every-th
+    row is a query; the PCA and the reference centroids use the remaining rows.
+    Held-out augmentations are transforms of the reference image, so absolute
+    numbers are optimistic; use the sweep to compare dimensions.
+    """
+    codes = sorted(augmented)
+    train = []
+    queries = []
+    labels = []
+    for i, code in enumerate(codes):
+        rows = np.asarray(augmented[code], dtype=np.float64)
+        held = np.arange(len(rows)) % holdout_every == 0
+        train.append(rows[~held])
+        queries.append(rows[held])
+        labels.extend([i] * int(held.sum()))
+
+    full_dim = train[0].shape[1]
+    dims = sorted({min(k, full_dim) for k in dims})
+    pca = fit_pca(np.concatenate(train), dims[-1]) if dims else None
+    centroids = np.stack([rows.mean(axis=0) for rows in train])
+    query_matrix = np.concatenate(queries)
+    labels = np.array(labels)
+    raw_sims = normalize_rows(query_matrix) @ normalize_rows(centroids).T
+
+    def top1(project, fit_ramp: bool = True) -> tuple:
+        """(raw cosine top-1, fused top-1, ramp) of one projection."""
+        refs = project(centroids)
+        sims = normalize_rows(project(query_matrix)) @ normalize_rows(refs).T
+        ramp = fit_emb_ramp(raw_sims, sims) if fit_ramp else EMB_RAMP
+        fused = fused_scores_batch(ReferenceSet(codes, refs, emb_ramp=ramp), project(query_matrix))
+        if not len(labels):
+            return 0.0, 0.0, ramp
+        return float(np.mean(sims.argmax(axis=1) == labels)), float(np.mean(fused.argmax(axis=1) == labels)), ramp
+
+    raw, fused, ramp = top1(lambda x: x, fit_ramp=False)
+    results = [{"k": None, "varianceRetained": 1.0, "top1": raw, "top1Fused": fused, "embRamp": ramp,
+                "top1Whitened": None, "top1FusedWhitened": None, "embRampWhitened": None}]
+    for k in dims:
+        plain = pca.truncate(k, whiten=False)
+        raw, fused, ramp = top1(plain.project)
+        raw_w, fused_w, ramp_w = top1(pca.truncate(k, whiten=True).project)
+        results.append({
+            "k": k,
+            "varianceRetained": plain.variance_retained,
+            "top1": raw,
+            "top1Fused": fused,
+            "embRamp": ramp,
+            "top1Whitened": raw_w,
+            "top1FusedWhitened": fused_w,
+            "embRampWhitened": ramp_w,
+        })
+    return results
@@ -0,0 +1,151 @@
+"""
+Producer/consumer pipeline for cross-card batched inference.
+
+Workers prepare model inputs for upcoming cards (decode, crop, descriptors,
+augmentations) while the main thread runs the model. Input rows are packed into
+fixed-size batches across card boundaries, and the outputs are split back per
+card so each card can be finalized (e.g. averaged into a centroid).
+
+Model inputs and outputs are plain NumPy arrays, so the pipeline does not care
+which inference backend is behind `infer`.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+
+
+@dataclass
+class Prepared:
+    """
+    Output of a prepare step. Either `result` is already final (e.g. a cache hit)
+    or `inputs` holds (N, ...) rows that still need inference.
+    """
+    result: dict | None = None
+    inputs: np.ndarray | None = None
+    state: dict = field(default_factory=dict)
+
+
+@dataclass
+class CardOutcome:
+    item: Any
+    result: dict | None = None
+    error: str | None = None
+    cached: bool = False
+
+
+class _Slot:
+    def __init__(self, item, prepared: Prepared | None = None, error: str | None = None):
+        self.item = item
+        self.prepared = prepared
+        self.error = error
+        self.outputs: list[np.ndarray] = []
+        self.remaining = 0 if prepared is None or prepared.inputs is None else len(prepared.inputs)
+        self.result = prepared.result if prepared is not None else None
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or self.remaining == 0
+
+
+def run_batched(
+    items: Iterable,
+    prepare: Callable[[Any], Prepared],
+    infer: Callable[[np.ndarray], np.ndarray],
+    finalize: Callable[[Prepared, np.ndarray], dict],
+    batch_size: int,
+    workers: int = 1,
+    prefetch: int | None = None,
+) -> Iterator[CardOutcome]:
+    """
+    Yield a CardOutcome per item, in input order.
+
+    prepare runs on `workers` threads, at most `prefetch` items ahead of inference.
+    infer receives batches of exactly batch_size rows (the last one may be smaller).
+    finalize receives the card's Prepared and its (N, D) output rows in input order.
+    Exceptions from prepare/finalize are reported per item; exceptions from infer propagate.
+    """
+    batch_size = max(1, batch_size)
+    workers = max(1, workers)
+    prefetch = prefetch or workers * 2
+
+    items_iter = iter(items)
+    futures: deque = deque()
+    slots: deque[_Slot] = deque()
+    rows: deque[tuple[_Slot, np.ndarray]] = deque()
+    buffered = 0
+
+    def refill(pool):
+        while len(futures) < prefetch:
+            item = next(items_iter, _SENTINEL)
+            if item is _SENTINEL:
+                return
+            futures.append((item, pool.submit(prepare, item)))
+
+    def finish(slot: _Slot):
+        try:
+            slot.result = finalize(slot.prepared, np.concatenate(slot.outputs))
+        except Exception as e:
+            slot.error = str(e)
+        slot.outputs = []
+        slot.prepared.inputs = None
+
+    def flush(limit: int):
+        nonlocal buffered
+        chunks = []
+        owners = []
+        taken = 0
+        while rows and taken < limit:
+            slot, arr = rows.popleft()
+            take = min(len(arr), limit - taken)
+            chunks.append(arr[:take])
+            owners.append((slot, take))
+            if take < len(arr):
+                rows.appendleft((slot, arr[take:]))
+            taken += take
+        buffered -= taken
+
+        out = infer(chunks[0] if len(chunks) == 1 else np.concatenate(chunks))
+        offset = 0
+        for slot, count in owners:
+            slot.outputs.append(out[offset:offset + count])
+            offset += count
+            slot.remaining -= count
+            if slot.remaining == 0:
+                finish(slot)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        refill(pool)
+        while futures or buffered:
+            if futures:
+                item, future = futures.popleft()
+                refill(pool)
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    slots.append(_Slot(item, error=str(e)))
+                else:
+                    slot = _Slot(item, prepared)
+                    slots.append(slot)
+                    if not slot.done:
+                        rows.append((slot, prepared.inputs))
+                        buffered += len(prepared.inputs)
+                while buffered >= batch_size:
+                    flush(batch_size)
+            else:
+                flush(batch_size)
+
+            while slots and slots[0].done:
+                slot = slots.popleft()
+                yield CardOutcome(
+                    item=slot.item,
+                    result=slot.result,
+                    error=slot.error,
+                    cached=slot.prepared is not None and slot.prepared.result is not None,
+                )
+
+
+_SENTINEL = object()
@@ -0,0 +1,95 @@
+"""
+Process-pool preprocessing with shared-memory handoff.
+
+CPU-heavy PIL/NumPy preprocessing does not scale across threads because of the
+GIL, so it runs in worker processes instead. Rather than pickling the resulting
+arrays (or PIL images) back to the parent, each worker writes its uint8 output
+into a pre-allocated shared memory slot; the parent converts it straight into
+model input and hands the slot back for reuse.
+
+The worker function must be importable (module level) and return a
+ml.pipeline.Prepared whose `inputs` (if any) fit in one slot.
+"""
+
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable
+
+import numpy as np
+
+from ml.pipeline import Prepared
+
+# Worker-side attachments, reused across tasks
+_attached: dict[str, SharedMemory] = {}
+
+
+def _attach(name: str) -> SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        shm = SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def _run_into_slot(fn: Callable, slot_name: str, args: tuple):
+    """Worker entry point: run fn, move its array output into the shared slot."""
+    prepared = fn(*args)
+    if prepared.inputs is None:
+        return prepared, None, None
+
+    arr = np.ascontiguousarray(prepared.inputs)
+    shm = _attach(slot_name)
+    if arr.nbytes > shm.size:
+        raise ValueError(f"Preprocessed output ({arr.nbytes} bytes) exceeds shared slot ({shm.size} bytes)")
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    prepared.inputs = None
+    return prepared, arr.shape, arr.dtype.str
+
+
+class SharedMemoryPool:
+    """
+    Callable wrapper running `fn(*args)` in a process pool.
+
+    `convert(view, prepared)` turns the shared uint8 view into the final model
+    input and must return a copy, since the slot is recycled as soon as it
+    returns. Safe to call from several threads at once; at most `workers` calls
+    run concurrently.
+    """
+
+    def __init__(self, fn: Callable, convert: Callable[[np.ndarray, Prepared], np.ndarray],
+                 workers: int, slot_bytes: int, start_method: str = "spawn"):
+        self.fn = fn
+        self.convert = convert
+        self.workers = max(1, workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context(start_method))
+        self._slots = [SharedMemory(create=True, size=slot_bytes) for _ in range(self.workers)]
+        self._free: queue.Queue[SharedMemory] = queue.Queue()
+        for slot in self._slots:
+            self._free.put(slot)
+
+    def __call__(self, *args) -> Prepared:
+        slot = self._free.get()
+        try:
+            future = self._executor.submit(_run_into_slot, self.fn, slot.name, args)
+            prepared, shape, dtype = future.result()
+            if shape is not None:
+                view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=slot.buf)
+                prepared.inputs = self.convert(view, prepared)
+                del view
+        finally:
+            self._free.put(slot)
+        return prepared
+
+    def close(self):
+        self._executor.shutdown()
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,213 @@
+"""
+Python port of the browser's candidate scoring (findTopCandidates in
+src/lib/card-recognition/reference-db.ts), vectorized over all references.
+
+Used offline to measure how generator-side changes (quantization, augmentation
+sets...) affect what the scanner would actually return, and by identify_cards.py
+to score whole batches of photos with fused_scores_batch. Keep the weights and
+normalization ramps in sync with reference-db.ts.
+"""
+
+import numpy as np
+
+from ml.dbformat import dense_histogram
+from ml.descriptors import DHASH_DIM
+
+# Fused score weights: (embedding, histogram, spatial)
+WEIGHTS_ALL = (0.45, 0.25, 0.3)
+WEIGHTS_EMB_SPATIAL = (0.55, 0.45)
+WEIGHTS_EMB_HIST = (0.6, 0.4)
+
+# Below this best same-color score the color filter falls back to every reference
+COLOR_FALLBACK_SCORE = 0.4
+
+# Embedding score ramp (start, width) for the model's own embeddings; PCA-projected
+# databases ship a retuned one as manifest projection.embRamp (see ml/pca.py)
+EMB_RAMP = (0.35, 0.35)
+
+
+def norm_emb(v: np.ndarray, ramp: tuple = EMB_RAMP) -> np.ndarray:
+    start, width = ramp
+    return np.clip((v - start) / width, 0, 1)
+
+
+def manifest_emb_ramp(manifest: dict | None) -> tuple:
+    """The embedding ramp the scanner uses with a manifest's databases."""
+    return tuple(((manifest or {}).get("projection") or {}).get("embRamp", EMB_RAMP))
+
+
+def norm_hist(v: np.ndarray) -> np.ndarray:
+    return np.clip((v - 0.05) / 0.30, 0, 1)
+
+
+def norm_spatial(v: np.ndarray) -> np.ndarray:
+    return np.clip((v - 0.10) / 0.40, 0, 1)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize along the last axis; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _stack(rows: list, dim: int | None) -> tuple:
+    """Stack optional per-entry vectors into (N, D) plus a presence mask."""
+    present = np.array([r is not None for r in rows], dtype=bool)
+    if not present.any():
+        return None, present
+    dim = dim or len(next(r for r in rows if r is not None))
+    matrix = np.zeros((len(rows), dim), dtype=np.float32)
+    for i, r in enumerate(rows):
+        if r is not None:
+            matrix[i] = r
+    return matrix, present
+
+
+class ReferenceSet:
+    """
+    Reference entries as matrices: embeddings are L2-normalized like loadReferenceDatabase.
+    emb_ramp is the embedding score ramp of their manifest (manifest_emb_ramp).
+    """
+
+    def __init__(self, codes: list, embeddings: np.ndarray, histograms: np.ndarray | None = None,
+                 dhashes: np.ndarray | None = None, colors: list | None = None,
+                 has_hist: np.ndarray | None = None, has_dhash: np.ndarray | None = None,
+                 emb_ramp: tuple = EMB_RAMP):
+        n = len(codes)
+        self.codes = list(codes)
+        self.embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        self.histograms = histograms
+        self.dhashes = None if dhashes is None else normalize_rows(np.asarray(dhashes, dtype=np.float32))
+        self.colors = list(colors) if colors is not None else [None] * n
+        self.has_hist = has_hist if has_hist is not None else np.full(n, histograms is not None)
+        self.has_dhash = has_dhash if has_dhash is not None else np.full(n, dhashes is not None)
+        self.emb_ramp = tuple(emb_ramp)
+
+    @classmethod
+    def from_entries(cls, entries: list, emb_ramp: tuple = EMB_RAMP) -> "ReferenceSet":
+        histograms, has_hist = _stack(
+            [None if e.get("histogram") is None else dense_histogram(e["histogram"]) for e in entries], None)
+        # Legacy string dhashes decode to all-zero descriptors in the browser (hexToDHash)
+        dhashes, has_dhash = _stack(
+            [np.zeros(DHASH_DIM) if isinstance(e.get("dhash"), str) else e.get("dhash") for e in entries],
+            None)
+        return cls(
+            codes=[e["cardCode"] for e in entries],
+            embeddings=np.asarray([e["embedding"] for e in entries], dtype=np.float32),
+            histograms=histograms,
+            dhashes=dhashes,
+            colors=[e.get("color") for e in entries],
+            has_hist=has_hist,
+            has_dhash=has_dhash,
+            emb_ramp=emb_ramp,
+        )
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def fused_scores(refs: ReferenceSet, query: np.ndarray, query_hist: np.ndarray | None = None,
+                 query_dhash: np.ndarray | None = None) -> np.ndarray:
+    """Score of every reference for one query (scoreRef in reference-db.ts)."""
+    q = np.asarray(query, dtype=np.float64)
+    q_norm = np.linalg.norm(q)
+    emb_sim = refs.embeddings @ (q / q_norm) if q_norm > 0 else np.zeros(len(refs))
+    emb = norm_emb(emb_sim, refs.emb_ramp)
+
+    use_hist = query_hist is not None and refs.histograms is not None and refs.has_hist.any()
+    use_dhash = query_dhash is not None and refs.dhashes is not None and refs.has_dhash.any()
+    scores = emb.copy()
+
+    if use_hist:
+        hist = norm_hist(np.minimum(refs.histograms, np.asarray(query_hist)[None, :]).sum(axis=1))
+    if use_dhash:
+        dq = np.asarray(query_dhash, dtype=np.float64)
+        dq_norm = np.linalg.norm(dq)
+        dh_sim = np.maximum(0, refs.dhashes @ (dq / dq_norm)) if dq_norm > 0 else np.zeros(len(refs))
+        spatial = norm_spatial(dh_sim)
+
+    if use_dhash:
+        w_emb, w_spatial = WEIGHTS_EMB_SPATIAL
+        rows = refs.has_dhash
+        scores[rows] = w_emb * emb[rows] + w_spatial * spatial[rows]
+    if use_hist:
+        w_emb, w_hist = WEIGHTS_EMB_HIST
+        rows = (refs.has_hist & ~refs.has_dhash) if use_dhash else refs.has_hist
+        scores[rows] = w_emb * emb[rows] + w_hist * hist[rows]
+    if use_hist and use_dhash:
+        w_emb, w_hist, w_spatial = WEIGHTS_ALL
+        rows = refs.has_hist & refs.has_dhash
+        scores[rows] = w_emb * emb[rows] + w_hist * hist[rows] + w_spatial * spatial[rows]
+    return scores
+
+
+def fused_scores_batch(refs: ReferenceSet, queries: np.ndarray, query_hists: np.ndarray | None = None,
+                       query_dhashes: np.ndarray | None = None, chunk_elements: int = 1 << 24) -> np.ndarray:
+    """
+    (Q, N) fused_scores of Q queries at once: one matrix product per term. The histogram
+    intersection materializes (rows, N, bins), so queries go through it in chunks of at
+    most chunk_elements.
+    """
+    q = normalize_rows(np.asarray(queries, dtype=np.float64))
+    scores = norm_emb(q @ refs.embeddings.T.astype(np.float64), refs.emb_ramp)
+    emb = scores.copy()
+
+    use_hist = query_hists is not None and refs.histograms is not None and refs.has_hist.any()
+    use_dhash = query_dhashes is not None and refs.dhashes is not None and refs.has_dhash.any()
+
+    if use_hist:
+        query_hists = np.asarray(query_hists, dtype=np.float32)
+        hist = np.empty_like(scores)
+        step = max(1, chunk_elements // max(1, refs.histograms.size))
+        for start in range(0, len(q), step):
+            block = query_hists[start:start + step]
+            hist[start:start + step] = np.minimum(refs.histograms[None, :, :], block[:, None, :]).sum(axis=2)
+        hist = norm_hist(hist)
+    if use_dhash:
+        dq = normalize_rows(np.asarray(query_dhashes, dtype=np.float64))
+        spatial = norm_spatial(np.maximum(0, dq @ refs.dhashes.T.astype(np.float64)))
+
+    if use_dhash:
+        w_emb, w_spatial = WEIGHTS_EMB_SPATIAL
+        rows = refs.has_dhash
+        scores[:, rows] = w_emb * emb[:, rows] + w_spatial * spatial[:, rows]
+    if use_hist:
+        w_emb, w_hist = WEIGHTS_EMB_HIST
+        rows = (refs.has_hist & ~refs.has_dhash) if use_dhash else refs.has_hist
+        scores[:, rows] = w_emb * emb[:, rows] + w_hist * hist[:, rows]
+    if use_hist and use_dhash:
+        w_emb, w_hist, w_spatial = WEIGHTS_ALL
+        rows = refs.has_hist & refs.has_dhash
+        scores[:, rows] = w_emb * emb[:, rows] + w_hist * hist[:, rows] + w_spatial * spatial[:, rows]
+    return scores
+
+
+def top_candidates(scores: np.ndarray, refs: ReferenceSet, top_k: int, threshold: float,
+                   candidates: np.ndarray | None = None) -> list:
+    """Top-K (cardCode, score) pairs of one query's scores, deduplicated by card."""
+    candidates = np.arange(len(refs)) if candidates is None else candidates
+    candidates = candidates[scores[candidates] >= threshold]
+    best: dict[str, float] = {}
+    for i in candidates[np.argsort(-scores[candidates], kind="stable")]:
+        code = refs.codes[i]
+        if code not in best:
+            best[code] = float(scores[i])
+            if len(best) == top_k:
+                break
+    return list(best.items())
+
+
+def find_top_candidates(query: np.ndarray, refs: ReferenceSet, top_k: int, threshold: float,
+                        query_hist: np.ndarray | None = None, color_filter: str | None = None,
+                        query_dhash: np.ndarray | None = None) -> list:
+    """Top-K (cardCode, score) pairs, deduplicated by card, like findTopCandidates."""
+    scores = fused_scores(refs, query, query_hist, query_dhash)
+
+    candidates = np.arange(len(refs))
+    if color_filter:
+        same = np.array([c == color_filter for c in refs.colors], dtype=bool)
+        best_same = scores[same].max() if same.any() else 0.0
+        if same.any() and best_same >= threshold and best_same >= COLOR_FALLBACK_SCORE:
+            candidates = candidates[same]
+
+    return top_candidates(scores, refs, top_k, threshold, candidates)
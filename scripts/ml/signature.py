@@ -0,0 +1,165 @@
+"""
+Compact binary signatures of the references, for a cascaded pre-filter.
+
+findTopCandidates computes the full fused score (embedding dot product, sparse
+histogram intersection, spatial descriptor) of every reference it considers.
+Each reference also carries a SIGNATURE_BITS-bit SimHash of its embedding: bit b
+is set when the L2-normalized embedding's projection onto hyperplane b reaches
+that plane's threshold. The scanner hashes the query the same way and skips every
+reference more than `cutoff` bits away (an XOR and a popcount per 32 bits)
+before scoring it (see reference-db.ts).
+
+Hyperplanes are Rademacher (+1/-1) vectors drawn from a xorshift32 stream seeded
+with `seed`, row-major over (dim, bits), so the browser regenerates them from the
+manifest instead of downloading a dim x bits matrix (signatureHyperplanes in
+reference-db.ts; keep the two in sync). Model embeddings are far from centered,
+so zero thresholds would hash most references alike: each plane's threshold is
+the references' median projection instead, which makes every bit split them in
+half.
+
+The cutoff is calibrated on synthetic scanner captures (ml/evaluate.py): the
+largest distance from a capture's signature to the references tied for the full
+scorer's first place and to the best-scoring row of its true card, plus a margin. It is
+then checked on captures drawn with another noise seed (cascade_report). Queries come
+from every model the scanner may embed frames with (the reference model and the
+manifest's distilled embedder, see distill_student.py), listed in `calibrated_with`;
+the scanner only applies the cutoff to queries from one of them.
+
+The fitted hash is stored in manifest.json as "signature"; the signatures go in
+the databases (signature_hex / signature_words in ml/dbformat.py).
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+from ml.dbformat import signature_hex
+from ml.scoring import ReferenceSet, fused_scores, normalize_rows
+
+SIGNATURE_BITS = 128
+SIGNATURE_SEED = 0x9E3779B9
+
+# Bits added to the largest calibration distance
+DEFAULT_MARGIN = 4
+
+
+@lru_cache(maxsize=4)
+def hyperplanes(dim: int, bits: int, seed: int) -> np.ndarray:
+    """(dim, bits) +1/-1 matrix: the top bit of successive xorshift32 states, row-major."""
+    x = seed & 0xFFFFFFFF or 1
+    signs = np.empty(dim * bits, dtype=np.float64)
+    for i in range(dim * bits):
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        signs[i] = 1.0 if x & 0x80000000 else -1.0
+    return signs.reshape(dim, bits)
+
+
+def hamming(query: np.ndarray, signatures: np.ndarray) -> np.ndarray:
+    """(N,) bit distances between one (W,) uint32 signature and (N, W) signatures."""
+    diff = np.bitwise_xor(signatures, query[None, :]).astype("<u4")
+    return np.unpackbits(diff.view(np.uint8), axis=1).sum(axis=1)
+
+
+@dataclass
+class SimHash:
+    thresholds: np.ndarray  # (bits,)
+    dim: int
+    seed: int = SIGNATURE_SEED
+    cutoff: int | None = None
+    calibrated_with: list | None = None  # query models the cutoff was calibrated on
+
+    @property
+    def bits(self) -> int:
+        return len(self.thresholds)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, bits: int = SIGNATURE_BITS, seed: int = SIGNATURE_SEED) -> "SimHash":
+        """Thresholds at the median projection of (N, D) reference embeddings (rounded as stored)."""
+        if bits % 32:
+            raise ValueError(f"Signature bits must be a multiple of 32, got {bits}")
+        x = np.asarray(embeddings, dtype=np.float64)
+        projections = normalize_rows(x) @ hyperplanes(x.shape[1], bits, seed)
+        return cls(np.round(np.median(projections, axis=0), 6), x.shape[1], seed)
+
+    def signatures(self, embeddings: np.ndarray) -> np.ndarray:
+        """(N, bits / 32) uint32 signatures of (N, D) embeddings; bit b is bit b % 32 of word b // 32."""
+        x = normalize_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float64)))
+        bits = x @ hyperplanes(self.dim, self.bits, self.seed) >= self.thresholds[None, :]
+        return np.packbits(bits, axis=1, bitorder="little").view("<u4").astype(np.uint32)
+
+    def signature(self, embedding) -> str:
+        """Hex signature of one embedding, as stored in the databases."""
+        return signature_hex(self.signatures(embedding)[0])
+
+    def to_json(self) -> dict:
+        info = {
+            "kind": "simhash",
+            "bits": self.bits,
+            "seed": self.seed,
+            "embeddingDim": self.dim,
+            "thresholds": [float(t) for t in self.thresholds],
+        }
+        if self.cutoff is not None:
+            info["cutoff"] = self.cutoff
+            info["calibratedWith"] = list(self.calibrated_with or [])
+        return info
+
+    @classmethod
+    def from_json(cls, info: dict) -> "SimHash":
+        return cls(np.asarray(info["thresholds"], dtype=np.float64), info["embeddingDim"], info["seed"],
+                   info.get("cutoff"), info.get("calibratedWith"))
+
+
+def _protected_distances(simhash: SimHash, refs: ReferenceSet, ref_signatures: np.ndarray,
+                         queries: list) -> list:
+    """
+    Per query: (Hamming distances to every reference, rows tied for the full scorer's
+    top-1, best-scoring row of the true card or None).
+    """
+    codes = np.asarray(refs.codes)
+    out = []
+    for q in queries:
+        scores = fused_scores(refs, np.asarray(q["embedding"]), np.asarray(q["histogram"]), np.asarray(q["dhash"]))
+        distances = hamming(simhash.signatures(q["embedding"])[0], ref_signatures)
+        true_rows = np.flatnonzero(codes == q["cardCode"])
+        true_row = int(true_rows[np.argmax(scores[true_rows])]) if len(true_rows) else None
+        out.append((distances, np.flatnonzero(scores == scores.max()), true_row))
+    return out
+
+
+def calibrate_cutoff(simhash: SimHash, refs: ReferenceSet, ref_signatures: np.ndarray, queries: list,
+                     margin: int = DEFAULT_MARGIN) -> int:
+    """Smallest cutoff keeping every query's top-1 and true card, plus `margin` bits."""
+    worst = 0
+    for distances, top1, true_row in _protected_distances(simhash, refs, ref_signatures, queries):
+        worst = max(worst, int(distances[top1].max()), int(distances[true_row]) if true_row is not None else 0)
+    return min(simhash.bits, worst + margin)
+
+
+def cascade_report(simhash: SimHash, refs: ReferenceSet, ref_signatures: np.ndarray, queries: list,
+                   cutoff: int) -> dict:
+    """
+    What the pre-filter does to `queries` at `cutoff`: the mean fraction of references
+    pruned, how many queries keep the full scorer's top-1 (the cascade then returns the
+    same top-1) and how many keep their true card.
+    """
+    pruned = []
+    top1_kept = 0
+    true_kept = 0
+    true_total = 0
+    for distances, top1, true_row in _protected_distances(simhash, refs, ref_signatures, queries):
+        pruned.append(float(np.mean(distances > cutoff)))
+        top1_kept += bool((distances[top1] <= cutoff).all())
+        if true_row is not None:
+            true_total += 1
+            true_kept += bool(distances[true_row] <= cutoff)
+    return {
+        "queries": len(queries),
+        "prunedFraction": float(np.mean(pruned)) if pruned else 0.0,
+        "top1Kept": top1_kept,
+        "trueKept": true_kept,
+        "trueTotal": true_total,
+    }
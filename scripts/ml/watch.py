@@ -0,0 +1,88 @@
+"""
+Change detection for generate_embeddings.py --watch.
+
+The daemon keeps the model, the preprocessing workers and the caches loaded and
+regenerates only what changed under prisma/data/cards.json and the card image
+cache. InputWatcher polls the watched paths' (mtime, size) signatures, which
+needs no platform file-notification API, and reports a change once the paths
+have stopped changing for one interval: an editor saving cards.json or a batch
+of images being copied in triggers one regeneration, not several.
+
+set_fingerprints reduces each set to a digest of what its database is built
+from: every card's id, imageUrl and group, plus the size and mtime of its cached
+image. A set is regenerated when its digest changes; the per-card result cache
+then recomputes only the cards whose image bytes changed.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+DEFAULT_WATCH_INTERVAL = 1.0
+
+
+def _stat(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def path_signature(path: Path) -> tuple | None:
+    """(mtime, size) of a file, or of every entry of a directory by name; None if missing."""
+    if not path.is_dir():
+        return _stat(path)
+    try:
+        with os.scandir(path) as entries:
+            return tuple(sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size)
+                                for e in entries if e.is_file()))
+    except OSError:
+        return None
+
+
+class InputWatcher:
+    """Polls a list of files and directories for changes."""
+
+    def __init__(self, paths: list, interval: float = DEFAULT_WATCH_INTERVAL):
+        self.paths = list(paths)
+        self.interval = interval
+        self.signature = self._snapshot()
+
+    def _snapshot(self) -> tuple:
+        return tuple(path_signature(p) for p in self.paths)
+
+    def wait(self) -> list:
+        """
+        Block until some path changes and then holds still for one interval.
+        Returns the paths that changed since the previous wait().
+        """
+        while True:
+            current = self._snapshot()
+            if current != self.signature:
+                break
+            time.sleep(self.interval)
+        while True:
+            time.sleep(self.interval)
+            settled = self._snapshot()
+            if settled == current:
+                break
+            current = settled
+        changed = [p for p, old, new in zip(self.paths, self.signature, current) if old != new]
+        self.signature = current
+        return changed
+
+
+def set_fingerprints(sets: dict, image_path: Callable[[str], Path]) -> dict:
+    """Set code -> digest of its cards' id, imageUrl and group and their cached images' (mtime, size)."""
+    fingerprints = {}
+    for set_code, cards in sets.items():
+        digest = hashlib.sha256()
+        for card in sorted(cards, key=lambda c: c["id"]):
+            image = _stat(image_path(card["id"])) if card.get("imageUrl") else None
+            digest.update(json.dumps([card["id"], card.get("imageUrl"), card.get("group"), image]).encode("utf-8"))
+        fingerprints[set_code] = digest.hexdigest()
+    return fingerprints
@@ -32,7 +32,7 @@ fi
 echo ""
 echo "── Step 2: Install Python dependencies ──"
 .venv/bin/pip install --upgrade pip
-.venv/bin/pip install torch torchvision numpy pillow requests onnxruntime
+.venv/bin/pip install torch torchvision numpy pillow requests onnx onnxruntime pytest
 
 # Step 3: Copy WASM files
 echo ""
@@ -0,0 +1,41 @@
+"""Run from the project root: .venv/bin/python -m pytest scripts/tests (npm run ml:test)."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The scripts import each other as top-level modules (from ml.x import ..., from generate_embeddings import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def card_image():
+    """Deterministic card-sized PIL images: smooth gradients under sharp-edged blocks, like card art and frames."""
+    Image = pytest.importorskip("PIL.Image")
+
+    def make(seed: int = 7, width: int = 420, height: int = 600):
+        y, x = np.mgrid[0:height, 0:width] / np.array([height, width])[:, None, None]
+        pixels = np.stack([255 * x, 255 * y, 255 * (1 - x) * y], axis=-1)
+        rng = np.random.default_rng(seed)
+        for _ in range(24):
+            left, top = rng.integers(0, width - 40), rng.integers(0, height - 40)
+            pixels[top:top + rng.integers(10, 80), left:left + rng.integers(10, 120)] = rng.integers(0, 256, 3)
+        return Image.fromarray(pixels.astype(np.uint8))
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def reference_model():
+    """generate_embeddings.load_model on the CPU; skips without torch or the pretrained weights."""
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("torchvision")
+    pytest.importorskip("requests")
+    import generate_embeddings
+
+    try:
+        return generate_embeddings.load_model(torch.device("cpu"))
+    except OSError as e:  # pretrained weights not cached and no network
+        pytest.skip(f"MobileNetV3 weights unavailable: {e}")
@@ -0,0 +1,24 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("PIL")
+pytest.importorskip("torchvision")
+
+import generate_embeddings  # noqa: E402
+from ml.backends import load_backend  # noqa: E402
+
+
+@pytest.fixture
+def infer(reference_model):
+    return load_backend("torch", reference_model, torch.device("cpu"), generate_embeddings.EMBEDDING_DIM)
+
+
+def test_tensor_engine_stays_within_drift_tolerance(infer, card_image, tmp_path, monkeypatch, capsys):
+    card_image().save(tmp_path / "KS-000.png")
+    monkeypatch.setattr(generate_embeddings, "get_cache_path", lambda card_id: tmp_path / f"{card_id}.png")
+    cards = [{"id": "KS-000", "imageUrl": "KS-000.png"}, {"id": "KS-001", "imageUrl": "KS-001.png"}]
+
+    assert generate_embeddings.check_augment_drift(cards, infer, 2)
+    out = capsys.readouterr().out
+    assert "over 1 cards" in out  # the uncached card is skipped
+    assert f"PASS: centroids within {generate_embeddings.AUGMENT_DRIFT_TOLERANCE}" in out
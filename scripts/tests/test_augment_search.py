@@ -0,0 +1,76 @@
+import numpy as np
+
+from ml.augment_search import SEARCH_TOP_K, SubsetScorer, greedy_prune
+from ml.scoring import ReferenceSet, find_top_candidates, normalize_rows
+
+
+def _scenario(cards=12, augmentations=6, dim=16, views=4):
+    """Augmented reference embeddings (C, A, D), with descriptors, and noisy capture queries of every card."""
+    rng = np.random.default_rng(3)
+    cards_emb = rng.normal(size=(cards, dim))
+    augmented = cards_emb[:, None, :] + 0.6 * rng.normal(size=(cards, augmentations, dim))
+    histograms = rng.random((cards, 32))
+    histograms /= histograms.sum(axis=1, keepdims=True)
+    dhashes = rng.normal(size=(cards, 8))
+    codes = [f"KS-{i:03d}" for i in range(cards)]
+    entries = [{"cardCode": code, "embedding": augmented[i].mean(axis=0).tolist(), "histogram": histograms[i],
+                "dhash": dhashes[i]} for i, code in enumerate(codes)]
+    refs = ReferenceSet.from_entries(entries)
+    queries = [{"cardCode": codes[i], "embedding": cards_emb[i] + 1.2 * rng.normal(size=dim),
+                "histogram": histograms[i] * rng.uniform(0.5, 1.5, 32), "dhash": dhashes[i] + rng.normal(size=8)}
+               for _ in range(views) for i in range(cards)]
+    return augmented, refs, queries
+
+
+def test_accuracy_matches_find_top_candidates(subsets=([0, 1, 2, 3, 4, 5], [0, 2], [5])):
+    augmented, refs, queries = _scenario()
+    scorer = SubsetScorer(augmented, refs, queries)
+    for subset in subsets:
+        centroids = normalize_rows(augmented[:, subset].mean(axis=1).astype(np.float32))
+        subset_refs = ReferenceSet(refs.codes, centroids, refs.histograms, dhashes=refs.dhashes,
+                                   has_hist=refs.has_hist, has_dhash=refs.has_dhash)
+        ranks = []
+        for q in queries:
+            ranked = find_top_candidates(q["embedding"], subset_refs, len(refs), -np.inf, q["histogram"],
+                                         query_dhash=q["dhash"])
+            ranks.append([code for code, _ in ranked].index(q["cardCode"]))
+        ranks = np.array(ranks)
+        top1, topk = scorer.accuracy(subset)
+        assert top1 == np.mean(ranks == 0) and topk == np.mean(ranks < SEARCH_TOP_K)
+        assert 0 < top1 < 1  # the scenario discriminates
+
+
+class _TableScorer:
+    """Accuracy looked up from the kept augmentation indices."""
+
+    top_k = SEARCH_TOP_K
+
+    def __init__(self, accuracy):
+        self.accuracy = lambda subset: accuracy(frozenset(subset))
+
+
+def test_validation_vetoes_drops_the_selection_queries_accept():
+    select = _TableScorer(lambda kept: (0.9, 0.95))  # every drop looks free
+    validate = _TableScorer(lambda kept: (0.9, 0.95) if 1 in kept else (0.5, 0.6))
+
+    kept, steps = greedy_prune(select, ["a", "b", "c"], tolerance=0.01, log=lambda line: None)
+    assert kept == ["c"]
+    kept, steps = greedy_prune(select, ["a", "b", "c"], tolerance=0.01, log=lambda line: None, validation=validate)
+    assert kept == ["b"]
+    assert [s["dropped"] for s in steps] == [None, "a", "c"]
+    assert all(s["validationTop1"] == 0.9 for s in steps)
+
+
+def test_greedy_prune_keeps_accuracy_within_tolerance():
+    augmented, refs, queries = _scenario()
+    select = SubsetScorer(augmented, refs, queries[:24])
+    validate = SubsetScorer(augmented, refs, queries[24:])
+    names = [f"aug{i}" for i in range(augmented.shape[1])]
+    kept, steps = greedy_prune(select, names, tolerance=0.05, log=lambda line: None, validation=validate)
+
+    indices = [names.index(n) for n in kept]
+    assert len(kept) == steps[-1]["count"] < len(names)
+    for scorer, (top1, topk) in ((select, (steps[0]["top1"], steps[0]["topK"])),
+                                 (validate, (steps[0]["validationTop1"], steps[0]["validationTopK"]))):
+        kept_top1, kept_topk = scorer.accuracy(indices)
+        assert kept_top1 >= top1 - 0.05 and kept_topk >= topk - 0.05
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+pytest.importorskip("PIL")
+
+import generate_embeddings  # noqa: E402
+from export_onnx import export_model  # noqa: E402
+from ml.backends import BACKEND_TOLERANCE, compare_backends, load_backend  # noqa: E402
+
+
+def test_onnxruntime_agrees_with_torch(reference_model, card_image, tmp_path, monkeypatch):
+    """What generate_embeddings.py --check-backends (npm run ml:check-backends) checks, on a fixture card."""
+    card_image().save(tmp_path / "KS-000.png")
+    monkeypatch.setattr(generate_embeddings, "get_cache_path", lambda card_id: tmp_path / f"{card_id}.png")
+    batch = generate_embeddings.prepare_card({"id": "KS-000", "imageUrl": "KS-000.png"}).inputs
+
+    onnx_path = tmp_path / "mobilenet_v3_large.onnx"
+    export_model(reference_model, onnx_path)
+    device = torch.device("cpu")
+    reference = load_backend("torch", reference_model, device, generate_embeddings.EMBEDDING_DIM)
+    backend = load_backend("onnxruntime", reference_model, device, generate_embeddings.EMBEDDING_DIM, onnx_path)
+
+    assert backend.tolerance == BACKEND_TOLERANCE
+    expected = reference(batch)
+    assert expected.shape == (len(batch), generate_embeddings.EMBEDDING_DIM) and np.isfinite(expected).all()
+    stats = compare_backends(expected, backend(batch))
+    assert stats["minCos"] >= backend.tolerance, stats
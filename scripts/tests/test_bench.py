@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from ml.bench import DEFAULT_MIN_DELTA_MS, DEFAULT_REGRESSION_THRESHOLD, compare_results, summarize
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+
+
+def _result(**medians) -> dict:
+    return {"timings": {name.replace("__", "/"): {"medianMs": ms} for name, ms in medians.items()}}
+
+
+def test_compare_flags_changes_past_threshold_and_noise_floor():
+    baseline = _result(slower=1.0, jitter=1.05, faster=1.0, tiny=0.01, big=10.0, idle=0.0, gone=1.0)
+    current = _result(slower=1.2, jitter=1.1, faster=0.8, tiny=0.05, big=10.9, idle=0.5, added=1.0)
+    rows = {name: (change, status) for name, _, _, change, status in compare_results(baseline, current)}
+
+    assert set(rows) == {"slower", "jitter", "faster", "tiny", "big", "idle"}
+    assert rows["slower"] == (pytest.approx(0.2), "regression")
+    assert rows["jitter"][1] == "ok"  # under DEFAULT_REGRESSION_THRESHOLD
+    assert rows["faster"] == (pytest.approx(-0.2), "improvement")
+    assert rows["tiny"] == (pytest.approx(4.0), "ok")  # +400%, but under DEFAULT_MIN_DELTA_MS
+    assert rows["big"][1] == "ok"  # +0.9 ms is only 9%
+    assert rows["idle"] == (0.0, "ok")  # no relative change from a zero baseline
+
+
+def test_threshold_and_noise_floor_are_configurable():
+    baseline, current = _result(stage=1.0), _result(stage=1.08)
+    assert compare_results(baseline, current)[0][4] == "ok"
+    assert compare_results(baseline, current, threshold=0.05)[0][4] == "regression"
+    assert compare_results(baseline, current, threshold=0.05, min_delta_ms=0.1)[0][4] == "ok"
+    assert DEFAULT_REGRESSION_THRESHOLD == 0.10 and DEFAULT_MIN_DELTA_MS == 0.05
+
+
+def test_summarize_reports_per_item_median():
+    stats = summarize([4.0, 2.0, 3.0, 100.0], items_per_call=2)
+    assert stats["medianMs"] == 3.5 and stats["perItemMs"] == 1.75 and stats["minMs"] == 2.0
+    assert stats["calls"] == 4 and stats["itemsPerCall"] == 2
+
+
+def _benchmark(tmp_path, *argv):
+    # Importing any of these fails in the child process
+    blocked = ("torch", "torchvision", "PIL", "onnxruntime")
+    runner = (f"import runpy, sys; sys.modules.update(dict.fromkeys({blocked!r})); "
+              f"sys.argv = ['benchmark.py', *{list(argv)!r}]; "
+              f"runpy.run_path({str(SCRIPTS / 'benchmark.py')!r}, run_name='__main__')")
+    return subprocess.run([sys.executable, "-c", runner], cwd=tmp_path, capture_output=True, text=True,
+                          env={**os.environ, "PYTHONPATH": os.pathsep.join([str(SCRIPTS), *sys.path])},
+                          timeout=120)
+
+
+def test_onnx_only_run_and_compare_need_no_torch(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for i in range(3):
+        (corpus / f"KS-{i:03d}.jpg").write_bytes(bytes([i]) * 64)
+    result = _benchmark(tmp_path, "run", "--skip-stages", "--corpus", str(corpus), "--output", "base.json")
+    assert result.returncode == 0, result.stdout + result.stderr
+    written = json.loads((tmp_path / "base.json").read_text())
+    assert written["corpus"]["images"] == 3 and "torch" not in written["environment"]
+
+    (tmp_path / "new.json").write_text(json.dumps({**written, "timings": {"stage/decode": {"medianMs": 2.0}}}))
+    written["timings"] = {"stage/decode": {"medianMs": 1.0}}
+    (tmp_path / "base.json").write_text(json.dumps(written))
+    assert _benchmark(tmp_path, "compare", "base.json", "new.json").returncode == 1
+    assert _benchmark(tmp_path, "compare", "new.json", "base.json").returncode == 0
@@ -0,0 +1,104 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from ml.crops import INITIAL_CAPACITY, CropStore
+from ml.descriptors import DHASH_DIM
+
+pytest.importorskip("fcntl")
+
+SIZE = 8
+CONFIG = {"artCropBox": [0.08, 0.18, 0.92, 0.62]}
+
+
+def _crop(seed: int) -> tuple:
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 256, (SIZE, SIZE, 3), dtype=np.uint8), (1, 0, 6, SIZE), 0.5,
+            rng.random(DHASH_DIM, dtype=np.float32))
+
+
+def _add(store: CropStore, card_id: str, image_hash: str, seed: int) -> int:
+    crop, box, scale, spatial = _crop(seed)
+    return store.add(card_id, image_hash, crop, box, scale, spatial)
+
+
+def test_changed_image_gets_a_new_row(tmp_path):
+    store = CropStore(CONFIG, SIZE, tmp_path, writable=True)
+    with store.writing():
+        first = _add(store, "KS-001", "hash-a", 0)
+    assert store.lookup("KS-001", "hash-a") == first
+    assert store.lookup("KS-001", "hash-b") is None
+
+    reader = CropStore(CONFIG, SIZE, tmp_path)
+    old = reader.crop(first)
+    with store.writing():
+        second = _add(store, "KS-001", "hash-b", 1)
+    assert second != first
+    np.testing.assert_array_equal(old, _crop(0)[0])  # rows are never overwritten under a reader
+
+    reader = CropStore(CONFIG, SIZE, tmp_path)
+    assert reader.lookup("KS-001", "hash-a") is None and reader.lookup("KS-001", "hash-b") == second
+    np.testing.assert_array_equal(reader.crop(second), _crop(1)[0])
+    np.testing.assert_array_equal(reader.spatial(second), _crop(1)[3])
+    assert reader.geometry("KS-001") == (0.5, (1, 0, 6, SIZE))
+
+
+def test_new_config_leaves_mapped_files_alone(tmp_path):
+    store = CropStore(CONFIG, SIZE, tmp_path, writable=True)
+    with store.writing():
+        for i in range(3):
+            _add(store, f"KS-{i:03d}", f"hash-{i}", i)
+    reader = CropStore(CONFIG, SIZE, tmp_path)
+    mapped = reader.crop(2)
+    files = {p: p.stat().st_size for p in store.dir.iterdir()}
+
+    other_config = {**CONFIG, "artCropBox": [0, 0, 1, 1]}
+    other = CropStore(other_config, SIZE, tmp_path, writable=True)
+    assert other.dir != store.dir and other.lookup("KS-002", "hash-2") is None
+    with other.writing():
+        _add(other, "KS-002", "hash-2", 9)
+
+    assert {p: p.stat().st_size for p in store.dir.iterdir()} == files
+    np.testing.assert_array_equal(mapped, _crop(2)[0])
+    np.testing.assert_array_equal(CropStore(CONFIG, SIZE, tmp_path).crop(2), _crop(2)[0])
+    other_reader = CropStore(other_config, SIZE, tmp_path)
+    np.testing.assert_array_equal(other_reader.crop(other_reader.row("KS-002")), _crop(9)[0])
+
+
+def test_writes_outside_writing_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        with CropStore(CONFIG, SIZE, tmp_path).writing():
+            pass
+    with pytest.raises(RuntimeError):
+        _add(CropStore(CONFIG, SIZE, tmp_path, writable=True), "KS-001", "hash-a", 0)
+
+
+def _writer(root, worker: int, count: int):
+    store = CropStore(CONFIG, SIZE, root, writable=True)
+    for i in range(count):
+        with store.writing():
+            _add(store, f"W{worker}-{i:03d}", f"hash-{worker}-{i}", worker * 1000 + i)
+
+
+def test_concurrent_writers_append_without_clobbering(tmp_path):
+    # Enough rows that the store grows past INITIAL_CAPACITY while the writers interleave
+    workers, count = 4, INITIAL_CAPACITY // 2
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_writer, args=(tmp_path, w, count)) for w in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    reader = CropStore(CONFIG, SIZE, tmp_path)
+    assert len(reader) == workers * count and reader.index["used"] == workers * count
+    assert reader.index["capacity"] > INITIAL_CAPACITY
+    rows = set()
+    for w in range(workers):
+        for i in range(count):
+            row = reader.lookup(f"W{w}-{i:03d}", f"hash-{w}-{i}")
+            rows.add(row)
+            np.testing.assert_array_equal(reader.crop(row), _crop(w * 1000 + i)[0])
+    assert len(rows) == workers * count
@@ -0,0 +1,137 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from ml.download import (STATUS_CACHED, STATUS_DOWNLOADED, STATUS_FAILED,  # noqa: E402
+                         STATUS_NOT_MODIFIED, ImageDownloader, create_session)
+
+IMAGE = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Image host stand-in. /ok.jpg serves IMAGE with validators (304 when they match),
+    /flaky.jpg answers 503 then 429 before serving it, /broken.jpg promises more
+    bytes than it sends and drops the connection.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            hits = sum(path == self.path for path, _ in server.requests)
+        if self.path == "/ok.jpg":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._image({"ETag": ETAG, "Last-Modified": LAST_MODIFIED})
+        elif self.path == "/flaky.jpg":
+            if hits <= 2:
+                self.send_response(503 if hits == 1 else 429)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._image({})
+        elif self.path == "/broken.jpg":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(IMAGE)))
+            self.end_headers()
+            self.wfile.write(IMAGE[:100])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+        else:
+            self.send_error(404)
+
+    def _image(self, headers: dict):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(IMAGE)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def downloader(server, tmp_path):
+    session = create_session(pool_size=2, retries=3, backoff=0)
+    return ImageDownloader(tmp_path, workers=2, session=session, timeout=5,
+                           base_url=f"http://127.0.0.1:{server.server_port}/")
+
+
+def _leftovers(cache_dir):
+    """Temp files atomic_write_bytes would leave behind if a write were interrupted."""
+    return sorted(p.name for p in cache_dir.iterdir() if p.name.endswith(".tmp"))
+
+
+def test_download_then_revalidate(server, downloader, tmp_path):
+    assert downloader.fetch("KS-001", "ok.jpg") == STATUS_DOWNLOADED
+    assert downloader.path("KS-001").read_bytes() == IMAGE
+    assert downloader.fetch("KS-001", "ok.jpg") == STATUS_CACHED
+    assert len(server.requests) == 1
+
+    assert downloader.fetch("KS-001", "ok.jpg", revalidate=True) == STATUS_NOT_MODIFIED
+    _, headers = server.requests[-1]
+    assert headers["If-None-Match"] == ETAG and headers["If-Modified-Since"] == LAST_MODIFIED
+    assert downloader.path("KS-001").read_bytes() == IMAGE
+    assert _leftovers(tmp_path) == []
+
+
+def test_validators_are_not_sent_for_another_url(server, downloader):
+    downloader.fetch("KS-001", "ok.jpg")
+    assert downloader.fetch("KS-001", "flaky.jpg", revalidate=True) == STATUS_DOWNLOADED
+    assert all("If-None-Match" not in headers for path, headers in server.requests if path == "/flaky.jpg")
+
+
+def test_throttling_and_server_errors_are_retried(server, downloader):
+    assert downloader.fetch("KS-002", "flaky.jpg") == STATUS_DOWNLOADED
+    assert [path for path, _ in server.requests] == ["/flaky.jpg"] * 3
+    assert downloader.path("KS-002").read_bytes() == IMAGE
+
+
+def test_broken_connection_leaves_no_partial_image(downloader, tmp_path):
+    with pytest.raises(requests.RequestException):
+        downloader.fetch("KS-003", "broken.jpg")
+    assert not downloader.path("KS-003").exists()
+
+    # A revalidation cut off mid-body keeps the previously cached image
+    downloader.fetch("KS-001", "ok.jpg")
+    with pytest.raises(requests.RequestException):
+        downloader.fetch("KS-001", "broken.jpg", revalidate=True)
+    assert downloader.path("KS-001").read_bytes() == IMAGE
+    assert _leftovers(tmp_path) == []
+
+
+def test_download_all_counts_each_outcome(downloader, tmp_path):
+    downloader.fetch("KS-001", "ok.jpg")
+    cards = [{"id": "KS-001", "imageUrl": "ok.jpg"}, {"id": "KS-002", "imageUrl": "flaky.jpg"},
+             {"id": "KS-003", "imageUrl": "broken.jpg"}, {"id": "KS-004", "imageUrl": "missing.jpg"},
+             {"id": "KS-005", "imageUrl": None}]
+    counts = downloader.download_all(cards, revalidate=True, log=lambda line: None)
+    assert counts[STATUS_NOT_MODIFIED] == 1 and counts[STATUS_DOWNLOADED] == 1 and counts[STATUS_FAILED] == 2
+    assert sorted(card_id for card_id, _ in counts["failures"]) == ["KS-003", "KS-004"]
+    assert sorted(p.name for p in tmp_path.glob("*.jpg")) == ["KS-001.jpg", "KS-002.jpg"]
+    assert _leftovers(tmp_path) == []
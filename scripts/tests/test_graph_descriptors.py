@@ -0,0 +1,72 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ml.descriptors import HISTOGRAM_SIZE, hsv_histograms, spatial_colors
+
+FIXTURE = Path(__file__).resolve().parents[2] / "src/__tests__/fixtures/descriptor-parity.json"
+FRAME_SIZE = 64
+
+
+def _fixture_cases() -> list:
+    """(image, histogram, dhash) of each case the TS parity test checks."""
+    with open(FIXTURE) as f:
+        cases = json.load(f)["cases"]
+    out = []
+    for case in cases:
+        image = np.asarray(case["rgb"], dtype=np.uint8).reshape(case["height"], case["width"], 3)
+        histogram = np.zeros(HISTOGRAM_SIZE, dtype=np.float32)
+        for i, value in case["histogram"]:
+            histogram[i] = value
+        out.append((image, histogram, np.asarray(case["dhash"], dtype=np.float32)))
+    return out
+
+
+def test_fixture_matches_python_descriptors():
+    for image, histogram, dhash in _fixture_cases():
+        np.testing.assert_allclose(hsv_histograms(image)[0], histogram, atol=1e-7)
+        np.testing.assert_allclose(spatial_colors(image)[0], dhash, atol=1e-7)
+
+
+@pytest.fixture(scope="module")
+def multi_output_session(tmp_path_factory):
+    """MultiOutput (export_onnx.py --descriptor-outputs) around a tiny stand-in embedder, on onnxruntime."""
+    torch = pytest.importorskip("torch")
+    ort = pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from export_onnx import MultiOutput
+
+    model = torch.nn.Sequential(torch.nn.AdaptiveAvgPool2d(4), torch.nn.Flatten()).eval()
+    path = tmp_path_factory.mktemp("onnx") / "multi.onnx"
+    torch.onnx.export(
+        MultiOutput(model).eval(),
+        (torch.randint(0, 256, (1, FRAME_SIZE, FRAME_SIZE, 4), dtype=torch.uint8),
+         torch.tensor([[0, 8, FRAME_SIZE, 48]], dtype=torch.int32)),
+        str(path),
+        input_names=["pixels", "box"],
+        output_names=["embedding", "histogram", "dhash"],
+        dynamic_axes={name: {0: "batch"} for name in ("pixels", "box", "embedding", "histogram", "dhash")},
+        opset_version=17,
+    )
+    return ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+
+
+def test_graph_descriptors_match_the_fixture(multi_output_session):
+    from export_onnx import DESCRIPTOR_PARITY_TOLERANCE
+    from ml.graph_descriptors import parity_cases
+
+    for (frame, box, _), (_, histogram, dhash) in zip(parity_cases(FRAME_SIZE), _fixture_cases(), strict=True):
+        graph_hist, graph_dhash = multi_output_session.run(["histogram", "dhash"],
+                                                           {"pixels": frame[None], "box": box[None]})
+        assert np.abs(graph_hist[0] - histogram).max() < DESCRIPTOR_PARITY_TOLERANCE
+        assert np.abs(graph_dhash[0] - dhash).max() < DESCRIPTOR_PARITY_TOLERANCE
+
+
+def test_embedding_alone_matches_the_full_run(multi_output_session):
+    # runFrame in onnx-model.ts fetches only "embedding" from descriptor-output models
+    frame = np.random.default_rng(0).integers(0, 256, (1, FRAME_SIZE, FRAME_SIZE, 4), dtype=np.uint8)
+    feeds = {"pixels": frame, "box": np.array([[0, 0, FRAME_SIZE, FRAME_SIZE]], dtype=np.int32)}
+    (embedding,) = multi_output_session.run(["embedding"], feeds)
+    np.testing.assert_array_equal(embedding, multi_output_session.run(None, feeds)[0])
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from ml.journal import SetJournal, write_database_json
+
+CONFIG = {"model": "mobilenet_v3_large", "augmentations": 20}
+
+
+def _entry(code: str) -> dict:
+    return {"cardCode": code, "embedding": [0.5, -1.25], "histogram": [[3, 0.125]], "dhash": None}
+
+
+def _journal(path, *codes, failed=()):
+    journal = SetJournal(path, CONFIG)
+    for code in codes:
+        journal.add(_entry(code))
+    for code in failed:
+        journal.add_failure(code, "HTTPError: 503")
+    return journal
+
+
+def test_resume_skips_journaled_cards_and_retries_failed_ones(tmp_path):
+    path = tmp_path / "embeddings-KS.jsonl"
+    _journal(path, "KS-001", "KS-002", failed=["KS-003"]).close()
+
+    journal = SetJournal(path, CONFIG, resume=True)
+    assert journal.resumed == 2 and "KS-001" in journal and "KS-002" in journal
+    # generate_real_database only skips cards in the journal, so the failed card is processed again
+    assert "KS-003" not in journal and journal.failed == {"KS-003": "HTTPError: 503"}
+    journal.add(_entry("KS-003"))
+    assert journal.failed == {}
+    journal.close()
+
+    reopened = SetJournal(path, CONFIG, resume=True)
+    assert reopened.resumed == 3 and reopened.failed == {}
+    assert list(reopened.entries(["KS-003", "KS-001", "KS-999", "KS-002"])) == [
+        _entry("KS-003"), _entry("KS-001"), _entry("KS-002")]
+
+
+@pytest.mark.parametrize("tail", [b'{"cardCode": "KS-003", "ent', b'{"cardCode": "KS-003", "entry": {}}'])
+def test_torn_tail_is_dropped_before_appending(tmp_path, tail):
+    path = tmp_path / "embeddings-KS.jsonl"
+    _journal(path, "KS-001", "KS-002").close()
+    intact = path.read_bytes()
+    with open(path, "ab") as f:
+        f.write(tail)  # the process died before the newline
+
+    journal = SetJournal(path, CONFIG, resume=True)
+    assert journal.resumed == 2 and "KS-003" not in journal
+    assert path.read_bytes() == intact
+    journal.add(_entry("KS-004"))
+    journal.close()
+    assert all(json.loads(line) for line in path.read_bytes().splitlines())
+    assert list(SetJournal(path, CONFIG, resume=True).entries(["KS-001", "KS-002", "KS-004"])) == [
+        _entry("KS-001"), _entry("KS-002"), _entry("KS-004")]
+
+
+def test_config_change_starts_a_fresh_journal(tmp_path):
+    path = tmp_path / "embeddings-KS.jsonl"
+    _journal(path, "KS-001", failed=["KS-002"]).close()
+
+    journal = SetJournal(path, {**CONFIG, "augmentations": 12}, resume=True)
+    assert journal.resumed == 0 and len(journal) == 0 and journal.failed == {}
+    assert "KS-001" not in journal
+    journal.close()
+    assert len(path.read_bytes().splitlines()) == 1  # just the new header
+
+    assert SetJournal(path, CONFIG, resume=True).resumed == 0
+
+
+def test_without_resume_an_existing_journal_is_overwritten(tmp_path):
+    path = tmp_path / "embeddings-KS.jsonl"
+    _journal(path, "KS-001").close()
+    assert SetJournal(path, CONFIG).resumed == 0
+    assert "KS-001" not in SetJournal(path, CONFIG, resume=True)
+
+
+def test_read_opens_a_finished_journal_whatever_its_config(tmp_path):
+    path = tmp_path / "embeddings-KS.jsonl"
+    _journal(path, "KS-001", "KS-002", failed=["KS-003"]).close()
+    with open(path, "ab") as f:
+        f.write(b'{"cardCode": "KS-004"')
+    size = path.stat().st_size
+
+    journal = SetJournal.read(path)
+    assert journal.resumed == 2 and journal.failed == {"KS-003": "HTTPError: 503"}
+    assert list(journal.entries(["KS-002", "KS-001"])) == [_entry("KS-002"), _entry("KS-001")]
+    assert path.stat().st_size == size  # read-only: the torn tail is left alone
+    journal.close()
+
+    (tmp_path / "other.jsonl").write_text("not a journal\n")
+    with pytest.raises(ValueError):
+        SetJournal.read(tmp_path / "other.jsonl")
+    with pytest.raises(ValueError):
+        SetJournal.read(tmp_path / "missing.jsonl")
+
+
+def test_discard_deletes_the_journal(tmp_path):
+    path = tmp_path / "embeddings-KS.jsonl"
+    journal = _journal(path, "KS-001")
+    journal.discard()
+    assert not path.exists()
+
+
+@pytest.mark.parametrize("header", [{}, {"version": "1.0.0", "model": "m", "embeddingDim": 2, "cardCount": 3}])
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_database_json_matches_json_dump(tmp_path, header, count):
+    entries = [_entry(f"KS-{i:03d}") for i in range(count)]
+    path = tmp_path / "embeddings-KS.json"
+    assert write_database_json(path, header, iter(entries)) == count
+    assert path.read_text() == json.dumps({**header, "entries": entries})
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+    strip = lambda entry: {"cardCode": entry["cardCode"]}
+    write_database_json(path, header, iter(entries), strip)
+    assert path.read_text() == json.dumps({**header, "entries": [strip(e) for e in entries]})
+
+
+def test_failed_database_write_keeps_the_previous_file(tmp_path):
+    path = tmp_path / "embeddings-KS.json"
+    write_database_json(path, {"cardCount": 1}, [_entry("KS-001")])
+    previous = path.read_bytes()
+
+    def entries():
+        yield _entry("KS-001")
+        raise RuntimeError("crashed mid-set")
+
+    with pytest.raises(RuntimeError):
+        write_database_json(path, {"cardCount": 2}, entries())
+    assert path.read_bytes() == previous
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
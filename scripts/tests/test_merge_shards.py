@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("requests")
+
+import generate_embeddings as ge  # noqa: E402
+from ml.journal import SetJournal  # noqa: E402
+
+CONFIG = {"engine": "pil"}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A project root with cards.json and two finished --shard outputs covering it."""
+    monkeypatch.chdir(tmp_path)
+    cards = [{"id": f"{code}-{i:03d}", "imageUrl": f"cards/{code}-{i:03d}.webp", "set": code}
+             for code in ("KS", "XX") for i in range(1, 4)]
+    ge.DATA_PATH.parent.mkdir(parents=True)
+    ge.DATA_PATH.write_text(json.dumps(cards))
+    rng = np.random.default_rng(0)
+    for index in range(2):
+        shard_dir = ge.SHARD_DIR / ge.shard_name(index, 2)
+        journals = {}
+        for card in ge.shard_cards(cards, index, 2):
+            if card["set"] not in journals:
+                journals[card["set"]] = SetJournal(shard_dir / f"embeddings-{card['set']}.jsonl", CONFIG)
+            journals[card["set"]].add({"cardCode": card["id"], "embedding": rng.normal(size=ge.EMBEDDING_DIM).tolist(),
+                                       "histogram": None, "dhash": None})
+        for journal in journals.values():
+            journal.close()
+        ge.write_shard_manifest(shard_dir, index, 2, CONFIG, journals)
+    return cards
+
+
+def _merged_cards() -> dict:
+    manifest = json.loads((ge.OUTPUT_DIR / "manifest.json").read_text())
+    return {entry["setCode"]: entry["cardCount"] for entry in manifest["sets"]}
+
+
+def test_merge_writes_every_shard_card(project):
+    ge.merge_shards(ge.parse_merge_args([]))
+    assert _merged_cards() == {"KS": 3, "XX": 3}
+
+
+def test_merge_refuses_changed_cards_unless_allowed(project, capsys):
+    ge.DATA_PATH.write_text(json.dumps(project + [{"id": "KS-004", "imageUrl": "cards/KS-004.webp", "set": "KS"}]))
+    with pytest.raises(SystemExit):
+        ge.merge_shards(ge.parse_merge_args([]))
+    assert "ERROR" in capsys.readouterr().out
+    assert not (ge.OUTPUT_DIR / "manifest.json").exists()
+
+    ge.merge_shards(ge.parse_merge_args(["--allow-changed-cards"]))
+    assert "KS-004" in capsys.readouterr().out  # reported missing
+    assert _merged_cards() == {"KS": 3, "XX": 3}
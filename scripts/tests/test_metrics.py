@@ -0,0 +1,79 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ml import metrics
+from ml.metrics import METRICS_VERSION, RunMetrics
+
+
+class _Clock:
+    """A perf_counter that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(metrics, "time", SimpleNamespace(perf_counter=clock))
+    return clock
+
+
+def test_stage_summaries_from_known_durations(clock):
+    run = RunMetrics()
+    for ms in range(1, 101):
+        run.record("download", ms / 1000)
+    with run.stage("modelLoad"):
+        clock.advance(2.5)
+    write = run.timed("write", lambda seconds: clock.advance(seconds))
+    write(0.25)
+    write(0.75)
+    run.stages["unused"]  # a stage that never ran is left out
+
+    stages = run.to_json()["stages"]
+    assert set(stages) == {"download", "modelLoad", "write"}
+    assert stages["download"] == {"count": 100, "p50Ms": 50.5, "p95Ms": 95.05, "maxMs": 100.0, "totalS": 5.05}
+    assert stages["modelLoad"] == {"count": 1, "p50Ms": 2500.0, "p95Ms": 2500.0, "maxMs": 2500.0, "totalS": 2.5}
+    assert stages["write"] == {"count": 2, "p50Ms": 500.0, "p95Ms": 725.0, "maxMs": 750.0, "totalS": 1.0}
+
+
+def test_card_latency_throughput_and_failures(clock):
+    run = RunMetrics()
+    prepare = run.timed_prepare(lambda card: clock.advance(0.1))
+    infer = run.timed_infer(lambda batch: clock.advance(0.2 * len(batch)) or np.zeros((len(batch), 4)))
+
+    prepare({"id": "KS-001"})  # latency clock starts at 0.0
+    prepare({"id": "KS-002"})  # ... and at 0.1
+    assert infer(np.zeros((3, 8))).shape == (3, 4)
+    assert infer(np.zeros((1, 8))).shape == (1, 4)
+    run.card_done("KS-001")
+    run.card_done("KS-002", "OSError: truncated image")
+    run.card_done("KS-000", "HTTPError: 404")  # failed before it was prepared: no latency
+    prepare({"id": "KS-003"})
+    run.card_done("KS-003", "HTTPError: 503")
+    run.card_done("KS-003")  # retried and finalized
+
+    data = json.loads(json.dumps(run.to_json()))
+    assert data["version"] == METRICS_VERSION and data["durationS"] == 1.1
+    assert data["stages"]["prepare"]["count"] == 3 and data["stages"]["prepare"]["totalS"] == 0.3
+    assert data["stages"]["forward"] == {"count": 2, "p50Ms": 400.0, "p95Ms": 580.0, "maxMs": 600.0, "totalS": 0.8}
+    # KS-001 and KS-002 finished at 1.0 after the forward passes; KS-003 took one prepare
+    assert data["cards"] == {"count": 3, "p50Ms": 900.0, "p95Ms": 990.0, "maxMs": 1000.0}
+    assert data["throughput"] == {"images": 4, "forwardPasses": 2, "imagesPerSec": 5.0, "forwardPassesPerSec": 2.5}
+    assert data["failed"] == [{"cardCode": "KS-000", "error": "HTTPError: 404"},
+                              {"cardCode": "KS-002", "error": "OSError: truncated image"}]
+
+
+def test_empty_run(clock):
+    data = RunMetrics().to_json()
+    assert data["stages"] == {} and data["cards"] == {"count": 0} and data["failed"] == []
+    assert data["throughput"] == {"images": 0, "forwardPasses": 0, "imagesPerSec": 0.0, "forwardPassesPerSec": 0.0}
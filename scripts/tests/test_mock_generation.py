@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+
+# Importing any of these raises ImportError in the child process
+BLOCKED = ("torch", "torchvision", "PIL", "onnxruntime")
+
+
+def test_mock_run_needs_no_torch(tmp_path):
+    cards = [{"id": f"{code}-{i:03d}", "nameEn": f"Card {i}", "nameFr": None, "type": "CHARACTER", "rarity": "C",
+              "imageUrl": f"cards/{code}-{i:03d}.webp", "set": code, "cardNumber": i}
+             for code in ("KS", "XX") for i in range(1, 4)]
+    (tmp_path / "prisma/data").mkdir(parents=True)
+    (tmp_path / "prisma/data/cards.json").write_text(json.dumps(cards))
+    runner = (f"import runpy, sys; sys.modules.update(dict.fromkeys({BLOCKED!r})); "
+              f"sys.argv = ['generate_embeddings.py', '--mock']; "
+              f"runpy.run_path({str(SCRIPTS / 'generate_embeddings.py')!r}, run_name='__main__')")
+    result = subprocess.run([sys.executable, "-c", runner], cwd=tmp_path, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": os.pathsep.join([str(SCRIPTS), *sys.path])},
+                            timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    manifest = json.loads((tmp_path / "public/ml/manifest.json").read_text())
+    assert manifest["model"].endswith("_mock")
+    assert {s["setCode"]: s["cardCount"] for s in manifest["sets"]} == {"KS": 3, "XX": 3}
+    assert "cutoff" not in manifest["signature"]
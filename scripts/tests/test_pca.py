@@ -0,0 +1,44 @@
+import numpy as np
+
+from ml.pca import fit_emb_ramp, fit_pca, heldout_sweep
+from ml.scoring import EMB_RAMP, norm_emb, normalize_rows
+
+
+def _augmented(cards=40, dim=64, views=10):
+    """Card embeddings sharing a large positive offset, like the model's, plus augmentation noise."""
+    rng = np.random.default_rng(0)
+    offset = np.abs(rng.normal(size=dim))
+    return {f"KS-{i:03d}": offset + 0.8 * rng.normal(size=dim) + 0.5 * rng.normal(size=(views, dim))
+            for i in range(cards)}
+
+
+def test_ramp_of_unchanged_similarities_is_the_default():
+    sims = np.random.default_rng(1).normal(0.4, 0.2, size=5000)
+    np.testing.assert_allclose(fit_emb_ramp(sims, sims), EMB_RAMP, atol=0.01)
+
+
+def test_fitted_ramp_clips_projected_cosines_like_the_default_clips_raw_ones():
+    augmented = _augmented()
+    codes = sorted(augmented)
+    centroids = np.stack([augmented[c][1:].mean(axis=0) for c in codes])
+    queries = np.stack([augmented[c][0] for c in codes])
+    pca = fit_pca(np.concatenate([augmented[c][1:] for c in codes]), 16)
+    raw = normalize_rows(queries) @ normalize_rows(centroids).T
+    projected = normalize_rows(pca.project(queries)) @ normalize_rows(pca.project(centroids)).T
+
+    ramp = fit_emb_ramp(raw, projected)
+    # Centering pulls unrelated cards' cosines toward 0: the default ramp would zero almost every pair
+    assert np.mean(norm_emb(projected) == 0) > 0.9
+    for edge in (0, 1):
+        assert abs(np.mean(norm_emb(projected, ramp) == edge) - np.mean(norm_emb(raw) == edge)) < 0.02
+
+
+def test_sweep_reports_the_scanner_score_with_each_ramp():
+    sweep = heldout_sweep(_augmented(), [8, 16])
+    assert [row["k"] for row in sweep] == [None, 8, 16]
+    assert sweep[0]["embRamp"] == EMB_RAMP and sweep[0]["top1FusedWhitened"] is None
+    for row in sweep:
+        assert 0 < row["top1Fused"] <= row["top1"] <= 1
+    for row in sweep[1:]:
+        assert row["embRamp"][0] < EMB_RAMP[0] and row["embRampWhitened"][0] < EMB_RAMP[0]
+        assert 0 < row["top1FusedWhitened"] <= 1
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("PIL")
+pytest.importorskip("requests")
+
+import generate_embeddings  # noqa: E402
+
+CARDS = [{"id": f"KS-{i:03d}", "imageUrl": f"cards/KS-{i:03d}.webp"} for i in range(3)]
+
+
+@pytest.fixture
+def cached_cards(card_image, tmp_path, monkeypatch):
+    """CARDS with their images in a fresh CACHE_DIR under tmp_path, the cwd of the spawned workers too."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(generate_embeddings, "_crop_store", None)
+    for seed, card in enumerate(CARDS):
+        path = generate_embeddings.get_cache_path(card["id"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        card_image(seed).save(path, format="JPEG", quality=90)
+    return CARDS
+
+
+@pytest.mark.parametrize("engine", ["pil", "tensor"])
+def test_worker_processes_prepare_the_same_inputs(cached_cards, engine):
+    augmentations = generate_embeddings.AUGMENTATIONS[:4]
+    in_process = [generate_embeddings.prepare_card(card, None, engine, augmentations=augmentations)
+                  for card in cached_cards]
+    with generate_embeddings.create_preprocess_pool(2, len(augmentations)) as pool:
+        pooled = [pool(card, None, engine, False, augmentations) for card in cached_cards]
+
+    for expected, prepared in zip(in_process, pooled, strict=True):
+        assert prepared.inputs.dtype == np.float32
+        np.testing.assert_array_equal(prepared.inputs, expected.inputs)
+        assert prepared.state["histogram"] == expected.state["histogram"]
+        assert prepared.state["dhash"] == expected.state["dhash"]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from ml.augment_search import embedding_weights
+from ml.scoring import ReferenceSet, fused_scores, fused_scores_batch, norm_emb, norm_hist, norm_spatial
+
+
+def _refs(dhash_rows=()):
+    """Five references with histograms; spatial descriptors only on dhash_rows."""
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(5, 8))
+    histograms = rng.random((5, 16)).astype(np.float32)
+    histograms /= histograms.sum(axis=1, keepdims=True)
+    has_dhash = np.isin(np.arange(5), dhash_rows)
+    return ReferenceSet([f"KS-{i:03d}" for i in range(5)], embeddings, histograms,
+                        dhashes=rng.normal(size=(5, 6)), has_dhash=has_dhash), rng
+
+
+def _dense(refs, query, query_hist, query_dhash=None):
+    """fused_scores written out row by row, as scoreRow in reference-db.ts."""
+    q = query / np.linalg.norm(query)
+    scores = []
+    for i in range(len(refs)):
+        emb = norm_emb(refs.embeddings[i] @ q)
+        hist = norm_hist(np.minimum(refs.histograms[i], query_hist).sum())
+        if query_dhash is not None and refs.has_dhash[i]:
+            dq = query_dhash / np.linalg.norm(query_dhash)
+            spatial = norm_spatial(max(0.0, refs.dhashes[i] @ dq))
+            scores.append(0.45 * emb + 0.25 * hist + 0.3 * spatial)
+        else:
+            scores.append(0.6 * emb + 0.4 * hist)
+    return np.array(scores)
+
+
+def test_histogram_only_rows_blend_without_a_spatial_query():
+    refs, rng = _refs()
+    query, query_hist = rng.normal(size=8), refs.histograms[2]
+    expected = _dense(refs, query, query_hist)
+    np.testing.assert_allclose(fused_scores(refs, query, query_hist), expected, atol=1e-6)
+    np.testing.assert_allclose(fused_scores_batch(refs, query[None], query_hist[None])[0], expected, atol=1e-6)
+
+
+def test_mixed_spatial_rows():
+    refs, rng = _refs(dhash_rows=(1, 3))
+    query, query_hist, query_dhash = rng.normal(size=8), refs.histograms[0], rng.normal(size=6)
+    expected = _dense(refs, query, query_hist, query_dhash)
+    np.testing.assert_allclose(fused_scores(refs, query, query_hist, query_dhash), expected, atol=1e-6)
+    np.testing.assert_allclose(fused_scores_batch(refs, query[None], query_hist[None], query_dhash[None])[0],
+                               expected, atol=1e-6)
+
+
+def test_embedding_weights_match_the_fused_blend():
+    refs, _ = _refs(dhash_rows=(1, 3))
+    np.testing.assert_allclose(embedding_weights(refs, True, False), [0.6] * 5)
+    np.testing.assert_allclose(embedding_weights(refs, True, True), [0.6, 0.45, 0.6, 0.45, 0.6])
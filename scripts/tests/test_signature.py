@@ -0,0 +1,41 @@
+import numpy as np
+
+from ml.scoring import ReferenceSet
+from ml.signature import SimHash, calibrate_cutoff, cascade_report
+
+
+def _references():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(40, 16))
+    return ReferenceSet([f"KS-{i:03d}" for i in range(40)], embeddings), embeddings, rng
+
+
+def test_cutoff_and_query_models_survive_the_manifest():
+    _, embeddings, _ = _references()
+    simhash = SimHash.fit(embeddings, bits=64)
+    simhash.cutoff = 12
+    simhash.calibrated_with = ["teacher", "teacher_student"]
+    restored = SimHash.from_json(simhash.to_json())
+    assert restored.to_json() == simhash.to_json()
+    assert restored.calibrated_with == ["teacher", "teacher_student"]
+    np.testing.assert_array_equal(restored.signatures(embeddings), simhash.signatures(embeddings))
+
+
+def test_uncalibrated_hash_names_no_query_model():
+    _, embeddings, _ = _references()
+    info = SimHash.fit(embeddings, bits=32).to_json()
+    assert "cutoff" not in info and "calibratedWith" not in info
+
+
+def test_calibrated_cutoff_keeps_every_tuning_top1():
+    refs, embeddings, rng = _references()
+    simhash = SimHash.fit(embeddings, bits=64)
+    signatures = simhash.signatures(embeddings)
+    # Queries from two "models": small and larger perturbations of the references
+    queries = [{"cardCode": refs.codes[i], "embedding": embeddings[i] + scale * rng.normal(size=16),
+                "histogram": None, "dhash": None}
+               for scale in (0.1, 0.4) for i in range(0, 40, 4)]
+    cutoff = calibrate_cutoff(simhash, refs, signatures, queries)
+    report = cascade_report(simhash, refs, signatures, queries, cutoff)
+    assert report["top1Kept"] == report["queries"] == len(queries)
+    assert report["trueKept"] == report["trueTotal"]
@@ -0,0 +1,134 @@
+import { describe, it, expect } from 'vitest';
+import { readFileSync } from 'fs';
+import path from 'path';
+import {
+  parseBinaryDatabase,
+  float16ToFloat32,
+  findTopCandidates,
+  normalizeEmbedding,
+} from '@/lib/card-recognition/reference-db';
+import type { EmbeddingDatabase } from '@/types/ml';
+import source from './fixtures/embeddings-tiny.json';
+
+// Fixtures are written by scripts/ml/dbformat.py:
+//   python scripts/ml/dbformat.py --fixture src/__tests__/fixtures
+
+function loadFixture(dtype: string): ArrayBuffer {
+  const file = readFileSync(
+    path.resolve(__dirname, 'fixtures', `embeddings-tiny.${dtype}.bin`)
+  );
+  return file.buffer.slice(file.byteOffset, file.byteOffset + file.byteLength);
+}
+
+const db = source as EmbeddingDatabase;
+const sourceByCode = new Map(db.entries.map((e) => [e.cardCode, e]));
+
+// Max absolute error per stored value for each dtype
+const TOLERANCES: Record<string, number> = {
+  float32: 1e-6,
+  float16: 1e-3,
+  int8: 1e-2,
+};
+
+function expectClose(actual: Float32Array, expected: ArrayLike<number>, tolerance: number) {
+  expect(actual.length).toBe(expected.length);
+  for (let i = 0; i < expected.length; i++) {
+    expect(Math.abs(actual[i] - expected[i])).toBeLessThanOrEqual(tolerance);
+  }
+}
+
+describe('float16ToFloat32', () => {
+  it('should decode common values', () => {
+    expect(float16ToFloat32(0x3c00)).toBe(1);
+    expect(float16ToFloat32(0xc000)).toBe(-2);
+    expect(float16ToFloat32(0x3800)).toBe(0.5);
+    expect(float16ToFloat32(0x0000)).toBe(0);
+  });
+
+  it('should decode subnormals and infinity', () => {
+    expect(float16ToFloat32(0x0001)).toBeCloseTo(5.96e-8, 10);
+    expect(float16ToFloat32(0x7c00)).toBe(Infinity);
+    expect(float16ToFloat32(0x7e00)).toBeNaN();
+  });
+});
+
+describe('parseBinaryDatabase', () => {
+  Object.entries(TOLERANCES).forEach(([dtype, tolerance]) => {
+    describe(dtype, () => {
+      const parsed = parseBinaryDatabase(loadFixture(dtype));
+
+      it('should read metadata and every entry', () => {
+        expect(parsed.cardCount).toBe(db.cardCount);
+        expect(parsed.embeddingDim).toBe(db.embeddingDim);
+        expect(parsed.model).toBe(db.model);
+        expect(parsed.embeddings.map((e) => e.cardCode).sort()).toEqual(
+          db.entries.map((e) => e.cardCode).sort()
+        );
+      });
+
+      it('should group entries by color, uncolored last', () => {
+        expect(parsed.embeddings.map((e) => e.color)).toEqual([
+          'Akatsuki',
+          'Leaf Village',
+          undefined,
+        ]);
+      });
+
+      it('should restore normalized embeddings, histograms and descriptors', () => {
+        parsed.embeddings.forEach((ref) => {
+          const entry = sourceByCode.get(ref.cardCode)!;
+          expectClose(
+            ref.embedding,
+            normalizeEmbedding(new Float32Array(entry.embedding)),
+            tolerance
+          );
+          expectClose(ref.histogram!, entry.histogram!, tolerance);
+          expectClose(ref.dhash!, entry.dhash as number[], tolerance);
+        });
+      });
+
+      it('should rank each reference first for its own embedding', () => {
+        db.entries.forEach((entry) => {
+          const results = findTopCandidates(
+            new Float32Array(entry.embedding),
+            parsed,
+            1,
+            0
+          );
+          expect(results[0].cardCode).toBe(entry.cardCode);
+        });
+      });
+    });
+  });
+
+  it('should map float32 sections without copying', () => {
+    const buffer = loadFixture('float32');
+    const parsed = parseBinaryDatabase(buffer);
+    expect(parsed.embeddings[0].embedding.buffer).toBe(buffer);
+    expect(parsed.embeddings[1].histogram!.buffer).toBe(buffer);
+    expect(parsed.packed!.embeddings.buffer).toBe(buffer);
+  });
+
+  it('should expose the color groups as packed row ranges', () => {
+    const parsed = parseBinaryDatabase(loadFixture('float16'));
+    const packed = parsed.packed!;
+    expect(packed.count).toBe(3);
+    expect(packed.cardCodes).toEqual(parsed.embeddings.map((e) => e.cardCode));
+    expect(packed.colorGroups.get('Akatsuki')).toEqual({ start: 0, end: 1 });
+    expect(packed.colorGroups.get('Leaf Village')).toEqual({ start: 1, end: 2 });
+    expect(packed.embeddings.length).toBe(3 * db.embeddingDim);
+  });
+
+  it('should share one contiguous array across quantized entries', () => {
+    const parsed = parseBinaryDatabase(loadFixture('int8'));
+    expect(parsed.embeddings[0].embedding.buffer).toBe(
+      parsed.embeddings[2].embedding.buffer
+    );
+  });
+
+  it('should reject buffers without the magic header', () => {
+    expect(() => parseBinaryDatabase(new ArrayBuffer(16))).toThrow(
+      'Not a binary embedding database'
+    );
+  });
+});
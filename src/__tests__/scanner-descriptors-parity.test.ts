@@ -0,0 +1,55 @@
+import { describe, it, expect } from 'vitest';
+import { computeHistogram, HISTOGRAM_SIZE } from '@/lib/card-recognition/histogram';
+import { computeDHashFromRgb, DHASH_DIM } from '@/lib/card-recognition/dhash';
+import fixture from './fixtures/descriptor-parity.json';
+
+// Expected values come from scripts/ml/descriptors.py (the batched descriptors used to
+// build reference databases). Regenerate with:
+//   python scripts/ml/descriptors.py --fixture src/__tests__/fixtures/descriptor-parity.json
+
+interface ParityCase {
+  width: number;
+  height: number;
+  rgb: number[];
+  histogram: [number, number][];
+  dhash: number[];
+}
+
+const cases = fixture.cases as ParityCase[];
+
+function toImageData({ width, height, rgb }: ParityCase): ImageData {
+  const data = new Uint8ClampedArray(width * height * 4);
+  for (let i = 0; i < width * height; i++) {
+    data[i * 4] = rgb[i * 3];
+    data[i * 4 + 1] = rgb[i * 3 + 1];
+    data[i * 4 + 2] = rgb[i * 3 + 2];
+    data[i * 4 + 3] = 255;
+  }
+  return { data, width, height, colorSpace: 'srgb' } as ImageData;
+}
+
+describe('descriptor parity with the Python generator', () => {
+  it('should have fixture cases', () => {
+    expect(cases.length).toBeGreaterThan(0);
+  });
+
+  cases.forEach((c, i) => {
+    it(`should match the HSV histogram for case ${i} (${c.width}x${c.height})`, () => {
+      const expected = new Float32Array(HISTOGRAM_SIZE);
+      for (const [index, value] of c.histogram) expected[index] = value;
+
+      const histogram = computeHistogram(toImageData(c));
+      for (let j = 0; j < HISTOGRAM_SIZE; j++) {
+        expect(histogram[j]).toBeCloseTo(expected[j], 6);
+      }
+    });
+
+    it(`should match the spatial color descriptor for case ${i} (${c.width}x${c.height})`, () => {
+      const descriptor = computeDHashFromRgb(new Uint8Array(c.rgb), c.width, c.height);
+      expect(descriptor.length).toBe(DHASH_DIM);
+      for (let j = 0; j < DHASH_DIM; j++) {
+        expect(descriptor[j]).toBeCloseTo(c.dhash[j], 6);
+      }
+    });
+  });
+});
@@ -4,8 +4,19 @@ import {
   normalizeEmbedding,
   computeL2Norm,
   findTopCandidates,
+  packReferences,
+  buildAnnIndex,
+  annCandidateRows,
+  decodeHistogram,
+  sparsifyRows,
+  signatureHyperplanes,
+  buildSignatureFilter,
+  querySignature,
+  hexToSignature,
+  manifestSignatureFilter,
 } from '@/lib/card-recognition/reference-db';
-import type { ReferenceDatabase } from '@/lib/card-recognition/reference-db';
+import { histogramIntersection } from '@/lib/card-recognition/histogram';
+import type { AnnIndexFile, Manifest, ReferenceDatabase } from '@/lib/card-recognition/reference-db';
 
 describe('computeL2Norm', () => {
   it('should compute L2 norm of a simple vector', () => {
@@ -140,4 +151,275 @@ describe('findTopCandidates', () => {
     const results = findTopCandidates(query, db, 10, 0.99);
     expect(results.length).toBe(0);
   });
+
+  it('should stop at the same-color block on a strong match', () => {
+    const db = makeDb([
+      { code: 'KS-001', emb: [1, 0, 0] },
+      { code: 'KS-002', emb: [0.9, 0.1, 0] },
+    ]);
+    db.embeddings[0].color = 'Akatsuki';
+    db.embeddings[1].color = 'Leaf Village';
+    const results = findTopCandidates(
+      new Float32Array([1, 0, 0]), db, 10, 0, undefined, 'Leaf Village'
+    );
+    expect(results.map((r) => r.cardCode)).toEqual(['KS-002']);
+  });
+
+  it('should fall back to every reference when the color block is weak', () => {
+    const db = makeDb([
+      { code: 'KS-001', emb: [1, 0, 0] },
+      { code: 'KS-002', emb: [0, 1, 0] },
+    ]);
+    db.embeddings[0].color = 'Akatsuki';
+    db.embeddings[1].color = 'Leaf Village';
+    const results = findTopCandidates(
+      new Float32Array([1, 0, 0]), db, 10, 0, undefined, 'Leaf Village'
+    );
+    expect(results[0].cardCode).toBe('KS-001');
+    expect(results.map((r) => r.cardCode)).toContain('KS-002');
+  });
+});
+
+describe('packReferences', () => {
+  it('should group rows by color and normalize them', () => {
+    const packed = packReferences([
+      { cardCode: 'KS-001', embedding: new Float32Array([3, 4]), color: 'Akatsuki' },
+      { cardCode: 'KS-002', embedding: new Float32Array([0, 2]) },
+      { cardCode: 'KS-003', embedding: new Float32Array([1, 0]), color: 'Akatsuki' },
+    ]);
+    expect(packed.cardCodes).toEqual(['KS-001', 'KS-003', 'KS-002']);
+    expect(packed.colorGroups.get('Akatsuki')).toEqual({ start: 0, end: 2 });
+    expect(Array.from(packed.embeddings)).toEqual([
+      expect.closeTo(0.6, 5), expect.closeTo(0.8, 5), 1, 0, 0, 1,
+    ]);
+  });
+});
+
+describe('buildAnnIndex', () => {
+  const references = [
+    { cardCode: 'KS-001', embedding: new Float32Array([1, 0, 0]) },
+    { cardCode: 'KS-002', embedding: new Float32Array([0.9, 0.1, 0]) },
+    { cardCode: 'KS-003', embedding: new Float32Array([0, 1, 0]) },
+    { cardCode: 'KS-004', embedding: new Float32Array([0, 0.9, 0.1]) },
+    { cardCode: 'KS-005', embedding: new Float32Array([0, 0, 1]) },
+  ];
+  const file: AnnIndexFile = {
+    version: 1,
+    kind: 'ivf',
+    metric: 'cosine',
+    embeddingDim: 3,
+    nProbe: 1,
+    centroids: [[1, 0.05, 0], [0, 1, 0.05]],
+    lists: [['KS-001', 'KS-002'], ['KS-003', 'KS-004']],
+  };
+
+  function makeDb(nProbe: number): ReferenceDatabase {
+    const packed = packReferences(references);
+    return {
+      embeddings: references,
+      cardCount: references.length,
+      embeddingDim: 3,
+      model: 'test',
+      packed,
+      ann: buildAnnIndex([{ ...file, nProbe }], packed),
+    };
+  }
+
+  it('should map list codes to packed rows and keep unlisted rows', () => {
+    const ann = buildAnnIndex([file], packReferences(references))!;
+    expect(ann.lists.map((rows) => Array.from(rows))).toEqual([[0, 1], [2, 3]]);
+    expect(Array.from(ann.unindexed)).toEqual([4]);
+    expect(Array.from(annCandidateRows(ann, new Float32Array([1, 0, 0])))).toEqual([0, 1, 4]);
+  });
+
+  it('should match the exact search when every list is probed', () => {
+    const query = new Float32Array([0.5, 0.5, 0.1]);
+    const exact = findTopCandidates(query, { ...makeDb(2), ann: undefined }, 5, 0);
+    expect(findTopCandidates(query, makeDb(2), 5, 0)).toEqual(exact);
+  });
+
+  it('should only rescore the probed lists', () => {
+    const results = findTopCandidates(new Float32Array([1, 0, 0]), makeDb(1), 5, 0);
+    expect(results.map((r) => r.cardCode).sort()).toEqual(['KS-001', 'KS-002', 'KS-005']);
+  });
+
+  it('should reject an index of another dimension', () => {
+    expect(buildAnnIndex([{ ...file, embeddingDim: 4 }], packReferences(references))).toBeUndefined();
+  });
+});
+
+describe('sparse histograms', () => {
+  // Deterministic histograms with ~90% empty bins, normalized to sum 1
+  function makeHistogram(seed: number, size = 1024): Float32Array {
+    let state = seed;
+    const next = () => {
+      state = (state * 16807) % 2147483647;
+      return state / 2147483647;
+    };
+    const hist = new Float32Array(size);
+    for (let i = 0; i < size; i++) hist[i] = next() < 0.1 ? next() : 0;
+    const sum = hist.reduce((a, b) => a + b, 0);
+    return hist.map((v) => v / sum);
+  }
+
+  it('should decode dense, sparse and uint16 histograms', () => {
+    expect(Array.from(decodeHistogram([0, 0.25, 0.75]))).toEqual([0, 0.25, 0.75]);
+    expect(Array.from(decodeHistogram({ size: 4, bins: [1, 3], values: [0.25, 0.75] })))
+      .toEqual([0, 0.25, 0, 0.75]);
+    const quantized = decodeHistogram({ size: 3, bins: [2], values: [65535], scale: 1 / 65535 });
+    expect(Array.from(quantized)).toEqual([0, 0, 1]);
+  });
+
+  it('should keep only nonzero bins per row', () => {
+    const sparse = sparsifyRows(new Float32Array([0, 0.5, 0.5, 0, 0, 0, 1, 0, 0]), 3, 3);
+    expect(Array.from(sparse.offsets)).toEqual([0, 2, 2, 3]);
+    expect(Array.from(sparse.bins)).toEqual([1, 2, 0]);
+    expect(Array.from(sparse.values)).toEqual([0.5, 0.5, 1]);
+  });
+
+  it('should score exactly like the dense intersection', () => {
+    const refs = Array.from({ length: 20 }, (_, i) => ({
+      cardCode: `KS-${String(i + 1).padStart(3, '0')}`,
+      embedding: new Float32Array([1, 0]),
+      histogram: makeHistogram(i + 1),
+    }));
+    const db: ReferenceDatabase = {
+      embeddings: refs,
+      cardCount: refs.length,
+      embeddingDim: 2,
+      model: 'test',
+    };
+    const query = makeHistogram(99);
+    const results = findTopCandidates(new Float32Array([1, 0]), db, refs.length, 0, query);
+
+    expect(results).toHaveLength(refs.length);
+    for (const result of results) {
+      const ref = refs.find((r) => r.cardCode === result.cardCode)!;
+      const histSim = histogramIntersection(query, ref.histogram);
+      // Embedding similarity is exactly 1, so the fused score only varies with the histogram
+      const expected = 0.6 + 0.4 * Math.min(1, Math.max(0, (histSim - 0.05) / 0.3));
+      expect(result.confidence).toBe(expected);
+    }
+  });
+});
+
+describe('embedding ramp', () => {
+  const refs = [
+    { cardCode: 'KS-001', embedding: new Float32Array([0.6, 0.8]) },
+    { cardCode: 'KS-002', embedding: new Float32Array([-0.6, 0.8]) },
+  ];
+  const db: ReferenceDatabase = { embeddings: refs, cardCount: 2, embeddingDim: 2, model: 'test' };
+
+  it('should clip projected cosines below the default ramp', () => {
+    // Cosines 0.6 and -0.6: the default ramp scores (0.6 - 0.35) / 0.35 and 0
+    const results = findTopCandidates(new Float32Array([1, 0]), db, 2, 0);
+    expect(results[0].cardCode).toBe('KS-001');
+    expect(results[0].confidence).toBeCloseTo((0.6 - 0.35) / 0.35, 6);
+  });
+
+  it('should score with the manifest ramp of projected references', () => {
+    const results = findTopCandidates(new Float32Array([1, 0]), { ...db, embRamp: [-0.8, 2] }, 2, 0);
+    expect(results[0].cardCode).toBe('KS-001');
+    expect(results[0].confidence).toBeCloseTo(0.7, 6);
+    expect(results[1].confidence).toBeCloseTo(0.1, 6);
+  });
+});
+
+describe('signature pre-filter', () => {
+  const references = [
+    { cardCode: 'KS-001', embedding: new Float32Array([1, 0, 0]) },
+    { cardCode: 'KS-002', embedding: new Float32Array([0.9, 0.1, 0]) },
+    { cardCode: 'KS-003', embedding: new Float32Array([0, 1, 0]) },
+    { cardCode: 'KS-004', embedding: new Float32Array([0, 0, 1]) },
+  ];
+
+  function makeDb(cutoff: number): ReferenceDatabase {
+    const filter = buildSignatureFilter({
+      kind: 'simhash',
+      bits: 32,
+      seed: 7,
+      embeddingDim: 3,
+      thresholds: new Array(32).fill(0),
+      cutoff,
+    })!;
+    const refs = references.map((r) => ({
+      ...r,
+      signature: querySignature(filter, normalizeEmbedding(r.embedding)),
+    }));
+    return {
+      embeddings: refs,
+      cardCount: refs.length,
+      embeddingDim: 3,
+      model: 'test',
+      packed: packReferences(refs),
+      signature: filter,
+    };
+  }
+
+  it('should draw the same hyperplanes as the generator', () => {
+    // hyperplanes(4, 8, 1) in scripts/ml/signature.py
+    expect(Array.from(signatureHyperplanes(4, 8, 1))).toEqual([
+      -1, -1, 1, -1, 1, -1, -1, -1, -1, 1, 1, -1, 1, -1, -1, 1,
+      -1, 1, -1, 1, 1, 1, -1, 1, -1, -1, 1, -1, -1, 1, -1, 1,
+    ]);
+  });
+
+  it('should decode hex signatures word by word', () => {
+    expect(Array.from(hexToSignature('0000000180000000'))).toEqual([1, 0x80000000]);
+  });
+
+  it('should not require a calibrated cutoff', () => {
+    expect(buildSignatureFilter({
+      kind: 'simhash', bits: 32, seed: 7, embeddingDim: 3, thresholds: new Array(32).fill(0),
+    })).toBeUndefined();
+  });
+
+  it('should score every row when the cutoff allows every distance', () => {
+    const query = new Float32Array([0.5, 0.5, 0.1]);
+    const exact = findTopCandidates(query, { ...makeDb(32), signature: undefined }, 5, 0);
+    expect(findTopCandidates(query, makeDb(32), 5, 0)).toEqual(exact);
+  });
+
+  it('should skip distant rows and keep the top-1', () => {
+    const query = new Float32Array([1, 0, 0]);
+    const results = findTopCandidates(query, makeDb(0), 5, 0);
+    expect(results[0].cardCode).toBe('KS-001');
+    expect(results.map((r) => r.cardCode)).not.toContain('KS-003');
+    expect(results.map((r) => r.cardCode)).not.toContain('KS-004');
+  });
+
+  describe('manifestSignatureFilter', () => {
+    const packed = makeDb(8).packed;
+    const manifest = (extra: Partial<Manifest>): Manifest => ({
+      version: '1.0.0',
+      model: 'teacher',
+      sets: [],
+      signature: {
+        kind: 'simhash', bits: 32, seed: 7, embeddingDim: 3, thresholds: new Array(32).fill(0),
+        cutoff: 8, calibratedWith: ['teacher'],
+      },
+      ...extra,
+    });
+    const embedder = {
+      name: 'student', url: '/ml/student.onnx', inputSize: 160, embeddingDim: 3, teacher: 'teacher',
+    };
+
+    it('should use a cutoff calibrated on the reference model', () => {
+      expect(manifestSignatureFilter(manifest({}), packed)?.cutoff).toBe(8);
+    });
+
+    it('should skip a cutoff not calibrated on the manifest embedder', () => {
+      expect(manifestSignatureFilter(manifest({ embedder }), packed)).toBeUndefined();
+    });
+
+    it('should use a cutoff calibrated on the manifest embedder', () => {
+      const info = { ...manifest({}).signature!, calibratedWith: ['teacher', 'student'] };
+      expect(manifestSignatureFilter(manifest({ embedder, signature: info }), packed)?.cutoff).toBe(8);
+    });
+
+    it('should ignore an embedder trained against another model', () => {
+      const stale = { ...embedder, teacher: 'other' };
+      expect(manifestSignatureFilter(manifest({ embedder: stale }), packed)?.cutoff).toBe(8);
+    });
+  });
 });
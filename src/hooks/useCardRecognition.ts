@@ -14,6 +14,7 @@ import {
   type TemporalSmoother,
 } from "@/lib/card-recognition/temporal-smoother";
 import { captureFrame } from "@/lib/card-recognition/capture";
+import { loadManifestEmbedder } from "@/lib/card-recognition/reference-db";
 import type {
   CardRecognitionState,
   RecognitionConfig,
@@ -31,6 +32,14 @@ const DEFAULT_CONFIG: RecognitionConfig = {
 const DEFAULT_MODEL_URL = "/ml/mobilenet_v3_large.onnx";
 const DEFAULT_EMBEDDINGS_URL = "/ml/manifest.json";
 
+/** The config at the input size the loaded model expects, when that differs from the default. */
+function withModelInputSize(
+  config: RecognitionConfig,
+  modelInputSize: number | null
+): RecognitionConfig {
+  return modelInputSize ? { ...config, inputSize: modelInputSize } : config;
+}
+
 export interface UseCardRecognitionReturn {
   state: CardRecognitionState;
   start: (
@@ -56,6 +65,8 @@ export function useCardRecognition(
   const isActiveRef = useRef(false);
   const initializedRef = useRef(false);
   const recognizingRef = useRef(false);
+  /** Input size of the manifest's distilled embedder, when it is the model in use. */
+  const modelInputSizeRef = useRef<number | null>(null);
   const [isUsingWorker, setIsUsingWorker] = useState(false);
 
   const [config, setConfigState] = useState<RecognitionConfig>(DEFAULT_CONFIG);
@@ -101,10 +112,16 @@ export function useCardRecognition(
     setState((prev) => ({ ...prev, status: "loading", loadingProgress: 0 }));
 
     try {
-      await bridge.initialize(
-        modelUrl ?? DEFAULT_MODEL_URL,
-        embeddingsUrl ?? DEFAULT_EMBEDDINGS_URL
-      );
+      const dbUrl = embeddingsUrl ?? DEFAULT_EMBEDDINGS_URL;
+      let resolvedModelUrl = modelUrl ?? DEFAULT_MODEL_URL;
+      if (!modelUrl && dbUrl.endsWith("manifest.json")) {
+        const embedder = await loadManifestEmbedder(dbUrl);
+        if (embedder) {
+          resolvedModelUrl = embedder.url;
+          modelInputSizeRef.current = embedder.inputSize;
+        }
+      }
+      await bridge.initialize(resolvedModelUrl, dbUrl);
       setIsUsingWorker(bridge.isUsingWorker());
       initializedRef.current = true;
       setState((prev) => ({
@@ -165,7 +182,10 @@ export function useCardRecognition(
       const loop = getLoop();
       const smoother = getSmoother();
       smoother.reset();
-      const currentConfig = config;
+      const currentConfig = withModelInputSize(
+        config,
+        modelInputSizeRef.current
+      );
 
       loop.start(
         video,
@@ -279,7 +299,10 @@ export function useCardRecognition(
 
         const bridge = getBridge();
         const { result, fps, detectedCards, topCandidates, identifiedCards } =
-          await bridge.recognize(capture.imageData, config);
+          await bridge.recognize(
+            capture.imageData,
+            withModelInputSize(config, modelInputSizeRef.current)
+          );
 
         setState((prev) => ({
           ...prev,
@@ -6,7 +6,7 @@ import type {
   CropRegion,
 } from "@/types/ml";
 import { captureFrame } from "./capture";
-import { preprocessFrame } from "./preprocess";
+import { letterboxFrame } from "./preprocess";
 import {
   loadReferenceDatabase,
   loadAllReferenceDatabases,
@@ -84,12 +84,12 @@ function createCardRecognizerImpl(): CardRecognizer {
         };
       }
 
-      const preprocessed = preprocessFrame(capture.imageData, config.inputSize);
+      const frame = letterboxFrame(capture.imageData, config.inputSize);
 
       let embedding: Float32Array;
 
       try {
-        embedding = await model.run(preprocessed, config.inputSize);
+        embedding = await model.runFrame(frame);
       } catch {
         return {
           cardCode: null,
@@ -3,10 +3,21 @@
  *
  * Loads the ONNX model via WASM backend and provides a simple inference API.
  *
- * Input: Float32Array in NCHW format, ImageNet-normalized
- * Output: Float32Array of 1280-dim embedding
+ * Input: Float32Array in NCHW format, ImageNet-normalized, or — for models
+ * exported with `export_onnx.py --rgba-input` (input named "pixels") — raw
+ * uint8 RGBA NHWC bytes, with the cast, channel drop, transpose and
+ * normalization done inside the graph.
+ * Output: Float32Array of 1280-dim embedding (K-dim when exported with --pca).
+ * Models exported with `--descriptor-outputs` also take the letterbox content
+ * "box" and return the HSV histogram and spatial descriptor of that region
+ * from the same run.
  */
 
+import { rgbaToNormalizedRgb, type LetterboxBox } from "./preprocess";
+
+/** Input name of models exported with fused RGBA preprocessing. */
+const RGBA_INPUT_NAME = "pixels";
+
 interface OrtTensor {
   data: Float32Array | Int32Array | Uint8Array;
   dims: readonly number[];
@@ -14,11 +25,20 @@ interface OrtTensor {
 }
 
 interface OrtTensorCtor {
-  new (type: string, data: Float32Array, dims: readonly number[]): OrtTensor;
+  new (
+    type: string,
+    data: Float32Array | Int32Array | Uint8Array,
+    dims: readonly number[]
+  ): OrtTensor;
 }
 
 interface OrtSession {
-  run(feeds: Record<string, OrtTensor>): Promise<Record<string, OrtTensor>>;
+  readonly inputNames: readonly string[];
+  readonly outputNames: readonly string[];
+  run(
+    feeds: Record<string, OrtTensor>,
+    fetches?: readonly string[]
+  ): Promise<Record<string, OrtTensor>>;
   release(): Promise<void>;
 }
 
@@ -33,8 +53,31 @@ interface OrtModule {
   env: { wasm: { wasmPaths?: string; numThreads?: number } };
 }
 
+/** Outputs of one model run over a letterboxed frame. */
+export interface FrameFeatures {
+  embedding: Float32Array;
+  /** Present when the model computes descriptors in-graph. */
+  histogram?: Float32Array;
+  dhash?: Float32Array;
+}
+
 export interface OnnxFeatureModel {
+  /** True when the model takes raw RGBA bytes (fused preprocessing). */
+  readonly rgbaInput: boolean;
+  /** True when runFrameFeatures also returns the histogram and dhash. */
+  readonly descriptorOutputs: boolean;
+  /** Runs a float32 NCHW ImageNet-normalized input (float models only). */
   run(input: Float32Array, inputSize: number): Promise<Float32Array>;
+  /**
+   * Runs a letterboxed inputSize x inputSize frame (see letterboxFrame),
+   * passing its bytes straight in when the model has fused preprocessing.
+   */
+  runFrame(frame: ImageData): Promise<Float32Array>;
+  /**
+   * Like runFrame, plus the HSV histogram and spatial descriptor of the
+   * frame's content box when the model has descriptor outputs.
+   */
+  runFrameFeatures(frame: ImageData, box: LetterboxBox): Promise<FrameFeatures>;
   dispose(): void;
 }
 
@@ -59,27 +102,114 @@ export async function loadOnnxModel(
     executionProviders: ["wasm"],
   });
 
-  return {
-    async run(input: Float32Array, inputSize: number): Promise<Float32Array> {
-      const inputTensor = new ort.Tensor("float32", input, [
-        1,
-        3,
-        inputSize,
-        inputSize,
-      ]);
+  const rgbaInput = session.inputNames[0] === RGBA_INPUT_NAME;
+  const descriptorOutputs =
+    session.outputNames.includes("histogram") &&
+    session.outputNames.includes("dhash");
 
-      const feeds: Record<string, OrtTensor> = { input: inputTensor };
-      const results = await session.run(feeds);
+  /**
+   * First output of one run, computing only `fetches` when given; disposes
+   * the feeds and every output.
+   */
+  async function runEmbedding(
+    feeds: Record<string, OrtTensor>,
+    fetches?: readonly string[]
+  ): Promise<Float32Array> {
+    const results = await (fetches
+      ? session.run(feeds, fetches)
+      : session.run(feeds));
 
-      const outputKey = Object.keys(results)[0];
-      const output = results[outputKey];
-      const embedding = new Float32Array(output.data as Float32Array);
+    const outputKey = Object.keys(results)[0];
+    const output = results[outputKey];
+    const embedding = new Float32Array(output.data as Float32Array);
 
-      inputTensor.dispose();
-      output.dispose();
+    for (const feed of Object.values(feeds)) feed.dispose();
+    for (const result of Object.values(results)) result.dispose();
 
-      return embedding;
-    },
+    return embedding;
+  }
+
+  async function run(
+    input: Float32Array,
+    inputSize: number
+  ): Promise<Float32Array> {
+    if (rgbaInput) {
+      throw new Error("Model takes RGBA pixels; use runFrame()");
+    }
+    const inputTensor = new ort.Tensor("float32", input, [
+      1,
+      3,
+      inputSize,
+      inputSize,
+    ]);
+    return runEmbedding({ input: inputTensor });
+  }
+
+  function pixelsTensor(frame: ImageData): OrtTensor {
+    const { data } = frame;
+    const pixels = new Uint8Array(data.buffer, data.byteOffset, data.length);
+    return new ort.Tensor("uint8", pixels, [1, frame.height, frame.width, 4]);
+  }
+
+  function boxTensor(box: LetterboxBox): OrtTensor {
+    return new ort.Tensor(
+      "int32",
+      new Int32Array([box.x, box.y, box.width, box.height]),
+      [1, 4]
+    );
+  }
+
+  async function runFrameFeatures(
+    frame: ImageData,
+    box: LetterboxBox
+  ): Promise<FrameFeatures> {
+    if (!descriptorOutputs) {
+      return { embedding: await runFrame(frame) };
+    }
+    const pixels = pixelsTensor(frame);
+    const boxInput = boxTensor(box);
+    const results = await session.run({
+      [RGBA_INPUT_NAME]: pixels,
+      box: boxInput,
+    });
+
+    const features: FrameFeatures = {
+      embedding: new Float32Array(results.embedding.data as Float32Array),
+      histogram: new Float32Array(results.histogram.data as Float32Array),
+      dhash: new Float32Array(results.dhash.data as Float32Array),
+    };
+
+    pixels.dispose();
+    boxInput.dispose();
+    for (const output of Object.values(results)) output.dispose();
+
+    return features;
+  }
+
+  async function runFrame(frame: ImageData): Promise<Float32Array> {
+    if (descriptorOutputs) {
+      // The graph still takes a box, but only the embedding branch runs
+      const full = { x: 0, y: 0, width: frame.width, height: frame.height };
+      return runEmbedding(
+        { [RGBA_INPUT_NAME]: pixelsTensor(frame), box: boxTensor(full) },
+        ["embedding"]
+      );
+    }
+    if (!rgbaInput) {
+      return run(
+        rgbaToNormalizedRgb(frame.data, frame.width * frame.height),
+        frame.width
+      );
+    }
+    return runEmbedding({ [RGBA_INPUT_NAME]: pixelsTensor(frame) });
+  }
+
+  return {
+    rgbaInput,
+    descriptorOutputs,
+    run,
+    runFrame,
+    runFrameFeatures,
 
     dispose(): void {
       void session.release();
@@ -63,18 +63,41 @@ function createCanvas(
   return { canvas, ctx };
 }
 
+/** Where a letterboxed image's content sits inside the frame, in pixels. */
+export interface LetterboxBox {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
+/** Content box of a width x height image letterboxed to inputSize (see letterboxFrame). */
+export function letterboxContentBox(
+  width: number,
+  height: number,
+  inputSize: number
+): LetterboxBox {
+  const scale = Math.min(inputSize / width, inputSize / height);
+  const scaledW = Math.round(width * scale);
+  const scaledH = Math.round(height * scale);
+  return {
+    x: Math.round((inputSize - scaledW) / 2),
+    y: Math.round((inputSize - scaledH) / 2),
+    width: scaledW,
+    height: scaledH,
+  };
+}
+
 /**
- * Preprocesses an ImageData frame for MobileNet input.
+ * Letterboxes an ImageData frame to inputSize x inputSize RGBA.
  *
- * Uses letterbox resizing: pads the input to a square (with gray=128)
- * while preserving aspect ratio, then resizes to inputSize x inputSize.
- *
- * Output is NCHW layout with ImageNet normalization for ONNX Runtime Web.
+ * Pads the input to a square (with gray=128) while preserving aspect ratio,
+ * then resizes to inputSize x inputSize.
  */
-export function preprocessFrame(
+export function letterboxFrame(
   imageData: ImageData,
   inputSize: number
-): Float32Array {
+): ImageData {
   const { canvas: sourceCanvas, ctx: sourceCtx } = createCanvas(
     imageData.width,
     imageData.height
@@ -85,14 +108,11 @@ export function preprocessFrame(
   targetCtx.fillStyle = "rgb(128,128,128)";
   targetCtx.fillRect(0, 0, inputSize, inputSize);
 
-  const scale = Math.min(
-    inputSize / imageData.width,
-    inputSize / imageData.height
+  const box = letterboxContentBox(
+    imageData.width,
+    imageData.height,
+    inputSize
   );
-  const scaledW = Math.round(imageData.width * scale);
-  const scaledH = Math.round(imageData.height * scale);
-  const offsetX = Math.round((inputSize - scaledW) / 2);
-  const offsetY = Math.round((inputSize - scaledH) / 2);
 
   targetCtx.drawImage(
     sourceCanvas as CanvasImageSource,
@@ -100,12 +120,25 @@ export function preprocessFrame(
     0,
     imageData.width,
     imageData.height,
-    offsetX,
-    offsetY,
-    scaledW,
-    scaledH
+    box.x,
+    box.y,
+    box.width,
+    box.height
   );
 
-  const resized = targetCtx.getImageData(0, 0, inputSize, inputSize);
+  return targetCtx.getImageData(0, 0, inputSize, inputSize);
+}
+
+/**
+ * Preprocesses an ImageData frame for MobileNet input.
+ *
+ * Letterboxes the frame (see letterboxFrame), then converts it to NCHW
+ * layout with ImageNet normalization for ONNX Runtime Web.
+ */
+export function preprocessFrame(
+  imageData: ImageData,
+  inputSize: number
+): Float32Array {
+  const resized = letterboxFrame(imageData, inputSize);
   return rgbaToNormalizedRgb(resized.data, inputSize * inputSize);
 }
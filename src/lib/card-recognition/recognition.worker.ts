@@ -1,5 +1,5 @@
 import type { WorkerMessage, WorkerResponse } from "@/types/ml";
-import { preprocessFrame } from "./preprocess";
+import { letterboxFrame } from "./preprocess";
 import {
   loadReferenceDatabase,
   loadAllReferenceDatabases,
@@ -81,8 +81,8 @@ self.onmessage = async (event: MessageEvent<WorkerMessage>): Promise<void> => {
     const { imageData, config } = msg;
 
     try {
-      const preprocessed = preprocessFrame(imageData, config.inputSize);
-      const embedding = await model.run(preprocessed, config.inputSize);
+      const frame = letterboxFrame(imageData, config.inputSize);
+      const embedding = await model.runFrame(frame);
 
       const candidates = findTopCandidates(
         embedding,
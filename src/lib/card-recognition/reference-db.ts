@@ -1,15 +1,61 @@
 import type {
+  BinaryDatabaseHeader,
   EmbeddingDatabase,
   ReferenceEmbedding,
   RecognitionResult,
+  SparseHistogram,
 } from "@/types/ml";
-import { hexToDHash, dHashSimilarity } from "./dhash";
+import { hexToDHash } from "./dhash";
 
 export interface ReferenceDatabase {
   embeddings: ReferenceEmbedding[];
   cardCount: number;
   embeddingDim: number;
   model: string;
+  /** Scoring layout; built from `embeddings` on first use when absent. */
+  packed?: PackedReferences;
+  /** Candidate shortlist over `packed` rows; findTopCandidates scans every row without it. */
+  ann?: AnnIndex;
+  /** Hamming pre-filter over `packed` signatures; every candidate row is scored without it. */
+  signature?: SignatureFilter;
+  /** Embedding score ramp [start, width]; EMB_RAMP unless the references are PCA-projected. */
+  embRamp?: [number, number];
+}
+
+/** Embedding score ramp for the model's own embeddings (EMB_RAMP in scripts/ml/scoring.py). */
+export const EMB_RAMP: [number, number] = [0.35, 0.35];
+
+/**
+ * Nonzero entries of each row of a (count, dim) matrix, CSR-style: row r owns
+ * bins/values [offsets[r], offsets[r + 1]), bins ascending.
+ */
+export interface SparseRows {
+  offsets: Uint32Array;
+  bins: Uint16Array;
+  values: Float32Array;
+}
+
+/**
+ * References laid out for findTopCandidates: L2-normalized rows packed
+ * row-major and grouped by color, so scoring is a dot-product sweep over
+ * contiguous memory and a color filter only touches its own block.
+ * Histograms are mostly zeros, so only their nonzero bins are kept.
+ */
+export interface PackedReferences {
+  count: number;
+  cardCodes: string[];
+  embeddingDim: number;
+  embeddings: Float32Array;
+  histogramDim: number;
+  histograms: SparseRows | null;
+  hasHistogram: Uint8Array;
+  dhashDim: number;
+  dhashes: Float32Array | null;
+  hasDHash: Uint8Array;
+  /** uint32 words per signature; 0 unless every reference has one. */
+  signatureWords: number;
+  signatures: Uint32Array | null;
+  colorGroups: Map<string, { start: number; end: number }>;
 }
 
 export function computeL2Norm(v: Float32Array): number {
@@ -49,6 +95,55 @@ export function cosineSimilarity(a: Float32Array, b: Float32Array): number {
   return dot / denom;
 }
 
+/** Dense histogram of a database entry, stored either dense or sparse. */
+export function decodeHistogram(
+  histogram: number[] | SparseHistogram
+): Float32Array {
+  if (Array.isArray(histogram)) return new Float32Array(histogram);
+  const dense = new Float32Array(histogram.size);
+  const scale = histogram.scale ?? 1;
+  histogram.bins.forEach((bin, k) => {
+    dense[bin] = histogram.values[k] * scale;
+  });
+  return dense;
+}
+
+/** Nonzero entries of the first `count` rows of a row-major (count, dim) matrix. */
+export function sparsifyRows(
+  data: Float32Array,
+  dim: number,
+  count: number
+): SparseRows {
+  let nonzero = 0;
+  for (let i = 0; i < count * dim; i++) if (data[i] !== 0) nonzero++;
+
+  const offsets = new Uint32Array(count + 1);
+  const bins = new Uint16Array(nonzero);
+  const values = new Float32Array(nonzero);
+  let k = 0;
+  for (let r = 0; r < count; r++) {
+    const base = r * dim;
+    for (let i = 0; i < dim; i++) {
+      if (data[base + i] !== 0) {
+        bins[k] = i;
+        values[k] = data[base + i];
+        k++;
+      }
+    }
+    offsets[r + 1] = k;
+  }
+  return { offsets, bins, values };
+}
+
+/** uint32 words of a hex signature: 8 hex digits per word, word 0 first. */
+export function hexToSignature(hex: string): Uint32Array {
+  const words = new Uint32Array(hex.length >> 3);
+  for (let w = 0; w < words.length; w++) {
+    words[w] = parseInt(hex.slice(w * 8, w * 8 + 8), 16);
+  }
+  return words;
+}
+
 export async function loadReferenceDatabase(
   url: string
 ): Promise<ReferenceDatabase> {
@@ -59,14 +154,19 @@ export async function loadReferenceDatabase(
     );
   }
 
+  if (url.split("?")[0].endsWith(".bin")) {
+    return parseBinaryDatabase(await response.arrayBuffer());
+  }
+
   const json: EmbeddingDatabase = (await response.json()) as EmbeddingDatabase;
 
   const embeddings: ReferenceEmbedding[] = json.entries.map((entry) => ({
     cardCode: entry.cardCode,
     embedding: normalizeEmbedding(new Float32Array(entry.embedding)),
-    histogram: entry.histogram ? new Float32Array(entry.histogram) : undefined,
+    histogram: entry.histogram ? decodeHistogram(entry.histogram) : undefined,
     color: entry.color,
     dhash: entry.dhash ? hexToDHash(entry.dhash) : undefined,
+    signature: entry.signature ? hexToSignature(entry.signature) : undefined,
   }));
 
   return {
@@ -77,16 +177,489 @@ export async function loadReferenceDatabase(
   };
 }
 
+// Binary database format, written by scripts/ml/dbformat.py:
+// "NMDB" magic, uint32 version, uint32 header length, JSON header, then
+// 16-byte aligned row-major sections (typed arrays assume little-endian).
+const BINARY_MAGIC = 0x42444d4e; // "NMDB"
+const BINARY_FORMAT_VERSION = 1;
+
+export function float16ToFloat32(h: number): number {
+  const sign = h & 0x8000 ? -1 : 1;
+  const exponent = (h >> 10) & 0x1f;
+  const fraction = h & 0x3ff;
+  if (exponent === 0) return sign * fraction * 2 ** -24;
+  if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+  return sign * (1 + fraction / 1024) * 2 ** (exponent - 15);
+}
+
+interface Matrix {
+  data: Float32Array;
+  dim: number;
+  /** True when data views the file buffer rather than a decoded copy. */
+  view: boolean;
+}
+
+/**
+ * Float32 rows of a section. float32 sections are views onto the buffer itself;
+ * float16/int8/uint8 sections are expanded (with their per-row scale) into one
+ * contiguous array that every entry then views into.
+ */
+function readMatrix(
+  buffer: ArrayBuffer,
+  header: BinaryDatabaseHeader,
+  name: string
+): Matrix | null {
+  const section = header.sections[name];
+  if (!section) return null;
+
+  const [rows, dim] = section.shape;
+  const count = rows * dim;
+  const { offset } = section;
+
+  if (section.dtype === "float32") {
+    return { data: new Float32Array(buffer, offset, count), dim, view: true };
+  }
+
+  const data = new Float32Array(count);
+  if (section.dtype === "float16") {
+    const raw = new Uint16Array(buffer, offset, count);
+    for (let i = 0; i < count; i++) data[i] = float16ToFloat32(raw[i]);
+    return { data, dim, view: false };
+  }
+
+  if (section.dtype !== "int8" && section.dtype !== "uint8") {
+    throw new Error(`Unsupported section dtype: ${section.dtype as string}`);
+  }
+  const raw =
+    section.dtype === "int8"
+      ? new Int8Array(buffer, offset, count)
+      : new Uint8Array(buffer, offset, count);
+  const scaleSection = header.sections[`${name}Scale`];
+  const scale = scaleSection
+    ? new Float32Array(buffer, scaleSection.offset, rows)
+    : null;
+  for (let r = 0; r < rows; r++) {
+    const s = scale ? scale[r] : 1;
+    for (let i = r * dim; i < (r + 1) * dim; i++) data[i] = raw[i] * s;
+  }
+  return { data, dim, view: false };
+}
+
+function matrixRow(matrix: Matrix, row: number): Float32Array {
+  return matrix.data.subarray(row * matrix.dim, (row + 1) * matrix.dim);
+}
+
+export function parseBinaryDatabase(buffer: ArrayBuffer): ReferenceDatabase {
+  const view = new DataView(buffer);
+  if (buffer.byteLength < 12 || view.getUint32(0, true) !== BINARY_MAGIC) {
+    throw new Error("Not a binary embedding database");
+  }
+  const version = view.getUint32(4, true);
+  if (version !== BINARY_FORMAT_VERSION) {
+    throw new Error(`Unsupported binary database version: ${version}`);
+  }
+  const headerLength = view.getUint32(8, true);
+  const header = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength))
+  ) as BinaryDatabaseHeader;
+
+  const embedding = readMatrix(buffer, header, "embedding");
+  if (!embedding) {
+    throw new Error("Binary database has no embedding section");
+  }
+  const histogram = readMatrix(buffer, header, "histogram");
+  const dhash = readMatrix(buffer, header, "dhash");
+  const signatureSection = header.sections.signature;
+  const signatureWords = signatureSection ? signatureSection.shape[1] : 0;
+  const signatures = signatureSection
+    ? new Uint32Array(
+        buffer,
+        signatureSection.offset,
+        signatureSection.shape[0] * signatureWords
+      )
+    : null;
+
+  // Rows are stored normalized; re-normalize decoded (quantized) copies
+  const normalized = header.normalized;
+  if (normalized && !embedding.view) {
+    normalizeRows(embedding.data, embedding.dim);
+  }
+  if (normalized && dhash && !dhash.view) {
+    normalizeRows(dhash.data, dhash.dim);
+  }
+
+  const embeddings: ReferenceEmbedding[] = header.cardCodes.map(
+    (cardCode, i) => ({
+      cardCode,
+      embedding: normalized
+        ? matrixRow(embedding, i)
+        : normalizeEmbedding(matrixRow(embedding, i)),
+      histogram: histogram ? matrixRow(histogram, i) : undefined,
+      color: header.colors[i] ?? undefined,
+      dhash: dhash ? matrixRow(dhash, i) : undefined,
+      signature: signatures
+        ? signatures.subarray(i * signatureWords, (i + 1) * signatureWords)
+        : undefined,
+    })
+  );
+
+  // The file is already in scoring layout: score straight off these arrays
+  let packed: PackedReferences | undefined;
+  if (normalized && header.colorGroups) {
+    const count = header.cardCodes.length;
+    const colorGroups = new Map<string, { start: number; end: number }>();
+    for (const group of header.colorGroups) {
+      if (group.color !== null) {
+        colorGroups.set(group.color, {
+          start: group.start,
+          end: group.start + group.count,
+        });
+      }
+    }
+    packed = {
+      count,
+      cardCodes: header.cardCodes,
+      embeddingDim: embedding.dim,
+      embeddings: embedding.data,
+      histogramDim: histogram?.dim ?? 0,
+      histograms: histogram
+        ? sparsifyRows(histogram.data, histogram.dim, count)
+        : null,
+      hasHistogram: new Uint8Array(count).fill(histogram ? 1 : 0),
+      dhashDim: dhash?.dim ?? 0,
+      dhashes: dhash?.data ?? null,
+      hasDHash: new Uint8Array(count).fill(dhash ? 1 : 0),
+      signatureWords,
+      signatures,
+      colorGroups,
+    };
+  }
+
+  return {
+    embeddings,
+    cardCount: header.cardCount,
+    embeddingDim: header.embeddingDim,
+    model: header.model,
+    packed,
+  };
+}
+
+// Database files are content-hashed (embeddings-KS.<hash>.json): a URL never
+// changes content, so browsers can cache them indefinitely and only the
+// manifest has to be revalidated.
 interface ManifestEntry {
   setCode: string;
   embeddingsUrl: string;
   cardCount: number;
+  contentHash?: string;
+  format?: "json";
+  sizeBytes?: number;
+  binary?: {
+    url: string;
+    dtype: string;
+    sizeBytes: number;
+  };
+  ann?: {
+    url: string;
+    kind: "ivf";
+    lists: number;
+    nProbe: number;
+    sizeBytes: number;
+  };
 }
 
-interface Manifest {
+export interface Manifest {
   version: string;
   model: string;
   sets: ManifestEntry[];
+  /** Every set in one database, loaded with a single request when present. */
+  bundle?: {
+    url: string;
+    format: "json" | "binary";
+    dtype?: string;
+    cardCount: number;
+    contentHash: string;
+    sizeBytes: number;
+  };
+  /** PCA applied to the references and appended to the model (generate_embeddings.py --reduce-dim). */
+  projection?: {
+    dim: number;
+    whiten: boolean;
+    sourceDim: number;
+    /** Embedding score ramp retuned for the projected cosines (scripts/ml/pca.py). */
+    embRamp?: [number, number];
+  };
+  /** Distilled student to embed queries with instead of `model` (scripts/distill_student.py). */
+  embedder?: EmbedderInfo;
+  /** SimHash of the references' signatures (scripts/ml/signature.py). */
+  signature?: SignatureInfo;
+}
+
+/** Signature hash of the references, as written to the manifest. */
+export interface SignatureInfo {
+  kind: "simhash";
+  bits: number;
+  seed: number;
+  embeddingDim: number;
+  thresholds: number[];
+  /** Calibrated Hamming cutoff; absent when the generator couldn't validate one. */
+  cutoff?: number;
+  /** Query models (`model`, embedder names) whose captures the cutoff was calibrated on. */
+  calibratedWith?: string[];
+}
+
+/** Query embedder named by the manifest, trained to match the reference model's embeddings. */
+export interface EmbedderInfo {
+  name: string;
+  url: string;
+  inputSize: number;
+  embeddingDim: number;
+  /** Model the references were generated with. */
+  teacher: string;
+}
+
+/** IVF index file written by scripts/ml/ann.py next to each set. */
+export interface AnnIndexFile {
+  version: number;
+  kind: "ivf";
+  metric: "cosine";
+  embeddingDim: number;
+  nProbe: number;
+  centroids: number[][];
+  lists: string[][];
+}
+
+/**
+ * Inverted-file index over packed rows: a query is compared with the list
+ * centroids and only the rows of the `nProbe` closest lists are rescored.
+ */
+export interface AnnIndex {
+  embeddingDim: number;
+  /** L2-normalized centroids, row-major. */
+  centroids: Float32Array;
+  lists: Int32Array[];
+  nProbe: number;
+  /** Rows no list covers (e.g. cards missing from an index); always rescored. */
+  unindexed: Int32Array;
+}
+
+// Below this many references a linear scan is cheap enough that fetching the
+// ANN indices isn't worth it
+export const ANN_MIN_REFERENCES = 2000;
+
+/**
+ * Merge the per-set index files into one index over `packed` rows (lists
+ * name cards by code, so packing order doesn't matter). Probe counts add up
+ * across sets. Returns undefined when an index doesn't match the references.
+ */
+export function buildAnnIndex(
+  files: AnnIndexFile[],
+  packed: PackedReferences
+): AnnIndex | undefined {
+  const rowsByCode = new Map<string, number[]>();
+  packed.cardCodes.forEach((code, r) => {
+    const rows = rowsByCode.get(code);
+    if (rows) rows.push(r);
+    else rowsByCode.set(code, [r]);
+  });
+
+  const dim = packed.embeddingDim;
+  const centroidRows: number[][] = [];
+  const lists: Int32Array[] = [];
+  const covered = new Uint8Array(packed.count);
+  let nProbe = 0;
+  for (const file of files) {
+    if (file.kind !== "ivf" || file.embeddingDim !== dim) return undefined;
+    nProbe += file.nProbe;
+    file.centroids.forEach((centroid, c) => {
+      const rows: number[] = [];
+      for (const code of file.lists[c] ?? []) {
+        for (const r of rowsByCode.get(code) ?? []) {
+          rows.push(r);
+          covered[r] = 1;
+        }
+      }
+      centroidRows.push(centroid);
+      lists.push(Int32Array.from(rows));
+    });
+  }
+  if (lists.length === 0) return undefined;
+
+  const centroids = new Float32Array(lists.length * dim);
+  centroidRows.forEach((centroid, c) => centroids.set(centroid, c * dim));
+  normalizeRows(centroids, dim);
+
+  const unindexed: number[] = [];
+  covered.forEach((isCovered, r) => {
+    if (!isCovered) unindexed.push(r);
+  });
+
+  return {
+    embeddingDim: dim,
+    centroids,
+    lists,
+    nProbe: Math.min(nProbe, lists.length),
+    unindexed: Int32Array.from(unindexed),
+  };
+}
+
+/** Ascending packed rows to rescore for a normalized query. */
+export function annCandidateRows(
+  ann: AnnIndex,
+  normalizedQuery: Float32Array
+): Int32Array {
+  const { embeddingDim: dim, centroids, lists } = ann;
+  const sims = new Float32Array(lists.length);
+  for (let c = 0; c < lists.length; c++) {
+    let dot = 0;
+    for (let i = 0; i < dim; i++) dot += normalizedQuery[i] * centroids[c * dim + i];
+    sims[c] = dot;
+  }
+  const order = Array.from(sims.keys()).sort((a, b) => sims[b] - sims[a]);
+
+  let total = ann.unindexed.length;
+  for (let p = 0; p < ann.nProbe; p++) total += lists[order[p]].length;
+  const rows = new Int32Array(total);
+  let offset = 0;
+  for (let p = 0; p < ann.nProbe; p++) {
+    rows.set(lists[order[p]], offset);
+    offset += lists[order[p]].length;
+  }
+  rows.set(ann.unindexed, offset);
+  return rows.sort();
+}
+
+/**
+ * SimHash pre-filter: a reference whose signature is more than `cutoff` bits
+ * from the query's is skipped before the fused score (the generator checks
+ * the cutoff never drops the full scorer's top-1 on held-out captures).
+ */
+export interface SignatureFilter {
+  bits: number;
+  embeddingDim: number;
+  /** +1/-1 hyperplanes, row-major (embeddingDim, bits). */
+  planes: Int8Array;
+  thresholds: Float64Array;
+  cutoff: number;
+}
+
+/**
+ * The generator's hyperplanes (hyperplanes in scripts/ml/signature.py): the
+ * top bit of successive xorshift32 states, row-major over (dim, bits).
+ */
+export function signatureHyperplanes(
+  dim: number,
+  bits: number,
+  seed: number
+): Int8Array {
+  const planes = new Int8Array(dim * bits);
+  let x = seed >>> 0 || 1;
+  for (let i = 0; i < planes.length; i++) {
+    x ^= x << 13;
+    x ^= x >>> 17;
+    x ^= x << 5;
+    x >>>= 0;
+    planes[i] = x >>> 31 ? 1 : -1;
+  }
+  return planes;
+}
+
+export function buildSignatureFilter(
+  info: SignatureInfo
+): SignatureFilter | undefined {
+  if (info.kind !== "simhash" || info.cutoff === undefined) return undefined;
+  return {
+    bits: info.bits,
+    embeddingDim: info.embeddingDim,
+    planes: signatureHyperplanes(info.embeddingDim, info.bits, info.seed),
+    thresholds: Float64Array.from(info.thresholds),
+    cutoff: info.cutoff,
+  };
+}
+
+/** Signature of an L2-normalized query: bit b is bit b % 32 of word b / 32. */
+export function querySignature(
+  filter: SignatureFilter,
+  normalizedQuery: Float32Array
+): Uint32Array {
+  const { bits, embeddingDim: dim, planes, thresholds } = filter;
+  const projections = new Float64Array(bits);
+  for (let i = 0; i < dim; i++) {
+    const q = normalizedQuery[i];
+    const base = i * bits;
+    for (let b = 0; b < bits; b++) projections[b] += q * planes[base + b];
+  }
+  const words = new Uint32Array(bits >> 5);
+  for (let b = 0; b < bits; b++) {
+    if (projections[b] >= thresholds[b]) words[b >> 5] |= 1 << (b & 31);
+  }
+  return words;
+}
+
+function popcount32(v: number): number {
+  v -= (v >>> 1) & 0x55555555;
+  v = (v & 0x33333333) + ((v >>> 2) & 0x33333333);
+  return Math.imul((v + (v >>> 4)) & 0x0f0f0f0f, 0x01010101) >>> 24;
+}
+
+async function loadAnnIndexFile(url: string): Promise<AnnIndexFile> {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Failed to load ANN index from ${url}: ${response.status}`);
+  }
+  return (await response.json()) as AnnIndexFile;
+}
+
+/**
+ * The embedder named by a manifest, with its URL resolved against the manifest's
+ * origin, or null if the manifest names none (queries use the reference model).
+ */
+export async function loadManifestEmbedder(
+  manifestUrl: string
+): Promise<EmbedderInfo | null> {
+  const response = await fetch(manifestUrl);
+  if (!response.ok) {
+    throw new Error(
+      `Failed to load manifest from ${manifestUrl}: ${response.status}`
+    );
+  }
+  const manifest = (await response.json()) as Manifest;
+  if (!manifest.embedder || manifest.embedder.teacher !== manifest.model) {
+    return null;
+  }
+
+  let url = manifest.embedder.url;
+  try {
+    if (url.startsWith("/")) url = new URL(manifestUrl).origin + url;
+  } catch {
+    // manifestUrl is relative
+  }
+  return { ...manifest.embedder, url };
+}
+
+/**
+ * The manifest's pre-filter for `packed`: it needs a calibrated cutoff, signatures on
+ * every reference and, when the manifest names an embedder (which useCardRecognition
+ * runs by default, see loadManifestEmbedder), a cutoff calibrated on its queries too.
+ */
+export function manifestSignatureFilter(
+  manifest: Manifest,
+  packed: PackedReferences
+): SignatureFilter | undefined {
+  const info = manifest.signature;
+  if (
+    !info ||
+    info.embeddingDim !== packed.embeddingDim ||
+    info.bits !== packed.signatureWords * 32
+  ) {
+    return undefined;
+  }
+  const embedder =
+    manifest.embedder?.teacher === manifest.model ? manifest.embedder : undefined;
+  if (embedder && !(info.calibratedWith ?? []).includes(embedder.name)) {
+    return undefined;
+  }
+  return buildSignatureFilter(info);
 }
 
 export async function loadAllReferenceDatabases(
@@ -110,11 +683,29 @@ export async function loadAllReferenceDatabases(
   const resolveUrl = (url: string): string =>
     baseOrigin && url.startsWith("/") ? baseOrigin + url : url;
 
-  const databases = await Promise.all(
-    manifest.sets.map((entry) =>
-      loadReferenceDatabase(resolveUrl(entry.embeddingsUrl))
-    )
-  );
+  // ANN indices only pay off on large reference sets, and only if every set has one
+  const totalCards = manifest.sets.reduce((n, entry) => n + entry.cardCount, 0);
+  const useAnn =
+    totalCards >= ANN_MIN_REFERENCES &&
+    manifest.sets.length > 0 &&
+    manifest.sets.every((entry) => entry.ann);
+
+  const [databases, annFiles] = await Promise.all([
+    manifest.bundle
+      ? Promise.all([loadReferenceDatabase(resolveUrl(manifest.bundle.url))])
+      : Promise.all(
+          manifest.sets.map((entry) =>
+            loadReferenceDatabase(
+              resolveUrl(entry.binary?.url ?? entry.embeddingsUrl)
+            )
+          )
+        ),
+    useAnn
+      ? Promise.all(
+          manifest.sets.map((entry) => loadAnnIndexFile(resolveUrl(entry.ann!.url)))
+        ).catch(() => null)
+      : Promise.resolve(null),
+  ]);
 
   const allEmbeddings: ReferenceEmbedding[] = [];
   let embeddingDim = 0;
@@ -124,18 +715,139 @@ export async function loadAllReferenceDatabases(
     if (db.embeddingDim > 0) embeddingDim = db.embeddingDim;
   }
 
+  // Pack once at load so the first scanned frame doesn't pay for it
+  const packed =
+    databases.length === 1 && databases[0].packed
+      ? databases[0].packed
+      : packReferences(allEmbeddings);
+
+  const signature = manifestSignatureFilter(manifest, packed);
+
   return {
     embeddings: allEmbeddings,
     cardCount: allEmbeddings.length,
     embeddingDim,
     model: manifest.model,
+    packed,
+    ann: annFiles ? buildAnnIndex(annFiles, packed) : undefined,
+    signature,
+    embRamp: manifest.projection?.embRamp,
   };
 }
 
-function histogramIntersection(a: Float32Array, b: Float32Array): number {
-  let sum = 0;
-  for (let i = 0; i < a.length; i++) sum += Math.min(a[i], b[i]);
-  return sum;
+function normalizeRows(data: Float32Array, dim: number): void {
+  for (let base = 0; base < data.length; base += dim) {
+    let sum = 0;
+    for (let i = base; i < base + dim; i++) sum += data[i] * data[i];
+    const norm = Math.sqrt(sum);
+    if (norm > 0) {
+      for (let i = base; i < base + dim; i++) data[i] /= norm;
+    }
+  }
+}
+
+/**
+ * Copy references into the packed scoring layout: rows grouped by color
+ * (original order kept within a color), embeddings and spatial descriptors
+ * L2-normalized so similarity is a plain dot product.
+ */
+export function packReferences(refs: ReferenceEmbedding[]): PackedReferences {
+  const byColor = new Map<string | undefined, ReferenceEmbedding[]>();
+  for (const ref of refs) {
+    const group = byColor.get(ref.color);
+    if (group) group.push(ref);
+    else byColor.set(ref.color, [ref]);
+  }
+  const ordered = [...byColor.values()].flat();
+  const count = ordered.length;
+
+  const embeddingDim = ordered[0]?.embedding.length ?? 0;
+  const histogramDim = ordered.find((r) => r.histogram)?.histogram?.length ?? 0;
+  const dhashDim = ordered.find((r) => r.dhash)?.dhash?.length ?? 0;
+  const firstSignature = ordered[0]?.signature?.length ?? 0;
+  const signatureWords = ordered.every(
+    (r) => r.signature?.length === firstSignature
+  )
+    ? firstSignature
+    : 0;
+
+  const embeddings = new Float32Array(count * embeddingDim);
+  const denseHistograms =
+    histogramDim > 0 ? new Float32Array(count * histogramDim) : null;
+  const dhashes = dhashDim > 0 ? new Float32Array(count * dhashDim) : null;
+  const hasHistogram = new Uint8Array(count);
+  const hasDHash = new Uint8Array(count);
+  const signatures =
+    signatureWords > 0 ? new Uint32Array(count * signatureWords) : null;
+
+  ordered.forEach((ref, r) => {
+    if (ref.embedding.length !== embeddingDim) {
+      throw new Error(
+        `Vector dimension mismatch: ${embeddingDim} vs ${ref.embedding.length}`
+      );
+    }
+    embeddings.set(ref.embedding, r * embeddingDim);
+    if (denseHistograms && ref.histogram) {
+      denseHistograms.set(ref.histogram.subarray(0, histogramDim), r * histogramDim);
+      hasHistogram[r] = 1;
+    }
+    if (dhashes && ref.dhash) {
+      dhashes.set(ref.dhash.subarray(0, dhashDim), r * dhashDim);
+      hasDHash[r] = 1;
+    }
+    if (signatures) signatures.set(ref.signature!, r * signatureWords);
+  });
+  normalizeRows(embeddings, embeddingDim);
+  if (dhashes) normalizeRows(dhashes, dhashDim);
+
+  const colorGroups = new Map<string, { start: number; end: number }>();
+  let start = 0;
+  for (const [color, group] of byColor) {
+    if (color !== undefined) {
+      colorGroups.set(color, { start, end: start + group.length });
+    }
+    start += group.length;
+  }
+
+  return {
+    count,
+    cardCodes: ordered.map((r) => r.cardCode),
+    embeddingDim,
+    embeddings,
+    histogramDim,
+    histograms: denseHistograms
+      ? sparsifyRows(denseHistograms, histogramDim, count)
+      : null,
+    hasHistogram,
+    dhashDim,
+    dhashes,
+    hasDHash,
+    signatureWords,
+    signatures,
+    colorGroups,
+  };
+}
+
+// Databases without a loader-provided layout are packed once, on first use.
+// Their `embeddings` must not be mutated afterwards.
+const packedCache = new WeakMap<ReferenceDatabase, PackedReferences>();
+
+function getPackedReferences(db: ReferenceDatabase): PackedReferences {
+  if (db.packed) return db.packed;
+  let packed = packedCache.get(db);
+  if (!packed) {
+    packed = packReferences(db.embeddings);
+    packedCache.set(db, packed);
+  }
+  return packed;
+}
+
+// Below this best same-color score, the color filter scores every reference
+const COLOR_FALLBACK_SCORE = 0.4;
+
+interface Candidate {
+  cardCode: string;
+  similarity: number;
 }
 
 export function findTopCandidates(
@@ -147,87 +859,146 @@ export function findTopCandidates(
   colorFilter?: string | null,
   queryDHash?: Float32Array
 ): RecognitionResult[] {
+  const refs = getPackedReferences(db);
   const normalizedQuery = normalizeEmbedding(query);
-  const useHistogram =
-    !!queryHistogram && db.embeddings.some((e) => e.histogram);
-  const useDHash =
-    queryDHash !== undefined &&
-    db.embeddings.some((e) => e.dhash !== undefined);
+  if (refs.count > 0 && normalizedQuery.length !== refs.embeddingDim) {
+    throw new Error(
+      `Vector dimension mismatch: ${normalizedQuery.length} vs ${refs.embeddingDim}`
+    );
+  }
+
+  const {
+    cardCodes,
+    embeddingDim,
+    embeddings,
+    histogramDim,
+    histograms,
+    hasHistogram,
+    dhashDim,
+    dhashes,
+    hasDHash,
+  } = refs;
+  const hist = queryHistogram && histograms ? queryHistogram : null;
+  const dhashQuery =
+    queryDHash !== undefined && dhashes ? normalizeEmbedding(queryDHash) : null;
+  const histLen = hist ? Math.min(hist.length, histogramDim) : 0;
+  const histOffsets = histograms?.offsets;
+  const histBins = histograms?.bins;
+  const histValues = histograms?.values;
+  const dhashLen = dhashQuery ? Math.min(dhashQuery.length, dhashDim) : 0;
 
+  const [embStart, embWidth] = db.embRamp ?? EMB_RAMP;
   const normEmb = (v: number) =>
-    Math.min(1, Math.max(0, (v - 0.35) / 0.35));
+    Math.min(1, Math.max(0, (v - embStart) / embWidth));
   const normHist = (v: number) =>
     Math.min(1, Math.max(0, (v - 0.05) / 0.30));
   const normSpatial = (v: number) =>
     Math.min(1, Math.max(0, (v - 0.10) / 0.40));
 
-  function scoreRef(ref: ReferenceEmbedding): { score: number } {
-    const embSim = cosineSimilarity(normalizedQuery, ref.embedding);
-
-    if (
-      useHistogram &&
-      useDHash &&
-      ref.histogram &&
-      queryHistogram &&
-      ref.dhash !== undefined
-    ) {
-      const histSim = histogramIntersection(queryHistogram, ref.histogram);
-      const dhSim = dHashSimilarity(queryDHash, ref.dhash);
-      return {
-        score:
-          0.45 * normEmb(embSim) +
-          0.25 * normHist(histSim) +
-          0.3 * normSpatial(dhSim),
-      };
-    } else if (useDHash && ref.dhash !== undefined) {
-      const dhSim = dHashSimilarity(queryDHash, ref.dhash);
-      return {
-        score: 0.55 * normEmb(embSim) + 0.45 * normSpatial(dhSim),
-      };
-    } else if (useHistogram && ref.histogram && queryHistogram) {
-      const histSim = histogramIntersection(queryHistogram, ref.histogram);
-      return {
-        score: 0.6 * normEmb(embSim) + 0.4 * normHist(histSim),
-      };
-    }
-    return { score: normEmb(embSim) };
-  }
-
-  let results: Array<{ cardCode: string; similarity: number }> = [];
+  // With an ANN index only the shortlisted rows of each block are rescored
+  const shortlist = db.ann ? annCandidateRows(db.ann, normalizedQuery) : null;
 
-  if (colorFilter) {
-    const sameColorRefs = db.embeddings.filter((e) => e.color === colorFilter);
+  // Cascade: rows whose signature is too far from the query's are never scored
+  const filter =
+    db.signature &&
+    refs.signatures &&
+    db.signature.bits === refs.signatureWords * 32 &&
+    db.signature.embeddingDim === embeddingDim
+      ? db.signature
+      : null;
+  const querySig = filter ? querySignature(filter, normalizedQuery) : null;
+  const { signatureWords, signatures } = refs;
 
-    for (const ref of sameColorRefs) {
-      const { score } = scoreRef(ref);
-      if (score >= threshold) {
-        results.push({ cardCode: ref.cardCode, similarity: score });
+  function scoreRange(start: number, end: number, out: Candidate[]): void {
+    if (!shortlist) {
+      for (let r = start; r < end; r++) scoreRow(r, out);
+      return;
+    }
+    for (const r of shortlist) {
+      if (r >= start && r < end) scoreRow(r, out);
+    }
+  }
+
+  function scoreRow(r: number, out: Candidate[]): void {
+    if (querySig) {
+      let distance = 0;
+      const sigBase = r * signatureWords;
+      for (let w = 0; w < signatureWords; w++) {
+        distance += popcount32(querySig[w] ^ signatures![sigBase + w]);
       }
+      if (distance > filter!.cutoff) return;
     }
-    results.sort((a, b) => b.similarity - a.similarity);
 
-    const bestSameColor = results[0]?.similarity ?? 0;
-    if (bestSameColor < 0.4) {
-      results = [];
-      for (const ref of db.embeddings) {
-        const { score } = scoreRef(ref);
-        if (score >= threshold) {
-          results.push({ cardCode: ref.cardCode, similarity: score });
-        }
+    let base = r * embeddingDim;
+    let dot = 0;
+    for (let i = 0; i < embeddingDim; i++) {
+      dot += normalizedQuery[i] * embeddings[base + i];
+    }
+    const embScore = normEmb(dot);
+
+    let histSim = -1;
+    if (hist && hasHistogram[r]) {
+      // Zero bins add nothing to the intersection: only visit the row's nonzero bins
+      histSim = 0;
+      for (let k = histOffsets![r]; k < histOffsets![r + 1]; k++) {
+        const bin = histBins![k];
+        if (bin < histLen) histSim += Math.min(hist[bin], histValues![k]);
       }
-      results.sort((a, b) => b.similarity - a.similarity);
     }
-  } else {
-    for (const ref of db.embeddings) {
-      const { score } = scoreRef(ref);
-      if (score >= threshold) {
-        results.push({ cardCode: ref.cardCode, similarity: score });
+
+    let dhSim = -1;
+    if (dhashQuery && hasDHash[r]) {
+      base = r * dhashDim;
+      let d = 0;
+      for (let i = 0; i < dhashLen; i++) {
+        d += dhashQuery[i] * dhashes![base + i];
       }
+      dhSim = Math.max(0, d);
     }
-    results.sort((a, b) => b.similarity - a.similarity);
+
+    let score: number;
+    if (histSim >= 0 && dhSim >= 0) {
+      score =
+        0.45 * embScore + 0.25 * normHist(histSim) + 0.3 * normSpatial(dhSim);
+    } else if (dhSim >= 0) {
+      score = 0.55 * embScore + 0.45 * normSpatial(dhSim);
+    } else if (histSim >= 0) {
+      score = 0.6 * embScore + 0.4 * normHist(histSim);
+    } else {
+      score = embScore;
+    }
+
+    if (score >= threshold) {
+      out.push({ cardCode: cardCodes[r], similarity: score });
+    }
+  }
+
+  const results: Candidate[] = [];
+
+  if (colorFilter) {
+    const group = refs.colorGroups.get(colorFilter);
+    if (group) scoreRange(group.start, group.end, results);
+
+    let bestSameColor = 0;
+    for (const r of results) {
+      if (r.similarity > bestSameColor) bestSameColor = r.similarity;
+    }
+
+    // Stop at the same-color block on a strong match; otherwise sweep the
+    // remaining blocks (same-color scores are kept, not recomputed)
+    if (bestSameColor < COLOR_FALLBACK_SCORE) {
+      if (group) {
+        scoreRange(0, group.start, results);
+        scoreRange(group.end, refs.count, results);
+      } else {
+        scoreRange(0, refs.count, results);
+      }
+    }
+  } else {
+    scoreRange(0, refs.count, results);
   }
 
-  const seen = new Map<string, (typeof results)[0]>();
+  const seen = new Map<string, Candidate>();
   for (const r of results) {
     const existing = seen.get(r.cardCode);
     if (!existing || r.similarity > existing.similarity) {
@@ -12,7 +12,7 @@ import type {
   WorkerMessage,
   WorkerResponse,
 } from "@/types/ml";
-import { preprocessFrame } from "./preprocess";
+import { letterboxContentBox, letterboxFrame } from "./preprocess";
 import {
   loadReferenceDatabase,
   loadAllReferenceDatabases,
@@ -353,10 +353,14 @@ export function createWorkerBridge(
           artHeight
         );
 
-        const preprocessedNormal = preprocessFrame(artCrop, cfg.inputSize);
-        const embNormal = await model.run(preprocessedNormal, cfg.inputSize);
+        const frameNormal = letterboxFrame(artCrop, cfg.inputSize);
+        const featuresNormal = await model.runFrameFeatures(
+          frameNormal,
+          letterboxContentBox(artCrop.width, artCrop.height, cfg.inputSize)
+        );
+        const embNormal = featuresNormal.embedding;
 
-        const artHist = computeHistogram(artCrop);
+        const artHist = featuresNormal.histogram ?? computeHistogram(artCrop);
         let blendedHist: Float32Array | undefined;
         if (artHist && fullCardHist) {
           blendedHist = new Float32Array(artHist.length);
@@ -365,7 +369,7 @@ export function createWorkerBridge(
           }
         }
 
-        const dhashNormal = computeDHash(artCrop);
+        const dhashNormal = featuresNormal.dhash ?? computeDHash(artCrop);
 
         const candidates = findTopCandidates(
           embNormal,
@@ -401,10 +405,14 @@ export function createWorkerBridge(
         );
         const flippedArt = flipImageDataHorizontally(artCrop);
 
-        const preprocessedFlipped = preprocessFrame(flippedArt, cfg.inputSize);
-        const embFlipped = await model.run(preprocessedFlipped, cfg.inputSize);
+        const frameFlipped = letterboxFrame(flippedArt, cfg.inputSize);
+        const featuresFlipped = await model.runFrameFeatures(
+          frameFlipped,
+          letterboxContentBox(flippedArt.width, flippedArt.height, cfg.inputSize)
+        );
+        const embFlipped = featuresFlipped.embedding;
 
-        const artHist = computeHistogram(flippedArt);
+        const artHist = featuresFlipped.histogram ?? computeHistogram(flippedArt);
         let blendedHist: Float32Array | undefined;
         if (artHist && fullCardHist) {
           blendedHist = new Float32Array(artHist.length);
@@ -413,7 +421,7 @@ export function createWorkerBridge(
           }
         }
 
-        const dhashFlipped = computeDHash(flippedArt);
+        const dhashFlipped = featuresFlipped.dhash ?? computeDHash(flippedArt);
 
         const candidatesFlipped = findTopCandidates(
           embFlipped,
@@ -14,12 +14,25 @@ export interface RecognitionNoMatch {
 
 export type RecognitionOutput = RecognitionResult | RecognitionNoMatch;
 
+/**
+ * Nonzero bins of a histogram in ascending order (scripts/ml/dbformat.py
+ * sparse_histogram). With `scale`, values are uint16 codes (value = code * scale).
+ */
+export interface SparseHistogram {
+  size: number;
+  bins: number[];
+  values: number[];
+  scale?: number;
+}
+
 export interface EmbeddingEntry {
   cardCode: string;
   embedding: number[];
-  histogram?: number[];
+  histogram?: number[] | SparseHistogram;
   color?: string;
   dhash?: number[] | string;
+  /** Hex SimHash of the embedding (scripts/ml/signature.py). */
+  signature?: string;
 }
 
 export interface ReferenceEmbedding {
@@ -28,6 +41,7 @@ export interface ReferenceEmbedding {
   histogram?: Float32Array;
   color?: string;
   dhash?: Float32Array;
+  signature?: Uint32Array;
 }
 
 export interface EmbeddingDatabase {
@@ -39,6 +53,30 @@ export interface EmbeddingDatabase {
   entries: EmbeddingEntry[];
 }
 
+export type BinarySectionDtype = "float32" | "float16" | "int8" | "uint8";
+
+export interface BinarySection {
+  offset: number;
+  dtype: BinarySectionDtype;
+  shape: [number, number];
+}
+
+/** JSON header of a binary embedding database (scripts/ml/dbformat.py). */
+export interface BinaryDatabaseHeader {
+  version: string;
+  model: string;
+  embeddingDim: number;
+  cardCount: number;
+  generatedAt: string;
+  dtype: "float32" | "float16" | "int8";
+  normalized: boolean;
+  cardCodes: string[];
+  colors: (string | null)[];
+  /** Contiguous row blocks per color (rows are grouped by color). */
+  colorGroups?: { color: string | null; start: number; count: number }[];
+  sections: Record<string, BinarySection>;
+}
+
 export interface RecognitionConfig {
   confidenceThreshold: number;
   inputSize: number;